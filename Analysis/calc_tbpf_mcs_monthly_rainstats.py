@@ -0,0 +1,533 @@
+"""
+Calculate monthly MCS precipitation statistics reading each month of pixel files once, save output to netCDF files.
+Pixel files are read in time chunks, all requested statistics are accumulated in one pass:
+    --rainmap: monthly total, MCS precipitation amount and frequency (same as calc_tbpf_mcs_monthly_rainmap.py)
+    --hovmoller: monthly total and MCS precipitation Hovmoller diagram (same as calc_tbpf_mcs_monthly_rainhov.py)
+    --hist: rain rate histograms by types of convection for land & ocean (same as calc_mcs_rainrate_hist_byregion.py)
+
+>python calc_tbpf_mcs_monthly_rainstats.py -c config.yml -s 2018-06 -e 2018-08 --rainmap
+Optional arguments:
+--hovmoller lat_min lat_max lon_min lon_max --hov_region region_name
+--hist -l landfrac_range -o oceanfrac_range --extent lonmin lonmax latmin latmax --region region_name
+--nchunk number of pixel files to read at a time
+-p 1 -n n_workers (process months in parallel)
+
+Zhe Feng, PNNL
+contact: Zhe.Feng@pnnl.gov
+"""
+import numpy as np
+import glob, sys, os
+import xarray as xr
+import pandas as pd
+import time, datetime, calendar, pytz
+import argparse
+import dask
+from dask.distributed import Client, LocalCluster
+from pyflextrkr.ft_utilities import load_config
+from pyflextrkr.mapfeature_func import read_pixel_labels
+
+#-----------------------------------------------------------------------
+def parse_cmd_args():
+    # Define and retrieve the command-line arguments...
+    parser = argparse.ArgumentParser(
+        description="Calculate monthly MCS precipitation map, Hovmoller and rain rate PDF in one pass."
+    )
+    parser.add_argument("-c", "--config", help="yaml config file for tracking", required=True)
+    parser.add_argument("-s", "--start", help="first month to process, format=YYYY-mm", required=True)
+    parser.add_argument("-e", "--end", help="last month to process, format=YYYY-mm", required=True)
+    parser.add_argument("--rainmap", help="flag to calculate monthly precipitation map", action="store_true")
+    parser.add_argument("--hovmoller", nargs='+', help="Hovmoller region (lat_min lat_max lon_min lon_max)", type=float, default=None)
+    parser.add_argument("--hov_region", help="Hovmoller region name", default="region")
+    parser.add_argument("--hist", help="flag to calculate rain rate histograms", action="store_true")
+    parser.add_argument("-l", "--land", nargs='+', help="land fraction range (min max)", type=float, default=None)
+    parser.add_argument("-o", "--ocean", nargs='+', help="ocean fraction range (min max)", type=float, default=None)
+    parser.add_argument("--extent", nargs='+', help="histogram domain extent (lonmin lonmax latmin latmax)", type=float, default=None)
+    parser.add_argument("--region", help="histogram region name", default="fulldomain")
+    parser.add_argument("--nchunk", help="number of pixel files to read at a time", type=int, default=24)
+    parser.add_argument("-p", "--parallel", help="flag to run in parallel (0:serial, 1:parallel)", type=int, default=0)
+    parser.add_argument("-n", "--n_workers", help="number of workers to run in parallel", type=int, default=1)
+    args = parser.parse_args()
+
+    # Put arguments in a dictionary
+    args_dict = {
+        'config_file': args.config,
+        'start_month': args.start,
+        'end_month': args.end,
+        'rainmap': args.rainmap,
+        'hovmoller': args.hovmoller,
+        'hov_region': args.hov_region,
+        'hist': args.hist,
+        'land': args.land,
+        'ocean': args.ocean,
+        'extent': args.extent,
+        'region': args.region,
+        'nchunk': args.nchunk,
+        'run_parallel': args.parallel,
+        'n_workers': args.n_workers,
+    }
+
+    return args_dict
+
+#-----------------------------------------------------------------------
+def get_hist_masks(longitude, latitude, lon_bounds, lat_bounds, config):
+    """
+    Make land & ocean masks for the histogram region.
+
+    Args:
+        longitude: np.array
+            Longitude of the pixel files, dimensions: [lat, lon].
+        latitude: np.array
+            Latitude of the pixel files, dimensions: [lat, lon].
+        lon_bounds: list
+            Longitude bounds of the region.
+        lat_bounds: list
+            Latitude bounds of the region.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        land_mask: np.array(bool)
+            Land pixels within the region.
+        ocean_mask: np.array(bool)
+            Ocean pixels within the region.
+    """
+    land_range = config['land_range']
+    ocean_range = config['ocean_range']
+    # Read landmask
+    dslm = xr.open_dataset(config['landmask_filename'])
+    landmask = dslm[config['landmask_varname']].squeeze().values
+    dslm.close()
+    # Create a mask for the region
+    region_mask = (longitude >= min(lon_bounds)) & (longitude <= max(lon_bounds)) & \
+                  (latitude >= min(lat_bounds)) & (latitude <= max(lat_bounds))
+    # Create mask for land & ocean, combine with the region mask
+    land_mask = region_mask & (landmask >= min(land_range)) & (landmask <= max(land_range))
+    ocean_mask = region_mask & (landmask >= min(ocean_range)) & (landmask <= max(ocean_range))
+    return land_mask, ocean_mask
+
+#-----------------------------------------------------------------------
+def calc_hist_chunk(ds, land_mask, ocean_mask, rrbins, hist_counts):
+    """
+    Add rain rate histograms by types of convection for a chunk of pixel files.
+
+    Args:
+        ds: xarray.Dataset
+            Pixel data for a chunk of times.
+        land_mask: np.array(bool)
+            Land pixels within the region.
+        ocean_mask: np.array(bool)
+            Ocean pixels within the region.
+        rrbins: np.array
+            Rain rate bins.
+        hist_counts: dictionary
+            Histogram counts for each type, updated in place.
+    """
+    # Congestus Tb and rainrate thresholds
+    tb_thresh_congestus = 310.0     # K
+    rr_thresh_congestus = 0.5       # mm/h
+
+    # Range of rain rate
+    rr_range = (np.min(rrbins), np.max(rrbins))
+
+    precipitation = ds['precipitation'].values
+    cloudtracknumber = ds['cloudtracknumber'].values
+    cloudnumber = ds['cloudnumber'].values
+    tb = ds['tb'].values
+    type_masks = {
+        # All precipitation
+        'total': np.ones(precipitation.shape, dtype=bool),
+        # MCS precipitation
+        'mcs': cloudtracknumber > 0,
+        # Non-MCS deep convection (cloudnumber > 0: CCS & cloudtracknumber == NaN: non-MCS)
+        'idc': (cloudnumber > 0) & np.isnan(cloudtracknumber),
+        # Congestus (Tb between CCS and tb_thresh_congestus, rain rate > rr_thresh_congestus)
+        'congestus': np.isnan(cloudnumber) & (tb < tb_thresh_congestus) & (precipitation > rr_thresh_congestus),
+    }
+    for surface, surface_mask in zip(['land', 'ocean'], [land_mask, ocean_mask]):
+        for pcptype, type_mask in type_masks.items():
+            ipcp = precipitation[type_mask & surface_mask[None, :, :]]
+            counts, bins = np.histogram(ipcp, bins=rrbins, range=rr_range, density=False)
+            hist_counts[f'{pcptype}_{surface}'] += counts
+    return
+
+#-----------------------------------------------------------------------
+def drop_label_runs(ds):
+    """
+    Drop run-length encoded track label variables, their run dimension differs between files.
+    """
+    return ds.drop_dims([dim for dim in ds.dims if dim.endswith('_runs')])
+
+#-----------------------------------------------------------------------
+def add_dense_labels(ds, filenames, varnames):
+    """
+    Add run-length encoded track label variables to a chunk of pixel data as dense variables.
+
+    Args:
+        ds: xarray.Dataset
+            Pixel data for a chunk of times.
+        filenames: list
+            Pixel file names of the chunk.
+        varnames: list
+            Track label variable names to add.
+
+    Returns:
+        ds: xarray.Dataset
+            Pixel data with the track label variables, background values set to NaN.
+    """
+    for varname in varnames:
+        labels = [read_pixel_labels(filename, [varname]) for filename in filenames]
+        label = np.concatenate([ilabel[varname] for ilabel in labels], axis=0).astype(float)
+        with xr.open_dataset(filenames[0]) as ds0:
+            attrs = ds0[f'{varname}_run_value'].attrs
+        label[label == attrs['background']] = np.nan
+        ds[varname] = (attrs['dense_dims'].split(), label)
+    return ds
+
+#-----------------------------------------------------------------------
+def process_month(year, month, opts, config):
+    """
+    Calculate precipitation statistics for a month, reading each pixel file once.
+
+    Args:
+        year: int
+            Year.
+        month: int
+            Month.
+        opts: dictionary
+            Dictionary containing statistics options.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        hist_counts: dictionary
+            Histogram counts for each type, None if histograms are not requested or no files are found.
+    """
+    pixel_dir = config['pixeltracking_outpath']
+    output_monthly_dir = config['stats_outpath'] + 'monthly/'
+    yearstr = str(year)
+    monthstr = str(month).zfill(2)
+    nchunk = max(opts['nchunk'], 1)
+
+    # Find all pixel files in a month
+    mcsfiles = sorted(glob.glob(f'{pixel_dir}/mcstrack_{yearstr}{monthstr}*_*.nc'))
+    nfiles = len(mcsfiles)
+    print(yearstr, monthstr)
+    print('Number of files: ', nfiles)
+    if nfiles == 0:
+        print(f'No files found for {yearstr}{monthstr}.')
+        return None
+    os.makedirs(output_monthly_dir, exist_ok=True)
+
+    # Get map coordinates from the first file
+    ds0 = xr.open_dataset(mcsfiles[0])
+    lat = ds0['lat']
+    lon = ds0['lon']
+    longitude = ds0['longitude'].squeeze()
+    latitude = ds0['latitude'].squeeze()
+    ds0.close()
+    ny, nx = longitude.shape
+
+    # Variables to read
+    varlist = []
+    if opts['rainmap']:
+        varlist.extend(['precipitation', 'cloudtracknumber', 'pcptracknumber'])
+    if opts['hovmoller'] is not None:
+        hov_pcpvarname = config['track_field_for_speed']
+        startlat, endlat, startlon, endlon = opts['hovmoller']
+        varlist.extend([hov_pcpvarname, 'pcptracknumber'])
+        mcspreciphov = []
+        totpreciphov = []
+        basetime = []
+    if opts['hist']:
+        varlist.extend(['precipitation', 'cloudtracknumber', 'cloudnumber', 'tb'])
+        land_mask, ocean_mask = get_hist_masks(longitude.values, latitude.values,
+                                               opts['lon_bounds'], opts['lat_bounds'], config)
+        hist_counts = {f'{pcptype}_{surface}': np.zeros(len(opts['rrbins']) - 1, dtype=np.int64)
+                       for surface in ['land', 'ocean'] for pcptype in ['total', 'mcs', 'idc', 'congestus']}
+    varlist = list(dict.fromkeys(varlist))
+
+    # Create variables for maps
+    totprecip = np.zeros((ny, nx))
+    mcsprecip = np.zeros((ny, nx))
+    mcspcpct = np.zeros((ny, nx))
+    ntimes = 0
+
+    # Loop over chunks of pixel files
+    for ifile in range(0, nfiles, nchunk):
+        ds = xr.open_mfdataset(mcsfiles[ifile:ifile + nchunk], concat_dim='time', combine='nested',
+                               data_vars='minimal', coords='minimal', compat='override',
+                               preprocess=drop_label_runs)
+        ds = ds[[var for var in varlist if var in ds]].load()
+        # Decode run-length encoded track label variables (pixel_label_encoding: 'rle')
+        if ds.attrs.get('label_encoding', 'dense') == 'rle':
+            ds = add_dense_labels(ds, mcsfiles[ifile:ifile + nchunk], [var for var in varlist if var not in ds])
+        ntimes += ds.dims['time']
+
+        if opts['rainmap']:
+            precipitation = ds['precipitation'].values
+            # Sum MCS precipitation over time, use cloudtracknumber > 0 as mask
+            mcsprecip += np.nansum(np.where(ds['cloudtracknumber'].values > 0, precipitation, np.nan), axis=0, dtype=np.float64)
+            # Sum total precipitation over time
+            totprecip += np.nansum(precipitation, axis=0, dtype=np.float64)
+            # Sum MCS PF counts overtime to get number of hours
+            mcspcpct += np.count_nonzero(ds['pcptracknumber'].values > 0, axis=0)
+
+        if opts['hovmoller'] is not None:
+            # Mask out non-MCS precipitation as 0 for averaging Hovmoller purpose
+            mcspcp = ds[hov_pcpvarname].where(ds['pcptracknumber'] > 0, other=0)
+            # Select a latitude band and average over latitude
+            mcspreciphov.append(mcspcp.sel(lat=slice(startlat, endlat), lon=slice(startlon, endlon)).mean(dim='lat').data)
+            totpreciphov.append(ds[hov_pcpvarname].sel(lat=slice(startlat, endlat), lon=slice(startlon, endlon)).mean(dim='lat').data)
+            # Convert xarray decoded time back to Epoch Time in seconds
+            basetime.extend([tt.tolist()/1e9 for tt in ds.time.values])
+
+        if opts['hist']:
+            calc_hist_chunk(ds, land_mask, ocean_mask, opts['rrbins'], hist_counts)
+
+        ds.close()
+    print('Finish reading input files.')
+
+    if opts['rainmap']:
+        output_filename = f'{output_monthly_dir}mcs_rainmap_{yearstr}{monthstr}.nc'
+        write_rainmap(output_filename, year, month, longitude, latitude, lat, lon,
+                      totprecip, mcsprecip, mcspcpct, ntimes)
+
+    if opts['hovmoller'] is not None:
+        output_filename = f'{output_monthly_dir}mcs_rainhov_{opts["hov_region"]}_{yearstr}{monthstr}.nc'
+        lonhov = lon.sel(lon=slice(startlon, endlon))
+        write_rainhov(output_filename, np.concatenate(totpreciphov, axis=0), np.concatenate(mcspreciphov, axis=0),
+                      np.array(basetime), lonhov, opts['hovmoller'])
+
+    if opts['hist']:
+        return hist_counts
+    return None
+
+#-----------------------------------------------------------------------
+def write_rainmap(output_filename, year, month, longitude, latitude, lat, lon, totprecip, mcsprecip, mcspcpct, ntimes):
+    """
+    Write monthly precipitation map to a netCDF file.
+    """
+    # Compute Epoch Time for the month
+    months = np.zeros(1, dtype=int)
+    months[0] = calendar.timegm(datetime.datetime(int(year), int(month), 1, 0, 0, 0, tzinfo=pytz.UTC).timetuple())
+
+    var_dict = {
+        'longitude': (['lat', 'lon'], longitude.data, longitude.attrs),
+        'latitude': (['lat', 'lon'], latitude.data, latitude.attrs),
+        'precipitation': (['time', 'lat', 'lon'], np.expand_dims(totprecip, 0)),
+        'mcs_precipitation': (['time', 'lat', 'lon'], np.expand_dims(mcsprecip, 0)),
+        'mcs_precipitation_count': (['time', 'lat', 'lon'], np.expand_dims(mcspcpct, 0)),
+        'ntimes': (['time'], xr.DataArray(ntimes).expand_dims('time', axis=0).data),
+    }
+    coord_dict = {
+        'time': (['time'], months),
+        'lat': (['lat'], lat.data),
+        'lon': (['lon'], lon.data),
+    }
+    gattr_dict = {
+        'title': 'MCS precipitation accumulation',
+        'contact':'Zhe Feng, zhe.feng@pnnl.gov',
+        'created_on':time.ctime(time.time()),
+    }
+    dsout = xr.Dataset(var_dict, coords=coord_dict, attrs=gattr_dict)
+    dsout.time.attrs['long_name'] = 'Epoch Time (since 1970-01-01T00:00:00)'
+    dsout.time.attrs['units'] = 'Seconds since 1970-1-1 0:00:00 0:00'
+    dsout.lon.attrs['long_name'] = 'Longitude'
+    dsout.lon.attrs['units'] = 'degree'
+    dsout.lat.attrs['long_name'] = 'Latitude'
+    dsout.lat.attrs['units'] = 'degree'
+    dsout.ntimes.attrs['long_name'] = 'Number of times in the month'
+    dsout.ntimes.attrs['units'] = 'count'
+    dsout.precipitation.attrs['long_name'] = 'Total precipitation'
+    dsout.precipitation.attrs['units'] = 'mm'
+    dsout.mcs_precipitation.attrs['long_name'] = 'MCS precipitation'
+    dsout.mcs_precipitation.attrs['units'] = 'mm'
+    dsout.mcs_precipitation_count.attrs['long_name'] = 'Number of hours MCS precipitation is recorded'
+    dsout.mcs_precipitation_count.attrs['units'] = 'hour'
+
+    fillvalue = np.nan
+    # Set encoding/compression for all variables
+    comp = dict(zlib=True, _FillValue=fillvalue, dtype='float32')
+    encoding = {var: comp for var in dsout.data_vars}
+
+    dsout.to_netcdf(path=output_filename, mode='w', format='NETCDF4', unlimited_dims='time', encoding=encoding)
+    print(f'Output saved: {output_filename}')
+    return
+
+#-----------------------------------------------------------------------
+def write_rainhov(output_filename, totpreciphov, mcspreciphov, basetime, lonhov, hov_bounds):
+    """
+    Write monthly precipitation Hovmoller diagram to a netCDF file.
+    """
+    startlat, endlat, startlon, endlon = hov_bounds
+    print('Writing Hovmoller to netCDF file ...')
+    var_dict = {
+        'precipitation': (['time', 'lon'], totpreciphov),
+        'mcs_precipitation': (['time', 'lon'], mcspreciphov),
+    }
+    coord_dict = {
+        'lon': (['lon'], lonhov.data),
+        'time': (['time'], basetime),
+    }
+    gattr_dict = {
+        'title': 'MCS precipitation Hovmoller',
+        'startlat': startlat,
+        'endlat': endlat,
+        'startlon': startlon,
+        'endlon': endlon,
+        'contact': 'Zhe Feng, zhe.feng@pnnl.gov',
+        'created_on': time.ctime(time.time()),
+    }
+    dsout = xr.Dataset(var_dict, coords=coord_dict, attrs=gattr_dict)
+    dsout.lon.attrs['long_name'] = 'Longitude'
+    dsout.lon.attrs['units'] = 'degree'
+    dsout.time.attrs['long_name'] = 'Epoch Time (since 1970-01-01T00:00:00)'
+    dsout.time.attrs['units'] = 'seconds since 1970-01-01T00:00:00'
+    dsout.precipitation.attrs['long_name'] = 'Total precipitation'
+    dsout.precipitation.attrs['units'] = 'mm/h'
+    dsout.mcs_precipitation.attrs['long_name'] = 'MCS precipitation'
+    dsout.mcs_precipitation.attrs['units'] = 'mm/h'
+
+    fillvalue = np.nan
+    # Set encoding/compression for all variables
+    comp = dict(zlib=True, _FillValue=fillvalue, dtype='float32')
+    encoding = {var: comp for var in dsout.data_vars}
+
+    dsout.to_netcdf(path=output_filename, mode='w', format='NETCDF4', unlimited_dims='time', encoding=encoding)
+    print(f'Output saved: {output_filename}')
+    return
+
+#-----------------------------------------------------------------------
+def write_hist(outfile, hist_counts, rrbins, lon_bounds, lat_bounds, land_range, ocean_range):
+    """
+    Write rain rate histograms by types of convection to a netCDF file.
+    """
+    print('Writing output to netCDF file ...')
+    var_dict = {
+        'total_land': (['bins'], hist_counts['total_land']),
+        'mcs_land': (['bins'], hist_counts['mcs_land']),
+        'idc_land': (['bins'], hist_counts['idc_land']),
+        'congestus_land': (['bins'], hist_counts['congestus_land']),
+        'total_ocean': (['bins'], hist_counts['total_ocean']),
+        'mcs_ocean': (['bins'], hist_counts['mcs_ocean']),
+        'idc_ocean': (['bins'], hist_counts['idc_ocean']),
+        'congestus_ocean': (['bins'], hist_counts['congestus_ocean']),
+    }
+    coord_dict = {'bins': (['bins'], rrbins[:-1])}
+    gattr_dict = {
+        'title': 'Precipitation PDF by types',
+        'lon_bounds': lon_bounds,
+        'lat_bounds': lat_bounds,
+        'landfrac_range': land_range,
+        'oceanfrac_range': ocean_range,
+        'contact': 'Zhe Feng, zhe.feng@pnnl.gov',
+        'created_on': time.ctime(time.time()),
+    }
+    dsout = xr.Dataset(var_dict, coords=coord_dict, attrs=gattr_dict)
+
+    dsout.bins.attrs['long_name'] = 'Rain rate bins'
+    dsout.bins.attrs['units'] = 'mm/h'
+    for surface in ['land', 'ocean']:
+        dsout[f'total_{surface}'].attrs['long_name'] = f'{surface.capitalize()} total precipitation'
+        dsout[f'mcs_{surface}'].attrs['long_name'] = f'{surface.capitalize()} MCS precipitation'
+        dsout[f'idc_{surface}'].attrs['long_name'] = f'{surface.capitalize()} isolated deep convection precipitation'
+        dsout[f'congestus_{surface}'].attrs['long_name'] = f'{surface.capitalize()} congestus precipitation'
+    for var in dsout.data_vars:
+        dsout[var].attrs['units'] = 'count'
+
+    # Set encoding/compression for all variables
+    comp = dict(zlib=True, dtype='float')
+    encoding = {var: comp for var in dsout.data_vars}
+    # Write to file
+    dsout.to_netcdf(path=outfile, mode='w', format='NETCDF4', encoding=encoding)
+    print('Output saved as: ', outfile)
+    return
+
+
+if __name__ == "__main__":
+
+    # Get the command-line arguments...
+    args_dict = parse_cmd_args()
+    config_file = args_dict.get('config_file')
+    run_parallel = args_dict.get('run_parallel')
+    n_workers = args_dict.get('n_workers')
+
+    # Set up the rain rate bins (linear)
+    rrbins = np.arange(1, 201, 1)
+
+    # Get inputs from configuration file
+    config = load_config(config_file)
+
+    opts = {
+        'rainmap': args_dict.get('rainmap'),
+        'hovmoller': args_dict.get('hovmoller'),
+        'hov_region': args_dict.get('hov_region'),
+        'hist': args_dict.get('hist'),
+        'nchunk': args_dict.get('nchunk'),
+        'rrbins': rrbins,
+    }
+    if opts['hist']:
+        land_range = args_dict.get('land')
+        ocean_range = args_dict.get('ocean')
+        if (land_range is None) or (ocean_range is None):
+            sys.exit('Land (-l) and ocean (-o) fraction ranges are required for --hist.')
+        # Add land_range, ocean_range to config
+        config['land_range'] = land_range
+        config['ocean_range'] = ocean_range
+        # If extent is not specified, use geolimit from config
+        extent = args_dict.get('extent')
+        if extent is None:
+            geolimits = config['geolimits']
+            # geolimits: [lat_min, lon_min, lat_max, lon_max]
+            opts['lat_bounds'] = [geolimits[0], geolimits[2]]
+            opts['lon_bounds'] = [geolimits[1], geolimits[3]]
+        else:
+            # extent: [lonmin, lonmax, latmin, latmax]
+            opts['lon_bounds'] = [extent[0], extent[1]]
+            opts['lat_bounds'] = [extent[2], extent[3]]
+
+    # Make monthly start dates for the period
+    start_dates = pd.date_range(args_dict.get('start_month'), args_dict.get('end_month'), freq='1MS')
+
+    # Serial option
+    if run_parallel == 0:
+        results = []
+        for idate in start_dates:
+            result = process_month(idate.year, idate.month, opts, config)
+            results.append(result)
+
+    # Parallel option
+    elif run_parallel == 1:
+        # Set Dask temporary directory for workers
+        dask_tmp_dir = config.get("dask_tmp_dir", "./")
+        dask.config.set({'temporary-directory': dask_tmp_dir})
+        # Initialize dask
+        cluster = LocalCluster(n_workers=n_workers, threads_per_worker=1)
+        client = Client(cluster)
+        results = []
+        for idate in start_dates:
+            result = dask.delayed(process_month)(idate.year, idate.month, opts, config)
+            results.append(result)
+
+        # Trigger dask computation
+        results = dask.compute(*results)
+
+    # Sum histograms over all months and write to a file
+    if opts['hist']:
+        hist_counts = None
+        for result in results:
+            if result is None:
+                continue
+            if hist_counts is None:
+                hist_counts = result
+            else:
+                for key in hist_counts:
+                    hist_counts[key] += result[key]
+        if hist_counts is not None:
+            first_date = start_dates[0].strftime('%Y%m%d')
+            last_date = (start_dates[-1] + pd.offsets.MonthEnd(0)).strftime('%Y%m%d')
+            outfile = f"{config['stats_outpath']}mcs_rainrate_hist_{first_date}_{last_date}_{args_dict.get('region')}.nc"
+            write_hist(outfile, hist_counts, rrbins, opts['lon_bounds'], opts['lat_bounds'],
+                       config['land_range'], config['ocean_range'])
+        else:
+            print('No files found. No histogram saved.')
@@ -5,10 +5,10 @@ from pathlib import Path
 import numpy as np
 import pandas as pd
 import xarray as xr
-from netCDF4 import Dataset
 import sys, os
 import time, datetime, calendar, pytz
 from pyflextrkr.ft_utilities import load_config
+from pyflextrkr.mapfeature_func import read_pixel_labels
 
 # The times have a small offset from the exact times -- e.g. 34500 ns off. Correct this.
 def round_times_to_nearest_second(dstracks, fields):
@@ -62,6 +62,225 @@ def map_datetime2pixelfile(pixel_dir, mcs_pixelfilebase):
     }    
     return pixel_files, date_path_map
 
+def group_tracks_by_frame(base_time, track_duration):
+    """
+    Group track times by pixel file time.
+
+    Args:
+        base_time: np.array(datetime64)
+            Track base time, dimensions: [tracks, times].
+        track_duration: np.array
+            Track duration (number of times) for each track.
+
+    Return:
+        frame_tracks: dictionary
+            Dictionary key by datetimes (rounded to minute) and value by (track indices, time indices).
+        frame_end_tracks: dictionary
+            Dictionary key by datetimes and value by list of track indices that end at that time.
+    """
+    ntracks, ntimes = base_time.shape
+    # Valid track times up to the track duration
+    valid = (np.arange(ntimes)[None, :] < np.asarray(track_duration)[:, None]) & ~np.isnat(base_time)
+    idx_mcs, idx_time = np.nonzero(valid)
+    # Round off base_time to minute
+    frame_times = base_time[idx_mcs, idx_time].astype('datetime64[m]')
+    unique_times, inverse = np.unique(frame_times, return_inverse=True)
+    frame_tracks = {}
+    for ii, itime in enumerate(unique_times):
+        iframe = inverse == ii
+        frame_tracks[pd.to_datetime(itime)] = (idx_mcs[iframe], idx_time[iframe])
+    # The last time of each track
+    frame_end_tracks = {}
+    for imcs in np.unique(idx_mcs):
+        itime = pd.to_datetime(np.max(frame_times[idx_mcs == imcs]))
+        frame_end_tracks.setdefault(itime, []).append(imcs)
+    return frame_tracks, frame_end_tracks
+
+def read_tracknumber(tracknumber, nlut):
+    """
+    Convert a track number array from a pixel file to flattened integer track numbers.
+
+    Args:
+        tracknumber: np.array
+            Track number array from read_pixel_labels.
+        nlut: int
+            Size of the track number lookup tables, larger track numbers are set to 0.
+
+    Return:
+        tracknumber: np.array(int64)
+            Flattened track numbers, missing values set to 0.
+    """
+    tracknumber = np.ma.filled(tracknumber[0,:,:], 0)
+    if np.issubdtype(tracknumber.dtype, np.floating):
+        tracknumber = np.nan_to_num(tracknumber, nan=0)
+    tracknumber = tracknumber.astype(np.int64).ravel()
+    tracknumber[(tracknumber < 0) | (tracknumber >= nlut)] = 0
+    return tracknumber
+
+def make_lut(nlut, tracknumbers, values):
+    """
+    Make a track number to value lookup table, NaN values are skipped as in np.nansum.
+
+    Args:
+        nlut: int
+            Size of the lookup table.
+        tracknumbers: np.array
+            Track numbers.
+        values: np.array
+            Value for each track number.
+
+    Return:
+        lut: np.array
+            Lookup table, 0 for track numbers without a value.
+    """
+    lut = np.zeros(nlut)
+    values = np.asarray(values, dtype=float)
+    np.add.at(lut, tracknumbers, np.where(np.isnan(values), 0, values))
+    return lut
+
+def add_to_map(map_sum, pix, tracknumber, lut):
+    """
+    Add lookup table values to a map in place.
+
+    Args:
+        map_sum: np.array
+            Map to add to.
+        pix: np.array
+            Flattened pixel indices with a track number.
+        tracknumber: np.array
+            Track number of each pixel.
+        lut: np.array
+            Track number to value lookup table.
+    """
+    map_sum.reshape(-1)[pix] += lut[tracknumber]
+
+def split_pixels_by_track(pix, tracknumber, tracknumbers):
+    """
+    Split pixel indices by track number.
+
+    Args:
+        pix: np.array
+            Flattened pixel indices with a track number.
+        tracknumber: np.array
+            Track number of each pixel.
+        tracknumbers: np.array
+            Track numbers to get pixels for.
+
+    Return:
+        track_pix: list
+            Pixel indices of each track number in tracknumbers.
+    """
+    order = np.argsort(tracknumber, kind='stable')
+    sorted_tracknumber = tracknumber[order]
+    start = np.searchsorted(sorted_tracknumber, tracknumbers, side='left')
+    end = np.searchsorted(sorted_tracknumber, tracknumbers, side='right')
+    return [pix[order[i0:i1]] for i0, i1 in zip(start, end)]
+
+def add_counts_to_table(keys, counts, new_keys):
+    """
+    Add new keys to a sparse count table.
+
+    Args:
+        keys: np.array(int64)
+            Sorted unique keys in the count table.
+        counts: np.array(int64)
+            Count for each key.
+        new_keys: list
+            List of arrays with keys to add, each occurrence adds 1 to the count.
+
+    Return:
+        keys: np.array(int64)
+            Sorted unique keys in the updated count table.
+        counts: np.array(int64)
+            Count for each key.
+    """
+    if len(new_keys) == 0:
+        return keys, counts
+    new_keys = np.concatenate(new_keys)
+    all_keys = np.concatenate((keys, new_keys))
+    all_counts = np.concatenate((counts, np.ones(len(new_keys), dtype=np.int64)))
+    keys, inverse = np.unique(all_keys, return_inverse=True)
+    counts = np.bincount(inverse, weights=all_counts).astype(np.int64)
+    return keys, counts
+
+def calc_percentiles_from_counts(keys, counts, values, npix, percentiles):
+    """
+    Calculate per-pixel percentiles from a sparse (pixel, value) count table.
+
+    Results are identical to np.nanpercentile (linear method) over the samples of each pixel.
+
+    Args:
+        keys: np.array(int64)
+            Sorted unique keys, key = pixel index * number of values + value index.
+        counts: np.array(int64)
+            Count for each key.
+        values: np.array
+            Sorted unique values.
+        npix: int
+            Number of pixels.
+        percentiles: list
+            Percentiles to compute (0-100).
+
+    Return:
+        pts: np.array
+            Percentiles, dimensions: [percentiles, pixels], NaN for pixels without samples.
+    """
+    nvalues = len(values)
+    pix = keys // nvalues
+    value_of_key = values[keys % nvalues]
+    # Number of samples at each pixel and the position of their first sample
+    nsample = np.bincount(pix, weights=counts, minlength=npix).astype(np.int64)
+    pix_start = np.cumsum(nsample) - nsample
+    cum_counts = np.cumsum(counts)
+    pts = np.full((len(percentiles), npix), np.nan)
+    pix_valid = np.flatnonzero(nsample)
+    nsample = nsample[pix_valid]
+    pix_start = pix_start[pix_valid]
+    quantiles = np.true_divide(percentiles, 100.0)
+    for iq, quantile in enumerate(quantiles):
+        # Same index and interpolation steps as np.nanpercentile
+        virtual_index = (nsample - 1) * quantile
+        previous_index = np.floor(virtual_index).astype(np.int64)
+        next_index = previous_index + 1
+        above_bounds = virtual_index >= nsample - 1
+        previous_index[above_bounds] = nsample[above_bounds] - 1
+        next_index[above_bounds] = nsample[above_bounds] - 1
+        gamma = virtual_index - np.floor(virtual_index)
+        # Get the sorted sample at the index from the cumulative counts
+        previous = value_of_key[np.searchsorted(cum_counts, pix_start + previous_index, side='right')]
+        next = value_of_key[np.searchsorted(cum_counts, pix_start + next_index, side='right')]
+        diff = next - previous
+        ipts = previous + diff * gamma
+        ipts = np.where(gamma >= 0.5, next - diff * (1 - gamma), ipts)
+        pts[iq, pix_valid] = ipts
+    return pts
+
+def calc_mean_from_counts(keys, counts, values, npix):
+    """
+    Calculate per-pixel mean from a sparse (pixel, value) count table.
+
+    Args:
+        keys: np.array(int64)
+            Sorted unique keys, key = pixel index * number of values + value index.
+        counts: np.array(int64)
+            Count for each key.
+        values: np.array
+            Sorted unique values.
+        npix: int
+            Number of pixels.
+
+    Return:
+        mean: np.array
+            Mean value at each pixel, NaN for pixels without samples.
+    """
+    nvalues = len(values)
+    pix = keys // nvalues
+    total = np.bincount(pix, weights=counts * values[keys % nvalues], minlength=npix)
+    nsample = np.bincount(pix, weights=counts, minlength=npix)
+    mean = np.full(npix, np.nan)
+    np.divide(total, nsample, out=mean, where=nsample > 0)
+    return mean
+
 if __name__ == "__main__":
 
     # Get inputs from command line
@@ -154,7 +373,6 @@ if __name__ == "__main__":
 
     # Create variables for maps
     nt_uniq = len(np.unique(base_times))
-    map_lifetime_all = np.zeros((nmcs, ny, nx))*np.NAN
     map_ccsarea = np.zeros((ny, nx))
     map_pfarea = np.zeros((ny, nx))
     map_rainrateheavy = np.zeros((ny, nx))
@@ -176,156 +394,116 @@ if __name__ == "__main__":
 
     nframes = 0
 
-    # Loop over each MCS track
-    for imcs in range(nmcs):
-        # Track numbers are offset by 1
-        itrack = tracks.values[imcs] + 1
-        iduration = stats['track_duration'].data[imcs]
-        ilifetime = lifetime.values[imcs]
-        istartstatus = start_status.values[imcs]
-        istart_splitcloudnumber = start_split_cloudnumber[imcs]
-        print(f'Track number: {itrack}')
-        
-        temp_track = np.zeros((ny, nx))*np.nan
-        temp_nmcs_ccs = np.zeros((ny, nx))
-        temp_nmcs_pf = np.zeros((ny, nx))
-        
-        # Loop over each time up to the track duration
-        for it in range(iduration):
-            imcsstatus = mcs_status.values[imcs,it]
-            ibasetime = base_time.data[imcs, it]
-
-            # Round off base_time to minute, then convert to Pandas Timestamp
-            iTimestamp = pd.to_datetime(ibasetime.astype('datetime64[m]'))
-            
-            if np.isnan(ibasetime):
-                continue
-            else:
-                pixfname = date_path_map.get(iTimestamp, None)
-
-            # Check to make sure the basetime key exist in the dictionary before proceeding
-            if (pixfname is not None):
-                # print(pixfname)
-                
-                # Read pixel data
-                ds = Dataset(pixfname)
-                cloudtracknumber = ds.variables['cloudtracknumber'][0,:,:]
-                pcptracknumber = ds.variables['pcptracknumber'][0,:,:]
-                # Find cloudnumber matching the current one
-                idx_c = cloudtracknumber == itrack
-                idx_p = pcptracknumber == itrack
-                npix_c = np.count_nonzero(idx_c)
-                npix_p = np.count_nonzero(idx_p)
-                
-                # Set each frame with a number
-                # This is suitable for variables that change with time. e.g. PF area
-                # Get values from stats variables
-                iccsarea = ccs_area.values[imcs, it]
-                ipfarea = pf_area.values[imcs, it]
-                itotalrain = total_rain.values[imcs, it]
-                iheavyrain = total_heavyrain.values[imcs, it]
-                irainrateheavy = rainrate_heavyrain.values[imcs, it]
-                # Get max rain rate from all PFs
-                imaxrainrate = np.nanmax(pf_maxrainrate.values[imcs, it, :])
-
-                # Put stats value onto the map
-                temp_c = np.full((ny, nx), np.NAN)
-                temp_p = np.full((ny, nx), np.NAN)
-                temp_totalrain = np.full((ny, nx), np.NAN)
-                temp_totalrainheavy = np.full((ny, nx), np.NAN)
-                temp_rainrateheavy = np.full((ny, nx), np.NAN)
-                temp_rainratemax = np.full((ny, nx), np.NAN)
-                temp_pfspeed = np.full((ny, nx), np.NAN)
-                temp_uspeed = np.full((ny, nx), np.NAN)
-                temp_vspeed = np.full((ny, nx), np.NAN)
-
-                temp_c[idx_c] = iccsarea
-                temp_p[idx_p] = ipfarea
-                
-                # Assign single PF value to the entire PF mask
-                # This is to increase area for certain extreme statistics (e.g. max rain rate)
-                # to make results less noisy. Absolute location wise this is just an approximation.
-                temp_totalrain[idx_p] = itotalrain
-                temp_totalrainheavy[idx_p] = iheavyrain
-                temp_rainrateheavy[idx_p] = irainrateheavy
-                temp_rainratemax[idx_p] = imaxrainrate
-                # The following gives more precise location mapping
-                # Use PF mask as proxy location to map core values
-                if speed_exist:
-                    ispeed = speed.values[imcs, it]
-                    iuspeed = uspeed.values[imcs, it]
-                    ivspeed = vspeed.values[imcs, it]
-                    temp_pfspeed[idx_p] = ispeed
-                    temp_uspeed[idx_p] = iuspeed
-                    temp_vspeed[idx_p] = ivspeed
-                
-                # If MCS start status is not a split, check for initiation/genesis
-                if (np.isnan(istart_splitcloudnumber)):
-                    # If time step is == 0 (initiation)
-                    if (it == 0):
-                        map_init_ccs[idx_c] += 1
-
+    # Track lifetime at each pixel, saved as a sparse (pixel, lifetime) count table
+    lifetime_values, lifetime_index = np.unique(lifetime.values, return_inverse=True)
+    nlifetime = len(lifetime_values)
+    lifetime_keys = np.zeros(0, dtype=np.int64)
+    lifetime_counts = np.zeros(0, dtype=np.int64)
+    lifetime_new_keys = []
+    nlifetime_new_keys = 0
+
+    # Track numbers in the pixel files are offset by 1
+    tracknumbers = tracks.values.astype(int) + 1
+    nlut = (np.max(tracknumbers) + 1) if (nmcs > 0) else 1
+    track_duration = stats['track_duration'].sel(tracks=trackidx).values
+
+    # Group the track times by pixel file time, so that each pixel file is read once
+    frame_tracks, frame_end_tracks = group_tracks_by_frame(base_time.data, track_duration)
+
+    # Pixel indices of each track over its lifetime, gathered until the track ends
+    track_pix_c = {}
+    track_pix_p = {}
+
+    # Loop over each pixel file time
+    for iTimestamp in sorted(frame_tracks.keys()):
+        idx_mcs, idx_time = frame_tracks[iTimestamp]
+        pixfname = date_path_map.get(iTimestamp, None)
+
+        # Check to make sure the basetime key exist in the dictionary before proceeding
+        if (pixfname is not None):
+            # Read pixel data
+            labels = read_pixel_labels(pixfname, ['cloudtracknumber', 'pcptracknumber'])
+            cloudtracknumber = read_tracknumber(labels['cloudtracknumber'], nlut)
+            pcptracknumber = read_tracknumber(labels['pcptracknumber'], nlut)
+            # Pixels with a track number, and their track numbers
+            pix_c = np.flatnonzero(cloudtracknumber)
+            pix_p = np.flatnonzero(pcptracknumber)
+            tn_c = cloudtracknumber[pix_c]
+            tn_p = pcptracknumber[pix_p]
+            itracks = tracknumbers[idx_mcs]
+
+            # Put stats values onto the map with track number lookup tables
+            add_to_map(map_ccsarea, pix_c, tn_c, make_lut(nlut, itracks, ccs_area.values[idx_mcs, idx_time]))
+            add_to_map(map_pfarea, pix_p, tn_p, make_lut(nlut, itracks, pf_area.values[idx_mcs, idx_time]))
+            # Assign single PF value to the entire PF mask
+            # This is to increase area for certain extreme statistics (e.g. max rain rate)
+            # to make results less noisy. Absolute location wise this is just an approximation.
+            add_to_map(map_totalrain, pix_p, tn_p, make_lut(nlut, itracks, total_rain.values[idx_mcs, idx_time]))
+            add_to_map(map_totalrainheavy, pix_p, tn_p, make_lut(nlut, itracks, total_heavyrain.values[idx_mcs, idx_time]))
+            add_to_map(map_rainrateheavy, pix_p, tn_p, make_lut(nlut, itracks, rainrate_heavyrain.values[idx_mcs, idx_time]))
+            # Max rain rate from all PFs
+            add_to_map(map_rainratemax, pix_p, tn_p, make_lut(nlut, itracks, np.nanmax(pf_maxrainrate.values[idx_mcs, idx_time, :], axis=1)))
+            # Use PF mask as proxy location to map core values
+            if speed_exist:
+                ispeed = speed.values[idx_mcs, idx_time]
+                iuspeed = uspeed.values[idx_mcs, idx_time]
+                ivspeed = vspeed.values[idx_mcs, idx_time]
+                add_to_map(map_pfspeed, pix_p, tn_p, make_lut(nlut, itracks, ispeed))
+                add_to_map(map_uspeed, pix_p, tn_p, make_lut(nlut, itracks, iuspeed))
+                add_to_map(map_vspeed, pix_p, tn_p, make_lut(nlut, itracks, ivspeed))
                 # Keep speed if MCS status is met
-                if (speed_exist == True) & (imcsstatus == 1):
-                    temp_map_pfspeed_mcs = np.copy(map_pfspeed_mcs)
-                    temp_map_uspeed_mcs = np.copy(map_uspeed_mcs)
-                    temp_map_vspeed_mcs = np.copy(map_vspeed_mcs)
-                    map_pfspeed_mcs[:,:] = np.nansum(np.dstack((temp_map_pfspeed_mcs, temp_pfspeed)), axis=2)
-                    map_uspeed_mcs[:,:] = np.nansum(np.dstack((temp_map_uspeed_mcs, temp_uspeed)), axis=2)
-                    map_vspeed_mcs[:,:] = np.nansum(np.dstack((temp_map_vspeed_mcs, temp_vspeed)), axis=2)
-                    map_nhour_speedmcs[idx_p] += 1
-                        
-                # Make a temporary copy of the output array
-                temp_map_ccsarea = np.copy(map_ccsarea)
-                temp_map_pfarea = np.copy(map_pfarea)
-                temp_map_totalrain = np.copy(map_totalrain)
-                temp_map_totalrainheavy = np.copy(map_totalrainheavy)
-                temp_map_rainrateheavy = np.copy(map_rainrateheavy)
-                temp_map_rainratemax = np.copy(map_rainratemax)
-
-                # Stack two arrays and use nansum, then save it back to output array
-                map_ccsarea[:,:] = np.nansum(np.dstack((temp_map_ccsarea, temp_c)), axis=2)
-                map_pfarea[:,:] = np.nansum(np.dstack((temp_map_pfarea, temp_p)), axis=2)
-
-                map_totalrain[:,:] = np.nansum(np.dstack((temp_map_totalrain, temp_totalrain)), axis=2)
-                map_totalrainheavy[:,:] = np.nansum(np.dstack((temp_map_totalrainheavy, temp_totalrainheavy)), axis=2)
-                map_rainrateheavy[:,:] = np.nansum(np.dstack((temp_map_rainrateheavy, temp_rainrateheavy)), axis=2)
-                map_rainratemax[:,:] = np.nansum(np.dstack((temp_map_rainratemax, temp_rainratemax)), axis=2)
-                
-                if speed_exist:
-                    temp_map_pfspeed = np.copy(map_pfspeed)
-                    temp_map_uspeed = np.copy(map_uspeed)
-                    temp_map_vspeed = np.copy(map_vspeed)
-                    map_pfspeed[:,:] = np.nansum(np.dstack((temp_map_pfspeed, temp_pfspeed)), axis=2)
-                    map_uspeed[:,:] = np.nansum(np.dstack((temp_map_uspeed, temp_uspeed)), axis=2)
-                    map_vspeed[:,:] = np.nansum(np.dstack((temp_map_vspeed, temp_vspeed)), axis=2)
-
-                map_nhour_ccs[idx_c] += 1
-                map_nhour_pf[idx_p] += 1
-                
-                # Set all pixels to the track number, this is a mask for the entire duration of the MCS
-                temp_track[idx_c] = itrack
-                temp_nmcs_ccs[idx_c] = 1
-                temp_nmcs_pf[idx_p] = 1
-
-                nframes+=1
-                
-                ds.close()
-            else:
+                ismcs = mcs_status.values[idx_mcs, idx_time] == 1
+                add_to_map(map_pfspeed_mcs, pix_p, tn_p, make_lut(nlut, itracks[ismcs], ispeed[ismcs]))
+                add_to_map(map_uspeed_mcs, pix_p, tn_p, make_lut(nlut, itracks[ismcs], iuspeed[ismcs]))
+                add_to_map(map_vspeed_mcs, pix_p, tn_p, make_lut(nlut, itracks[ismcs], ivspeed[ismcs]))
+                add_to_map(map_nhour_speedmcs, pix_p, tn_p, make_lut(nlut, itracks[ismcs], np.ones(np.count_nonzero(ismcs))))
+
+            # If MCS start status is not a split, check for initiation/genesis at time step 0
+            isinit = np.isnan(start_split_cloudnumber.values[idx_mcs]) & (idx_time == 0)
+            add_to_map(map_init_ccs, pix_c, tn_c, make_lut(nlut, itracks[isinit], np.ones(np.count_nonzero(isinit))))
+
+            # Count the number of hours
+            ones = np.ones(len(itracks))
+            add_to_map(map_nhour_ccs, pix_c, tn_c, make_lut(nlut, itracks, ones))
+            add_to_map(map_nhour_pf, pix_p, tn_p, make_lut(nlut, itracks, ones))
+
+            # Keep the pixels of each track, this is a mask for the entire duration of the MCS
+            for imcs, ipix_c, ipix_p in zip(idx_mcs, split_pixels_by_track(pix_c, tn_c, tracknumbers[idx_mcs]),
+                                            split_pixels_by_track(pix_p, tn_p, tracknumbers[idx_mcs])):
+                track_pix_c.setdefault(imcs, []).append(ipix_c)
+                track_pix_p.setdefault(imcs, []).append(ipix_p)
+
+            nframes += len(idx_mcs)
+        else:
+            for imcs, it in zip(idx_mcs, idx_time):
                 print(f'No pixel-file found: {base_times[imcs, it]}')
 
-        # Set the entire track map to a single value
-        # This is suitable for mapping single value variables such as lifetime
-        temp_track[np.where(temp_track == itrack)] = ilifetime
-        
-        # Save value to output map
-        map_lifetime_all[imcs,:,:] = temp_track[:,:]
-        # Add the count for the number of MCS 
-        map_nmcs_ccs[:,:] += temp_nmcs_ccs[:,:]
-        map_nmcs_pf[:,:] += temp_nmcs_pf[:,:]
+        # Map tracks that end at this time
+        for imcs in frame_end_tracks.get(iTimestamp, []):
+            if imcs not in track_pix_c:
+                continue
+            print(f'Track number: {tracknumbers[imcs]}')
+            pix_c = np.unique(np.concatenate(track_pix_c.pop(imcs)))
+            pix_p = np.unique(np.concatenate(track_pix_p.pop(imcs)))
+            # Count the lifetime for the entire track map
+            # This is suitable for mapping single value variables such as lifetime
+            if ~np.isnan(lifetime.values[imcs]):
+                lifetime_new_keys.append(pix_c * nlifetime + lifetime_index[imcs])
+                nlifetime_new_keys += len(pix_c)
+                # Merge new keys into the count table to keep memory bounded
+                if nlifetime_new_keys > ny * nx:
+                    lifetime_keys, lifetime_counts = add_counts_to_table(lifetime_keys, lifetime_counts, lifetime_new_keys)
+                    lifetime_new_keys = []
+                    nlifetime_new_keys = 0
+            # Add the count for the number of MCS
+            map_nmcs_ccs.reshape(-1)[pix_c] += 1
+            map_nmcs_pf.reshape(-1)[pix_p] += 1
+
+    lifetime_keys, lifetime_counts = add_counts_to_table(lifetime_keys, lifetime_counts, lifetime_new_keys)
 
     percentiles = [50,75,90,95]
-    map_lifetime_pts = np.nanpercentile(map_lifetime_all, percentiles, axis=0)
+    map_lifetime_pts = calc_percentiles_from_counts(lifetime_keys, lifetime_counts, lifetime_values, ny * nx, percentiles)
+    map_lifetime_pts = np.reshape(map_lifetime_pts, (len(percentiles), ny, nx))
 
     # Calculate conditional mean (divide sum by total number of hours at each pixel)
     map_ccsarea_avg = map_ccsarea / map_nhour_ccs
@@ -343,7 +521,8 @@ if __name__ == "__main__":
     map_vspeed_avg = map_vspeed / map_nhour_pf
     map_vspeed_mcs_avg = map_vspeed_mcs / map_nhour_speedmcs
 
-    map_lifetime_avg = np.nanmean(map_lifetime_all, axis=0)
+    map_lifetime_avg = calc_mean_from_counts(lifetime_keys, lifetime_counts, lifetime_values, ny * nx)
+    map_lifetime_avg = np.reshape(map_lifetime_avg, (ny, nx))
 
 
     # Compute Epoch Time for the month
@@ -11,6 +11,10 @@ Optional arguments:
 --figbasename figure base name (output figure base name)
 --trackstats_file MCS track stats file name (optional, if different from robust MCS track stats file)
 --pixel_path Pixel-level tracknumber mask files directory (optional, if different from robust MCS pixel files)
+--tracknumber track number to plot (optional, only reads the track bounding box of the files containing the track,
+    requires the per-track index file written by mapfeature with pixel_track_index: 1)
+--index_file per-track index file name (optional, if different from the default index file name)
+--pad number of grid points around the track bounding box to plot (default 20)
 
 Zhe Feng, PNNL
 contact: Zhe.Feng@pnnl.gov
@@ -19,6 +23,7 @@ contact: Zhe.Feng@pnnl.gov
 import argparse
 import numpy as np
 import os
+import sys
 import xarray as xr
 import pandas as pd
 from scipy.ndimage import binary_erosion
@@ -38,6 +43,7 @@ from dask.distributed import Client, LocalCluster
 import warnings
 warnings.filterwarnings("ignore")
 from pyflextrkr.ft_utilities import load_config, subset_files_timerange
+from pyflextrkr.mapfeature_func import read_track_pixels
 
 #-----------------------------------------------------------------------
 def parse_cmd_args():
@@ -57,6 +63,9 @@ def parse_cmd_args():
     parser.add_argument("--figbasename", help="output figure base name", default="")
     parser.add_argument("--trackstats_file", help="MCS track stats file name", default=None)
     parser.add_argument("--pixel_path", help="Pixel-level tracknumer mask files directory", default=None)
+    parser.add_argument("--tracknumber", help="track number to plot (uses the per-track index)", type=int, default=None)
+    parser.add_argument("--index_file", help="per-track index file name", default=None)
+    parser.add_argument("--pad", help="number of grid points around the track bounding box", type=int, default=20)
     args = parser.parse_args()
 
     # Put arguments in a dictionary
@@ -73,6 +82,9 @@ def parse_cmd_args():
         'figbasename': args.figbasename,
         'trackstats_file': args.trackstats_file,
         'pixeltracking_path': args.pixel_path,
+        'tracknumber': args.tracknumber,
+        'index_file': args.index_file,
+        'pad': args.pad,
     }
 
     return args_dict
@@ -519,6 +531,79 @@ def work_for_time_loop(datafile, track_dict, map_info, plot_info, config):
     ds.close()
     return 1
 
+#-----------------------------------------------------------------------
+def work_for_track_time(track_pixel, track_dict, map_info, plot_info, config):
+    """
+    Work with the bounding box of a track in a pixel-level file.
+
+    Args:
+        track_pixel: dictionary
+            Track pixel data in the bounding box at one time (see read_track_pixels).
+        track_dict: dictionary
+            Dictionary containing tracking data variables.
+        map_info: dictionary
+            Dictionary containing map boundary info.
+        plot_info: dictionary
+            Dictionary containing plotting setup variables.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        1: success.
+    """
+    figdir = plot_info.get('figdir')
+    figbasename = plot_info.get('figbasename')
+    plot_info = dict(plot_info)
+    map_info = dict(map_info)
+
+    lon_sub = xr.DataArray(track_pixel['longitude'])
+    lat_sub = xr.DataArray(track_pixel['latitude'])
+    # Get map extent from the track bounding box
+    if map_info.get('map_extent', None) is None:
+        map_info['map_extent'] = [lon_sub.min().item(), lon_sub.max().item(), lat_sub.min().item(), lat_sub.max().item()]
+
+    # Make dilation structure (larger values make thicker outlines)
+    perim_thick = 6
+    dilationstructure = np.zeros((perim_thick+1,perim_thick+1), dtype=int)
+    dilationstructure[1:perim_thick, 1:perim_thick] = 1
+
+    # Tracknumber color levels for MCS masks (limit to 256 to fit in a colormap)
+    tracknumbers = track_dict['lifetime'].tracks
+    tn_nlev = np.min([len(tracknumbers), 256])
+    tn_levels = np.linspace(np.min(tracknumbers)+1, np.max(tracknumbers)+1, tn_nlev)
+    plot_info['levels'] = dict(plot_info['levels'], tn_levels=tn_levels)
+
+    # Track numbers are integers in the bounding box, set no track to NaN
+    tracknumber = track_pixel['cloudtracknumber'].astype(float)
+    tracknumber[tracknumber <= 0] = np.nan
+    tracknumber_sub = xr.DataArray(tracknumber)
+    # Get object perimeters
+    tn_perim = label_perimeter(tracknumber_sub.data, dilationstructure)
+
+    # Plotting variables
+    pixel_time = pd.to_datetime(track_pixel['base_time'], unit='s')
+    pixel_bt = np.array([pixel_time], dtype='datetime64[ns]')
+    fdatetime = pixel_time.strftime('%Y%m%d_%H%M%S')
+    timestr = pixel_time.strftime('%Y-%m-%d %H:%M:%S UTC')
+    figname = f'{figdir}{figbasename}{fdatetime}.png'
+
+    # Put pixel data in a dictionary
+    pixel_dict = {
+        'lon': lon_sub,
+        'lat': lat_sub,
+        'tb': xr.DataArray(track_pixel['tb']),
+        'pcp': xr.DataArray(track_pixel['precipitation']),
+        'tracknumber': tracknumber_sub,
+        'tracknumber_perim': tn_perim,
+        'pixel_bt': pixel_bt,
+    }
+    plot_info['timestr'] = timestr
+    plot_info['figname'] = figname
+
+    fig = plot_map_2panels(pixel_dict, plot_info, map_info, track_dict)
+    plt.close(fig)
+    print(figname)
+    return 1
 
 
 if __name__ == "__main__":
@@ -537,6 +622,9 @@ if __name__ == "__main__":
     figbasename = args_dict.get('figbasename')
     trackstats_file = args_dict.get('trackstats_file')
     pixeltracking_path = args_dict.get('pixeltracking_path')
+    tracknumber = args_dict.get('tracknumber')
+    index_file = args_dict.get('index_file')
+    pad = args_dict.get('pad')
 
     # Specify plotting info
     # Precipitation color levels
@@ -627,28 +715,53 @@ if __name__ == "__main__":
     TimeDelta = pd.Timedelta(days=4)
     start_datetime_4stats = (pd.to_datetime(start_datetime) - TimeDelta).strftime('%Y-%m-%dT%H')
 
-    # Find all pixel-level files that match the input datetime
-    datafiles, \
-    datafiles_basetime, \
-    datafiles_datestring, \
-    datafiles_timestring = subset_files_timerange(
-        pixeltracking_path,
-        pixeltracking_filebase,
-        start_basetime,
-        end_basetime,
-        time_format="yyyymodd_hhmmss",
-    )
-    print(f'Number of pixel files: {len(datafiles)}')
+    if tracknumber is None:
+        # Find all pixel-level files that match the input datetime
+        datafiles, \
+        datafiles_basetime, \
+        datafiles_datestring, \
+        datafiles_timestring = subset_files_timerange(
+            pixeltracking_path,
+            pixeltracking_filebase,
+            start_basetime,
+            end_basetime,
+            time_format="yyyymodd_hhmmss",
+        )
+        print(f'Number of pixel files: {len(datafiles)}')
+        work_func = work_for_time_loop
+        work_list = datafiles
+        work_names = datafiles
+    else:
+        # Read only the bounding box of the track in the pixel-level files containing the track
+        if index_file is None:
+            index_file = f"{stats_path}{config['pixel_track_index_filebase']}{pixeltracking_filebase}{startdate}_{enddate}.nc"
+        if not os.path.isfile(index_file):
+            sys.exit(f'Per-track index file not found: {index_file}\n'
+                     f'Run mapfeature with pixel_track_index: 1 to write the index file.')
+        track_pixels = read_track_pixels(
+            index_file,
+            tracknumber,
+            varnames=['tb', 'precipitation', 'cloudtracknumber', 'longitude', 'latitude'],
+            pixel_path=pixeltracking_path,
+            pad=pad,
+        )
+        # Keep the track times within the input datetime
+        track_pixels = [track_pixel for track_pixel in track_pixels
+                        if (track_pixel['base_time'] >= start_basetime) & (track_pixel['base_time'] <= end_basetime)]
+        print(f'Number of pixel files with track {tracknumber}: {len(track_pixels)}')
+        work_func = work_for_track_time
+        work_list = track_pixels
+        work_names = [track_pixel['filename'] for track_pixel in track_pixels]
 
     # Get track stats data
     track_dict = get_track_stats(trackstats_file, start_datetime_4stats, end_datetime, dt_thres)
 
     # Serial option
     if run_parallel == 0:
-        for ifile in range(len(datafiles)):
-            print(datafiles[ifile])
-            result = work_for_time_loop(
-                datafiles[ifile], track_dict, map_info, plot_info, config,
+        for ifile in range(len(work_list)):
+            print(work_names[ifile])
+            result = work_func(
+                work_list[ifile], track_dict, map_info, plot_info, config,
             )
 
     # Parallel option
@@ -660,10 +773,10 @@ if __name__ == "__main__":
         cluster = LocalCluster(n_workers=n_workers, threads_per_worker=1)
         client = Client(cluster)
         results = []
-        for ifile in range(len(datafiles)):
-            print(datafiles[ifile])
-            result = dask.delayed(work_for_time_loop)(
-                datafiles[ifile], track_dict, map_info, plot_info, config,
+        for ifile in range(len(work_list)):
+            print(work_names[ifile])
+            result = dask.delayed(work_func)(
+                work_list[ifile], track_dict, map_info, plot_info, config,
             )
             results.append(result)
 
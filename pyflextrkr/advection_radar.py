@@ -8,6 +8,7 @@ from scipy import ndimage as ndi
 import logging
 import dask
 from pyflextrkr.ft_utilities import subset_files_timerange
+from pyflextrkr.ft_profiling import profile_step
 
 
 def offset_to_speed(x, y, time_lag, dx, dy):
@@ -119,9 +120,13 @@ def movement_of_storm_fft(
 
             num_points = np.sum(mask > 0)
             # Updated to use phase_cross_correlation to replace masked_register_translation
-            y, x = -1 * phase_cross_correlation(
+            shifts = phase_cross_correlation(
                 field_1, field_2, reference_mask=mask_1, moving_mask=mask_2, overlap_ratio=0.7
             )
+            # Newer scikit-image versions also return the error and phase difference
+            if isinstance(shifts, tuple):
+                shifts = shifts[0]
+            y, x = -1 * shifts
 
             if plot_subplots:
                 plt.figure(figsize=(10, 5))
@@ -184,6 +189,7 @@ def movement_of_storm_fft_l(
     return y1, x1
 
 
+@profile_step
 def calc_mean_advection(config):
     """
     Calculate domain mean advection.
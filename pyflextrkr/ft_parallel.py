@@ -0,0 +1,245 @@
+import sys
+import math
+import time
+import logging
+import dask
+from dask.distributed import get_client, as_completed
+from pyflextrkr.ft_profiling import profiling_enabled, profile_task, add_timeline_records
+
+def get_dask_client():
+    """
+    Get the Dask distributed client created by the run script.
+
+    Args:
+        None.
+
+    Returns:
+        client: dask.distributed.Client
+            Active client, None if no client has been created in this process.
+    """
+    try:
+        client = get_client()
+    except ValueError:
+        client = None
+    return client
+
+def get_task_chunks(ntasks, config, nworkers=1):
+    """
+    Split task indices into chunks that are submitted to the scheduler as single tasks.
+
+    Args:
+        ntasks: int
+            Number of tasks (usually number of files).
+        config: dictionary
+            Dictionary containing config parameters.
+            Uses config["task_chunksize"] if provided, otherwise the chunk size is set
+            to give about 4 chunks per worker.
+        nworkers: int, default=1
+            Number of workers (threads) available.
+
+    Returns:
+        chunks: list
+            List of range objects, each containing the task indices of a chunk.
+    """
+    chunksize = config.get("task_chunksize", None)
+    if (chunksize is None) or (chunksize <= 0):
+        chunksize = max(1, math.ceil(ntasks / (4 * max(nworkers, 1))))
+    chunksize = int(chunksize)
+    chunks = [range(istart, min(istart + chunksize, ntasks)) for istart in range(0, ntasks, chunksize)]
+    return chunks
+
+def run_task_chunk(func, args_chunk, kwargs_chunk, config, task_indices=None, task_name=None):
+    """
+    Run a task function over a chunk of inputs on a worker.
+
+    Args:
+        func: function
+            Task function, called as func(*args, config, **kwargs).
+        args_chunk: list
+            List of positional argument tuples, one per task.
+        kwargs_chunk: list
+            List of keyword argument dictionaries, one per task.
+        config: dictionary
+            Dictionary containing config parameters.
+        task_indices: list, default=None
+            Task index of each input, used in the profiling records.
+        task_name: string, default=None
+            Step name used in the profiling records.
+
+    Returns:
+        results: list
+            Task function return values in input order.
+        compute_time: float
+            Time [second] spent inside the task function for the chunk.
+        records: list
+            Resource usage record of each task, empty if profiling is not enabled.
+    """
+    if task_indices is None:
+        task_indices = list(range(len(args_chunk)))
+    profile = profiling_enabled(config)
+    t0 = time.perf_counter()
+    results = []
+    records = []
+    for itask, args, kwargs in zip(task_indices, args_chunk, kwargs_chunk):
+        if profile:
+            result, record = profile_task(func, args, kwargs, config, task_name, itask)
+            records.append(record)
+        else:
+            result = func(*args, config, **kwargs)
+        results.append(result)
+    compute_time = time.perf_counter() - t0
+    return results, compute_time, records
+
+def iter_tasks(func, args_list, config, kwargs_list=None, task_name=None):
+    """
+    Run a per-file task function over a list of inputs, yielding results as they complete.
+
+    In parallel mode the inputs are grouped into chunks (config["task_chunksize"]),
+    one scheduler task is submitted per chunk, and config is scattered to the workers once
+    instead of being serialized with every task. At most config["task_max_inflight"] chunks
+    (default: 2 per worker) are submitted at a time, so only the results of those chunks
+    are held in memory until they are consumed.
+
+    Args:
+        func: function
+            Task function, called as func(*args, config, **kwargs).
+        args_list: list
+            List of positional argument tuples, one per task.
+        config: dictionary
+            Dictionary containing config parameters.
+        kwargs_list: list, default=None
+            List of keyword argument dictionaries, one per task.
+        task_name: string, default=None
+            Name used in log messages. Defaults to the task function name.
+
+    Yields:
+        itask: int
+            Index of the task in args_list.
+        result:
+            Task function return value.
+    """
+    logger = logging.getLogger(__name__)
+    run_parallel = config["run_parallel"]
+    ntasks = len(args_list)
+    if kwargs_list is None:
+        kwargs_list = [{}] * ntasks
+    if task_name is None:
+        task_name = func.__name__
+
+    t0 = time.perf_counter()
+    compute_time = 0.
+    # Serial
+    if run_parallel == 0:
+        nworkers = 1
+        nchunks = 1
+        for itask in range(0, ntasks):
+            iresults, itime, irecords = run_task_chunk(
+                func, [args_list[itask]], [kwargs_list[itask]], config,
+                task_indices=[itask], task_name=task_name,
+            )
+            compute_time += itime
+            add_timeline_records(irecords)
+            yield itask, iresults[0]
+    # Parallel
+    elif run_parallel >= 1:
+        client = get_dask_client()
+        if client is not None:
+            nworkers = max(sum(client.nthreads().values()), 1)
+        else:
+            nworkers = 1
+        chunks = get_task_chunks(ntasks, config, nworkers=nworkers)
+        nchunks = len(chunks)
+
+        if client is not None:
+            max_inflight = config.get("task_max_inflight", None)
+            if (max_inflight is None) or (max_inflight <= 0):
+                max_inflight = 2 * nworkers
+            # Send config to all workers once
+            config_future = client.scatter([config], broadcast=True, hash=False)[0]
+
+            def submit_chunk(ichunk):
+                future = client.submit(
+                    run_task_chunk,
+                    func,
+                    [args_list[ii] for ii in chunks[ichunk]],
+                    [kwargs_list[ii] for ii in chunks[ichunk]],
+                    config_future,
+                    task_indices=list(chunks[ichunk]),
+                    task_name=task_name,
+                    pure=False,
+                )
+                chunk_index[future] = ichunk
+                return future
+
+            # Submit the first chunks, then one more each time a chunk completes
+            chunk_index = {}
+            nsubmit = min(int(max_inflight), nchunks)
+            seq = as_completed([submit_chunk(ichunk) for ichunk in range(0, nsubmit)])
+            for future in seq:
+                ichunk = chunk_index.pop(future)
+                iresults, itime, irecords = future.result()
+                future.release()
+                add_timeline_records(irecords)
+                if nsubmit < nchunks:
+                    seq.add(submit_chunk(nsubmit))
+                    nsubmit += 1
+                compute_time += itime
+                for itask, result in zip(chunks[ichunk], iresults):
+                    yield itask, result
+            del config_future
+        else:
+            # No distributed client, fall back to the default Dask scheduler
+            chunk_results = dask.compute(*[
+                dask.delayed(run_task_chunk)(
+                    func,
+                    [args_list[ii] for ii in ichunk],
+                    [kwargs_list[ii] for ii in ichunk],
+                    config,
+                    task_indices=list(ichunk),
+                    task_name=task_name,
+                ) for ichunk in chunks
+            ])
+            for ichunk, (iresults, itime, irecords) in zip(chunks, chunk_results):
+                compute_time += itime
+                add_timeline_records(irecords)
+                for itask, result in zip(ichunk, iresults):
+                    yield itask, result
+    else:
+        sys.exit('Valid parallelization flag not provided.')
+
+    # Report time spent in the task functions versus scheduling/communication
+    wall_time = time.perf_counter() - t0
+    nactive = min(nworkers, nchunks)
+    overhead_time = max(wall_time - compute_time / max(nactive, 1), 0.)
+    logger.info(
+        f"{task_name}: {ntasks} tasks in {nchunks} chunks on {nworkers} workers, "
+        f"wall time: {wall_time:.1f}s, task compute time: {compute_time:.1f}s, "
+        f"scheduler overhead: {overhead_time:.1f}s"
+    )
+
+def run_tasks(func, args_list, config, kwargs_list=None, task_name=None):
+    """
+    Run a per-file task function over a list of inputs, in serial or in parallel.
+
+    See iter_tasks for the parallel options.
+
+    Args:
+        func: function
+            Task function, called as func(*args, config, **kwargs).
+        args_list: list
+            List of positional argument tuples, one per task.
+        config: dictionary
+            Dictionary containing config parameters.
+        kwargs_list: list, default=None
+            List of keyword argument dictionaries, one per task.
+        task_name: string, default=None
+            Name used in log messages. Defaults to the task function name.
+
+    Returns:
+        results: list
+            Task function return values in input order.
+    """
+    results = [None] * len(args_list)
+    for itask, result in iter_tasks(func, args_list, config, kwargs_list=kwargs_list, task_name=task_name):
+        results[itask] = result
+    return results
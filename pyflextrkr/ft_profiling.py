@@ -0,0 +1,326 @@
+import os
+import csv
+import json
+import time
+import socket
+import logging
+import resource
+import functools
+import threading
+
+# Records collected in this process (driver steps and per-file tasks)
+_timeline_records = []
+# Peak RSS observed by each active step, updated when the peak is reset by a task
+_active_step_peaks = {}
+_profiling_lock = threading.Lock()
+
+timeline_fields = [
+    "record_type",
+    "step",
+    "task_index",
+    "task_label",
+    "host",
+    "pid",
+    "start_time",
+    "wall_time",
+    "cpu_time",
+    "peak_rss_mb",
+    "read_mb",
+    "write_mb",
+]
+
+def profiling_enabled(config):
+    """
+    Check if performance profiling is turned on in the config.
+
+    Args:
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        enabled: bool
+            True if config["profile_timeline"] is set.
+    """
+    return bool(config.get("profile_timeline", False))
+
+def get_io_bytes():
+    """
+    Get bytes read and written by this process.
+
+    Uses rchar/wchar from /proc/self/io (Linux), which count all bytes passed
+    through read/write system calls, including reads served from the page cache.
+
+    Args:
+        None.
+
+    Returns:
+        read_bytes: int
+            Bytes read, None if not available.
+        write_bytes: int
+            Bytes written, None if not available.
+    """
+    read_bytes = None
+    write_bytes = None
+    try:
+        with open("/proc/self/io", "r") as fio:
+            for line in fio:
+                key, value = line.split(":")
+                if key == "rchar":
+                    read_bytes = int(value)
+                elif key == "wchar":
+                    write_bytes = int(value)
+    except (OSError, ValueError):
+        pass
+    return read_bytes, write_bytes
+
+def get_peak_rss():
+    """
+    Get peak resident set size of this process [MB].
+
+    Uses VmHWM from /proc/self/status (Linux), which can be reset by reset_peak_rss.
+    Falls back to resource.getrusage (lifetime peak) on other systems.
+
+    Args:
+        None.
+
+    Returns:
+        peak_rss: float
+            Peak resident set size [MB].
+    """
+    try:
+        with open("/proc/self/status", "r") as fstatus:
+            for line in fstatus:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.
+    except (OSError, ValueError, IndexError):
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+def reset_peak_rss():
+    """
+    Reset the peak resident set size of this process to the current value.
+
+    The peak before the reset is saved for the steps that are running, so that
+    their peak still includes it. Does nothing if the reset is not supported.
+
+    Args:
+        None.
+
+    Returns:
+        None.
+    """
+    with _profiling_lock:
+        peak_rss = get_peak_rss()
+        for key in _active_step_peaks:
+            _active_step_peaks[key] = max(_active_step_peaks[key], peak_rss)
+        try:
+            with open("/proc/self/clear_refs", "w") as fclear:
+                fclear.write("5")
+        except OSError:
+            pass
+
+def start_measure():
+    """
+    Get the starting point of a measurement.
+
+    Args:
+        None.
+
+    Returns:
+        start: dictionary
+            Wall time, CPU time and bytes read/written at the start.
+    """
+    read_bytes, write_bytes = get_io_bytes()
+    start = {
+        "start_time": time.time(),
+        "wall": time.perf_counter(),
+        "cpu": time.process_time(),
+        "read_bytes": read_bytes,
+        "write_bytes": write_bytes,
+    }
+    return start
+
+def stop_measure(start, peak_rss):
+    """
+    Get the resource usage since the start of a measurement.
+
+    Args:
+        start: dictionary
+            Returned from start_measure.
+        peak_rss: float
+            Peak resident set size [MB] during the measurement.
+
+    Returns:
+        record: dictionary
+            Resource usage record.
+    """
+    read_bytes, write_bytes = get_io_bytes()
+    if (read_bytes is not None) and (start["read_bytes"] is not None):
+        read_mb = (read_bytes - start["read_bytes"]) / 1024. ** 2
+        write_mb = (write_bytes - start["write_bytes"]) / 1024. ** 2
+    else:
+        read_mb = None
+        write_mb = None
+    record = {
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "start_time": start["start_time"],
+        "wall_time": time.perf_counter() - start["wall"],
+        "cpu_time": time.process_time() - start["cpu"],
+        "peak_rss_mb": peak_rss,
+        "read_mb": read_mb,
+        "write_mb": write_mb,
+    }
+    return record
+
+def get_task_label(args):
+    """
+    Get a short label (usually the input file name) for a task from its arguments.
+
+    Args:
+        args: tuple
+            Positional arguments of the task.
+
+    Returns:
+        label: string
+            Task label.
+    """
+    if len(args) == 0:
+        return ""
+    arg0 = args[0]
+    if isinstance(arg0, str):
+        return os.path.basename(arg0)
+    if isinstance(arg0, (tuple, list)) and all(isinstance(iarg, str) for iarg in arg0):
+        return ",".join([os.path.basename(iarg) for iarg in arg0])
+    return ""
+
+def profile_task(func, args, kwargs, config, step_name, task_index):
+    """
+    Run a task function and measure its resource usage.
+
+    The peak RSS is reset before the task, so it is the peak of the task if the worker
+    runs one task at a time (e.g., LocalCluster with threads_per_worker=1).
+    CPU time and bytes read/written are for the whole worker process.
+
+    Args:
+        func: function
+            Task function, called as func(*args, config, **kwargs).
+        args: tuple
+            Positional arguments of the task.
+        kwargs: dictionary
+            Keyword arguments of the task.
+        config: dictionary
+            Dictionary containing config parameters.
+        step_name: string
+            Name of the step the task belongs to.
+        task_index: int
+            Index of the task in the step.
+
+    Returns:
+        result:
+            Task function return value.
+        record: dictionary
+            Resource usage record of the task.
+    """
+    reset_peak_rss()
+    start = start_measure()
+    result = func(*args, config, **kwargs)
+    record = stop_measure(start, get_peak_rss())
+    record["record_type"] = "task"
+    record["step"] = step_name
+    record["task_index"] = task_index
+    record["task_label"] = get_task_label(args)
+    return result, record
+
+def add_timeline_records(records):
+    """
+    Add records to the timeline of this process.
+
+    Args:
+        records: list
+            List of resource usage records.
+
+    Returns:
+        None.
+    """
+    with _profiling_lock:
+        _timeline_records.extend(records)
+
+def write_timeline(config):
+    """
+    Write the timeline records to JSON and CSV files in the stats output directory.
+
+    Args:
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        timeline_outfile: string
+            Timeline JSON file name.
+    """
+    logger = logging.getLogger(__name__)
+    stats_path = config["stats_outpath"]
+    timeline_filebase = config.get("timeline_filebase", "timeline_")
+    timeline_outfile = f"{stats_path}{timeline_filebase}{config['startdate']}_{config['enddate']}.json"
+    timeline_csvfile = f"{stats_path}{timeline_filebase}{config['startdate']}_{config['enddate']}.csv"
+    os.makedirs(stats_path, exist_ok=True)
+
+    with _profiling_lock:
+        records = list(_timeline_records)
+    with open(timeline_outfile, "w") as fjson:
+        json.dump(records, fjson, indent=1)
+    with open(timeline_csvfile, "w", newline="") as fcsv:
+        writer = csv.DictWriter(fcsv, fieldnames=timeline_fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(records)
+    logger.debug(f"{timeline_outfile}")
+    return timeline_outfile
+
+def profile_step(func):
+    """
+    Decorator to record resource usage of a driver step.
+
+    The decorated function must take config as the first argument. Nothing is recorded
+    unless config["profile_timeline"] is set. The step record is measured in the process
+    running the driver; per-file tasks are recorded separately by the task runner.
+    The timeline files are rewritten after each step.
+
+    Args:
+        func: function
+            Driver function, called as func(config, *args, **kwargs).
+
+    Returns:
+        wrapper: function
+            Wrapped driver function.
+    """
+    @functools.wraps(func)
+    def wrapper(config, *args, **kwargs):
+        if not profiling_enabled(config):
+            return func(config, *args, **kwargs)
+
+        logger = logging.getLogger(__name__)
+        step_key = object()
+        reset_peak_rss()
+        with _profiling_lock:
+            _active_step_peaks[step_key] = 0.
+        start = start_measure()
+        try:
+            result = func(config, *args, **kwargs)
+        finally:
+            peak_rss = get_peak_rss()
+            with _profiling_lock:
+                peak_rss = max(peak_rss, _active_step_peaks.pop(step_key))
+            record = stop_measure(start, peak_rss)
+            record["record_type"] = "step"
+            record["step"] = func.__name__
+            record["task_index"] = None
+            record["task_label"] = ""
+            add_timeline_records([record])
+            write_timeline(config)
+            logger.info(
+                f"{func.__name__}: wall time: {record['wall_time']:.1f}s, "
+                f"CPU time: {record['cpu_time']:.1f}s, peak RSS: {record['peak_rss_mb']:.1f}MB"
+            )
+        return result
+    return wrapper
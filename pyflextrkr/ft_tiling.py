@@ -0,0 +1,318 @@
+import numpy as np
+import xarray as xr
+from concurrent.futures import ThreadPoolExecutor
+from scipy import ndimage, sparse
+from scipy.sparse import csgraph
+
+def get_tile_slices(shape, tile_size):
+    """
+    Split a 2D domain into tiles.
+
+    Args:
+        shape: tuple
+            Domain shape (ny, nx).
+        tile_size: int or list
+            Tile size [ny, nx] in number of grid points, or one value for both dimensions.
+
+    Returns:
+        tiles: list
+            List of (slice_y, slice_x) tuples for each tile, in row-major order.
+    """
+    ny, nx = shape
+    tile_ny, tile_nx = np.broadcast_to(np.asarray(tile_size, dtype=int), (2,))
+    tile_ny = max(int(tile_ny), 1)
+    tile_nx = max(int(tile_nx), 1)
+    tiles = [
+        (slice(iy, min(iy + tile_ny, ny)), slice(ix, min(ix + tile_nx, nx)))
+        for iy in range(0, ny, tile_ny)
+        for ix in range(0, nx, tile_nx)
+    ]
+    return tiles
+
+def label_tile(mask, label_number, slice_y, slice_x, structure):
+    """
+    Label one tile in place and find the first pixel of each tile label.
+
+    Args:
+        mask: np.array
+            2D array of the full domain, non-zero values are labeled.
+        label_number: np.array(int32)
+            2D label array of the full domain, the tile is labeled in place.
+        slice_y: slice
+            Tile slice in y.
+        slice_x: slice
+            Tile slice in x.
+        structure: np.array
+            3x3 connectivity structure, see scipy.ndimage.label.
+
+    Returns:
+        ntile: int
+            Number of labels in the tile.
+        first_index: np.array(int64)
+            Flat index in the full domain of the first pixel of each tile label.
+    """
+    tile_number = label_number[slice_y, slice_x]
+    ntile = ndimage.label(mask[slice_y, slice_x], structure=structure, output=tile_number)
+    # ndimage.label numbers labels in the order of their first pixel,
+    # so a label first appears where the running max of the labels increases
+    running_max = np.maximum.accumulate(tile_number.ravel())
+    tile_index = np.flatnonzero(running_max[1:] > running_max[:-1]) + 1
+    if running_max[0] > 0:
+        tile_index = np.concatenate([[0], tile_index])
+    tile_nx = slice_x.stop - slice_x.start
+    nx = label_number.shape[1]
+    first_index = (tile_index // tile_nx + slice_y.start) * nx + (tile_index % tile_nx + slice_x.start)
+    return ntile, first_index.astype(np.int64)
+
+def find_seam_pairs(label_number, tiles, offsets, structure):
+    """
+    Find pairs of labels connected across tile seams.
+
+    Each tile only sees the 1-pixel halo of its neighbors: the row above and the column
+    to the left of every seam are compared with the first row/column of the next tile.
+
+    Args:
+        label_number: np.array
+            2D label array, labels of each tile start from 1.
+        tiles: list
+            List of (slice_y, slice_x) tuples for each tile, in row-major order.
+        offsets: np.array
+            Label offset of each tile, to make labels unique across tiles.
+        structure: np.array
+            3x3 connectivity structure.
+
+    Returns:
+        pairs: np.array(int64)
+            Connected label pairs (with offsets), shape: [npairs, 2].
+    """
+    ny, nx = label_number.shape
+    starts_y = np.array(sorted(set([islice[0].start for islice in tiles])))
+    starts_x = np.array(sorted(set([islice[1].start for islice in tiles])))
+    # Label offset of each pixel along a row/column
+    tile_offsets = np.asarray(offsets, dtype=np.int64).reshape(len(starts_y), len(starts_x))
+    tile_iy = np.searchsorted(starts_y, np.arange(ny), side="right") - 1
+    tile_ix = np.searchsorted(starts_x, np.arange(nx), side="right") - 1
+    def get_row(iy):
+        row = label_number[iy, :].astype(np.int64)
+        return np.where(row > 0, row + tile_offsets[tile_iy[iy], tile_ix], 0)
+    def get_column(ix):
+        column = label_number[:, ix].astype(np.int64)
+        return np.where(column > 0, column + tile_offsets[tile_iy, tile_ix[ix]], 0)
+
+    pairs = [np.zeros((0, 2), dtype=np.int64)]
+    for iy in starts_y[1:]:
+        upper = get_row(iy - 1)
+        lower = get_row(iy)
+        for dx in (-1, 0, 1):
+            if not structure[0, 1 + dx]:
+                continue
+            # Pixel (iy, ix) connects to (iy - 1, ix + dx)
+            ix0, ix1 = max(0, -dx), min(nx, nx - dx)
+            ilower = lower[ix0:ix1]
+            iupper = upper[ix0 + dx:ix1 + dx]
+            valid = (ilower > 0) & (iupper > 0)
+            pairs.append(np.stack([ilower[valid], iupper[valid]], axis=1))
+    for ix in starts_x[1:]:
+        left = get_column(ix - 1)
+        right = get_column(ix)
+        for dy in (-1, 0, 1):
+            if not structure[1 + dy, 0]:
+                continue
+            # Pixel (iy, ix) connects to (iy + dy, ix - 1)
+            iy0, iy1 = max(0, -dy), min(ny, ny - dy)
+            iright = right[iy0:iy1]
+            ileft = left[iy0 + dy:iy1 + dy]
+            valid = (iright > 0) & (ileft > 0)
+            pairs.append(np.stack([iright[valid], ileft[valid]], axis=1))
+    pairs = np.concatenate(pairs, axis=0)
+    return pairs
+
+def label_tiled(mask, tile_size=None, structure=None, nthreads=1):
+    """
+    Label connected regions tile by tile, identical to scipy.ndimage.label.
+
+    Each tile is labeled separately (in parallel threads if nthreads > 1, ndimage.label
+    releases the GIL). Labels that touch across tile seams (the 1-pixel halo of each tile)
+    are joined with union-find (connected components of the seam pair graph), and the joined
+    regions are numbered in the order of their first pixel in the full domain, which is the
+    numbering of ndimage.label.
+
+    Args:
+        mask: np.array
+            2D array, non-zero values are labeled.
+        tile_size: int or list, default=None
+            Tile size [ny, nx]. The full domain is labeled at once if None.
+        structure: np.array, default=None
+            3x3 connectivity structure, see scipy.ndimage.label.
+        nthreads: int, default=1
+            Number of threads to label the tiles. When files are processed in parallel,
+            each worker uses this many threads.
+
+    Returns:
+        label_number: np.array(int32)
+            Labeled regions.
+        nlabels: int
+            Number of labeled regions.
+    """
+    if (tile_size is None) or (np.ndim(mask) != 2):
+        label_number, nlabels = ndimage.label(mask, structure=structure)
+        return label_number.astype(np.int32, copy=False), nlabels
+
+    if structure is None:
+        structure = ndimage.generate_binary_structure(2, 1)
+    structure = np.asarray(structure, dtype=bool)
+    ny, nx = mask.shape
+    tiles = get_tile_slices((ny, nx), tile_size)
+    nthreads = max(min(int(nthreads), len(tiles)), 1)
+
+    # Label each tile in place
+    label_number = np.zeros((ny, nx), dtype=np.int32)
+    def label_one(tile):
+        return label_tile(mask, label_number, tile[0], tile[1], structure)
+    if nthreads == 1:
+        results = [label_one(tile) for tile in tiles]
+    else:
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            results = list(executor.map(label_one, tiles))
+
+    # Label offset of each tile to make labels unique across tiles
+    ntiles = np.array([ntile for ntile, _ in results], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(ntiles)[:-1]])
+    nprovisional = int(ntiles.sum())
+    if nprovisional == 0:
+        return label_number, 0
+    first_index = np.concatenate([first for _, first in results])
+
+    # Join labels connected across tile seams
+    pairs = find_seam_pairs(label_number, tiles, offsets, structure) - 1
+    graph = sparse.coo_matrix(
+        (np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])),
+        shape=(nprovisional, nprovisional),
+    )
+    nlabels, roots = csgraph.connected_components(graph, directed=False)
+
+    # Number the joined regions by their first pixel in the full domain
+    root_first = np.full(nlabels, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(root_first, roots, first_index)
+    order = np.argsort(root_first, kind="stable")
+    root_number = np.zeros(nlabels, dtype=np.int32)
+    root_number[order] = np.arange(1, nlabels + 1, dtype=np.int32)
+    def renumber_one(itile):
+        if ntiles[itile] == 0:
+            return
+        lookup = np.zeros(ntiles[itile] + 1, dtype=np.int32)
+        lookup[1:] = root_number[roots[offsets[itile]:offsets[itile] + ntiles[itile]]]
+        label_number[tiles[itile]] = lookup[label_number[tiles[itile]]]
+    if nthreads == 1:
+        for itile in range(len(tiles)):
+            renumber_one(itile)
+    else:
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            list(executor.map(renumber_one, range(len(tiles))))
+    return label_number, nlabels
+
+def count_overlaps_tiled(reference_file, new_file, feature_varname, tile_size):
+    """
+    Count overlapping pixels between features in two files, reading one tile at a time.
+
+    Args:
+        reference_file: string
+            Reference feature file name.
+        new_file: string
+            New feature file name.
+        feature_varname: string
+            Feature label variable name, dimensions: [time, y, x].
+        tile_size: int or list
+            Tile size [ny, nx].
+
+    Returns:
+        pair_ref: np.array
+            Reference feature number of each overlapping pair, sorted by (pair_ref, pair_new).
+        pair_new: np.array
+            New feature number of each overlapping pair.
+        pair_npix: np.array
+            Number of overlapping pixels of each pair.
+        reference_npix: np.array
+            Number of pixels of each reference feature (index is the feature number).
+        new_npix: np.array
+            Number of pixels of each new feature (index is the feature number).
+    """
+    reference_data = xr.open_dataset(reference_file, mask_and_scale=False, decode_times=False)
+    new_data = xr.open_dataset(new_file, mask_and_scale=False, decode_times=False)
+    reference_var = reference_data[feature_varname]
+    new_var = new_data[feature_varname]
+    ny, nx = reference_var.shape[-2:]
+
+    reference_npix = np.zeros(1, dtype=np.int64)
+    new_npix = np.zeros(1, dtype=np.int64)
+    pair_keys = []
+    pair_counts = []
+    for slice_y, slice_x in get_tile_slices((ny, nx), tile_size):
+        reference_tile = get_label_tile(reference_var, slice_y, slice_x)
+        new_tile = get_label_tile(new_var, slice_y, slice_x)
+        # Feature sizes
+        tile_npix = np.bincount(reference_tile.ravel())
+        reference_npix = add_counts(reference_npix, tile_npix)
+        tile_npix = np.bincount(new_tile.ravel())
+        new_npix = add_counts(new_npix, tile_npix)
+        # Overlapping pairs (both non-zero)
+        overlap = (reference_tile > 0) & (new_tile > 0)
+        if np.any(overlap):
+            keys = np.stack([reference_tile[overlap], new_tile[overlap]], axis=1)
+            keys, counts = np.unique(keys, axis=0, return_counts=True)
+            pair_keys.append(keys)
+            pair_counts.append(counts)
+    reference_data.close()
+    new_data.close()
+
+    if len(pair_keys) > 0:
+        pair_keys, inverse = np.unique(np.concatenate(pair_keys, axis=0), axis=0, return_inverse=True)
+        pair_npix = np.bincount(inverse.ravel(), weights=np.concatenate(pair_counts)).astype(np.int64)
+        pair_ref, pair_new = pair_keys[:, 0], pair_keys[:, 1]
+    else:
+        pair_ref = np.zeros(0, dtype=np.int64)
+        pair_new = np.zeros(0, dtype=np.int64)
+        pair_npix = np.zeros(0, dtype=np.int64)
+    return pair_ref, pair_new, pair_npix, reference_npix, new_npix
+
+def get_label_tile(label_var, slice_y, slice_x):
+    """
+    Read a tile of a feature label variable.
+
+    Args:
+        label_var: xarray.DataArray
+            Feature label variable, dimensions: [time, y, x].
+        slice_y: slice
+            Tile slice in y.
+        slice_x: slice
+            Tile slice in x.
+
+    Returns:
+        label_tile: np.array(int64)
+            Feature labels of the tile, missing values set to 0.
+    """
+    label_tile = label_var[..., slice_y, slice_x].values
+    if np.issubdtype(label_tile.dtype, np.floating):
+        label_tile[np.isnan(label_tile)] = 0
+    label_tile = label_tile.astype(np.int64)
+    label_tile[label_tile < 0] = 0
+    return label_tile
+
+def add_counts(total, counts):
+    """
+    Add counts to a running total, extending the total if needed.
+
+    Args:
+        total: np.array
+            Running total.
+        counts: np.array
+            Counts to add.
+
+    Returns:
+        total: np.array
+            Updated running total.
+    """
+    if len(counts) > len(total):
+        total = np.concatenate([total, np.zeros(len(counts) - len(total), dtype=total.dtype)])
+    total[:len(counts)] += counts
+    return total
@@ -6,6 +6,8 @@ import yaml
 import xarray as xr
 import pandas as pd
 import logging
+from collections import OrderedDict
+from collections.abc import MutableMapping
 from scipy.sparse import csr_matrix
 
 def setup_logging():
@@ -50,6 +52,9 @@ def load_config(config_file):
     tracknumbers_filebase = "tracknumbers_"
     trackstats_filebase = "trackstats_"
     trackstats_sparse_filebase = "trackstats_sparse_"
+    tracking_state_filebase = "tracking_state_"
+    trackstats_cache_filebase = "trackstats_cache_"
+    pixel_track_index_filebase = "pixel_track_index_"
 
     # Optional parameters (default values if not in config file)
     trackstats_dense_netcdf = config.get("trackstats_dense_netcdf", 0)
@@ -63,6 +68,15 @@ def load_config(config_file):
     # Calculate basetime for start and end date
     start_basetime = get_basetime_from_string(startdate)
     end_basetime = get_basetime_from_string(enddate)
+    # End of the previous run to continue from in append mode
+    append_from_enddate = config.get("append_from_enddate", None)
+    if append_from_enddate is not None:
+        append_basetime = get_basetime_from_string(append_from_enddate)
+        if (append_basetime < start_basetime) or (append_basetime >= end_basetime):
+            logger.critical(f"append_from_enddate ({append_from_enddate}) must be within startdate and enddate.")
+            sys.exit("Code exits in load_config.")
+    else:
+        append_basetime = None
     # Add newly defined variables to config
     config.update(
         {
@@ -74,9 +88,13 @@ def load_config(config_file):
             "tracknumbers_filebase": tracknumbers_filebase,
             "trackstats_filebase": trackstats_filebase,
             "trackstats_sparse_filebase": trackstats_sparse_filebase,
+            "tracking_state_filebase": tracking_state_filebase,
+            "trackstats_cache_filebase": trackstats_cache_filebase,
+            "pixel_track_index_filebase": pixel_track_index_filebase,
             "trackstats_dense_netcdf": trackstats_dense_netcdf,
             "start_basetime": start_basetime,
             "end_basetime": end_basetime,
+            "append_basetime": append_basetime,
             "geolimits": geolimits,
         }
     )
@@ -435,9 +453,10 @@ def load_sparse_trackstats(
         times_idx_varname,
         tracks_dimname,
         tracks_idx_varname,
+        cache_size=8,
 ):
     """
-    Load sparse trackstats file and convert to sparse arrays.
+    Load sparse trackstats file with lazy access to the sparse arrays.
 
     Args:
         max_trackduration:
@@ -445,45 +464,249 @@ def load_sparse_trackstats(
         times_idx_varname:
         tracks_dimname:
         tracks_idx_varname:
+        cache_size: int, default=8
+            Maximum number of sparse arrays kept in memory.
 
     Returns:
         ds_1d: Xarray Dataset
             Dataset containing 1D track stats variables.
         sparse_attrs_dict: dictionary
             Dictionary containing sparse array attributes.
-        sparse_dict: dictionary
-            Dictionary containing sparse array variables.
+        sparse_dict: SparseTrackstats
+            Dictionary-like access to sparse array variables,
+            each variable is converted to a CSR matrix on first access.
+            The file stays open until sparse_dict.close() is called by the caller.
     """
-    # xr.set_options(keep_attrs=True)
-    ds_all = xr.open_dataset(statistics_file,
-                             mask_and_scale=False,
-                             decode_times=False)
-    # Get sparse array info
-    sparse_dimname = 'sparse_index'
-    nsparse_data = ds_all.dims[sparse_dimname]
-    ntracks = ds_all.dims[tracks_dimname]
-    # Sparse array indices
-    tracks_idx = ds_all[tracks_idx_varname].values
-    times_idx = ds_all[times_idx_varname].values
-    row_col_ind = (tracks_idx, times_idx)
-    # Sparse array shapes
-    shape_2d = (ntracks, max_trackduration)
-    # Convert sparse arrays and put in a dictionary
-    sparse_dict = {}
-    sparse_attrs_dict = {}
-    for ivar in ds_all.data_vars.keys():
-        # Check dimension name for sparse arrays
-        if ds_all[ivar].dims[0] == sparse_dimname:
-            # Convert to sparse array
-            sparse_dict[ivar] = csr_matrix(
-                (ds_all[ivar].values, row_col_ind), shape=shape_2d, dtype=ds_all[ivar].dtype,
-            )
-            # Collect variable attributes
-            sparse_attrs_dict[ivar] = ds_all[ivar].attrs
+    sparse_dict = SparseTrackstats(
+        statistics_file,
+        max_trackduration,
+        times_idx_varname,
+        tracks_dimname,
+        tracks_idx_varname,
+        cache_size=cache_size,
+    )
     # Drop all sparse variables and dimension
-    ds_1d = ds_all.drop_dims(sparse_dimname)
-    ds_all.close()
-    return ds_1d, sparse_attrs_dict, sparse_dict
+    ds_1d = sparse_dict.ds.drop_dims(sparse_dict.sparse_dimname)
+    return ds_1d, sparse_dict.attrs, sparse_dict
+
+
+class SparseTrackstats(MutableMapping):
+    """
+    Lazy dictionary of sparse trackstats variables.
+
+    The file is opened once, and a variable is read and converted to a CSR matrix
+    only when it is first accessed. The most recently used variables are cached.
+    """
+
+    def __init__(
+            self,
+            statistics_file,
+            max_trackduration,
+            times_idx_varname,
+            tracks_dimname,
+            tracks_idx_varname,
+            cache_size=8,
+    ):
+        """
+        Open sparse trackstats file.
+
+        Args:
+            statistics_file: string
+                Sparse trackstats netCDF filename.
+            max_trackduration: int
+                Maximum track duration.
+            times_idx_varname: string
+                Times indices variable name.
+            tracks_dimname: string
+                Tracks dimension name.
+            tracks_idx_varname: string
+                Tracks indices variable name.
+            cache_size: int, default=8
+                Maximum number of sparse arrays kept in memory.
+        """
+        self.ds = xr.open_dataset(statistics_file,
+                                  mask_and_scale=False,
+                                  decode_times=False)
+        # Get sparse array info
+        self.sparse_dimname = 'sparse_index'
+        self.ntracks = self.ds.dims[tracks_dimname]
+        # Sparse array indices
+        self.tracks_idx = self.ds[tracks_idx_varname].values
+        self.times_idx = self.ds[times_idx_varname].values
+        # Sparse array shapes
+        self.shape_2d = (self.ntracks, max_trackduration)
+        self.cache_size = max(int(cache_size), 1)
+        self.varnames = [
+            ivar for ivar in self.ds.data_vars.keys()
+            if self.ds[ivar].dims[0] == self.sparse_dimname
+        ]
+        # Collect variable attributes
+        self.attrs = {ivar: self.ds[ivar].attrs for ivar in self.varnames}
+        # Cached arrays read from the file, most recently used last
+        self._cache = OrderedDict()
+        # Arrays assigned by the caller
+        self._assigned = {}
+
+    def __getitem__(self, key):
+        if key in self._assigned:
+            return self._assigned[key]
+        if key not in self.varnames:
+            raise KeyError(key)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        # Convert to sparse array
+        value = csr_matrix(
+            (self.ds[key].values, (self.tracks_idx, self.times_idx)),
+            shape=self.shape_2d, dtype=self.ds[key].dtype,
+        )
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    def __setitem__(self, key, value):
+        self._assigned[key] = value
+        self._cache.pop(key, None)
+        if key not in self.varnames:
+            self.varnames.append(key)
+
+    def __delitem__(self, key):
+        if key not in self.varnames:
+            raise KeyError(key)
+        self.varnames.remove(key)
+        self._assigned.pop(key, None)
+        self._cache.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self.varnames
+
+    def __iter__(self):
+        return iter(list(self.varnames))
+
+    def __len__(self):
+        return len(self.varnames)
+
+    def dense(self, key, fillval, fillval_f, mask=None):
+        """
+        Convert a sparse variable to a dense array, filling entries without a feature.
+
+        Args:
+            key: string
+                Variable name.
+            fillval: int
+                Missing value for int type variables.
+            fillval_f: float
+                Missing value for float type variables.
+            mask: np.array, default=None
+                Dense mask for no feature. Computed from base_time if None.
+
+        Returns:
+            var_dense: np.array
+                Dense array with shape (ntracks, max_trackduration).
+        """
+        if mask is None:
+            mask = self.feature_mask()
+        var_dense = self[key].toarray()
+        return fill_missing_dense(var_dense, mask, fillval, fillval_f)
+
+    def feature_mask(self):
+        """
+        Get the dense mask for no feature (base_time == 0).
+
+        Returns:
+            mask: np.array
+                Boolean array with shape (ntracks, max_trackduration).
+        """
+        return self['base_time'].toarray() == 0
+
+    def close(self):
+        """
+        Close the trackstats file and release the cached arrays.
+
+        The caller owns the open file, close it after the last access
+        (including lazy reads from the ds_1d Dataset returned by load_sparse_trackstats).
+        """
+        self._cache.clear()
+        self._assigned.clear()
+        self.ds.close()
+
+
+def fill_missing_dense(var_dense, mask, fillval, fillval_f):
+    """
+    Replace missing values in a dense trackstats array based on variable type.
+
+    Args:
+        var_dense: np.array
+            Dense array.
+        mask: np.array
+            Dense mask for no feature.
+        fillval: int
+            Missing value for int type variables.
+        fillval_f: float
+            Missing value for float type variables.
+
+    Returns:
+        var_dense: np.array
+            Dense array with missing values replaced (modified in place).
+    """
+    if isinstance(var_dense[0, 0], np.floating):
+        var_dense[mask] = fillval_f
+    else:
+        var_dense[mask] = fillval
+    return var_dense
+
+
+def write_trackstats_dense_netcdf(
+        filename,
+        varnames,
+        get_variable,
+        coord_dict,
+        gattr_dict,
+        tracks_dimname,
+):
+    """
+    Write dense trackstats netCDF file one variable at a time.
+
+    The first variable is written with the coordinates and global attributes,
+    the others are appended, so that only one dense variable is in memory at a time.
+
+    Args:
+        filename: string
+            Output netCDF filename.
+        varnames: list
+            Variable names in output order.
+        get_variable: function
+            Function returning the (dims, data, attrs) tuple for a variable name.
+        coord_dict: dictionary
+            Coordinate dictionary.
+        gattr_dict: dictionary
+            Global attributes dictionary.
+        tracks_dimname: string
+            Tracks dimension name (unlimited).
+
+    Returns:
+        None.
+    """
+    # Set encoding/compression for all variables
+    comp = dict(zlib=True)
+    for ii, key in enumerate(varnames):
+        if ii == 0:
+            dsout = xr.Dataset({key: get_variable(key)}, coords=coord_dict, attrs=gattr_dict)
+            mode = 'w'
+        else:
+            dsout = xr.Dataset({key: get_variable(key)})
+            mode = 'a'
+        # Write to netcdf file
+        dsout.to_netcdf(
+            path=filename,
+            mode=mode,
+            format='NETCDF4',
+            unlimited_dims=tracks_dimname,
+            encoding={key: comp},
+        )
+        del dsout
+    return
 
 
 def convert_trackstats_sparse2dense(
@@ -500,6 +723,8 @@ def convert_trackstats_sparse2dense(
     """
     Convert sparse trackstats netCDF file to dense trackstats netCDF file.
 
+    Variables are converted and written one at a time.
+
     Args:
         filename_sparse: string
             Filename for sparse trackstats netCDF file.
@@ -523,50 +748,32 @@ def convert_trackstats_sparse2dense(
     Returns:
         True.
     """
-    # Read sparse netCDF file
-    ds_all = xr.open_dataset(
+    # Read sparse netCDF file, no need to keep converted variables
+    sparse_dict = SparseTrackstats(
         filename_sparse,
-        mask_and_scale=False,
-        decode_times=False
+        max_trackduration,
+        times_idx_varname,
+        tracks_dimname,
+        tracks_idx_varname,
+        cache_size=1,
     )
-    # Get sparse array info
-    sparse_dimname = 'sparse_index'
-    nsparse_data = ds_all.dims[sparse_dimname]
-    ntracks = ds_all.dims[tracks_dimname]
-    # Sparse array indices
-    tracks_idx = ds_all[tracks_idx_varname].values
-    times_idx = ds_all[times_idx_varname].values
-    row_col_ind = (tracks_idx, times_idx)
-    # Sparse array shapes
-    shape_2d = (ntracks, max_trackduration)
+    ds_all = sparse_dict.ds
+    ntracks = sparse_dict.ntracks
 
     # Create a dense mask for no feature
-    mask = csr_matrix(
-        (ds_all['base_time'].data, row_col_ind),
-        shape=shape_2d,
-        dtype=ds_all['base_time'].dtype,
-    ).toarray() == 0
-
-    # Create variable dictionary
-    var_dict = {}
-    for key, value in ds_all.data_vars.items():
+    mask = sparse_dict.feature_mask()
+
+    def get_variable(key):
         # Check dimension name for sparse arrays
-        if ds_all[key].dims[0] == sparse_dimname:
+        if key in sparse_dict:
             # Convert to sparse array, then to dense array
-            var_dense = csr_matrix(
-                (ds_all[key].data, row_col_ind), shape=shape_2d, dtype=ds_all[key].dtype,
-            ).toarray()
-            # Replace missing values based on variable type
-            if isinstance(var_dense[0, 0], np.floating):
-                var_dense[mask] = fillval_f
-            else:
-                var_dense[mask] = fillval
-            var_dict[key] = ([tracks_dimname, times_dimname], var_dense, ds_all[key].attrs)
+            var_dense = sparse_dict.dense(key, fillval, fillval_f, mask=mask)
+            return ([tracks_dimname, times_dimname], var_dense, ds_all[key].attrs)
         else:
-            var_dict[key] = ([tracks_dimname], value.data, ds_all[key].attrs)
+            return ([tracks_dimname], ds_all[key].data, ds_all[key].attrs)
+
     # Remove the tracks/times indices variables
-    var_dict.pop(tracks_idx_varname, None)
-    var_dict.pop(times_idx_varname, None)
+    varnames = [key for key in ds_all.data_vars.keys() if key not in (tracks_idx_varname, times_idx_varname)]
 
     # Define coordinate dictionary
     coord_dict = {
@@ -578,17 +785,11 @@ def convert_trackstats_sparse2dense(
     gattr_dict = ds_all.attrs
     gattr_dict["Created_on"] = time.ctime(time.time())
 
-    # Define output Xarray dataset
-    dsout = xr.Dataset(var_dict, coords=coord_dict, attrs=gattr_dict)
-    # Set encoding/compression for all variables
-    comp = dict(zlib=True)
-    encoding = {var: comp for var in dsout.data_vars}
     # Write to netcdf file
-    dsout.to_netcdf(
-        path=filename_dense,
-        mode='w',
-        format='NETCDF4',
-        unlimited_dims=tracks_dimname,
-        encoding=encoding
+    if os.path.isfile(filename_dense):
+        os.remove(filename_dense)
+    write_trackstats_dense_netcdf(
+        filename_dense, varnames, get_variable, coord_dict, gattr_dict, tracks_dimname,
     )
+    sparse_dict.close()
     return True
\ No newline at end of file
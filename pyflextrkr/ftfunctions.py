@@ -1,5 +1,7 @@
 import numpy as np
 from collections import deque
+from scipy import ndimage
+from scipy.signal import medfilt2d
 from skimage.segmentation import watershed
 from skimage.feature import peak_local_max
 
@@ -29,7 +31,7 @@ def sort_renumber(
     """
 
     # Create output arrays
-    sortedlabelcell_number2d = np.zeros(np.shape(labelcell_number2d), dtype=int)
+    sortedlabelcell_number2d = np.zeros(np.shape(labelcell_number2d), dtype=np.int32)
 
     # Get number of labeled cells
     nlabelcells = np.nanmax(labelcell_number2d)
@@ -138,8 +140,8 @@ def sort_renumber2vars(
     """
 
     # Create output arrays
-    sortedlabelcell_number2d = np.zeros(np.shape(labelcell_number2d), dtype=int)
-    sortedlabelcell2_number2d = np.zeros(np.shape(labelcell_number2d), dtype=int)
+    sortedlabelcell_number2d = np.zeros(np.shape(labelcell_number2d), dtype=np.int32)
+    sortedlabelcell2_number2d = np.zeros(np.shape(labelcell_number2d), dtype=np.int32)
 
     # Get number of labeled cells
     nlabelcells = np.nanmax(labelcell_number2d)
@@ -227,6 +229,9 @@ def link_pf_tb(
     """
     Renumbers separated clouds over the same PF to one cloud, using the largest cloud number.
 
+    PFs are processed in order using a PF-cloud overlap table and a cloud size table,
+    the renumbering is then applied to the full image with lookup tables.
+
     Args:
         convcold_cloudnumber: np.ndarray(int)
             Convective-coldanvil cloud number
@@ -254,103 +259,90 @@ def link_pf_tb(
     pf_convcold_cloudnumber = np.copy(convcold_cloudnumber)
     pf_cloudnumber = np.copy(cloudnumber)
 
-    # Create a 2D index array with the same shape as the full image
-    # This index array is used to map the indices of indices back to the full image
-    arrayindex2d = np.reshape(np.arange(tb.size), tb.shape)
-
     # If number of PF > 0, proceed
     if npf > 0:
-
-        # Initiallize masks to keep track of which clouds have been renumbered
-        pf_convcold_mask = np.zeros(tb.shape, dtype=int)
-        pf_cloud_mask = np.zeros(tb.shape, dtype=int)
-
-        # Loop over each PF
-        for ipf in range(1, npf):
-
-            # Find pixel index for this PF
-            pfidx = np.where(pf_number == ipf)
-            npix_pf = len(pfidx[0])
-
-            if npix_pf > 0:
-                # Get unique cloud number defined within this PF
-                # cn_uniq = np.unique(convcold_cloudnumber[pfidx])
-                cn_uniq = np.unique(pf_convcold_cloudnumber[pfidx])
-
-                # Find actual clouds (cloudnumber > 0)
-                cn_uniq = cn_uniq[np.where(cn_uniq > 0)]
-                nclouds_uniq = len(cn_uniq)
-                # If there is at least 1 cloud, proceed
-                if nclouds_uniq >= 1:
-
-                    # Loop over each cloudnumber and get the size
-                    npix_uniq = np.zeros(nclouds_uniq, dtype=np.int64)
-                    for ic in range(0, nclouds_uniq):
-                        # Find pixels for each cloud, save the size
-                        # npix_uniq[ic] = len(np.where(convcold_cloudnumber == cn_uniq[ic])[0])
-                        npix_uniq[ic] = len(
-                            np.where(pf_convcold_cloudnumber == cn_uniq[ic])[0]
-                        )
-
-                    # Find cloud number that has maximum size
-                    cn_max = cn_uniq[np.argmax(npix_uniq)]
-
-                    # Loop over each cloudnumber again
-                    for ic in range(0, nclouds_uniq):
-
-                        # Find pixel locations within each cloud, and mask = 0 (cloud has not been renumbered)
-                        # idx_convcold = np.where((convcold_cloudnumber == cn_uniq[ic]) & (pf_convcold_mask == 0))
-                        idx_convcold = np.where(
-                            (pf_convcold_cloudnumber == cn_uniq[ic])
-                            & (pf_convcold_mask == 0)
-                        )
-                        # idx_cloud = np.where((cloudnumber == cn_uniq[ic]) & (pf_cloud_mask == 0))
-                        idx_cloud = np.where(
-                            (pf_cloudnumber == cn_uniq[ic]) & (pf_cloud_mask == 0)
-                        )
-                        if len(idx_convcold[0]) > 0:
-                            # Renumber the cloud to the largest cloud number (that overlaps with this PF)
-                            pf_convcold_cloudnumber[idx_convcold] = cn_max
-                            pf_convcold_mask[idx_convcold] = 1
-                        if len(idx_cloud[0]) > 0:
-                            # Renumber the cloud to the largest cloud number (that overlaps with this PF)
-                            pf_cloudnumber[idx_cloud] = cn_max
-                            pf_cloud_mask[idx_cloud] = 1
-
-                    # Find area within the PF that has no cloudnumber, Tb < warm threshold, and has not been labeled yet
-                    #                     idx_nocloud = np.asarray((pf_convcold_cloudnumber[pfidx] == 0) & (tb[pfidx] < tb_thresh) & (pf_convcold_mask[pfidx] == 0)).nonzero()
-                    idx_nocloud = np.asarray(
-                        (pf_convcold_cloudnumber[pfidx] == 0)
-                        & (pf_convcold_mask[pfidx] == 0)
-                    ).nonzero()
-                    if np.count_nonzero(idx_nocloud) > 0:
-                        # At this point, idx_nocloud is a 1D index referring to the subset within pfidx
-                        # Applying idx_nocloud of pfidx to the 2D full image index array gets the 1D indices referring to the full image,
-                        # then unravel_index converts those 1D indices back to 2D, which can then be applied to the 2D full image
-                        idx_loc = np.unravel_index(
-                            arrayindex2d[pfidx][idx_nocloud], tb.shape
-                        )
-                        # Label the no cloud area using the largest cloud number
-                        pf_convcold_cloudnumber[idx_loc] = cn_max
-                        pf_convcold_mask[idx_loc] = 1
-
-                    # Find area within the PF that has no cloudnumber, Tb < warm threshold, and has not been labeled yet
-                    #                     idx_nocloud = np.asarray((pf_cloudnumber[pfidx] == 0) & (tb[pfidx] < tb_thresh) & (pf_cloud_mask[pfidx] == 0)).nonzero()
-                    idx_nocloud = np.asarray(
-                        (pf_cloudnumber[pfidx] == 0) & (pf_cloud_mask[pfidx] == 0)
-                    ).nonzero()
-                    if np.count_nonzero(idx_nocloud) > 0:
-                        idx_loc = np.unravel_index(
-                            arrayindex2d[pfidx][idx_nocloud], tb.shape
-                        )
-                        # Label the no cloud area using the largest cloud number
-                        pf_cloudnumber[idx_loc] = cn_max
-                        pf_cloud_mask[idx_loc] = 1
-
-    else:
-        # Pass input variables to output if no PFs are defined
-        pf_convcold_cloudnumber = np.copy(convcold_cloudnumber)
-        pf_cloudnumber = np.copy(cloudnumber)
+        npf = int(npf)
+        pfnumber = np.asarray(pf_number).ravel()
+        if np.issubdtype(pfnumber.dtype, np.floating):
+            pfnumber = np.nan_to_num(pfnumber, nan=0)
+        pfnumber = pfnumber.astype(np.int64)
+        convcold_number = np.asarray(convcold_cloudnumber).ravel().astype(np.int64)
+        cloud_number = np.asarray(cloudnumber).ravel().astype(np.int64)
+        nlabels = max(np.max(convcold_number), np.max(cloud_number), 0) + 1
+
+        # PFs are processed in order from 1 to npf-1
+        mask_pf = (pfnumber > 0) & (pfnumber < npf)
+
+        # Overlap table between PFs and clouds, sorted by PF number then cloud number
+        mask_overlap = mask_pf & (convcold_number > 0)
+        pair_keys = np.unique(pfnumber[mask_overlap] * nlabels + convcold_number[mask_overlap])
+        pair_pf = pair_keys // nlabels
+        pair_cloud = pair_keys % nlabels
+        pf_uniq, pf_start = np.unique(pair_pf, return_index=True)
+        pf_end = np.append(pf_start[1:], len(pair_pf))
+
+        # Cloud size table, number of pixels without a cloud in each PF
+        cloud_npix = np.bincount(convcold_number[convcold_number > 0], minlength=nlabels).astype(np.int64)
+        convcold_nocloud_npix = np.bincount(pfnumber[mask_pf & (convcold_number == 0)], minlength=npf+1)
+        cloud_nocloud_npix = np.bincount(pfnumber[mask_pf & (cloud_number == 0)], minlength=npf+1)
+        # The no cloud area is not labeled if it is only the first pixel of the PF,
+        # because its position within the PF pixel subset is 0 (consistent with the previous
+        # implementation that checked the count of non-zero positions)
+        pf_first = np.zeros(npf+1, dtype=np.int64)
+        pf_values, pf_index = np.unique(pfnumber, return_index=True)
+        keep = (pf_values > 0) & (pf_values <= npf)
+        pf_first[pf_values[keep]] = pf_index[keep]
+        convcold_fill = (convcold_nocloud_npix > 1) | \
+                        ((convcold_nocloud_npix == 1) & (convcold_number[pf_first] != 0))
+        cloud_fill = (cloud_nocloud_npix > 1) | \
+                     ((cloud_nocloud_npix == 1) & (cloud_number[pf_first] != 0))
+
+        # Lookup tables to renumber the clouds, and flags to keep track of which clouds have been renumbered
+        # A cloud is renumbered at most once: by the first PF that overlaps with it
+        convcold_lut = np.arange(nlabels, dtype=np.int64)
+        cloud_lut = np.arange(nlabels, dtype=np.int64)
+        convcold_renumbered = np.zeros(nlabels, dtype=bool)
+        cloud_renumbered = np.zeros(nlabels, dtype=bool)
+        # Cloud number to label the no cloud area within each PF
+        pf_fillnumber = np.zeros(npf+1, dtype=np.int64)
+
+        # Loop over each PF that overlaps with clouds
+        for ipf, istart, iend in zip(pf_uniq, pf_start, pf_end):
+            # Get unique cloud number (after renumbering by previous PFs) defined within this PF
+            cn_uniq = np.unique(convcold_lut[pair_cloud[istart:iend]])
+            # Find cloud number that has maximum size
+            cn_max = cn_uniq[np.argmax(cloud_npix[cn_uniq])]
+
+            # Renumber the clouds that have not been renumbered to the largest cloud number
+            cn_renumber = cn_uniq[~convcold_renumbered[cn_uniq]]
+            convcold_lut[cn_renumber] = cn_max
+            convcold_renumbered[cn_renumber] = True
+            cn_renumber = cn_renumber[cn_renumber != cn_max]
+            cloud_npix[cn_max] += np.sum(cloud_npix[cn_renumber])
+            if convcold_fill[ipf]:
+                cloud_npix[cn_max] += convcold_nocloud_npix[ipf]
+            cloud_npix[cn_renumber] = 0
+            cn_renumber = cn_uniq[~cloud_renumbered[cn_uniq]]
+            cloud_lut[cn_renumber] = cn_max
+            cloud_renumbered[cn_renumber] = True
+
+            # Label the no cloud area within the PF using the largest cloud number
+            pf_fillnumber[ipf] = cn_max
+
+        # Apply the renumbering and no cloud area labels in one remap
+        fillnumber = np.zeros(pfnumber.shape, dtype=np.int64)
+        fillnumber[mask_pf] = pf_fillnumber[pfnumber[mask_pf]]
+        mask = convcold_number > 0
+        convcold_number[mask] = convcold_lut[convcold_number[mask]]
+        mask = (convcold_number == 0) & (fillnumber > 0) & convcold_fill[pfnumber]
+        convcold_number[mask] = fillnumber[mask]
+        mask = cloud_number > 0
+        cloud_number[mask] = cloud_lut[cloud_number[mask]]
+        mask = (cloud_number == 0) & (fillnumber > 0) & cloud_fill[pfnumber]
+        cloud_number[mask] = fillnumber[mask]
+
+        pf_convcold_cloudnumber[...] = convcold_number.reshape(pf_convcold_cloudnumber.shape)
+        pf_cloudnumber[...] = cloud_number.reshape(pf_cloudnumber.shape)
 
     return (
         pf_convcold_cloudnumber,
@@ -381,6 +373,115 @@ def olr_to_tb(OLR):
     tb = (-a + np.sqrt(a**2 + 4*b*tf))/(2*b)
     return tb
 
+def smooth_box_nan(data, width):
+    """
+    Smooth data with a normalized box filter, ignoring NaN.
+
+    Same as astropy.convolution.convolve(data, Box2DKernel(width), boundary="extend",
+    nan_treatment="interpolate", preserve_nan=True), using separable 1D filters:
+    the box filter of values (NaN set to 0) divided by the box filter of the valid mask.
+    The box filter is applied along all dimensions of data.
+
+    Args:
+        data: np.array
+            Input data array.
+        width: int
+            Width of the box filter (Box2DKernel width).
+
+    Returns:
+        smooth_data: np.array
+            Smoothed data (same float type as data, float64 otherwise), NaN where data is NaN.
+    """
+    data = np.asarray(data)
+    out_dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+    data = data.astype(np.float64, copy=False)
+    # 1D box kernel, an even width has half weights at both ends (same as Box1DKernel)
+    width = int(width)
+    if width % 2 == 1:
+        weights = np.ones(width, dtype=np.float64)
+    else:
+        weights = np.ones(width + 1, dtype=np.float64)
+        weights[[0, -1]] = 0.5
+    weights = weights / np.sum(weights)
+
+    # Box filter of values (NaN set to 0), extend boundary with the nearest values
+    mask_nan = np.isnan(data)
+    has_nan = np.any(mask_nan)
+    values = np.where(mask_nan, 0., data) if has_nan else data
+    for axis in range(0, data.ndim):
+        values = ndimage.correlate1d(values, weights, axis=axis, mode='nearest')
+    if not has_nan:
+        return values.astype(out_dtype, copy=False)
+
+    # Normalize by the box filter of the valid mask (sum of weights of valid values)
+    mask_good = (~mask_nan).astype(np.float64)
+    for axis in range(0, data.ndim):
+        mask_good = ndimage.correlate1d(mask_good, weights, axis=axis, mode='nearest')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        smooth_data = values / mask_good
+    smooth_data[mask_nan] = np.nan
+    return smooth_data.astype(out_dtype, copy=False)
+
+def medfilt2d_missing(data, kernel_size, missmask):
+    """
+    Median filter values (scipy.signal.medfilt2d) at missing pixels.
+
+    The windows around the missing pixels are copied side by side into one strip,
+    and the median filter is applied to the strip. The median at the center of each
+    window is identical to filtering the full array. Missing pixels near the array edges,
+    where medfilt2d clips the window, are filtered within bands along the edges.
+    The full array is filtered if the strip is larger than the array.
+
+    Args:
+        data: np.array
+            2D input data array.
+        kernel_size: int or list
+            Median filter window size (odd), see scipy.signal.medfilt2d.
+        missmask: np.array(bool)
+            Mask of missing pixels to get the filtered values.
+
+    Returns:
+        filt_values: np.array
+            Median filtered values at the missing pixels (order of data[missmask]).
+    """
+    ny, nx = data.shape
+    ky, kx = np.broadcast_to(np.asarray(kernel_size, dtype=int), (2,))
+    halo_y, halo_x = ky // 2, kx // 2
+    iy, ix = np.nonzero(missmask)
+    nmiss = len(iy)
+    if (nmiss * ky * kx > data.size) or (ny < 2 * halo_y) or (nx < 2 * halo_x) or \
+        (data.dtype not in (np.float32, np.float64)):
+        return medfilt2d(data, kernel_size=kernel_size)[missmask]
+
+    filt_values = np.zeros(nmiss, dtype=data.dtype)
+    # Missing pixels within half of the kernel size from the edges
+    top = iy < halo_y
+    bottom = ~top & (iy >= ny - halo_y)
+    left = ~top & ~bottom & (ix < halo_x)
+    right = ~top & ~bottom & ~left & (ix >= nx - halo_x)
+    inner = ~(top | bottom | left | right)
+
+    # Windows around the inner missing pixels [nmiss, ky, kx], put side by side to a strip [ky, nmiss*kx]
+    if np.any(inner):
+        windows = np.lib.stride_tricks.sliding_window_view(data, (ky, kx))[iy[inner] - halo_y, ix[inner] - halo_x]
+        strip = np.ascontiguousarray(windows.transpose(1, 0, 2)).reshape(ky, -1)
+        filt_values[inner] = medfilt2d(strip, kernel_size=kernel_size)[halo_y, halo_x::kx]
+
+    # Bands along the edges with twice the half kernel size, the windows are clipped the same way
+    if np.any(top):
+        band_filt = medfilt2d(data[:2*halo_y, :], kernel_size=kernel_size)
+        filt_values[top] = band_filt[iy[top], ix[top]]
+    if np.any(bottom):
+        band_filt = medfilt2d(data[ny-2*halo_y:, :], kernel_size=kernel_size)
+        filt_values[bottom] = band_filt[iy[bottom] - (ny - 2*halo_y), ix[bottom]]
+    if np.any(left):
+        band_filt = medfilt2d(data[:, :2*halo_x], kernel_size=kernel_size)
+        filt_values[left] = band_filt[iy[left], ix[left]]
+    if np.any(right):
+        band_filt = medfilt2d(data[:, nx-2*halo_x:], kernel_size=kernel_size)
+        filt_values[right] = band_filt[iy[right], ix[right] - (nx - 2*halo_x)]
+    return filt_values
+
 def get_neighborhood(point, grid):
     """
     Given a grid of labeled points with 0=unlabeled, -1 to be processed, other # to be proccesed.
@@ -495,12 +596,12 @@ def skimage_watershed(fvar, config):
     
     # Generate 2D field with shape of favr, local maxima locations marked by the maxima number
     # Field is zero where maxima not present
-    markers = np.zeros(fvar.shape, dtype=int)
+    markers = np.zeros(fvar.shape, dtype=np.int32)
     for p in range(cc):
         markers[local_maxes[p,0], local_maxes[p,1]] = p + 1    # plus 1 because dont want a marker = 0.
 
     # Define a binary mask used in watershed algorithm
-    Pmask = np.zeros(fvar.shape, dtype=int)
+    Pmask = np.zeros(fvar.shape, dtype=np.int8)
     Pmask[fvar > cont_thresh] = 1
 
     # Use watershed to define objects:
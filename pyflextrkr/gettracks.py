@@ -6,7 +6,9 @@ from netCDF4 import Dataset
 import xarray as xr
 import logging
 from pyflextrkr.ft_utilities import subset_files_timerange
+from pyflextrkr.ft_profiling import profile_step
 
+@profile_step
 def gettracknumbers(config):
     """
     Track features sequentially from the single track files.
@@ -33,6 +35,8 @@ def gettracknumbers(config):
     start_basetime = config["start_basetime"]
     end_basetime = config["end_basetime"]
     fillval = config["fillval"]
+    append_basetime = config.get("append_basetime", None)
+    save_tracking_state = config.get("save_tracking_state", False)
 
     logger = logging.getLogger(__name__)
     np.set_printoptions(threshold=np.inf)
@@ -41,6 +45,19 @@ def gettracknumbers(config):
     # Set track numbers output file name
     tracknumbers_outfile = f"{stats_outpath}{tracknumbers_filebase}{startdate}_{enddate}.nc"
 
+    # In append mode, continue from the open-track state at the end of the previous run
+    if append_basetime is not None:
+        append_from_enddate = config["append_from_enddate"]
+        tracking_state_file = f"{stats_outpath}{config['tracking_state_filebase']}" + \
+                              f"{startdate}_{append_from_enddate}.nc"
+        prev_tracknumbers_file = f"{stats_outpath}{tracknumbers_filebase}{startdate}_{append_from_enddate}.nc"
+        state = load_tracking_state(tracking_state_file, maxnclouds)
+        logger.info(f"Appending to tracks from: {prev_tracknumbers_file}")
+        # Only process track files after the last file of the previous run
+        start_basetime = max(start_basetime, state["basetime"] + 1)
+    else:
+        state = None
+
     # Identify files to process
     files, \
     files_basetime, \
@@ -54,56 +71,78 @@ def gettracknumbers(config):
     # Initialize matrices
     nfiles = len(files)
     logger.info(f"Total number of files to process: {nfiles}")
+    if nfiles == 0:
+        logger.critical(f"No track files found between {startdate} and {enddate}.")
+        sys.exit("Code exits in gettracks.py")
 
     fillval_f = np.nan
     missingfrac = 0.3
-    nfiles_m = int(nfiles*(1.+missingfrac))
-    tracknumber = np.full((1, nfiles_m, maxnclouds), fillval, dtype=int)
-    referencetrackstatus = np.full((nfiles_m, maxnclouds), fillval_f, dtype=float)
-    newtrackstatus = np.full((nfiles_m, maxnclouds), fillval_f, dtype=float)
-    trackstatus = np.full((1, nfiles_m, maxnclouds), fillval, dtype=int)
-    trackmergenumber = np.full((1, nfiles_m, maxnclouds), fillval, dtype=int)
-    tracksplitnumber = np.full((1, nfiles_m, maxnclouds), fillval, dtype=int)
+    # One more row for the first (reference) file
+    nfiles_m = int(nfiles*(1.+missingfrac)) + 1
+    # Track numbers are int32, status/reset flags are int16 (max status value is 65)
+    tracknumber = np.full((1, nfiles_m, maxnclouds), fillval, dtype=np.int32)
+    referencetrackstatus = np.full((nfiles_m, maxnclouds), fillval_f, dtype=np.float32)
+    newtrackstatus = np.full((nfiles_m, maxnclouds), fillval_f, dtype=np.float32)
+    trackstatus = np.full((1, nfiles_m, maxnclouds), fillval, dtype=np.int16)
+    trackmergenumber = np.full((1, nfiles_m, maxnclouds), fillval, dtype=np.int32)
+    tracksplitnumber = np.full((1, nfiles_m, maxnclouds), fillval, dtype=np.int32)
     basetime = np.empty(nfiles_m, dtype="datetime64[s]")
-    trackreset = np.full((1, nfiles_m, maxnclouds), fillval, dtype=int)
-
-    ############################################################################
-    # Load first file
-    logger.debug("Processing first file")
-    logger.debug(f"tracking_outpath: {tracking_outpath}")
-    logger.debug(f"files[0]: {files[0]}")
-    # singletracking_data = Dataset(tracking_outpath + files[0], "r")
-    singletracking_data = Dataset(files[0], "r")
-
-    # Number of clouds in reference file
-    nclouds_reference = int(np.nanmax(singletracking_data["nclouds_ref"][:]) + 1)
-    basetime_ref = singletracking_data["basetime_ref"][:]
-    ref_file = f"{tracking_outpath}{singletracking_data.getncattr('ref_file')}"
-    singletracking_data.close()
-
-    # Make sure number of clouds does not exceed maximum.
-    if nclouds_reference > maxnclouds:
-        logger.critical(f"Error: Number of clouds in reference file exceed allowed maximum number of clouds")
-        logger.critical(f"nclouds_reference: {nclouds_reference}, nmaxclouds: {maxnclouds}")
-        logger.critical("Increase maxnclouds in the config file.")
-        sys.exit("Code exits in gettracks.py")
+    trackreset = np.full((1, nfiles_m, maxnclouds), fillval, dtype=np.int16)
 
-    # Isolate file name and add it to the filelist
-    basetime[0] = basetime_ref.item()
+    if state is None:
+        ############################################################################
+        # Load first file
+        logger.debug("Processing first file")
+        logger.debug(f"tracking_outpath: {tracking_outpath}")
+        logger.debug(f"files[0]: {files[0]}")
+        # singletracking_data = Dataset(tracking_outpath + files[0], "r")
+        singletracking_data = Dataset(files[0], "r")
 
-    temp_referencefile = os.path.basename(ref_file)
-    strlength = len(temp_referencefile)
-    cloudidfiles = np.chararray((nfiles_m, int(strlength)))
-    cloudidfiles[0, :] = list(os.path.basename(ref_file))
+        # Number of clouds in reference file
+        nclouds_reference = int(np.nanmax(singletracking_data["nclouds_ref"][:]) + 1)
+        basetime_ref = singletracking_data["basetime_ref"][:]
+        ref_file = f"{tracking_outpath}{singletracking_data.getncattr('ref_file')}"
+        singletracking_data.close()
 
-    # Initate track numbers
-    tracknumber[0, 0, 0 : int(nclouds_reference)] = (
-        np.arange(0, int(nclouds_reference)) + 1
-    )
-    itrack = nclouds_reference + 1
+        # Make sure number of clouds does not exceed maximum.
+        if nclouds_reference > maxnclouds:
+            logger.critical(f"Error: Number of clouds in reference file exceed allowed maximum number of clouds")
+            logger.critical(f"nclouds_reference: {nclouds_reference}, nmaxclouds: {maxnclouds}")
+            logger.critical("Increase maxnclouds in the config file.")
+            sys.exit("Code exits in gettracks.py")
 
-    # Record that the tracks are being reset / initialized
-    trackreset[0, 0, :] = 1
+        # Isolate file name and add it to the filelist
+        basetime[0] = basetime_ref.item()
+
+        temp_referencefile = os.path.basename(ref_file)
+        strlength = len(temp_referencefile)
+        cloudidfiles = np.chararray((nfiles_m, int(strlength)))
+        cloudidfiles[0, :] = list(os.path.basename(ref_file))
+
+        # Initate track numbers
+        tracknumber[0, 0, 0 : int(nclouds_reference)] = (
+            np.arange(0, int(nclouds_reference)) + 1
+        )
+        itrack = nclouds_reference + 1
+
+        # Record that the tracks are being reset / initialized
+        trackreset[0, 0, :] = 1
+        time_prev = None
+    else:
+        ############################################################################
+        # Start from the last file of the previous run
+        basetime[0] = state["basetime"]
+        strlength = len(state["cloudid_file"])
+        cloudidfiles = np.chararray((nfiles_m, int(strlength)))
+        cloudidfiles[0, :] = list(state["cloudid_file"])
+        tracknumber[0, 0, :] = state["track_numbers"]
+        tracksplitnumber[0, 0, :] = state["track_splitnumbers"]
+        newtrackstatus[0, :] = state["newtrack_status"]
+        # Track reset flags before the last file was flagged as the end of the data
+        trackreset[0, 0, :] = state["track_reset"]
+        itrack = state["next_tracknumber"]
+        time_prev = state["basetime"]
+    last_trackreset = None
 
     ###########################################################################
     # Loop over files and generate tracks
@@ -171,14 +210,15 @@ def gettracknumbers(config):
         # logger.debug((time.ctime()))
 
         # Set previous and new times
-        if ifile < 1:
+        check_gap = time_prev is not None
+        if time_prev is None:
             time_prev = np.copy(basetime_new[0])
 
         time_new = np.copy(basetime_new[0])
 
         # Check if files immediately follow each other. Missing files can exist.
         # If missing files exist need to increment index and track numbers
-        if ifile > 0:
+        if check_gap:
             hour_diff = np.array([time_new - time_prev]).astype(float)
             if hour_diff > (timegap * 3.6 * 10 ** 12):
                 logger.debug(f"Track terminates on: {ref_date}")
@@ -209,325 +249,29 @@ def gettracknumbers(config):
 
         ########################################################################################
         # Compare forward and backward single track matirces to link new and reference clouds
-        # Intiailize matrix for this time period
-        # logger.debug('Generating tracks')
-        # logger.debug((time.ctime()))
-        trackfound = np.ones(nclouds_reference + 1, dtype=int) * -9999
-
-        # Loop over all reference clouds
-        # logger.debug('Looping over all clouds in the reference file')
-        # logger.debug(('Number of clouds to process: ' + str(nclouds_reference)))
-        # logger.debug((time.ctime()))
-        for ncr in np.arange(
-            1, nclouds_reference + 1
-        ):  # Looping over each reference cloud. Start at 1 since clouds numbered starting at 1.
-            # logger.debug(('Reference cloud #: ' + str(ncr)))
-            # logger.debug((time.ctime()))
-            if trackfound[ncr - 1] < 1:
-
-                # Find all clouds (both forward and backward) associated with this reference cloud
-                nreferenceclouds = 0
-                ntemp_referenceclouds = 1  # Start by forcing to see if track exists
-                temp_referenceclouds = [ncr]
-
-                trackpresent = 0
-                # logger.debug('Finding all associated clouds')
-                # logger.debug((time.ctime()))
-                while ntemp_referenceclouds > nreferenceclouds:
-                    associated_referenceclouds = np.copy(temp_referenceclouds).astype(
-                        int
-                    )
-                    nreferenceclouds = ntemp_referenceclouds
-
-                    for nr in range(0, nreferenceclouds):
-                        # logger.debug(('Processing cloud #: ' + str(nr)))
-                        # logger.debug((time.ctime()))
-                        tempncr = associated_referenceclouds[nr]
-
-                        # Find indices of forward linked clouds.
-                        # Need to subtract one since looping based on core number and
-                        # since python starts with indices at zero.
-                        # Row of that core is one less than its number.
-                        newforwardindex = np.array(
-                            np.where(refcloud_forward_index[0, tempncr - 1, :] > 0)
-                        )
-                        nnewforward = np.shape(newforwardindex)[1]
-                        if nnewforward > 0:
-                            core_newforward = refcloud_forward_index[
-                                0, tempncr - 1, newforwardindex[0, :]
-                            ]
-
-                        # Find indices of backwards linked clouds
-                        newbackwardindex = np.array(
-                            np.where(newcloud_backward_index[0, :, :] == tempncr)
-                        )
-                        nnewbackward = np.shape(newbackwardindex)[1]
-                        if nnewbackward > 0:
-                            # Need to add one since want the core index, which starts at one.
-                            # But this is using that row number, which starts at zero.
-                            core_newbackward = (newbackwardindex[0, :] + 1)
-
-                        # Put all the indices associated with new clouds linked to the reference cloud in one vector
-                        if nnewforward > 0:
-                            if trackpresent == 0:
-                                associated_newclouds = core_newforward[:].astype(int)
-                                trackpresent = trackpresent + 1
-                            else:
-                                associated_newclouds = np.append(
-                                    associated_newclouds, core_newforward.astype(int)
-                                )
-
-                        if nnewbackward > 0:
-                            if trackpresent == 0:
-                                associated_newclouds = core_newbackward[:]
-                                trackpresent = trackpresent + 1
-                            else:
-                                associated_newclouds = np.append(
-                                    associated_newclouds, core_newbackward.astype(int)
-                                )
-
-                        if nnewbackward == 0 and nnewforward == 0:
-                            associated_newclouds = []
-
-                        # If the reference cloud is linked to a new cloud
-                        if trackpresent > 0:
-                            # Sort and find the unique new clouds associated with the reference cloud
-                            if len(associated_newclouds) > 1:
-                                associated_newclouds = np.unique(
-                                    np.sort(associated_newclouds)
-                                )
-                            nnewclouds = len(associated_newclouds)
-
-                            # Find reference clouds associated with each new cloud.
-                            # Look to see if these new clouds are linked to other cells in the reference file as well.
-                            for nnew in range(0, nnewclouds):
-                                # Find associated reference clouds
-                                referencecloudindex = np.array(
-                                    np.where(
-                                        refcloud_forward_index[0, :, :]
-                                        == associated_newclouds[nnew]
-                                    )
-                                )
-                                nassociatedreference = np.shape(referencecloudindex)[1]
-                                if nassociatedreference > 0:
-                                    temp_referenceclouds = np.append(
-                                        temp_referenceclouds, referencecloudindex[0] + 1
-                                    )
-                                    temp_referenceclouds = np.unique(
-                                        np.sort(temp_referenceclouds)
-                                    )
-
-                            ntemp_referenceclouds = len(temp_referenceclouds)
-                        else:
-                            nnewclouds = 0
-
-                #################################################################
-                # Now get the track status
-
-                if nnewclouds > 0:
-                    ############################################################
-                    # Find the largest reference and new clouds
-                    # Largest reference cloud
-                    # Need to subtract one since associated_referenceclouds gives core index and matrix starts at zero
-                    allreferencepix = npix_reference[associated_referenceclouds - 1]
-                    largestreferenceindex = np.argmax(allreferencepix)
-                    # Cloud number of the largest reference cloud
-                    largest_referencecloud = associated_referenceclouds[largestreferenceindex]
-
-                    # Largest new cloud
-                    # Need to subtract one since associated_newclouds gives cloud number and the matrix starts at zero
-                    allnewpix = npix_new[associated_newclouds - 1]
-                    largestnewindex = np.argmax(allnewpix)
-                    # Cloud number of the largest new cloud
-                    largest_newcloud = associated_newclouds[largestnewindex]
-
-                    if nnewclouds == 1 and nreferenceclouds == 1:
-                        ############################################################
-                        # Simple continuation
-
-                        # Check trackstatus already has a valid value.
-                        # This will prtrack splits from a previous step being overwritten
-
-                        # logger.debug(trackstatus[ifill,ncr-1])
-                        referencetrackstatus[ifill, ncr - 1] = 1
-                        trackfound[ncr - 1] = 1
-                        tracknumber[0, ifill + 1, associated_newclouds - 1] = np.copy(
-                            tracknumber[0, ifill, ncr - 1]
-                        )
-
-                    elif nreferenceclouds > 1:
-                        ##############################################################
-                        # Merging only
-
-                        # Loop through the reference clouds and assign the track to the largest one,
-                        # the rest just go away
-                        if nnewclouds == 1:
-                            for tempreferencecloud in associated_referenceclouds:
-                                trackfound[tempreferencecloud - 1] = 1
-
-                                # If this reference cloud is the largest fragment of the merger,
-                                # label this reference time (file) as the larger part of merger (2)
-                                # and merging at the next time (ifile + 1)
-                                if tempreferencecloud == largest_referencecloud:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = 2
-                                    tracknumber[
-                                        0, ifill + 1, associated_newclouds - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-                                # If this reference cloud is the smaller fragment of the merger,
-                                # label the reference time (ifile) as the small merger (12)
-                                # and merging at the next time (file + 1)
-                                else:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = 21
-                                    trackmergenumber[
-                                        0, ifill, tempreferencecloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-
-                        #################################################################
-                        # Merging and spliting
-                        else:
-
-                            # Loop over the reference clouds and assign the track the largest one
-                            for tempreferencecloud in associated_referenceclouds:
-                                trackfound[tempreferencecloud - 1] = 1
-
-                                # If this is the larger fragment ofthe merger,
-                                # label the reference time (ifill) as large merger (2)
-                                # and the actual merging track at the next time [ifill+1]
-                                if tempreferencecloud == largest_referencecloud:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = (2 + 13)
-                                    tracknumber[
-                                        0, ifill + 1, largest_newcloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-                                # For the smaller fragment of the merger,
-                                # label the reference time (ifill) as the small merge and
-                                # have the actual merging occur at the next time (ifill+1)
-                                else:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = (21 + 13)
-                                    trackmergenumber[
-                                        0, ifill, tempreferencecloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-
-                            # Loop through the new clouds and assign the smaller ones a new track
-                            for tempnewcloud in associated_newclouds:
-
-                                # For the smaller fragment of the split,
-                                # label the new time (ifill+1) as the small split
-                                # because the cloud only occurs at the new time step
-                                if tempnewcloud != largest_newcloud:
-                                    newtrackstatus[ifill + 1, tempnewcloud - 1] = 31
-
-                                    tracknumber[0, ifill + 1, tempnewcloud - 1] = itrack
-                                    itrack = itrack + 1
-
-                                    tracksplitnumber[
-                                        0, ifill + 1, tempnewcloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-
-                                    trackreset[0, ifill + 1, tempnewcloud - 1] = 0
-                                # For the larger fragment of the split,
-                                # label the new time (ifill+1) as the large split
-                                # so that is consistent with the small fragments.
-                                # The track continues to follow this cloud so the tracknumber is not incramented.
-                                else:
-                                    newtrackstatus[ifill + 1, tempnewcloud - 1] = 3
-                                    tracknumber[
-                                        0, ifill + 1, tempnewcloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-
-                    #####################################################################
-                    # Splitting only
-                    elif nnewclouds > 1:
-                        # logger.debug('Splitting only')
-                        # logger.debug((time.ctime()))
-                        # Label reference cloud as a pure split
-                        referencetrackstatus[ifill, ncr - 1] = 13
-                        tracknumber[0, ifill, ncr - 1] = np.copy(
-                            tracknumber[0, ifill, largest_referencecloud - 1]
-                        )
-
-                        # Loop over the clouds and assign new tracks to the smaller ones
-                        for tempnewcloud in associated_newclouds:
-                            # For the smaller fragment of the split,
-                            # label the new time (ifill+1) as teh small split (13)
-                            # because the cloud only occurs at the new time.
-                            if tempnewcloud != largest_newcloud:
-                                newtrackstatus[ifill + 1, tempnewcloud - 1] = 31
-
-                                tracknumber[0, ifill + 1, tempnewcloud - 1] = itrack
-                                itrack = itrack + 1
-
-                                tracksplitnumber[
-                                    0, ifill + 1, tempnewcloud - 1
-                                ] = np.copy(tracknumber[0, ifill, ncr - 1])
-
-                                trackreset[0, ifill + 1, tempnewcloud - 1] = 0
-                            # For the larger fragment of the split,
-                            # label new time (ifill+1) as the large split (3)
-                            # so that is consistent with the small fragments
-                            else:
-                                newtrackstatus[ifill + 1, tempnewcloud - 1] = 3
-                                tracknumber[0, ifill + 1, tempnewcloud - 1] = np.copy(
-                                    tracknumber[0, ifill, ncr - 1]
-                                )
-
-                    else:
-                        sys.exit(str(ncr) + " How did we get here?")
-
-                ######################################################################################
-                # No new clouds. Track dissipated
-                else:
-
-                    trackfound[ncr - 1] = 1
-
-                    referencetrackstatus[ifill, ncr - 1] = 0
-
-        ##############################################################################
-        # Find any clouds in the new track that don't have a track number.
-        # These are new clouds this file
-
-        for ncn in range(1, int(nclouds_new) + 1):
-            if tracknumber[0, ifill + 1, ncn - 1] < 0:
-                tracknumber[0, ifill + 1, ncn - 1] = itrack
-                itrack = itrack + 1
-
-                trackreset[0, ifill + 1, ncn - 1] = 0
+        itrack = link_pair_tracks(
+            refcloud_forward_index,
+            newcloud_backward_index,
+            npix_reference,
+            npix_new,
+            nclouds_reference,
+            nclouds_new,
+            tracknumber[0, ifill, :],
+            tracknumber[0, ifill + 1, :],
+            referencetrackstatus[ifill, :],
+            newtrackstatus[ifill + 1, :],
+            trackmergenumber[0, ifill, :],
+            tracksplitnumber[0, ifill + 1, :],
+            trackreset[0, ifill + 1, :],
+            itrack,
+        )
 
         #############################################################################
         # Flag the last file in the dataset
         if ifile == nfiles - 1:
             logger.debug("WE ARE AT THE LAST FILE")
+            # Keep the track reset flags of the last file for appending later
+            last_trackreset = np.copy(trackreset[0, ifill + 1, :])
             for ncn in range(1, int(nclouds_new) + 1):
                 trackreset[0, ifill + 1, :] = 2
             ifill = ifill + 1
@@ -546,6 +290,36 @@ def gettracknumbers(config):
 
     nfiles = ifill + 1
 
+    # Save the open-track state at the last file
+    if save_tracking_state or (state is not None):
+        tracking_state_outfile = f"{stats_outpath}{config['tracking_state_filebase']}{startdate}_{enddate}.nc"
+        write_tracking_state(
+            tracking_state_outfile,
+            tracknumber[0, nfiles - 1, :],
+            last_trackreset,
+            tracksplitnumber[0, nfiles - 1, :],
+            newtrackstatus[nfiles - 1, :],
+            itrack,
+            basetime[nfiles - 1],
+            cloudidfiles[nfiles - 1, :].tobytes().decode(),
+            config,
+        )
+
+    # Add the tracks of the previous run before the last file of the previous run
+    if state is not None:
+        tracknumber, trackstatus, trackmergenumber, tracksplitnumber, trackreset, \
+        basetime, cloudidfiles, nfiles = append_previous_tracknumbers(
+            prev_tracknumbers_file,
+            tracknumber[:, :nfiles, :],
+            trackstatus[:, :nfiles, :],
+            trackmergenumber[:, :nfiles, :],
+            tracksplitnumber[:, :nfiles, :],
+            trackreset[:, :nfiles, :],
+            basetime[:nfiles],
+            cloudidfiles[:nfiles, :],
+        )
+        strlength = cloudidfiles.shape[1]
+
     # #################################################################
     # # Create histograms of the values in tracknumber.
     # # This effectively counts the number of times each track number appaers in tracknumber,
@@ -611,7 +385,7 @@ def gettracknumbers(config):
         "basetimes": (["nfiles"], basetime[:nfiles]),
         "cloudid_files": (["nfiles", "ncharacters"], cloudidfiles[:nfiles,:]),
         "track_numbers": (["time", "nfiles", "nclouds"], tracknumber[:,:nfiles,:]),
-        "track_status": (["time", "nfiles", "nclouds"], trackstatus[:,:nfiles,:].astype(int)),
+        "track_status": (["time", "nfiles", "nclouds"], trackstatus[:,:nfiles,:]),
         "track_mergenumbers": (["time", "nfiles", "nclouds"], trackmergenumber[:,:nfiles,:]),
         "track_splitnumbers": (["time", "nfiles", "nclouds"], tracksplitnumber[:,:nfiles,:]),
         "track_reset": (["time", "nfiles", "nclouds"], trackreset[:,:nfiles,:]),
@@ -714,7 +488,7 @@ def gettracknumbers(config):
         format="NETCDF4_CLASSIC",
         # unlimited_dims="ntracks",
         encoding={
-            "ntracks": {"dtype": "int", "zlib": True},
+            "ntracks": {"dtype": "int32", "zlib": True},
             "basetimes": {
                 "dtype": "int64",
                 "zlib": True,
@@ -723,13 +497,521 @@ def gettracknumbers(config):
             "cloudid_files": {
                 "zlib": True,
             },
-            "track_numbers": {"dtype": "int", "zlib": True, "_FillValue": -9999},
-            "track_status": {"dtype": "int", "zlib": True, "_FillValue": -9999},
-            "track_mergenumbers": {"dtype": "int", "zlib": True, "_FillValue": -9999},
-            "track_splitnumbers": {"dtype": "int", "zlib": True, "_FillValue": -9999},
-            "track_reset": {"dtype": "int", "zlib": True, "_FillValue": -9999},
+            "track_numbers": {"dtype": "int32", "zlib": True, "_FillValue": -9999},
+            "track_status": {"dtype": "int16", "zlib": True, "_FillValue": -9999},
+            "track_mergenumbers": {"dtype": "int32", "zlib": True, "_FillValue": -9999},
+            "track_splitnumbers": {"dtype": "int32", "zlib": True, "_FillValue": -9999},
+            "track_reset": {"dtype": "int16", "zlib": True, "_FillValue": -9999},
         },
     )
     logger.info(tracknumbers_outfile)
     logger.info('Get track numbers done.')
     return tracknumbers_outfile
+
+def link_pair_tracks(
+    refcloud_forward_index,
+    newcloud_backward_index,
+    npix_reference,
+    npix_new,
+    nclouds_reference,
+    nclouds_new,
+    tracknumber_ref,
+    tracknumber_new,
+    referencetrackstatus_ref,
+    newtrackstatus_new,
+    trackmergenumber_ref,
+    tracksplitnumber_new,
+    trackreset_new,
+    itrack,
+):
+    """
+    Link features in a reference file and a new file to tracks.
+
+    The track arrays of the reference and the new file are updated in place.
+
+    Args:
+        refcloud_forward_index: np.array
+            New cloud numbers linked to each reference cloud, dimensions: [1, nclouds_ref, nmaxlinks].
+        newcloud_backward_index: np.array
+            Reference cloud numbers linked to each new cloud, dimensions: [1, nclouds_new, nmaxlinks].
+        npix_reference: np.array
+            Number of pixels of each reference cloud.
+        npix_new: np.array
+            Number of pixels of each new cloud.
+        nclouds_reference: int
+            Number of clouds in the reference file.
+        nclouds_new: int
+            Number of clouds in the new file.
+        tracknumber_ref: np.array
+            Track number of each cloud in the reference file.
+        tracknumber_new: np.array
+            Track number of each cloud in the new file.
+        referencetrackstatus_ref: np.array
+            Track status of each cloud in the reference file from linking to the new file.
+        newtrackstatus_new: np.array
+            Track status of each cloud in the new file from linking to the reference file.
+        trackmergenumber_ref: np.array
+            Track number that each cloud in the reference file merges into.
+        tracksplitnumber_new: np.array
+            Track number that each cloud in the new file splits from.
+        trackreset_new: np.array
+            Track reset flag of each cloud in the new file.
+        itrack: int
+            Next free track number.
+
+    Returns:
+        itrack: int
+            Next free track number.
+    """
+    # Intiailize matrix for this time period
+    # logger.debug('Generating tracks')
+    # logger.debug((time.ctime()))
+    trackfound = np.ones(nclouds_reference + 1, dtype=int) * -9999
+
+    # Loop over all reference clouds
+    # logger.debug('Looping over all clouds in the reference file')
+    # logger.debug(('Number of clouds to process: ' + str(nclouds_reference)))
+    # logger.debug((time.ctime()))
+    for ncr in np.arange(
+        1, nclouds_reference + 1
+    ):  # Looping over each reference cloud. Start at 1 since clouds numbered starting at 1.
+        # logger.debug(('Reference cloud #: ' + str(ncr)))
+        # logger.debug((time.ctime()))
+        if trackfound[ncr - 1] < 1:
+
+            # Find all clouds (both forward and backward) associated with this reference cloud
+            nreferenceclouds = 0
+            ntemp_referenceclouds = 1  # Start by forcing to see if track exists
+            temp_referenceclouds = [ncr]
+
+            trackpresent = 0
+            # logger.debug('Finding all associated clouds')
+            # logger.debug((time.ctime()))
+            while ntemp_referenceclouds > nreferenceclouds:
+                associated_referenceclouds = np.copy(temp_referenceclouds).astype(
+                    int
+                )
+                nreferenceclouds = ntemp_referenceclouds
+
+                for nr in range(0, nreferenceclouds):
+                    # logger.debug(('Processing cloud #: ' + str(nr)))
+                    # logger.debug((time.ctime()))
+                    tempncr = associated_referenceclouds[nr]
+
+                    # Find indices of forward linked clouds.
+                    # Need to subtract one since looping based on core number and
+                    # since python starts with indices at zero.
+                    # Row of that core is one less than its number.
+                    newforwardindex = np.array(
+                        np.where(refcloud_forward_index[0, tempncr - 1, :] > 0)
+                    )
+                    nnewforward = np.shape(newforwardindex)[1]
+                    if nnewforward > 0:
+                        core_newforward = refcloud_forward_index[
+                            0, tempncr - 1, newforwardindex[0, :]
+                        ]
+
+                    # Find indices of backwards linked clouds
+                    newbackwardindex = np.array(
+                        np.where(newcloud_backward_index[0, :, :] == tempncr)
+                    )
+                    nnewbackward = np.shape(newbackwardindex)[1]
+                    if nnewbackward > 0:
+                        # Need to add one since want the core index, which starts at one.
+                        # But this is using that row number, which starts at zero.
+                        core_newbackward = (newbackwardindex[0, :] + 1)
+
+                    # Put all the indices associated with new clouds linked to the reference cloud in one vector
+                    if nnewforward > 0:
+                        if trackpresent == 0:
+                            associated_newclouds = core_newforward[:].astype(int)
+                            trackpresent = trackpresent + 1
+                        else:
+                            associated_newclouds = np.append(
+                                associated_newclouds, core_newforward.astype(int)
+                            )
+
+                    if nnewbackward > 0:
+                        if trackpresent == 0:
+                            associated_newclouds = core_newbackward[:]
+                            trackpresent = trackpresent + 1
+                        else:
+                            associated_newclouds = np.append(
+                                associated_newclouds, core_newbackward.astype(int)
+                            )
+
+                    if nnewbackward == 0 and nnewforward == 0:
+                        associated_newclouds = []
+
+                    # If the reference cloud is linked to a new cloud
+                    if trackpresent > 0:
+                        # Sort and find the unique new clouds associated with the reference cloud
+                        if len(associated_newclouds) > 1:
+                            associated_newclouds = np.unique(
+                                np.sort(associated_newclouds)
+                            )
+                        nnewclouds = len(associated_newclouds)
+
+                        # Find reference clouds associated with each new cloud.
+                        # Look to see if these new clouds are linked to other cells in the reference file as well.
+                        for nnew in range(0, nnewclouds):
+                            # Find associated reference clouds
+                            referencecloudindex = np.array(
+                                np.where(
+                                    refcloud_forward_index[0, :, :]
+                                    == associated_newclouds[nnew]
+                                )
+                            )
+                            nassociatedreference = np.shape(referencecloudindex)[1]
+                            if nassociatedreference > 0:
+                                temp_referenceclouds = np.append(
+                                    temp_referenceclouds, referencecloudindex[0] + 1
+                                )
+                                temp_referenceclouds = np.unique(
+                                    np.sort(temp_referenceclouds)
+                                )
+
+                        ntemp_referenceclouds = len(temp_referenceclouds)
+                    else:
+                        nnewclouds = 0
+
+            #################################################################
+            # Now get the track status
+
+            if nnewclouds > 0:
+                ############################################################
+                # Find the largest reference and new clouds
+                # Largest reference cloud
+                # Need to subtract one since associated_referenceclouds gives core index and matrix starts at zero
+                allreferencepix = npix_reference[associated_referenceclouds - 1]
+                largestreferenceindex = np.argmax(allreferencepix)
+                # Cloud number of the largest reference cloud
+                largest_referencecloud = associated_referenceclouds[largestreferenceindex]
+
+                # Largest new cloud
+                # Need to subtract one since associated_newclouds gives cloud number and the matrix starts at zero
+                allnewpix = npix_new[associated_newclouds - 1]
+                largestnewindex = np.argmax(allnewpix)
+                # Cloud number of the largest new cloud
+                largest_newcloud = associated_newclouds[largestnewindex]
+
+                if nnewclouds == 1 and nreferenceclouds == 1:
+                    ############################################################
+                    # Simple continuation
+
+                    # Check trackstatus already has a valid value.
+                    # This will prtrack splits from a previous step being overwritten
+
+                    referencetrackstatus_ref[ncr - 1] = 1
+                    trackfound[ncr - 1] = 1
+                    tracknumber_new[associated_newclouds - 1] = np.copy(
+                        tracknumber_ref[ncr - 1]
+                    )
+
+                elif nreferenceclouds > 1:
+                    ##############################################################
+                    # Merging only
+
+                    # Loop through the reference clouds and assign the track to the largest one,
+                    # the rest just go away
+                    if nnewclouds == 1:
+                        for tempreferencecloud in associated_referenceclouds:
+                            trackfound[tempreferencecloud - 1] = 1
+
+                            # If this reference cloud is the largest fragment of the merger,
+                            # label this reference time (file) as the larger part of merger (2)
+                            # and merging at the next time (ifile + 1)
+                            if tempreferencecloud == largest_referencecloud:
+                                referencetrackstatus_ref[tempreferencecloud - 1] = 2
+                                tracknumber_new[associated_newclouds - 1] = np.copy(
+                                    tracknumber_ref[largest_referencecloud - 1]
+                                )
+                            # If this reference cloud is the smaller fragment of the merger,
+                            # label the reference time (ifile) as the small merger (12)
+                            # and merging at the next time (file + 1)
+                            else:
+                                referencetrackstatus_ref[tempreferencecloud - 1] = 21
+                                trackmergenumber_ref[tempreferencecloud - 1] = np.copy(
+                                    tracknumber_ref[largest_referencecloud - 1]
+                                )
+
+                    #################################################################
+                    # Merging and spliting
+                    else:
+
+                        # Loop over the reference clouds and assign the track the largest one
+                        for tempreferencecloud in associated_referenceclouds:
+                            trackfound[tempreferencecloud - 1] = 1
+
+                            # If this is the larger fragment ofthe merger,
+                            # label the reference time as large merger (2)
+                            # and the actual merging track at the next time
+                            if tempreferencecloud == largest_referencecloud:
+                                referencetrackstatus_ref[tempreferencecloud - 1] = (2 + 13)
+                                tracknumber_new[largest_newcloud - 1] = np.copy(
+                                    tracknumber_ref[largest_referencecloud - 1]
+                                )
+                            # For the smaller fragment of the merger,
+                            # label the reference time as the small merge and
+                            # have the actual merging occur at the next time
+                            else:
+                                referencetrackstatus_ref[tempreferencecloud - 1] = (21 + 13)
+                                trackmergenumber_ref[tempreferencecloud - 1] = np.copy(
+                                    tracknumber_ref[largest_referencecloud - 1]
+                                )
+
+                        # Loop through the new clouds and assign the smaller ones a new track
+                        for tempnewcloud in associated_newclouds:
+
+                            # For the smaller fragment of the split,
+                            # label the new time as the small split
+                            # because the cloud only occurs at the new time step
+                            if tempnewcloud != largest_newcloud:
+                                newtrackstatus_new[tempnewcloud - 1] = 31
+
+                                tracknumber_new[tempnewcloud - 1] = itrack
+                                itrack = itrack + 1
+
+                                tracksplitnumber_new[tempnewcloud - 1] = np.copy(
+                                    tracknumber_ref[largest_referencecloud - 1]
+                                )
+
+                                trackreset_new[tempnewcloud - 1] = 0
+                            # For the larger fragment of the split,
+                            # label the new time as the large split
+                            # so that is consistent with the small fragments.
+                            # The track continues to follow this cloud so the tracknumber is not incramented.
+                            else:
+                                newtrackstatus_new[tempnewcloud - 1] = 3
+                                tracknumber_new[tempnewcloud - 1] = np.copy(
+                                    tracknumber_ref[largest_referencecloud - 1]
+                                )
+
+                #####################################################################
+                # Splitting only
+                elif nnewclouds > 1:
+                    # logger.debug('Splitting only')
+                    # logger.debug((time.ctime()))
+                    # Label reference cloud as a pure split
+                    referencetrackstatus_ref[ncr - 1] = 13
+                    tracknumber_ref[ncr - 1] = np.copy(
+                        tracknumber_ref[largest_referencecloud - 1]
+                    )
+
+                    # Loop over the clouds and assign new tracks to the smaller ones
+                    for tempnewcloud in associated_newclouds:
+                        # For the smaller fragment of the split,
+                        # label the new time as teh small split (13)
+                        # because the cloud only occurs at the new time.
+                        if tempnewcloud != largest_newcloud:
+                            newtrackstatus_new[tempnewcloud - 1] = 31
+
+                            tracknumber_new[tempnewcloud - 1] = itrack
+                            itrack = itrack + 1
+
+                            tracksplitnumber_new[tempnewcloud - 1] = np.copy(tracknumber_ref[ncr - 1])
+
+                            trackreset_new[tempnewcloud - 1] = 0
+                        # For the larger fragment of the split,
+                        # label new time as the large split (3)
+                        # so that is consistent with the small fragments
+                        else:
+                            newtrackstatus_new[tempnewcloud - 1] = 3
+                            tracknumber_new[tempnewcloud - 1] = np.copy(
+                                tracknumber_ref[ncr - 1]
+                            )
+
+                else:
+                    sys.exit(str(ncr) + " How did we get here?")
+
+            ######################################################################################
+            # No new clouds. Track dissipated
+            else:
+
+                trackfound[ncr - 1] = 1
+
+                referencetrackstatus_ref[ncr - 1] = 0
+
+    ##############################################################################
+    # Find any clouds in the new track that don't have a track number.
+    # These are new clouds this file
+
+    for ncn in range(1, int(nclouds_new) + 1):
+        if tracknumber_new[ncn - 1] < 0:
+            tracknumber_new[ncn - 1] = itrack
+            itrack = itrack + 1
+
+            trackreset_new[ncn - 1] = 0
+
+    return itrack
+
+
+def write_tracking_state(
+    tracking_state_outfile,
+    tracknumber,
+    trackreset,
+    tracksplitnumber,
+    newtrackstatus,
+    next_tracknumber,
+    basetime,
+    cloudid_file,
+    config,
+):
+    """
+    Write the open-track state at the last file of a run, used to append new periods later.
+
+    Args:
+        tracking_state_outfile: string
+            Tracking state output filename.
+        tracknumber: np.array
+            Track number of each cloud in the last file.
+        trackreset: np.array
+            Track reset flag of each cloud in the last file, before flagging the end of the data.
+        tracksplitnumber: np.array
+            Split track number of each cloud in the last file.
+        newtrackstatus: np.array
+            Track status of each cloud in the last file from linking with the previous file.
+        next_tracknumber: int
+            Next free track number.
+        basetime: np.datetime64
+            Base time of the last file.
+        cloudid_file: string
+            Last cloudid file name.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        None.
+    """
+    logger = logging.getLogger(__name__)
+    var_dict = {
+        "track_numbers": (["nclouds"], tracknumber.astype(np.int32)),
+        "track_reset": (["nclouds"], trackreset.astype(np.int16)),
+        "track_splitnumbers": (["nclouds"], tracksplitnumber.astype(np.int32)),
+        "newtrack_status": (["nclouds"], newtrackstatus.astype(np.float32)),
+        "next_tracknumber": ([], np.int32(next_tracknumber)),
+        "basetime": ([], np.int64(basetime.astype("datetime64[s]").astype(np.int64))),
+    }
+    coord_dict = {
+        "nclouds": (["nclouds"], np.arange(0, len(tracknumber))),
+    }
+    gattr_dict = {
+        "Title": "Open-track state at the last file of a tracking run",
+        "Created": time.ctime(time.time()),
+        "startdate": config["startdate"],
+        "enddate": config["enddate"],
+        "cloudid_file": cloudid_file,
+    }
+    ds_out = xr.Dataset(var_dict, coords=coord_dict, attrs=gattr_dict)
+    ds_out.track_numbers.attrs["long_name"] = "Track number of each cloud in the last file"
+    ds_out.track_reset.attrs["long_name"] = "Track reset flag of each cloud in the last file before the end of the data"
+    ds_out.track_splitnumbers.attrs["long_name"] = "Number of the track that each cloud in the last file splits from"
+    ds_out.newtrack_status.attrs["long_name"] = "Track status of each cloud in the last file from the previous file"
+    ds_out.next_tracknumber.attrs["long_name"] = "Next free track number"
+    ds_out.basetime.attrs["long_name"] = "Epoch time (seconds since 01/01/1970 00:00) of the last file"
+    ds_out.to_netcdf(path=tracking_state_outfile, mode="w", format="NETCDF4")
+    logger.info(tracking_state_outfile)
+    return
+
+def load_tracking_state(tracking_state_file, maxnclouds):
+    """
+    Load the open-track state at the last file of a previous run.
+
+    Args:
+        tracking_state_file: string
+            Tracking state filename.
+        maxnclouds: int
+            Maximum number of clouds, must be the same as the previous run.
+
+    Returns:
+        state: dictionary
+            Dictionary containing the state variables.
+    """
+    logger = logging.getLogger(__name__)
+    if not os.path.isfile(tracking_state_file):
+        logger.critical(f"Tracking state file not found: {tracking_state_file}")
+        logger.critical("Set save_tracking_state: True in the config file of the previous run.")
+        sys.exit("Code exits in gettracks.py")
+    ds = xr.open_dataset(tracking_state_file)
+    if ds.sizes["nclouds"] != maxnclouds:
+        logger.critical(f"maxnclouds ({maxnclouds}) differs from the previous run ({ds.sizes['nclouds']}).")
+        sys.exit("Code exits in gettracks.py")
+    state = {
+        "track_numbers": ds["track_numbers"].values,
+        "track_reset": ds["track_reset"].values,
+        "track_splitnumbers": ds["track_splitnumbers"].values,
+        "newtrack_status": ds["newtrack_status"].values,
+        "next_tracknumber": int(ds["next_tracknumber"].values),
+        "basetime": int(ds["basetime"].values),
+        "cloudid_file": ds.attrs["cloudid_file"],
+    }
+    ds.close()
+    return state
+
+def append_previous_tracknumbers(
+    prev_tracknumbers_file,
+    tracknumber,
+    trackstatus,
+    trackmergenumber,
+    tracksplitnumber,
+    trackreset,
+    basetime,
+    cloudidfiles,
+):
+    """
+    Combine track numbers of a previous run with those of an appended period.
+
+    The first file of the appended period is the last file of the previous run,
+    which replaces it because its status and merge numbers are now complete.
+
+    Args:
+        prev_tracknumbers_file: string
+            Track numbers filename of the previous run.
+        tracknumber: np.array
+            Track numbers of the appended period, dimensions: [1, nfiles, nclouds].
+        trackstatus: np.array
+            Track status of the appended period.
+        trackmergenumber: np.array
+            Merge track numbers of the appended period.
+        tracksplitnumber: np.array
+            Split track numbers of the appended period.
+        trackreset: np.array
+            Track reset flags of the appended period.
+        basetime: np.array
+            Base time of each file of the appended period.
+        cloudidfiles: np.array
+            Cloudid filenames (characters) of the appended period, dimensions: [nfiles, ncharacters].
+
+    Returns:
+        tracknumber, trackstatus, trackmergenumber, tracksplitnumber, trackreset: np.array
+            Combined arrays.
+        basetime: np.array
+            Combined base time.
+        cloudidfiles: np.array
+            Combined cloudid filenames.
+        nfiles: int
+            Combined number of files.
+    """
+    logger = logging.getLogger(__name__)
+    if not os.path.isfile(prev_tracknumbers_file):
+        logger.critical(f"Track numbers file of the previous run not found: {prev_tracknumbers_file}")
+        sys.exit("Code exits in gettracks.py")
+    ds = xr.open_dataset(prev_tracknumbers_file, mask_and_scale=False, decode_times=False)
+    # Drop the last file of the previous run
+    nprev = ds.sizes["nfiles"] - 1
+    tracknumber = np.concatenate([ds["track_numbers"].values[:, :nprev, :], tracknumber], axis=1)
+    trackstatus = np.concatenate([ds["track_status"].values[:, :nprev, :], trackstatus], axis=1)
+    trackmergenumber = np.concatenate([ds["track_mergenumbers"].values[:, :nprev, :], trackmergenumber], axis=1)
+    tracksplitnumber = np.concatenate([ds["track_splitnumbers"].values[:, :nprev, :], tracksplitnumber], axis=1)
+    trackreset = np.concatenate([ds["track_reset"].values[:, :nprev, :], trackreset], axis=1)
+    basetime = np.concatenate([ds["basetimes"].values[:nprev].astype("datetime64[s]"), basetime])
+    prev_cloudidfiles = ds["cloudid_files"].values[:nprev, :]
+    ds.close()
+    # Pad filenames to the same length
+    strlength = max(prev_cloudidfiles.shape[1], cloudidfiles.shape[1])
+    cloudidfiles = np.concatenate([
+        np.pad(prev_cloudidfiles, ((0, 0), (0, strlength - prev_cloudidfiles.shape[1])), constant_values=b""),
+        np.pad(np.asarray(cloudidfiles), ((0, 0), (0, strlength - cloudidfiles.shape[1])), constant_values=b""),
+    ], axis=0)
+    nfiles = tracknumber.shape[1]
+    return tracknumber, trackstatus, trackmergenumber, tracksplitnumber, trackreset, basetime, cloudidfiles, nfiles
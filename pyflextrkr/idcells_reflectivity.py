@@ -54,6 +54,8 @@ def idcells_reflectivity(
     input_source = config['input_source']
     geolimits = config.get('geolimits', None)
     convolve_method = config.get('convolve_method', 'ndimage')
+    tile_size = config.get('tile_size', None)
+    tile_nthreads = config.get('tile_nthreads', 1)
 
     # Set echo classification type values
     types_powell = {
@@ -144,6 +146,8 @@ def idcells_reflectivity(
             remove_smallcores=True,
             return_diag=return_diag,
             convolve_method=convolve_method,
+            tile_size=tile_size,
+            tile_nthreads=tile_nthreads,
         )
 
     if return_diag == True:
@@ -165,12 +169,15 @@ def idcells_reflectivity(
             remove_smallcores=True,
             return_diag=return_diag,
             convolve_method=convolve_method,
+            tile_size=tile_size,
+            tile_nthreads=tile_nthreads,
         )
     
     # Expand convective cell masks outward to a set of radii to
     # increase the convective cell footprint for better tracking convective cells
     core_expand, core_sorted = expand_conv_core(
-        core_dilate, radii_expand, dx, dy, min_corenpix=0)
+        core_dilate, radii_expand, dx, dy, min_corenpix=0,
+        tile_size=tile_size, tile_nthreads=tile_nthreads)
 
     # Calculate echo-top heights for various reflectivity thresholds
     shape_2d = refl.shape
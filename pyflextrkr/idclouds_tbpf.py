@@ -4,16 +4,15 @@ import logging
 import numpy as np
 import xarray as xr
 import pandas as pd
-from scipy.signal import medfilt2d
-from scipy.ndimage import label, filters
-from astropy.convolution import Box2DKernel, convolve
+from scipy.ndimage import filters
 from pyflextrkr import netcdf_io as net
-from pyflextrkr.ftfunctions import olr_to_tb
+from pyflextrkr.ftfunctions import olr_to_tb, smooth_box_nan, medfilt2d_missing
 from pyflextrkr.futyan3 import futyan3
 from pyflextrkr.label_and_grow_cold_clouds import label_and_grow_cold_clouds
 from pyflextrkr.ftfunctions import sort_renumber, sort_renumber2vars, link_pf_tb
 from pyflextrkr.sl3d_func import run_sl3d
 from pyflextrkr.ft_utilities import get_timestamp_from_filename_single
+from pyflextrkr.ft_tiling import label_tiled
 
 def idclouds_tbpf(
     filename,
@@ -74,6 +73,8 @@ def idclouds_tbpf(
     pf_smooth_window = config.get('pf_smooth_window', 0)
     pf_dbz_thresh = config.get('pf_dbz_thresh', 0)
     pf_link_area_thresh = config.get('pf_link_area_thresh', 0)
+    tile_size = config.get('tile_size', None)
+    tile_nthreads = config.get('tile_nthreads', 1)
     feature_type = config['feature_type']
     # Output file name parameters
     tracking_outpath = config['tracking_outpath']
@@ -225,14 +226,14 @@ def idclouds_tbpf(
                 logger.error(f'Tracking will exit now.')
                 sys.exit()
 
-            # Use median filter to fill in missing values
-            ir_filt = medfilt2d(in_ir, kernel_size=medfiltsize)
-            # Copy the original IR data
-            out_ir = np.copy(in_ir)
+            # Copy the original IR data (Tb is kept in float32)
+            out_ir = np.array(in_ir, dtype=np.float32)
             # Create a mask for the missing pixels
             missmask = np.isnan(in_ir)
-            # Fill in the missing pixels with the filtered values, retain the rest
-            out_ir[missmask] = ir_filt[missmask]
+            # Use median filter to fill in missing values, retain the rest
+            # The median filter is only computed around the missing pixels
+            if np.any(missmask):
+                out_ir[missmask] = medfilt2d_missing(in_ir, medfiltsize, missmask)
 
             #####################################################
             # Mask brightness temperatures outside of normal range
@@ -258,6 +259,8 @@ def idclouds_tbpf(
                             mincoldcorepix,
                             smoothwindowdimensions,
                             warmanvilexpansion,
+                            tile_size=tile_size,
+                            tile_nthreads=tile_nthreads,
                         )
                     elif cloudidmethod == "futyan3":
                         clouddata = futyan3(
@@ -313,19 +316,16 @@ def idclouds_tbpf(
 
                             # Replace values <=0 with 0 before smoothing
                             pcp_linkpf[pcp_linkpf <= 0] = 0
-                            # Smooth pcp_linkpf using convolve filter (handles NaN)
-                            kernel = Box2DKernel(pf_smooth_window)
-                            pcp_s = convolve(
-                                np.squeeze(pcp_linkpf), kernel, 
-                                boundary="extend", nan_treatment="interpolate", preserve_nan=True,
-                            )
+                            # Smooth pcp_linkpf using box filter (handles NaN)
+                            pcp_s = smooth_box_nan(np.squeeze(pcp_linkpf), pf_smooth_window)
                             # Smooth PF variable, then label PF exceeding threshold
                             # pcp_s = filters.uniform_filter(
                             #     np.squeeze(pcp_linkpf),
                             #     size=pf_smooth_window,
                             #     mode="nearest",
                             # )
-                            pf_number, npf = label(pcp_s >= pf_dbz_thresh)
+                            pf_number, npf = label_tiled(
+                                pcp_s >= pf_dbz_thresh, tile_size=tile_size, nthreads=tile_nthreads)
 
                             # Convert PF area threshold to number of pixels
                             min_npix = np.ceil(
@@ -380,16 +380,17 @@ def idclouds_tbpf(
                                 final_pcp = np.expand_dims(pcp, axis=0)
                             else:
                                 final_pcp = pcp
+                            final_pcp = final_pcp.astype(np.float32, copy=False)
 
                         else:
                             # Create default arrays
                             final_pcp = np.full(
                                 final_convcold_cloudnumber.shape,
                                 np.nan,
-                                dtype=float,
+                                dtype=np.float32,
                             )
                             final_pf_number = np.full(
-                                final_convcold_cloudnumber.shape, 0, dtype=int
+                                final_convcold_cloudnumber.shape, 0, dtype=np.int32
                             )
                             # Make a copy of the original arrays
                             final_cloudnumber_orig = final_cloudnumber
@@ -399,10 +400,10 @@ def idclouds_tbpf(
                     else:
                         # Create default arrays
                         final_pcp = np.full(
-                            final_convcold_cloudnumber.shape, np.nan, dtype=float
+                            final_convcold_cloudnumber.shape, np.nan, dtype=np.float32
                         )
                         final_pf_number = np.full(
-                            final_convcold_cloudnumber.shape, 0, dtype=int
+                            final_convcold_cloudnumber.shape, 0, dtype=np.int32
                         )
                         # Make a copy of the original arrays
                         final_cloudnumber_orig = final_cloudnumber
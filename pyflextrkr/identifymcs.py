@@ -5,7 +5,9 @@ import sys
 import xarray as xr
 import logging
 from pyflextrkr.ft_utilities import load_sparse_trackstats
+from pyflextrkr.ft_profiling import profile_step
 
+@profile_step
 def identifymcs_tb(config):
     """
     Identify MCS using track Tb features.
@@ -282,7 +284,9 @@ def identifymcs_tb(config):
     # Subset MCS tracks from 1D dataset
     # Note: the tracks_dimname cannot be used here as Xarray does not seem to have
     # a method to select data with a string variable
-    ds_1d = ds_1d.sel(tracks=trackidx_mcs)
+    ds_1d = ds_1d.sel(tracks=trackidx_mcs).load()
+    # Close the sparse trackstats file
+    sparse_dict.close()
     # Replace tracks coordinate
     ds_1d[tracks_dimname] = tracks_coord
     # Merge 1D & 2D datasets
@@ -1,9 +1,35 @@
 import sys
 import logging
-import dask
-from dask.distributed import wait
 from pyflextrkr.ft_utilities import subset_files_timerange
+from pyflextrkr.ft_parallel import run_tasks
+from pyflextrkr.ft_profiling import profile_step
 
+def get_idfeature_function(feature_type):
+    """
+    Get the feature identification function for a feature type.
+
+    Args:
+        feature_type: string
+            Feature type from the config file.
+
+    Returns:
+        id_feature: function
+            Feature identification function, called as id_feature(filename, config).
+    """
+    logger = logging.getLogger(__name__)
+    if feature_type == "generic":
+        from pyflextrkr.idfeature_generic import idfeature_generic as id_feature
+    elif feature_type == "radar_cells":
+        from pyflextrkr.idcells_reflectivity import idcells_reflectivity as id_feature
+    elif "tb_pf" in feature_type:
+        from pyflextrkr.idclouds_tbpf import idclouds_tbpf as id_feature
+    else:
+        logger.critical(f"ERROR: Unknown feature_type: {feature_type}")
+        logger.critical("Tracking will now exit.")
+        sys.exit()
+    return id_feature
+
+@profile_step
 def idfeature_driver(config):
     """
     Driver for feature identification.
@@ -24,19 +50,13 @@ def idfeature_driver(config):
     start_basetime = config["start_basetime"]
     end_basetime = config["end_basetime"]
     time_format = config["time_format"]
-    run_parallel = config["run_parallel"]
     feature_type = config["feature_type"]
+    append_basetime = config.get("append_basetime", None)
+    # In append mode, only process files after the end of the previous run
+    if append_basetime is not None:
+        start_basetime = max(start_basetime, append_basetime + 1)
     # Load function depending on feature_type
-    if feature_type == "generic":
-        from pyflextrkr.idfeature_generic import idfeature_generic as id_feature
-    elif feature_type == "radar_cells":
-        from pyflextrkr.idcells_reflectivity import idcells_reflectivity as id_feature
-    elif "tb_pf" in feature_type:
-        from pyflextrkr.idclouds_tbpf import idclouds_tbpf as id_feature
-    else:
-        logger.critical(f"ERROR: Unknown feature_type: {feature_type}")
-        logger.critical("Tracking will now exit.")
-        sys.exit()
+    id_feature = get_idfeature_function(feature_type)
 
     # Identify files to process
     infiles_info = subset_files_timerange(
@@ -51,20 +71,8 @@ def idfeature_driver(config):
     nfiles = len(rawdatafiles)
     logger.info(f"Total number of files to process: {nfiles}")
 
-    # Serial
-    if run_parallel == 0:
-        for ifile in range(0, nfiles):
-            id_feature(rawdatafiles[ifile], config)
-    # Parallel
-    elif run_parallel >= 1:
-        results = []
-        for ifile in range(0, nfiles):
-            result = dask.delayed(id_feature)(rawdatafiles[ifile], config)
-            results.append(result)
-        final_result = dask.compute(*results)
-        wait(final_result)
-    else:
-        sys.exit('Valid parallelization flag not provided')
+    # Run feature identification for each file
+    run_tasks(id_feature, [(rawdatafile,) for rawdatafile in rawdatafiles], config, task_name="idfeature")
 
     logger.info('Done with features from raw data.')
     return
\ No newline at end of file
@@ -5,8 +5,9 @@ import time
 import xarray as xr
 import pandas as pd
 import logging
-from scipy.ndimage import label
 from pyflextrkr.ftfunctions import sort_renumber, skimage_watershed
+from pyflextrkr.ft_tiling import label_tiled
+from pyflextrkr.trackstats_func import add_feature_stats
 
 def idfeature_generic(
     input_filename,
@@ -44,6 +45,8 @@ def idfeature_generic(
     label_method = config.get("label_method", "ndimage.label")
     R_earth = config.get("R_earth")
     pass_varname = config.get("pass_varname", None)
+    tile_size = config.get("tile_size", None)
+    tile_nthreads = config.get("tile_nthreads", 1)
     fillval = config["fillval"]
 
     # Get min/max field thresholds
@@ -124,7 +127,8 @@ def idfeature_generic(
         # Label feature
         # Simple threshold & connectivity method
         if label_method == 'ndimage.label':
-            var_number, nblobs = label((field_thresh_min < fvar) & (fvar < field_thresh_max))
+            var_number, nblobs = label_tiled((field_thresh_min < fvar) & (fvar < field_thresh_max),
+                                         tile_size=tile_size, nthreads=tile_nthreads)
             param_dict = {
                 'field_thresh': field_thresh,
             }
@@ -218,6 +222,10 @@ def idfeature_generic(
         # Define xarray dataset
         dsout = xr.Dataset(var_dict, coords=coord_dict, attrs=gattr_dict)
 
+        # Add feature statistics for trackstats
+        if config.get("feature_stats_at_id", True):
+            dsout = add_feature_stats(dsout, config)
+
         # Delete file if it already exists
         if os.path.isfile(cloudid_outfile):
             os.remove(cloudid_outfile)
@@ -0,0 +1,165 @@
+import os
+import time
+import logging
+import pandas as pd
+from dask.distributed import as_completed
+from pyflextrkr.ft_utilities import subset_files_timerange, get_timestamp_from_filename_single
+from pyflextrkr.ft_parallel import get_dask_client, run_task_chunk
+from pyflextrkr.ft_profiling import add_timeline_records, profile_step
+from pyflextrkr.idfeature_driver import idfeature_driver, get_idfeature_function
+from pyflextrkr.tracksingle_driver import tracksingle_driver
+from pyflextrkr.tracksingle_drift import trackclouds
+
+@profile_step
+def idfeature_tracksingle_driver(config):
+    """
+    Driver for feature identification pipelined with tracking of sequential pairs.
+
+    Feature identification tasks for all files are submitted at once. As soon as the
+    idfeature outputs of two adjacent times exist, trackclouds for that pair is submitted,
+    so that tracking overlaps with the tail of feature identification.
+    Each input file is expected to produce one idfeature file.
+
+    The two steps are run one after the other (idfeature_driver, tracksingle_driver) if
+    running in serial, if no Dask client is available, if a driftfile is provided,
+    or in append mode (append_from_enddate).
+
+    Args:
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        Feature identification and track data are written to netCDF files.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    clouddata_path = config["clouddata_path"]
+    databasename = config["databasename"]
+    cloudid_filebase = config["cloudid_filebase"]
+    start_basetime = config["start_basetime"]
+    end_basetime = config["end_basetime"]
+    time_format = config["time_format"]
+    run_parallel = config["run_parallel"]
+    feature_type = config["feature_type"]
+    driftfile = config.get("driftfile", None)
+    append_basetime = config.get("append_basetime", None)
+
+    client = get_dask_client() if (run_parallel >= 1) else None
+    if (client is None) or (driftfile is not None) or (append_basetime is not None):
+        logger.info('Pipeline not available, running idfeature and tracksingle sequentially')
+        idfeature_driver(config)
+        tracksingle_driver(config)
+        return
+
+    logger.info('Identifying features and tracking sequential pairs of idfeature files (pipelined)')
+
+    # Load function depending on feature_type
+    id_feature = get_idfeature_function(feature_type)
+
+    # Identify files to process
+    rawdatafiles = subset_files_timerange(
+        clouddata_path,
+        databasename,
+        start_basetime,
+        end_basetime,
+        time_format=time_format,
+    )[0]
+    nfiles = len(rawdatafiles)
+    logger.info(f"Total number of files to process: {nfiles}")
+
+    t0 = time.perf_counter()
+    # Send config to all workers once
+    config_future = client.scatter([config], broadcast=True, hash=False)[0]
+
+    # Submit feature identification for all files
+    task_index = {}
+    for ifile in range(0, nfiles):
+        future = client.submit(
+            run_task_chunk, id_feature, [(rawdatafiles[ifile],)], [{}], config_future,
+            task_indices=[ifile], task_name="idfeature", pure=False,
+        )
+        task_index[future] = ("idfeature", ifile)
+
+    # idfeature output filename for each input file (None if no output)
+    status_done = [False] * nfiles
+    cloudid_files = [None] * nfiles
+    submitted_pairs = set()
+    npairs = 0
+
+    def find_neighbor(ifile, step):
+        # Find the nearest input file index with an output, stepping over
+        # finished files without output. Returns None if a file in between
+        # is still running or the end of the list is reached.
+        jfile = ifile + step
+        while 0 <= jfile < nfiles:
+            if not status_done[jfile]:
+                return None
+            if cloudid_files[jfile] is not None:
+                return jfile
+            jfile += step
+        return None
+
+    def submit_pair(ifile, jfile):
+        if (ifile is None) or (jfile is None) or ((ifile, jfile) in submitted_pairs):
+            return 0
+        submitted_pairs.add((ifile, jfile))
+        filepair = (cloudid_files[ifile], cloudid_files[jfile])
+        basetimepair = (
+            get_cloudid_basetime(filepair[0], cloudid_filebase),
+            get_cloudid_basetime(filepair[1], cloudid_filebase),
+        )
+        future = client.submit(
+            run_task_chunk, trackclouds, [(filepair, basetimepair)], [{}], config_future,
+            task_indices=[ifile], task_name="tracksingle", pure=False,
+        )
+        task_index[future] = ("tracksingle", ifile)
+        seq.add(future)
+        return 1
+
+    # Process tasks in order of completion
+    seq = as_completed(list(task_index.keys()))
+    for future in seq:
+        task_type, ifile = task_index.pop(future)
+        # Raise the exception if the task failed
+        iresults, itime, irecords = future.result()
+        add_timeline_records(irecords)
+        result = iresults[0]
+        if task_type != "idfeature":
+            continue
+        status_done[ifile] = True
+        cloudid_files[ifile] = result
+        # Submit tracking for the pairs that became available
+        iprev = find_neighbor(ifile, -1)
+        inext = find_neighbor(ifile, 1)
+        if result is not None:
+            npairs += submit_pair(iprev, ifile)
+            npairs += submit_pair(ifile, inext)
+        else:
+            npairs += submit_pair(iprev, inext)
+    del config_future
+
+    wall_time = time.perf_counter() - t0
+    logger.info(f"Pipelined {nfiles} idfeature tasks and {npairs} tracksingle tasks, wall time: {wall_time:.1f}s")
+    logger.info('Done with features from raw data and tracking sequential pairs of idfeature files')
+    return
+
+def get_cloudid_basetime(filename, cloudid_filebase):
+    """
+    Get base time (Epoch time) of an idfeature file from its filename.
+
+    Args:
+        filename: string
+            idfeature file name.
+        cloudid_filebase: string
+            idfeature file base name.
+
+    Returns:
+        basetime: int
+            Base time of the file.
+    """
+    file_timestamp = get_timestamp_from_filename_single(os.path.basename(filename), cloudid_filebase)
+    # Seconds are set to 0 consistent with get_basetime_from_filename
+    file_timestamp = file_timestamp.replace(second=0)
+    basetime = int((file_timestamp - pd.Timestamp('1970-01-01T00:00:00')).total_seconds())
+    return basetime
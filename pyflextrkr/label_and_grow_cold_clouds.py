@@ -1,8 +1,8 @@
 import logging
 import numpy as np
-from scipy.ndimage import label, binary_dilation, generate_binary_structure
-from astropy.convolution import Box2DKernel, convolve
-from pyflextrkr.ftfunctions import sort_renumber, grow_cells
+from scipy.ndimage import binary_dilation, generate_binary_structure
+from pyflextrkr.ftfunctions import sort_renumber, grow_cells, smooth_box_nan
+from pyflextrkr.ft_tiling import label_tiled
 
 
 def label_and_grow_cold_clouds(
@@ -13,6 +13,8 @@ def label_and_grow_cold_clouds(
     mincoldcorepix,
     smoothsize,
     warmanvilexpansion,
+    tile_size=None,
+    tile_nthreads=1,
 ):
     """
     Label and growth cold clouds using infrared Tb.
@@ -32,6 +34,10 @@ def label_and_grow_cold_clouds(
             Window size to smooth Tb data using Box2DKernel.
         warmanvilexpansion: int
             Flag to expand cloud to include warm anvil.
+        tile_size: int or list, default=None
+            Tile size [ny, nx] to label regions tile by tile (see ft_tiling.label_tiled).
+        tile_nthreads: int, default=1
+            Number of threads to label the tiles.
 
     Returns:
         Dictionary: 
@@ -71,12 +77,13 @@ def label_and_grow_cold_clouds(
     # Smooth Tb data
     smoothir = smooth_tb(ir, smoothsize)
     # Label cold cores
-    labelcore_number2d, nlabelcores = find_and_label_cold_cores(smoothir, thresh_core)
+    labelcore_number2d, nlabelcores = find_and_label_cold_cores(
+        smoothir, thresh_core, tile_size=tile_size, tile_nthreads=tile_nthreads)
 
     # Create empty arrays
-    labelcorecold_number2d = np.zeros((ny, nx), dtype=int)
-    sortedcorecold_number2d = np.zeros((ny, nx), dtype=int)
-    final_corecoldwarmnumber = np.zeros((ny, nx), dtype=int)
+    labelcorecold_number2d = np.zeros((ny, nx), dtype=np.int32)
+    sortedcorecold_number2d = np.zeros((ny, nx), dtype=np.int32)
+    final_corecoldwarmnumber = np.zeros((ny, nx), dtype=np.int32)
     labelcorecold_npix = []
     sortedcore_npix = []
     sortedcold_npix = []
@@ -128,7 +135,7 @@ def label_and_grow_cold_clouds(
         # Label cold anvils that do not have a cold core
 
         # Find indices that satisfy cold anvil threshold or convective core threshold and is not labeled
-        isolated_flag = np.zeros((ny, nx), dtype=int)
+        isolated_flag = np.zeros((ny, nx), dtype=np.int8)
         isolated_indices = np.where(
             (labelcorecold_number2d == 0) & ((coldanvil_flag > 0) | (core_flag > 0))
         )
@@ -137,7 +144,7 @@ def label_and_grow_cold_clouds(
             isolated_flag[isolated_indices] = 1
 
         # Label isolated cold cores or cold anvils
-        labelisolated_number2d, nlabelisolated = label(isolated_flag)
+        labelisolated_number2d, nlabelisolated = label_tiled(isolated_flag, tile_size=tile_size, nthreads=tile_nthreads)
 
         # Sort isolated cold cores/anvils by size and remove small ones
         sortedisolated_number2d, sortedisolated_npix = sort_renumber(labelisolated_number2d, nthresh)
@@ -173,7 +180,7 @@ def label_and_grow_cold_clouds(
         sortedcorecoldisolated_number1d = np.copy(labelcorecoldisolated_number1d[order])
 
         # Re-number clouds
-        sortedcorecoldisolated_number2d = np.zeros((ny, nx), dtype=int)
+        sortedcorecoldisolated_number2d = np.zeros((ny, nx), dtype=np.int32)
         final_ncorepix = np.ones(ncorecoldisolated, dtype=int) * -9999
         final_ncoldpix = np.ones(ncorecoldisolated, dtype=int) * -9999
         final_nwarmpix = np.ones(ncorecoldisolated, dtype=int) * -9999
@@ -211,12 +218,12 @@ def label_and_grow_cold_clouds(
         #################################################
         # Label regions with cold anvils and cores
         corecold_flag = core_flag + coldanvil_flag
-        corecold_number2d, ncorecold = label(coldanvil_flag)
+        corecold_number2d, ncorecold = label_tiled(coldanvil_flag, tile_size=tile_size, nthreads=tile_nthreads)
 
         ##########################################################
         # Loop through clouds and only keep those where core + cold anvil exceed threshold
         if ncorecold > 0:
-            labelcorecold_number2d = np.zeros((ny, nx), dtype=int)
+            labelcorecold_number2d = np.zeros((ny, nx), dtype=np.int32)
             labelcore_npix = np.ones(ncorecold, dtype=int) * -9999
             labelcold_npix = np.ones(ncorecold, dtype=int) * -9999
             labelwarm_npix = np.ones(ncorecold, dtype=int) * -9999
@@ -268,7 +275,7 @@ def label_and_grow_cold_clouds(
                 # Re-number cores
                 sortedcorecold_number1d = np.copy(labelcorecold_number1d[order])
 
-                sortedcorecold_number2d = np.zeros((ny, nx), dtype=int)
+                sortedcorecold_number2d = np.zeros((ny, nx), dtype=np.int32)
                 corecoldstep = 0
                 for isortedcorecold in range(0, ncorecold):
                     sortedcorecold_indices = np.where(
@@ -291,8 +298,8 @@ def label_and_grow_cold_clouds(
             final_nwarmpix = np.copy(sortedwarm_npix)
             final_ncorecoldpix = final_ncorepix + final_ncoldpix
         else:
-            final_corecoldnumber = np.zeros((ny, nx), dtype=int)
-            final_corecoldwarmnumber = np.zeros((ny, nx), dtype=int)
+            final_corecoldnumber = np.zeros((ny, nx), dtype=np.int32)
+            final_corecoldwarmnumber = np.zeros((ny, nx), dtype=np.int32)
             final_ncorecold = 0
             final_ncorepix = np.zeros((1,), dtype=int)
             final_ncoldpix = np.zeros((1,), dtype=int)
@@ -424,7 +431,7 @@ def label_and_grow_cold_clouds(
     }
 
 
-def find_and_label_cold_cores(smoothir, thresh_core):
+def find_and_label_cold_cores(smoothir, thresh_core, tile_size=None, tile_nthreads=1):
     """
     Label cold cores using ndimage.label.
 
@@ -433,6 +440,10 @@ def find_and_label_cold_cores(smoothir, thresh_core):
             Array containing smoothed IR Tb data.
         thresh_core: float
             Tb threshold to define cold core.
+        tile_size: int or list, default=None
+            Tile size [ny, nx] to label regions tile by tile.
+        tile_nthreads: int, default=1
+            Number of threads to label the tiles.
 
     Returns:
         labelcore_number2d: np.array
@@ -442,19 +453,19 @@ def find_and_label_cold_cores(smoothir, thresh_core):
 
     """
     # Find cold cores in smoothed data
-    smoothcore_flag = np.zeros(smoothir.shape, dtype=int)
+    smoothcore_flag = np.zeros(smoothir.shape, dtype=np.int8)
     smoothcore_indices = np.where(smoothir < thresh_core)
     nsmoothcorepix = np.shape(smoothcore_indices)[1]
     if nsmoothcorepix > 0:
         smoothcore_flag[smoothcore_indices] = 1
     # Label cold cores in smoothed data
-    labelcore_number2d, nlabelcores = label(smoothcore_flag)
+    labelcore_number2d, nlabelcores = label_tiled(smoothcore_flag, tile_size=tile_size, nthreads=tile_nthreads)
     return labelcore_number2d, nlabelcores
 
 
 def smooth_tb(ir, smoothsize):
     """
-    Smooth Tb with a convolve filter.
+    Smooth Tb with a box filter.
 
     Args:
         ir: np.array
@@ -469,11 +480,8 @@ def smooth_tb(ir, smoothsize):
             Array containing smoothed IR Tb data.
 
     """
-    # Smooth Tb data using a convolve filter
-    kernel = Box2DKernel(smoothsize)
-    smoothir = convolve(
-        ir, kernel, boundary="extend", nan_treatment="interpolate", preserve_nan=True
-    )
+    # Smooth Tb data using a box filter (handles NaN)
+    smoothir = smooth_box_nan(ir, smoothsize)
     return smoothir
 
 
@@ -515,8 +523,8 @@ def generate_pixel_identification_from_threshold(
         final_cloudid: np.array
             Array containing cloud type pixel flag.
     """
-    final_cloudid = np.zeros((ny, nx), dtype=int)
-    core_flag = np.zeros((ny, nx), dtype=int)
+    final_cloudid = np.zeros((ny, nx), dtype=np.int16)
+    core_flag = np.zeros((ny, nx), dtype=np.int8)
     # Flag cold core
     core_indices = np.where(ir < thresh_core)
     ncorepix = np.shape(core_indices)[1]
@@ -524,28 +532,28 @@ def generate_pixel_identification_from_threshold(
         core_flag[core_indices] = 1
         final_cloudid[core_indices] = 1
     # Flag cold anvil
-    coldanvil_flag = np.zeros((ny, nx), dtype=int)
+    coldanvil_flag = np.zeros((ny, nx), dtype=np.int8)
     coldanvil_indices = np.where((ir >= thresh_core) & (ir < thresh_cold))
     ncoldanvilpix = np.shape(coldanvil_indices)[1]
     if ncoldanvilpix > 0:
         coldanvil_flag[coldanvil_indices] = 1
         final_cloudid[coldanvil_indices] = 2
     # Flag warm anvil
-    warmanvil_flag = np.zeros((ny, nx), dtype=int)
+    warmanvil_flag = np.zeros((ny, nx), dtype=np.int8)
     warmanvil_indices = np.where((ir >= thresh_cold) & (ir < thresh_warm))
     nwarmanvilpix = np.shape(warmanvil_indices)[1]
     if nwarmanvilpix > 0:
         warmanvil_flag[coldanvil_indices] = 1
         final_cloudid[warmanvil_indices] = 3
     # Flag warm clouds
-    othercloud_flag = np.zeros((ny, nx), dtype=int)
+    othercloud_flag = np.zeros((ny, nx), dtype=np.int8)
     othercloud_indices = np.where((ir >= thresh_warm) & (ir < thresh_cloud))
     nothercloudpix = np.shape(othercloud_indices)[1]
     if nothercloudpix > 0:
         othercloud_flag[othercloud_indices] = 1
         final_cloudid[othercloud_indices] = 4
     # Flag clear area
-    clear_flag = np.zeros((ny, nx), dtype=int)
+    clear_flag = np.zeros((ny, nx), dtype=np.int8)
     clear_indices = np.where(ir >= thresh_cloud)
     nclearpix = np.shape(clear_indices)[1]
     if nclearpix > 0:
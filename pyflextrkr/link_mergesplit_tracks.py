@@ -5,7 +5,9 @@ import sys
 import xarray as xr
 import logging
 from pyflextrkr.ft_utilities import load_sparse_trackstats
+from pyflextrkr.ft_profiling import profile_step
 
+@profile_step
 def link_mergesplit_tracks(config):
     """
     Link small merge or split tracks to main tracks.
@@ -220,7 +222,9 @@ def link_mergesplit_tracks(config):
     # Subset main tracks from 1D dataset
     # Note: the tracks_dimname cannot be used here as Xarray does not seem to have
     # a method to select data with a string variable
-    ds_1d = ds_1d.sel(tracks=maintrack_idx)
+    ds_1d = ds_1d.sel(tracks=maintrack_idx).load()
+    # Close the sparse trackstats file
+    sparse_dict.close()
     # Replace tracks coordinate
     ds_1d[tracks_dimname] = tracks_coord
     # Merge 1D & 2D datasets
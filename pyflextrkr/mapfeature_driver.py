@@ -1,13 +1,16 @@
 import os
 import sys
+import time
+import shutil
 import logging
 import numpy as np
 import xarray as xr
-import dask
-from dask.distributed import wait
 from pyflextrkr.ft_utilities import subset_files_timerange
-from pyflextrkr.mapfeature_func import map_feature
+from pyflextrkr.ft_parallel import run_tasks
+from pyflextrkr.mapfeature_func import map_feature, write_pixel_track_index, get_track_bbox, read_pixel_labels
+from pyflextrkr.ft_profiling import profile_step
 
+@profile_step
 def mapfeature_driver(
         config,
         trackstats_filebase="trackstats_",
@@ -54,16 +57,120 @@ def mapfeature_driver(
     end_basetime = config["end_basetime"]
     # Minimum time difference threshold [second] to match track stats and cloudid pixel files
     match_pixel_dt_thresh = config["match_pixel_dt_thresh"]
-    run_parallel = config["run_parallel"]
     # feature_type = config["feature_type"]
     nmaxlinks = config["nmaxlinks"]
     tracks_dimname = config.get("tracks_dimname", "tracks")
     times_dimname = config.get("times_dimname", "times")
     fillval = config.get("fillval", -9999)
+    # Write the per-track index of pixel-level files (default: no)
+    pixel_track_index = config.get("pixel_track_index", 0)
+    pixel_track_index_filebase = config.get("pixel_track_index_filebase", "pixel_track_index_")
+    append_basetime = config.get("append_basetime", None)
+    # Run-length encoded track label layers are not supported by regrid_tracking_mask
+    if (config.get("pixel_label_encoding", "dense") == "rle") and config.get("run_regrid_mask", False):
+        logger.critical("pixel_label_encoding: 'rle' is not supported with run_regrid_mask, use 'dense'.")
+        sys.exit("Code exits in mapfeature_driver.")
 
     #########################################################################################
     # Read track stats
     trackstats_file = f"{stats_path}{trackstats_filebase}{startdate}_{enddate}.nc"
+    stats = read_map_trackstats(trackstats_file, tracks_dimname, times_dimname, nmaxlinks, fillval)
+
+    #########################################################################################
+    # Identify files to process
+    # Create pixel tracking file output directory
+    os.makedirs(pixeltracking_outpath, exist_ok=True)
+    cloudidfiles, \
+    cloudidfiles_basetime, \
+    cloudidfiles_datestring, \
+    cloudidfiles_timestring = subset_files_timerange(tracking_outpath,
+                                                     cloudid_filebase,
+                                                     start_basetime,
+                                                     end_basetime)
+    nfiles = len(cloudidfiles)
+    logger.info(f"Total number of files to process: {nfiles}")
+
+    args_list = []
+    # Loop over each pixel file
+    for ifile in range(0, nfiles):
+        # Save task arguments for this file
+        args_list.append(
+            (cloudidfiles[ifile], cloudidfiles_basetime[ifile]) +
+            get_file_track_args(stats, cloudidfiles_basetime[ifile], match_pixel_dt_thresh) +
+            (stats["comments"],)
+        )
+
+    # In append mode, reuse the pixel files of the previous run
+    # if the tracks in the file have not changed
+    reuse_index = {}
+    if append_basetime is not None:
+        reuse_index = reuse_previous_pixel_files(
+            config,
+            args_list,
+            stats_path,
+            trackstats_filebase,
+            pixeltracking_outpath,
+            pixeltracking_filebase,
+            bool(pixel_track_index),
+        )
+    run_files = [ifile for ifile in range(0, nfiles) if ifile not in reuse_index]
+    if append_basetime is not None:
+        logger.info(f"Number of files reused from the previous run: {len(reuse_index)}")
+        logger.info(f"Number of files to map: {len(run_files)}")
+
+    # Map tracked features for each pixel file
+    kwargs_list = [
+        {
+            "pixeltracking_outpath": pixeltracking_outpath,
+            "pixeltracking_filebase": pixeltracking_filebase,
+            "return_index": bool(pixel_track_index),
+        }
+    ] * len(run_files)
+    run_results = run_tasks(
+        map_feature, [args_list[ifile] for ifile in run_files], config,
+        kwargs_list=kwargs_list, task_name="mapfeature",
+    )
+    results = [None] * nfiles
+    for ifile, result in zip(run_files, run_results):
+        results[ifile] = result
+    for ifile, result in reuse_index.items():
+        results[ifile] = result
+
+    # Save the bounding box of each track in each pixel file
+    if pixel_track_index:
+        index_filename = f"{stats_path}{pixel_track_index_filebase}{pixeltracking_filebase}{startdate}_{enddate}.nc"
+        write_pixel_track_index(
+            index_filename,
+            [result[0] for result in results],
+            cloudidfiles_basetime,
+            [result[1] for result in results],
+            pixeltracking_outpath,
+        )
+
+    logger.info('Done with mapping features to pixel-level files')
+    return
+
+def read_map_trackstats(trackstats_file, tracks_dimname, times_dimname, nmaxlinks, fillval):
+    """
+    Read the track stats variables needed to map tracked features to pixel-level files.
+
+    Args:
+        trackstats_file: string
+            Track statistics file name.
+        tracks_dimname: string
+            Tracks dimension name.
+        times_dimname: string
+            Times dimension name.
+        nmaxlinks: int
+            Maximum number of merge/split links.
+        fillval: int
+            Missing value.
+
+    Returns:
+        stats: dictionary
+            Dictionary containing base_time, cloudnumber, track_status, merge/split track numbers
+            and cloud numbers [tracks, times], and the track_status comments.
+    """
     ds = xr.open_dataset(
         trackstats_file,
         mask_and_scale=False,
@@ -74,12 +181,12 @@ def mapfeature_driver(
     # Get track stats dimensions
     ntracks = ds.sizes[tracks_dimname]
     ntimes = ds.sizes[times_dimname]
-    # Get track variables
-    stats_basetime = ds["base_time"].data
-    stats_cloudnumber = ds["cloudnumber"].data
-    stats_trackstatus = ds["track_status"].data
-    trackstats_comments = ds["track_status"].comments
-    ds.close()
+    stats = {
+        "basetime": ds["base_time"].data,
+        "cloudnumber": ds["cloudnumber"].data,
+        "trackstatus": ds["track_status"].data,
+        "comments": ds["track_status"].comments,
+    }
 
     # Put merge/split tracknumbers & cloudnumbers in a list
     ms_tracknumber = ["merge_tracknumbers", "split_tracknumbers"]
@@ -87,105 +194,222 @@ def mapfeature_driver(
 
     # Check if tracknumber are in the stats dataset
     if (set(ms_tracknumber).issubset(set(stats_varnames))):
-        stats_mergetracknumber = ds["merge_tracknumbers"].data
-        stats_splittracknumber = ds["split_tracknumbers"].data
+        stats["mergetracknumber"] = ds["merge_tracknumbers"].data
+        stats["splittracknumber"] = ds["split_tracknumbers"].data
     else:
-        stats_mergetracknumber = np.full((ntracks, ntimes), fillval, dtype=int)
-        stats_splittracknumber = np.full((ntracks, ntimes), fillval, dtype=int)
+        stats["mergetracknumber"] = np.full((ntracks, ntimes), fillval, dtype=int)
+        stats["splittracknumber"] = np.full((ntracks, ntimes), fillval, dtype=int)
 
     # Check if cloudnumber are in the stats dataset
     if (set(ms_cloudnumber).issubset(set(stats_varnames))):
-        stats_mergecloudnumber = ds["merge_cloudnumber"].data
-        stats_splitcloudnumber = ds["split_cloudnumber"].data
+        stats["mergecloudnumber"] = ds["merge_cloudnumber"].data
+        stats["splitcloudnumber"] = ds["split_cloudnumber"].data
     else:
-        stats_mergecloudnumber = np.full((ntracks, ntimes, nmaxlinks), fillval, dtype=int)
-        stats_splitcloudnumber = np.full((ntracks, ntimes, nmaxlinks), fillval, dtype=int)
+        stats["mergecloudnumber"] = np.full((ntracks, ntimes, nmaxlinks), fillval, dtype=int)
+        stats["splitcloudnumber"] = np.full((ntracks, ntimes, nmaxlinks), fillval, dtype=int)
+    ds.close()
+    return stats
 
-    #########################################################################################
-    # Identify files to process
-    # Create pixel tracking file output directory
-    os.makedirs(pixeltracking_outpath, exist_ok=True)
-    cloudidfiles, \
-    cloudidfiles_basetime, \
-    cloudidfiles_datestring, \
-    cloudidfiles_timestring = subset_files_timerange(tracking_outpath,
-                                                     cloudid_filebase,
-                                                     start_basetime,
-                                                     end_basetime)
-    nfiles = len(cloudidfiles)
-    logger.info(f"Total number of files to process: {nfiles}")
 
-    results = []
-    # Loop over each pixel file
-    for ifile in range(0, nfiles):
-        # Find all matching time indices from stats file to the current cloudid file
-        itrack, itime = np.array(
-            np.where(
-                np.abs(stats_basetime - cloudidfiles_basetime[ifile]) < match_pixel_dt_thresh)
-        )
+def get_file_track_args(stats, file_basetime, match_pixel_dt_thresh):
+    """
+    Get the track stats of the features in one pixel file.
+
+    Args:
+        stats: dictionary
+            Track stats (see read_map_trackstats).
+        file_basetime: float
+            Cloudid file base time.
+        match_pixel_dt_thresh: float
+            Time difference threshold [second] to match track stats and cloudid pixel files.
+
+    Returns:
+        file_args: tuple
+            file_trackindex, file_cloudnumber, file_trackstatus, file_mergetracknumber,
+            file_splittracknumber, file_mergecloudnumber, file_splitcloudnumber (see map_feature).
+    """
+    # Find all matching time indices from stats file to the current cloudid file
+    itrack, itime = np.array(
+        np.where(
+            np.abs(stats["basetime"] - file_basetime) < match_pixel_dt_thresh)
+    )
 
-        # Get cloudnumbers for this time (file)
-        file_trackindex = itrack
-        file_cloudnumber = stats_cloudnumber[itrack, itime]
-        file_trackstatus = stats_trackstatus[itrack, itime]
-
-        # Cloudnumbers for merge/split
-        file_mergecloudnumber = stats_mergecloudnumber[itrack, itime, :]
-        file_splitcloudnumber = stats_splitcloudnumber[itrack, itime, :]
-        if (file_mergecloudnumber.size > 0) & (file_splitcloudnumber.size > 0):
-            # Get number of max merge/split for all clouds at this time (file)
-            max_merge = np.sum(file_mergecloudnumber > 0, axis=1).max()
-            max_split = np.sum(file_splitcloudnumber > 0, axis=1).max()
-            # Subset arrays containing useful data to reduce array size
-            file_mergecloudnumber = file_mergecloudnumber[:, :max_merge]
-            file_splitcloudnumber = file_splitcloudnumber[:, :max_split]
-
-        # General merge/split tracknumber
-        file_mergetracknumber = stats_mergetracknumber[itrack, itime]
-        file_splittracknumber = stats_splittracknumber[itrack, itime]
-
-        # Serial
-        if run_parallel == 0:
-            result = map_feature(
-                cloudidfiles[ifile],
-                cloudidfiles_basetime[ifile],
-                file_trackindex,
-                file_cloudnumber,
-                file_trackstatus,
-                file_mergetracknumber,
-                file_splittracknumber,
-                file_mergecloudnumber,
-                file_splitcloudnumber,
-                trackstats_comments,
-                config,
-                pixeltracking_outpath,
-                pixeltracking_filebase,
-            )
-        # Parallel
-        elif run_parallel >= 1:
-            result = dask.delayed(map_feature)(
-                cloudidfiles[ifile],
-                cloudidfiles_basetime[ifile],
-                file_trackindex,
-                file_cloudnumber,
-                file_trackstatus,
-                file_mergetracknumber,
-                file_splittracknumber,
-                file_mergecloudnumber,
-                file_splitcloudnumber,
-                trackstats_comments,
-                config,
-                pixeltracking_outpath,
-                pixeltracking_filebase,
-            )
-            results.append(result)
+    # Get cloudnumbers for this time (file)
+    file_trackindex = itrack
+    file_cloudnumber = stats["cloudnumber"][itrack, itime]
+    file_trackstatus = stats["trackstatus"][itrack, itime]
+
+    # Cloudnumbers for merge/split
+    file_mergecloudnumber = stats["mergecloudnumber"][itrack, itime, :]
+    file_splitcloudnumber = stats["splitcloudnumber"][itrack, itime, :]
+    if (file_mergecloudnumber.size > 0) & (file_splitcloudnumber.size > 0):
+        # Get number of max merge/split for all clouds at this time (file)
+        max_merge = np.sum(file_mergecloudnumber > 0, axis=1).max()
+        max_split = np.sum(file_splitcloudnumber > 0, axis=1).max()
+        # Subset arrays containing useful data to reduce array size
+        file_mergecloudnumber = file_mergecloudnumber[:, :max_merge]
+        file_splitcloudnumber = file_splitcloudnumber[:, :max_split]
+
+    # General merge/split tracknumber
+    file_mergetracknumber = stats["mergetracknumber"][itrack, itime]
+    file_splittracknumber = stats["splittracknumber"][itrack, itime]
+
+    return (
+        file_trackindex,
+        file_cloudnumber,
+        file_trackstatus,
+        file_mergetracknumber,
+        file_splittracknumber,
+        file_mergecloudnumber,
+        file_splitcloudnumber,
+    )
+
+
+def reuse_previous_pixel_files(
+        config,
+        args_list,
+        stats_path,
+        trackstats_filebase,
+        pixeltracking_outpath,
+        pixeltracking_filebase,
+        return_index,
+):
+    """
+    Reuse the pixel-level files of the previous run in append mode.
+
+    A pixel file of the previous run (up to append_from_enddate) is reused if the track stats
+    of all features in that file are unchanged, i.e., the file would be written the same.
+    Files with tracks that continue across the append boundary, or whose track numbers changed,
+    are mapped again. Reused files are hard linked (or copied) to the new output directory.
+
+    Args:
+        config: dictionary
+            Dictionary containing config parameters.
+        args_list: list
+            map_feature positional arguments of each file in the current run.
+        stats_path: string
+            Track statistics directory.
+        trackstats_filebase: string
+            Track statistics file basename.
+        pixeltracking_outpath: string
+            Output directory for pixel-level files.
+        pixeltracking_filebase: string
+            Output pixel-level file basename.
+        return_index: bool
+            If True, also get the bounding box of each track in the reused files.
+
+    Returns:
+        reuse_index: dictionary
+            Key is the file index in args_list, value is the pixel-level file name,
+            or (file name, track index) if return_index is True.
+    """
+    logger = logging.getLogger(__name__)
+    startdate = config["startdate"]
+    enddate = config["enddate"]
+    append_from_enddate = config["append_from_enddate"]
+    append_basetime = config["append_basetime"]
+    match_pixel_dt_thresh = config["match_pixel_dt_thresh"]
+    pixel_track_index_filebase = config.get("pixel_track_index_filebase", "pixel_track_index_")
+
+    # Track stats and pixel files of the previous run
+    prev_trackstats_file = f"{stats_path}{trackstats_filebase}{startdate}_{append_from_enddate}.nc"
+    prev_outpath = pixeltracking_outpath.replace(f"{startdate}_{enddate}", f"{startdate}_{append_from_enddate}")
+    if not os.path.isfile(prev_trackstats_file):
+        logger.warning(f"Previous track stats file not found: {prev_trackstats_file}, mapping all files.")
+        return {}
+    prev_stats = read_map_trackstats(
+        prev_trackstats_file,
+        config.get("tracks_dimname", "tracks"),
+        config.get("times_dimname", "times"),
+        config["nmaxlinks"],
+        config.get("fillval", -9999),
+    )
+    # Track status definitions must be the same
+    if (len(args_list) == 0) or (prev_stats["comments"] != args_list[0][-1]):
+        return {}
+
+    # Track index of the previous pixel files
+    prev_index_file = f"{stats_path}{pixel_track_index_filebase}{pixeltracking_filebase}" + \
+                      f"{startdate}_{append_from_enddate}.nc"
+    prev_track_index = read_pixel_track_index(prev_index_file) if return_index else {}
+
+    reuse_index = {}
+    for ifile, args in enumerate(args_list):
+        cloudid_filename, file_basetime = args[0], args[1]
+        if file_basetime > append_basetime:
+            continue
+        # Compare track stats of the features in this file
+        prev_args = get_file_track_args(prev_stats, file_basetime, match_pixel_dt_thresh)
+        if not all(np.array_equal(new, prev) for new, prev in zip(args[2:-1], prev_args)):
+            continue
+        file_datetime = time.strftime("%Y%m%d_%H%M%S", time.gmtime(np.copy(file_basetime)))
+        pixel_filename = f"{pixeltracking_filebase}{file_datetime}.nc"
+        prev_file = f"{prev_outpath}{pixel_filename}"
+        new_file = f"{pixeltracking_outpath}{pixel_filename}"
+        if not os.path.isfile(prev_file):
+            continue
+        if os.path.abspath(prev_file) != os.path.abspath(new_file):
+            link_or_copy(prev_file, new_file)
+        if return_index:
+            track_index = prev_track_index.get(pixel_filename, None)
+            if track_index is None:
+                trackmap = read_pixel_labels(new_file, ["cloudtracknumber"])["cloudtracknumber"]
+                track_index = get_track_bbox(trackmap.squeeze())
+            reuse_index[ifile] = (new_file, track_index)
         else:
-            sys.exit('Valid parallelization flag not provided.')
+            reuse_index[ifile] = new_file
+    return reuse_index
 
-    if run_parallel >= 1:
-        # Trigger dask computation
-        final_result = dask.compute(*results)
-        wait(final_result)
 
-    logger.info('Done with mapping features to pixel-level files')
-    return
\ No newline at end of file
+def read_pixel_track_index(index_filename):
+    """
+    Read the per-track index of pixel-level files, grouped by pixel file.
+
+    Args:
+        index_filename: string
+            Index file name (see write_pixel_track_index).
+
+    Returns:
+        track_index: dictionary
+            Key is the pixel file name, value is the track index dictionary (see get_track_bbox).
+            Empty if the index file does not exist.
+    """
+    if not os.path.isfile(index_filename):
+        return {}
+    keys = ["tracknumber", "y_start", "y_end", "x_start", "x_end", "npix"]
+    ds = xr.open_dataset(index_filename, decode_times=False)
+    entries = {key: ds[key].data for key in keys}
+    file_index = ds["file_index"].data
+    pixel_filenames = ds["pixel_filename"].data
+    ds.close()
+    # Entries are sorted by track number, sort them by file (keeping track number order)
+    order = np.argsort(file_index, kind="stable")
+    file_index = file_index[order]
+    entries = {key: val[order] for key, val in entries.items()}
+    starts = np.searchsorted(file_index, np.arange(len(pixel_filenames) + 1))
+    track_index = {}
+    for ifile, pixel_filename in enumerate(pixel_filenames):
+        sl = slice(starts[ifile], starts[ifile + 1])
+        track_index[str(pixel_filename)] = {key: val[sl] for key, val in entries.items()}
+    return track_index
+
+
+def link_or_copy(src, dst):
+    """
+    Hard link a file to a new path, copy it if hard links are not supported.
+
+    Args:
+        src: string
+            Source file name.
+        dst: string
+            Destination file name, replaced if it exists.
+
+    Returns:
+        None.
+    """
+    if os.path.isfile(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
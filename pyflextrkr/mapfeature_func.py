@@ -1,9 +1,23 @@
 import numpy as np
 import time
 import os
+import sys
 import logging
 import xarray as xr
 
+# Track label layers written by map_feature
+label_varnames = [
+    "tracknumber",
+    "merge_tracknumber",
+    "split_tracknumber",
+    "track_status",
+    "cloudtracknumber",
+    "cloudmerge_tracknumber",
+    "cloudsplit_tracknumber",
+    "pcptracknumber",
+    "dbztracknumber",
+]
+
 def map_feature(
         cloudid_filename,
         filebasetime,
@@ -18,6 +32,7 @@ def map_feature(
         config,
         pixeltracking_outpath,
         pixeltracking_filebase,
+        return_index=False,
 ):
     """
     Map track numbers to pixel level files for all feature tracking.
@@ -49,10 +64,15 @@ def map_feature(
             Output directory for pixel-level files.
         pixeltracking_filebase: string
             Output pixel-level file basename.
+        return_index: bool, default=False
+            If True, also return the bounding box of each track in the file.
 
     Returns:
         tracksmap_outfile: string
             Track number pixel-level file name.
+        track_index: dictionary
+            Bounding box and number of pixels of each track (see get_track_bbox).
+            Only returned if return_index is True.
     """
     feature_varname = config.get("feature_varname", "feature_number")
     feature_type = config.get("feature_type", None)
@@ -60,6 +80,8 @@ def map_feature(
     y_dimname = "lat"
     x_dimname = "lon"
     fillval = config.get("fillval", -9999)
+    # Track label layer encoding in the output file ('dense' or 'rle')
+    label_encoding = config.get("pixel_label_encoding", "dense")
 
     np.set_printoptions(threshold=np.inf)
     logger = logging.getLogger(__name__)
@@ -90,14 +112,14 @@ def map_feature(
 
     ################################################################
     # Create map of status and track number for every feature in this file
-    statusmap = np.full((1, ny, nx), fillval, dtype=int)
-    trackmap = np.zeros((1, ny, nx), dtype=int)
-    allmergemap = np.zeros((1, ny, nx), dtype=int)
-    allsplitmap = np.zeros((1, ny, nx), dtype=int)
+    statusmap = np.full((1, ny, nx), fillval, dtype=np.int16)
+    trackmap = np.zeros((1, ny, nx), dtype=np.int32)
+    allmergemap = np.zeros((1, ny, nx), dtype=np.int32)
+    allsplitmap = np.zeros((1, ny, nx), dtype=np.int32)
 
-    trackmap_include_ms = np.zeros((1, ny, nx), dtype=int)
-    trackmap_merge = np.zeros((1, ny, nx), dtype=int)
-    trackmap_split = np.zeros((1, ny, nx), dtype=int)
+    trackmap_include_ms = np.zeros((1, ny, nx), dtype=np.int32)
+    trackmap_merge = np.zeros((1, ny, nx), dtype=np.int32)
+    trackmap_split = np.zeros((1, ny, nx), dtype=np.int32)
 
     # Check number of matched features
     nmatchcloud = len(file_cloudnumber)
@@ -287,6 +309,13 @@ def map_feature(
     ds_out.attrs["Title"] = "Pixel-level feature tracking data"
     ds_out.attrs["Created_on"] = time.ctime(time.time())
 
+    # Replace the dense track label layers with run-length encoded runs
+    if label_encoding == "rle":
+        ds_out = encode_label_layers(ds_out, label_varnames)
+    elif label_encoding != "dense":
+        logger.critical(f"Unknown pixel_label_encoding: {label_encoding}, valid options: 'dense', 'rle'.")
+        sys.exit("Code exits in map_feature.")
+
     #####################################################################
     # Output to netcdf file
 
@@ -314,4 +343,411 @@ def map_feature(
     )
     logger.info(f"{tracksmap_outfile}")
 
-    return tracksmap_outfile
\ No newline at end of file
+    if return_index:
+        track_index = get_track_bbox(trackmap_include_ms.data[0])
+        return tracksmap_outfile, track_index
+
+    return tracksmap_outfile
+
+def get_track_bbox(trackmap):
+    """
+    Get the bounding box and number of pixels of each track in a track number map.
+
+    Args:
+        trackmap: np.array
+            2D track number map, 0 is no track.
+
+    Returns:
+        track_index: dictionary
+            Dictionary containing arrays sorted by track number:
+            tracknumber, y_start, y_end, x_start, x_end (end is exclusive), npix.
+    """
+    iy, ix = np.nonzero(trackmap > 0)
+    tracknumber = trackmap[iy, ix]
+    order = np.argsort(tracknumber, kind="stable")
+    tracknumber = tracknumber[order]
+    iy = iy[order]
+    ix = ix[order]
+    # Start position of each track in the sorted pixels
+    starts = np.flatnonzero(np.diff(tracknumber, prepend=0) != 0)
+    if len(starts) == 0:
+        empty = np.zeros(0, dtype=np.int32)
+        return {
+            "tracknumber": empty, "y_start": empty, "y_end": empty,
+            "x_start": empty, "x_end": empty, "npix": np.zeros(0, dtype=np.int64),
+        }
+    track_index = {
+        "tracknumber": tracknumber[starts].astype(np.int32),
+        "y_start": np.minimum.reduceat(iy, starts).astype(np.int32),
+        "y_end": (np.maximum.reduceat(iy, starts) + 1).astype(np.int32),
+        "x_start": np.minimum.reduceat(ix, starts).astype(np.int32),
+        "x_end": (np.maximum.reduceat(ix, starts) + 1).astype(np.int32),
+        "npix": np.diff(np.append(starts, len(tracknumber))).astype(np.int64),
+    }
+    return track_index
+
+def write_pixel_track_index(
+        index_filename,
+        pixel_filenames,
+        pixel_basetimes,
+        track_index_list,
+        pixeltracking_outpath,
+        tracknumber_varname="cloudtracknumber",
+):
+    """
+    Write the per-track index of pixel-level files to a netCDF file.
+
+    Each entry is one track in one pixel file, entries are sorted by track number and time.
+
+    Args:
+        index_filename: string
+            Output index file name.
+        pixel_filenames: list
+            Pixel-level file names.
+        pixel_basetimes: np.array
+            Base time of each pixel-level file.
+        track_index_list: list
+            Track index dictionary (see get_track_bbox) of each pixel-level file.
+        pixeltracking_outpath: string
+            Pixel-level file directory.
+        tracknumber_varname: string, default="cloudtracknumber"
+            Track number variable name in the pixel-level files.
+
+    Returns:
+        index_filename: string
+            Output index file name.
+    """
+    logger = logging.getLogger(__name__)
+    keys = ["tracknumber", "y_start", "y_end", "x_start", "x_end", "npix"]
+    entries = {key: np.concatenate([tindex[key] for tindex in track_index_list]) for key in keys}
+    file_index = np.concatenate([
+        np.full(len(tindex["tracknumber"]), ifile, dtype=np.int32) for ifile, tindex in enumerate(track_index_list)
+    ])
+    # Sort entries by track number, then by time
+    order = np.lexsort((np.asarray(pixel_basetimes)[file_index], entries["tracknumber"]))
+    entries = {key: val[order] for key, val in entries.items()}
+    file_index = file_index[order]
+
+    var_dict = {
+        "tracknumber": (["entries"], entries["tracknumber"], {"long_name": "Track number"}),
+        "file_index": (["entries"], file_index, {"long_name": "Index of the pixel-level file (files dimension)"}),
+        "y_start": (["entries"], entries["y_start"], {"long_name": "First y index of the track bounding box"}),
+        "y_end": (["entries"], entries["y_end"], {"long_name": "Last y index + 1 of the track bounding box"}),
+        "x_start": (["entries"], entries["x_start"], {"long_name": "First x index of the track bounding box"}),
+        "x_end": (["entries"], entries["x_end"], {"long_name": "Last x index + 1 of the track bounding box"}),
+        "npix": (["entries"], entries["npix"], {"long_name": "Number of pixels of the track", "units": "count"}),
+        "pixel_filename": (["files"], np.array([os.path.basename(fname) for fname in pixel_filenames], dtype=object),
+                           {"long_name": "Pixel-level file name"}),
+        "base_time": (["files"], np.asarray(pixel_basetimes),
+                      {"long_name": "Epoch time of the pixel-level file", "units": "Seconds since 1970-1-1 0:00:00 0:00"}),
+    }
+    gattr_dict = {
+        "Title": "Per-track index of pixel-level files",
+        "pixeltracking_outpath": pixeltracking_outpath,
+        "tracknumber_varname": tracknumber_varname,
+        "Created_on": time.ctime(time.time()),
+    }
+    dsout = xr.Dataset(var_dict, attrs=gattr_dict)
+    if os.path.isfile(index_filename):
+        os.remove(index_filename)
+    encoding = {var: dict(zlib=True) for var in dsout.data_vars if var != "pixel_filename"}
+    dsout.to_netcdf(path=index_filename, mode="w", format="NETCDF4", encoding=encoding)
+    logger.info(f"Pixel track index saved: {index_filename}")
+    return index_filename
+
+def read_track_pixels(index_filename, tracknumber, varnames=None, pixel_path=None, pad=0):
+    """
+    Read the pixel-level data of a track using the per-track index.
+
+    Only the pixel files containing the track are opened, and only the track bounding box is read.
+
+    Args:
+        index_filename: string
+            Index file name written by write_pixel_track_index.
+        tracknumber: int
+            Track number (track index + 1).
+        varnames: list, default=None
+            Variable names to read in addition to the track number variable.
+        pixel_path: string, default=None
+            Pixel-level file directory. If None, the directory saved in the index file is used.
+        pad: int, default=0
+            Number of grid points to add around the track bounding box (limited to the domain).
+
+    Returns:
+        track_pixels: list
+            List of dictionaries, one for each time of the track, containing:
+            base_time, filename, y_slice, x_slice, npix,
+            mask (track mask in the bounding box), and the requested variables in the bounding box.
+            Track label variables are returned as integer arrays (see read_pixel_labels).
+            Variables without a time dimension (e.g., 2D longitude/latitude) are also subset.
+    """
+    ds_index = xr.open_dataset(index_filename, decode_times=False)
+    index_tracknumber = ds_index["tracknumber"].values
+    # Entries are sorted by track number
+    i0 = np.searchsorted(index_tracknumber, tracknumber, side="left")
+    i1 = np.searchsorted(index_tracknumber, tracknumber, side="right")
+    entries = ds_index.isel(entries=slice(i0, i1)).load()
+    pixel_filename = ds_index["pixel_filename"].values
+    pixel_basetime = ds_index["base_time"].values
+    tracknumber_varname = ds_index.attrs["tracknumber_varname"]
+    if pixel_path is None:
+        pixel_path = ds_index.attrs["pixeltracking_outpath"]
+    ds_index.close()
+
+    if varnames is None:
+        varnames = []
+    track_pixels = []
+    for ii in range(i1 - i0):
+        ifile = int(entries["file_index"].values[ii])
+        filename = os.path.join(pixel_path, pixel_filename[ifile])
+        # Read only the bounding box
+        ds = xr.open_dataset(filename, decode_times=False)
+        if ds.attrs.get("label_encoding", "dense") == "rle":
+            dims = ds[f"{tracknumber_varname}_run_value"].attrs["dense_dims"].split()
+        else:
+            dims = ds[tracknumber_varname].dims
+        ny, nx = ds.sizes[dims[1]], ds.sizes[dims[2]]
+        y_slice = slice(max(int(entries["y_start"].values[ii]) - pad, 0), min(int(entries["y_end"].values[ii]) + pad, ny))
+        x_slice = slice(max(int(entries["x_start"].values[ii]) - pad, 0), min(int(entries["x_end"].values[ii]) + pad, nx))
+        bbox = {dims[0]: 0, dims[1]: y_slice, dims[2]: x_slice}
+        label_vars = [tracknumber_varname] + [var for var in varnames if var in label_varnames]
+        labels = read_pixel_labels(ds, label_vars, isel=bbox)
+        track_pixel = {
+            "base_time": pixel_basetime[ifile],
+            "filename": filename,
+            "y_slice": y_slice,
+            "x_slice": x_slice,
+            "npix": int(entries["npix"].values[ii]),
+            "mask": labels[tracknumber_varname] == tracknumber,
+        }
+        for varname in varnames:
+            if varname in labels:
+                track_pixel[varname] = labels[varname]
+            else:
+                track_pixel[varname] = ds[varname].isel(bbox, missing_dims="ignore").values
+        ds.close()
+        track_pixels.append(track_pixel)
+    return track_pixels
+
+def encode_label_runs(label, background=0):
+    """
+    Run-length encode a label array in row-major (C) order, keeping only the non-background runs.
+
+    Args:
+        label: np.array
+            Label array.
+        background: int, default=0
+            Background value that is not saved.
+
+    Returns:
+        run_start: np.array(int64)
+            Flattened index of the first pixel of each run.
+        run_length: np.array(int32)
+            Number of pixels of each run.
+        run_value: np.array
+            Label value of each run.
+    """
+    flat = np.ravel(label)
+    if flat.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), flat
+    # A run starts at the first pixel and wherever the value changes
+    run_start = np.flatnonzero(np.concatenate(([True], flat[1:] != flat[:-1])))
+    run_length = np.diff(np.append(run_start, flat.size))
+    run_value = flat[run_start]
+    keep = run_value != background
+    return run_start[keep].astype(np.int64), run_length[keep].astype(np.int32), run_value[keep]
+
+def decode_label_runs(run_start, run_length, run_value, shape, background=0, dtype=None):
+    """
+    Reconstruct a dense label array from run-length encoded runs.
+
+    Args:
+        run_start: np.array
+            Flattened index of the first pixel of each run.
+        run_length: np.array
+            Number of pixels of each run.
+        run_value: np.array
+            Label value of each run.
+        shape: tuple
+            Shape of the dense label array.
+        background: int, default=0
+            Value of pixels outside of the runs.
+        dtype: np.dtype, default=None
+            Data type of the dense array. Defaults to the run_value data type.
+
+    Returns:
+        label: np.array
+            Dense label array.
+    """
+    if dtype is None:
+        dtype = np.asarray(run_value).dtype
+    npix = int(np.prod(shape))
+    run_start = np.asarray(run_start, dtype=np.int64)
+    run_end = run_start + np.asarray(run_length, dtype=np.int64)
+    # Runs do not overlap: add the value at the run start and remove it after the run end
+    delta = np.zeros(npix + 1, dtype=np.int64)
+    value = np.asarray(run_value, dtype=np.int64) - background
+    delta[run_start] += value
+    delta[run_end] -= value
+    label = np.cumsum(delta[:-1]) + background
+    return label.astype(dtype).reshape(shape)
+
+def decode_label_runs_isel(run_start, run_length, run_value, shape, indexers, background=0, dtype=None):
+    """
+    Reconstruct a subset of a dense label array from run-length encoded runs.
+
+    Only the rows (last dimension) spanned by the subset are decoded, not the full array.
+
+    Args:
+        run_start: np.array
+            Flattened index of the first pixel of each run.
+        run_length: np.array
+            Number of pixels of each run.
+        run_value: np.array
+            Label value of each run.
+        shape: tuple
+            Shape of the dense label array (at least 2 dimensions).
+        indexers: list
+            Integer or slice for each dimension, an integer drops the dimension.
+        background: int, default=0
+            Value of pixels outside of the runs.
+        dtype: np.dtype, default=None
+            Data type of the dense array. Defaults to the run_value data type.
+
+    Returns:
+        label: np.array
+            Dense label array of the subset.
+    """
+    if dtype is None:
+        dtype = np.asarray(run_value).dtype
+    index = [np.arange(ndim)[indexer] for ndim, indexer in zip(shape, indexers)]
+    out_shape = [len(idx) for idx in index if np.ndim(idx) == 1]
+    index = [np.atleast_1d(idx) for idx in index]
+    if any(len(idx) == 0 for idx in index):
+        return np.full(out_shape, background, dtype=dtype)
+    ncols = shape[-1]
+    # Rows of the selection, in the array flattened to [rows, ncols]
+    rows = np.ravel_multi_index(np.ix_(*index[:-1]), shape[:-1])
+    row0 = int(rows.min())
+    row1 = int(rows.max()) + 1
+    # Keep the runs overlapping the rows and clip them to the rows
+    lo = row0 * ncols
+    hi = row1 * ncols
+    run_start = np.asarray(run_start, dtype=np.int64)
+    run_end = run_start + np.asarray(run_length, dtype=np.int64)
+    i0 = np.searchsorted(run_end, lo, side="right")
+    i1 = np.searchsorted(run_start, hi, side="left")
+    sub_start = np.maximum(run_start[i0:i1], lo)
+    sub_end = np.minimum(run_end[i0:i1], hi)
+    block = decode_label_runs(
+        sub_start - lo, sub_end - sub_start, np.asarray(run_value)[i0:i1], (row1 - row0, ncols),
+        background=background, dtype=dtype,
+    )
+    label = block[rows - row0][..., index[-1]]
+    return label.reshape(out_shape)
+
+def encode_label_layers(ds, varnames):
+    """
+    Replace dense label variables in a dataset with run-length encoded variables.
+
+    Each variable [var] is replaced by [var]_run_start, [var]_run_length, [var]_run_value
+    on a [var]_runs dimension. The original attributes are kept in [var]_run_value.
+
+    Args:
+        ds: xarray.Dataset
+            Dataset containing dense label variables.
+        varnames: list
+            Label variable names to encode, variables not in the dataset are skipped.
+
+    Returns:
+        ds: xarray.Dataset
+            Dataset with encoded label variables.
+    """
+    for varname in varnames:
+        if varname not in ds:
+            continue
+        var = ds[varname]
+        attrs = dict(var.attrs)
+        background = attrs.pop("_FillValue", var.encoding.get("_FillValue", 0))
+        run_start, run_length, run_value = encode_label_runs(var.data, background=background)
+        attrs.update({
+            "label_encoding": "rle",
+            "background": background,
+            "dense_dims": " ".join(var.dims),
+            "dense_shape": np.array(var.shape, dtype=np.int64),
+            "dense_dtype": str(var.dtype),
+        })
+        rundim = f"{varname}_runs"
+        ds = ds.drop_vars(varname)
+        ds[f"{varname}_run_start"] = xr.DataArray(
+            run_start, dims=[rundim], attrs={"long_name": "Flattened (row-major) index of the first pixel of each run"})
+        ds[f"{varname}_run_length"] = xr.DataArray(
+            run_length, dims=[rundim], attrs={"long_name": "Number of pixels of each run"})
+        ds[f"{varname}_run_value"] = xr.DataArray(run_value, dims=[rundim], attrs=attrs)
+    ds.attrs["label_encoding"] = "rle"
+    return ds
+
+def read_pixel_labels(ds, varnames, isel=None):
+    """
+    Read label variables from a pixel-level file as dense integer arrays.
+
+    Works for both dense and run-length encoded (pixel_label_encoding: 'rle') files.
+    Pixels outside of the labels are set to the background (_FillValue) value.
+
+    Args:
+        ds: xarray.Dataset or string
+            Pixel-level dataset, or file name.
+        varnames: list
+            Label variable names to read.
+        isel: dictionary, default=None
+            Indexers on the dense label dimensions (e.g., {'time': 0, 'lat': slice(10, 20)}).
+
+    Returns:
+        labels: dictionary
+            Dense label array of each variable.
+    """
+    close = False
+    if isinstance(ds, (str, os.PathLike)):
+        ds = xr.open_dataset(ds, decode_times=False)
+        close = True
+    if isel is None:
+        isel = {}
+    labels = {}
+    for varname in varnames:
+        if f"{varname}_run_value" in ds:
+            run_value = ds[f"{varname}_run_value"]
+            dims = run_value.attrs["dense_dims"].split()
+            shape = tuple(np.atleast_1d(run_value.attrs["dense_shape"]))
+            if (len(isel) > 0) and (len(shape) >= 2):
+                # Only decode the rows inside the selection
+                labels[varname] = decode_label_runs_isel(
+                    ds[f"{varname}_run_start"].values,
+                    ds[f"{varname}_run_length"].values,
+                    run_value.values,
+                    shape,
+                    [isel.get(dim, slice(None)) for dim in dims],
+                    background=run_value.attrs["background"],
+                    dtype=run_value.attrs["dense_dtype"],
+                )
+                continue
+            label = decode_label_runs(
+                ds[f"{varname}_run_start"].values,
+                ds[f"{varname}_run_length"].values,
+                run_value.values,
+                shape,
+                background=run_value.attrs["background"],
+                dtype=run_value.attrs["dense_dtype"],
+            )
+            labels[varname] = xr.DataArray(label, dims=dims).isel(isel).values
+        else:
+            var = ds[varname]
+            label = var.isel(isel).values
+            # Undo the _FillValue masking to get the integer labels
+            fillval = var.encoding.get("_FillValue", var.attrs.get("_FillValue"))
+            dtype = var.encoding.get("dtype", label.dtype)
+            if (fillval is not None) and (label.dtype.kind == "f") and (np.dtype(dtype).kind in "iu"):
+                label = np.where(np.isnan(label), fillval, label).astype(dtype)
+            labels[varname] = label
+    if close:
+        ds.close()
+    return labels
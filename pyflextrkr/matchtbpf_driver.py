@@ -1,14 +1,14 @@
 import numpy as np
 import os
-import sys
 import xarray as xr
 import time
 import logging
-import dask
-from dask.distributed import wait
 from pyflextrkr.ft_utilities import subset_files_timerange
+from pyflextrkr.ft_parallel import iter_tasks
+from pyflextrkr.ft_profiling import profile_step
 # from pyflextrkr.matchtbpf_func import matchtbpf_singlefile
 
+@profile_step
 def match_tbpf_tracks(config):
     """
     Match Tb tracked MCS with precipitation to calculate PF statistics.
@@ -34,7 +34,6 @@ def match_tbpf_tracks(config):
     tracks_dimname = config["tracks_dimname"]
     times_dimname = config["times_dimname"]
     pf_dimname = config["pf_dimname"]
-    run_parallel = config["run_parallel"]
     fillval = config["fillval"]
     # Minimum time difference threshold [second] to match track stats and cloudid pixel files
     match_pixel_dt_thresh = config["match_pixel_dt_thresh"]
@@ -92,9 +91,9 @@ def match_tbpf_tracks(config):
     # Create a list to store matchindices for each pixel file
     trackindices_all = []
     timeindices_all = []
-    results = []
+    args_list = []
 
-    # Loop over each pixel file to calculate PF statistics
+    # Loop over each pixel file to get the matching tracks
     for ifile in range(nfiles):
         filename = cloudidfile_list[ifile]
 
@@ -113,75 +112,44 @@ def match_tbpf_tracks(config):
         trackindices_all.append(idx_track)
         timeindices_all.append(idx_time)
 
-        # Call function to calculate PF stats
-        # Serial
-        if run_parallel == 0:
-            result = matchtbpf_singlefile(
-                filename,
-                file_cloudnumber,
-                file_mergecloudnumber,
-                file_splitcloudnumber,
-                config,
-            )
-            results.append(result)
-        # Parallel
-        elif run_parallel >= 1:
-            result = dask.delayed(matchtbpf_singlefile)(
-                filename,
-                file_cloudnumber,
-                file_mergecloudnumber,
-                file_splitcloudnumber,
-                config,
-            )
-            results.append(result)
-        else:
-            sys.exit('Valid parallelization flag not provided.')
-
-    if run_parallel == 0:
-        final_result = results
-    elif run_parallel >= 1:
-        # Trigger dask computation
-        final_result = dask.compute(*results)
-        wait(final_result)
-    else:
-        sys.exit('Valid parallelization flag not provided.')
-
+        # Save task arguments for this file
+        args_list.append((
+            filename,
+            file_cloudnumber,
+            file_mergecloudnumber,
+            file_splitcloudnumber,
+        ))
 
     #########################################################################################
     # Create arrays to store output
-    logger.debug("Collecting track PF statistics.")
-
     maxtracklength = ir_nmaxlength
     numtracks = ir_ntracks
-
-    # Make a variable list and get attributes from one of the returned dictionaries
-    # Loop over each return results till one that is not None
-    counter = 0
-    while counter < nfiles:
-        if final_result[counter] is not None:
-            var_names = list(final_result[counter][0].keys())
-            # Get variable attributes
-            var_attrs = final_result[counter][1]
-            var_names_2d = final_result[counter][2]
-            break
-        counter += 1
-
-    # Loop over variable list to create the dictionary entry
-    pf_dict = {}
+    pf_dict = None
     pf_dict_attrs = {}
-    for ivar in var_names:
-        pf_dict[ivar] = np.full((numtracks, maxtracklength, nmaxpf), np.nan, dtype=np.float32)
-        pf_dict_attrs[ivar] = var_attrs[ivar]
-    for ivar in var_names_2d:
-        pf_dict[ivar] = np.full((numtracks, maxtracklength), np.nan, dtype=np.float32)
-
-    # Collect results
-    for ifile in range(0, nfiles):
-        if final_result[ifile] is not None:
+
+    # Call function to calculate PF stats for each pixel file,
+    # collect the results as they complete
+    for ifile, result in iter_tasks(matchtbpf_singlefile, args_list, config, task_name="matchtbpf"):
+        if result is not None:
+            # Make a variable list and get attributes from the first returned dictionaries
+            if pf_dict is None:
+                var_names = list(result[0].keys())
+                # Get variable attributes
+                var_attrs = result[1]
+                var_names_2d = result[2]
+
+                # Loop over variable list to create the dictionary entry
+                pf_dict = {}
+                for ivar in var_names:
+                    pf_dict[ivar] = np.full((numtracks, maxtracklength, nmaxpf), np.nan, dtype=np.float32)
+                    pf_dict_attrs[ivar] = var_attrs[ivar]
+                for ivar in var_names_2d:
+                    pf_dict[ivar] = np.full((numtracks, maxtracklength), np.nan, dtype=np.float32)
+
             # Get the return results for this pixel file
             # The result is a tuple: (out_dict, out_dict_attrs)
             # The first entry is the dictionary containing the variables
-            iResult = final_result[ifile][0]
+            iResult = result[0]
 
             # Get trackindices and timeindices for this file
             trackindices = trackindices_all[ifile]
@@ -193,6 +161,7 @@ def match_tbpf_tracks(config):
                     pf_dict[ivar][trackindices,timeindices] = iResult[ivar]
                 if iResult[ivar].ndim == 2:
                     pf_dict[ivar][trackindices,timeindices,:] = iResult[ivar]
+    logger.debug("Collecting track PF statistics done.")
 
     # Define a dataset containing all PF variables
     varlist = {}
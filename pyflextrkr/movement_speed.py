@@ -8,10 +8,12 @@ from netCDF4 import Dataset
 import xarray as xr
 from scipy.signal import fftconvolve
 from scipy.interpolate import interp1d
-import dask
-from dask.distributed import wait
 from pyflextrkr.ft_utilities import subset_files_timerange
+from pyflextrkr.ft_parallel import run_tasks
+from pyflextrkr.mapfeature_func import read_pixel_labels
+from pyflextrkr.ft_profiling import profile_step
 
+@profile_step
 def movement_speed(
         config,
         trackstats_filebase=None,
@@ -50,7 +52,6 @@ def movement_speed(
     end_basetime = config["end_basetime"]
     tracks_dimname = config["tracks_dimname"]
     times_dimname = config["times_dimname"]
-    run_parallel = config["run_parallel"]
     feature_type = config["feature_type"]
     pixel_radius = config["pixel_radius"]
     lag = config["lag_for_speed"]
@@ -105,36 +106,22 @@ def movement_speed(
     filepairs = list(zip(filelist[0:-lag], filelist[lag::]))
 
 
-    results = []
-    # Serial
-    if run_parallel == 0:
-        for ifile in range(0, nfiles-1):
-            result = movement_of_feature_fft(
-                filepairs[ifile], ntracks,
-                config,
-            )
-            results.append(result)
-        final_result = results
-    # Parallel
-    elif run_parallel >= 1:
-        for ifile in range(0, nfiles-1):
-            result = dask.delayed(movement_of_feature_fft)(
-                filepairs[ifile], ntracks,
-                config,
-            )
-            results.append(result)
-        final_result = dask.compute(*results)
-        wait(final_result)
-    else:
-        sys.exit('Valid parallelization flag not provided')
+    # Calculate movement for each file pair
+    args_list = [(filepairs[ifile], ntracks) for ifile in range(0, nfiles-1)]
+    final_result = run_tasks(movement_of_feature_fft, args_list, config, task_name="movement_speed")
 
-    move_y, move_x, time_lag, base_time = zip(*final_result)
-    move_y = np.array(move_y)
-    move_x = np.array(move_x)
+    # Each file pair returns the movement of the tracks present in both files,
+    # concatenate them into a list of (file pair, track) movement
+    pair_tracknumbers, move_y, move_x, time_lag, base_time = zip(*final_result)
+    pair_index = np.repeat(np.arange(len(final_result)), [len(tn) for tn in pair_tracknumbers])
+    pair_tracknumbers = np.concatenate(pair_tracknumbers)
+    move_y = np.concatenate(move_y)
+    move_x = np.concatenate(move_x)
+    time_lag = np.asarray(time_lag, dtype=float)
     base_time = np.asarray(base_time, dtype=float)
 
     # Compute movement speed, direction
-    (r_mag, r_dir, r_speed) = offset_to_speed(move_x, move_y, time_lag)
+    (r_mag, r_dir, r_speed) = offset_to_speed(move_x, move_y, time_lag[pair_index])
 
     # Convert distance to physical units
     # Movement magnitude [km]
@@ -150,7 +137,8 @@ def movement_speed(
 
     # Put the movement variables in an Xarray Dataset
     # consistent with track statistics
-    ds_vars = define_movement_dataset(base_time, lag, movement_dir, movement_mag, movement_speed, movement_x,
+    ds_vars = define_movement_dataset(base_time, pair_index, pair_tracknumbers, lag,
+                                      movement_dir, movement_mag, movement_speed, movement_x,
                                       movement_y, ntimes, ntracks, stats_basetime, times_coord, times_dimname,
                                       tracks_coord, tracks_dimname)
 
@@ -191,7 +179,7 @@ def movement_of_feature_fft(
         optimize_sub_array=True,
 ):
     """
-    Calculate movement of tracked features.
+    Calculate movement of tracked features present in both files of a pair.
 
     Args:
         filepairs: tuple
@@ -204,10 +192,12 @@ def movement_of_feature_fft(
             Flag to subset each tracked feature from the full image.
 
     Returns:
+        tracknumbers: np.array
+            Track numbers with movement (present in both files with a minimum size).
         y_lag: np.array
-            Movement magnitude in y-direction.
+            Movement magnitude in y-direction for each track in tracknumbers.
         x_lag: np.array
-            Movement magnitude in x-direction.
+            Movement magnitude in x-direction for each track in tracknumbers.
         time_lag: float
             Time difference between two pixel files.
         base_time: float
@@ -225,55 +215,56 @@ def movement_of_feature_fft(
 
     dset1 = Dataset(filepairs[0], 'r')
     dset2 = Dataset(filepairs[1], 'r')
-    y_lag = np.zeros(ntracks)
-    x_lag = np.zeros(ntracks)
-
-    # Get minimum size of feature from pixel files
-    min_cloud_size = np.minimum(get_pixel_size_of_clouds(dset1, ntracks, tracknumber),
-                                get_pixel_size_of_clouds(dset2, ntracks, tracknumber))
-    # Get tracknumber and field values
-    tracknumber_1 = dset1.variables[tracknumber][:].squeeze()
-    tracknumber_2 = dset2.variables[tracknumber][:].squeeze()
+
+    # Get tracknumber (dense or run-length encoded) and field values
+    tracknumber_1 = read_pixel_labels(filepairs[0], [tracknumber])[tracknumber].squeeze()
+    tracknumber_2 = read_pixel_labels(filepairs[1], [tracknumber])[tracknumber].squeeze()
     field_1 = dset1.variables[track_field][:].squeeze()
     field_2 = dset2.variables[track_field][:].squeeze()
 
+    # Get tracks present in both files with a minimum feature size
+    tracks_1, size_1 = get_pixel_size_of_clouds(tracknumber_1, ntracks)
+    tracks_2, size_2 = get_pixel_size_of_clouds(tracknumber_2, ntracks)
+    tracknumbers, idx_1, idx_2 = np.intersect1d(tracks_1, tracks_2, assume_unique=True, return_indices=True)
+    min_cloud_size = np.minimum(size_1[idx_1], size_2[idx_2])
+    tracknumbers = tracknumbers[min_cloud_size >= min_size_thresh]
+    ntracks_pair = len(tracknumbers)
+    y_lag = np.zeros(ntracks_pair)
+    x_lag = np.zeros(ntracks_pair)
+
     # Loop over each track number
-    for track_number in np.arange(0, ntracks):
-        if min_cloud_size[track_number] < min_size_thresh:
-            y_lag[track_number] = np.nan
-            x_lag[track_number] = np.nan
+    for itrack, track_number in enumerate(tracknumbers):
+        if optimize_sub_array:
+            # Calculate size of bounding box
+            ymin, ymax, xmin, xmax = get_bounding_box_for_fft(tracknumber_1, tracknumber_2, track_number)
+            masked_field_1 = field_1[ymin:ymax, xmin:xmax].copy()
+            masked_field_2 = field_2[ymin:ymax, xmin:xmax].copy()
+
+            masked_field_1[tracknumber_1[ymin:ymax, xmin:xmax] != track_number] = 0
+            masked_field_1[np.isnan(masked_field_1)] = 0
+
+            masked_field_2[tracknumber_2[ymin:ymax, xmin:xmax] != track_number] = 0
+            masked_field_2[np.isnan(masked_field_2)] = 0
         else:
-            if optimize_sub_array:
-                # Calculate size of bounding box
-                ymin, ymax, xmin, xmax = get_bounding_box_for_fft(tracknumber_1, tracknumber_2, track_number)
-                masked_field_1 = field_1[ymin:ymax, xmin:xmax].copy()
-                masked_field_2 = field_2[ymin:ymax, xmin:xmax].copy()
-
-                masked_field_1[tracknumber_1[ymin:ymax, xmin:xmax] != track_number] = 0
-                masked_field_1[np.isnan(masked_field_1)] = 0
-
-                masked_field_2[tracknumber_2[ymin:ymax, xmin:xmax] != track_number] = 0
-                masked_field_2[np.isnan(masked_field_2)] = 0
-            else:
-                masked_field_1 = field_1.copy()
-                masked_field_2 = field_2.copy()
-
-                masked_field_1[tracknumber_1 != track_number] = 0
-                masked_field_1[np.isnan(masked_field_1)] = 0
-
-                masked_field_2[tracknumber_2 != track_number] = 0
-                masked_field_2[np.isnan(masked_field_2)] = 0
-
-            # Flip the second image, do an FFT convolution
-            result = fftconvolve(masked_field_1, masked_field_2[::-1, ::-1], mode='same')
-            # Get the index with max value (highest correlation)
-            # then reshape it to 2D to get x, y index
-            y_step, x_step = np.unravel_index(np.argmax(result), result.shape)
-            y_dim, x_dim = np.shape(masked_field_1)
-            # Get the relative position from the center of the image
-            # This is the movement in x, y direction
-            y_lag[track_number] = np.floor(y_dim/2) - y_step
-            x_lag[track_number] = np.floor(x_dim/2) - x_step
+            masked_field_1 = field_1.copy()
+            masked_field_2 = field_2.copy()
+
+            masked_field_1[tracknumber_1 != track_number] = 0
+            masked_field_1[np.isnan(masked_field_1)] = 0
+
+            masked_field_2[tracknumber_2 != track_number] = 0
+            masked_field_2[np.isnan(masked_field_2)] = 0
+
+        # Flip the second image, do an FFT convolution
+        result = fftconvolve(masked_field_1, masked_field_2[::-1, ::-1], mode='same')
+        # Get the index with max value (highest correlation)
+        # then reshape it to 2D to get x, y index
+        y_step, x_step = np.unravel_index(np.argmax(result), result.shape)
+        y_dim, x_dim = np.shape(masked_field_1)
+        # Get the relative position from the center of the image
+        # This is the movement in x, y direction
+        y_lag[itrack] = np.floor(y_dim/2) - y_step
+        x_lag[itrack] = np.floor(x_dim/2) - x_step
 
     # Get time difference between the file pair
     time_lag = dset2.variables['time'][0] - dset1.variables['time'][0]
@@ -281,33 +272,31 @@ def movement_of_feature_fft(
 
     dset1.close()
     dset2.close()
-    return y_lag, x_lag, time_lag, base_time
+    return tracknumbers, y_lag, x_lag, time_lag, base_time
 
 
 def get_pixel_size_of_clouds(
-        dataset,
-        ntracks,
         tracknumber,
+        ntracks,
 ):
     """
-    Calculate pixel size of each identified cloud in the file.
+    Calculate pixel size of each tracked cloud in the file.
 
     Args:
-        dataset: Dataset
-            netcdf Dataset
-        tracknumber: string
-            variable that contains pixel level values.
+        tracknumber: np.array
+            Pixel level track number array.
+        ntracks: int
+            Number of tracks, only track numbers 1 to ntracks-1 are counted.
 
     Returns:
-        counts: array_like
-            Pixel size of every cloud in file. Cloud 0 is stored at 0.
+        tracks: np.array
+            Sorted track numbers in the file.
+        counts: np.array
+            Pixel size of each track in tracks.
     """
-    storm_sizes = np.zeros(ntracks + 1)
-
-    track, counts = np.unique(dataset.variables[tracknumber][:], return_counts=True)
-    storm_sizes[track] = counts
-    storm_sizes[0] = 0
-    return storm_sizes
+    tracks, counts = np.unique(np.ma.filled(tracknumber, 0), return_counts=True)
+    valid = (tracks > 0) & (tracks < ntracks)
+    return tracks[valid], counts[valid]
 
 
 def get_bounding_box_for_fft(in1, in2, track_number):
@@ -356,7 +345,7 @@ def offset_to_speed(x, y, time_lag):
         y: np.array
             Movement in y-direction.
         time_lag: np.array
-            Time lag for each movement.
+            Time lag for each movement (same shape as x, y).
 
     Returns:
         r_mag: np.array
@@ -371,11 +360,13 @@ def offset_to_speed(x, y, time_lag):
     # Movement direction
     r_dir = np.arctan2(y, x)*180/np.pi
     # Movement speed [n_grid / second]
-    r_speed = np.array([r_mag_i / (time_lag) for r_mag_i in r_mag.T]).T
+    r_speed = r_mag / time_lag
     return r_mag, r_dir, r_speed
 
 def define_movement_dataset(
         base_time,
+        pair_index,
+        pair_tracknumbers,
         lag,
         movement_dir,
         movement_mag,
@@ -390,6 +381,39 @@ def define_movement_dataset(
         tracks_coord,
         tracks_dimname,
 ):
+    """
+    Put the (file pair, track) movement values in arrays matching the track stats structure.
+
+    Args:
+        base_time: np.array
+            Base time of the first file of each pair, sorted in time.
+        pair_index: np.array
+            File pair index of each movement value.
+        pair_tracknumbers: np.array
+            Track number of each movement value.
+        lag: int
+            Lag intervals between tracked features.
+        movement_dir, movement_mag, movement_speed, movement_x, movement_y: np.array
+            Movement values, same size as pair_index.
+        ntimes: int
+            Number of times in the track stats.
+        ntracks: int
+            Number of tracks in the track stats.
+        stats_basetime: np.array
+            Track stats base time, dimensions: [ntracks, ntimes].
+        times_coord: np.array
+            Times coordinate.
+        times_dimname: string
+            Times dimension name.
+        tracks_coord: np.array
+            Tracks coordinate.
+        tracks_dimname: string
+            Tracks dimension name.
+
+    Returns:
+        ds_vars: Xarray Dataset
+            Dataset containing movement variables.
+    """
     # Create arrays to match track stats structure
     fillval_f = np.nan
     tracks_movement_mag = np.full((ntracks, ntimes), fillval_f, dtype=np.float32)
@@ -397,33 +421,35 @@ def define_movement_dataset(
     tracks_movement_dir = np.full((ntracks, ntimes), fillval_f, dtype=np.float32)
     tracks_movement_x = np.full((ntracks, ntimes), fillval_f, dtype=np.float32)
     tracks_movement_y = np.full((ntracks, ntimes), fillval_f, dtype=np.float32)
-    # Loop over each track to align the data
-    for track_number in np.arange(0, ntracks - 1):
-        # Find matching track start base_time
-        start_time = stats_basetime[track_number, 0]
-        # base_time_diff = np.abs(base_time - np.array(start_time))
-        base_time_diff = np.abs(base_time - start_time)
-        start_idx = np.nanargmin(base_time_diff)
-        # Find valid movement value indices
-        valid_indices = np.where(np.isfinite(movement_speed[:, track_number + 1]))[0]
-
-        if len(valid_indices) < 1:
-            continue
-        else:
-            end_idx = valid_indices[-1]
-
-        duration = np.min([ntimes, end_idx - start_idx + 1])
-
-        tracks_movement_mag[track_number, 0:duration] = \
-            movement_mag[start_idx:start_idx + duration, track_number + 1]
-        tracks_movement_speed[track_number, 0:duration] = \
-            movement_speed[start_idx:start_idx + duration, track_number + 1]
-        tracks_movement_dir[track_number, 0:duration] = \
-            movement_dir[start_idx:start_idx + duration, track_number + 1]
-        tracks_movement_x[track_number, 0:duration] = \
-            movement_x[start_idx:start_idx + duration, track_number + 1]
-        tracks_movement_y[track_number, 0:duration] = \
-            movement_y[start_idx:start_idx + duration, track_number + 1]
+
+    # Track index of each movement value
+    track_idx = pair_tracknumbers.astype(np.int64) - 1
+
+    # Find the file pair closest to each track start base_time (first one if tied)
+    start_time = stats_basetime[:, 0]
+    start_idx = np.searchsorted(base_time, start_time, side="left")
+    start_idx_left = np.clip(start_idx - 1, 0, len(base_time) - 1)
+    start_idx = np.clip(start_idx, 0, len(base_time) - 1)
+    use_left = np.abs(base_time[start_idx_left] - start_time) <= np.abs(base_time[start_idx] - start_time)
+    start_idx = np.where(use_left, start_idx_left, start_idx)
+
+    # Find the last file pair with a valid movement value for each track
+    end_idx = np.full(ntracks, -1, dtype=np.int64)
+    valid = np.isfinite(movement_speed)
+    np.maximum.at(end_idx, track_idx[valid], pair_index[valid])
+
+    # Time index of each movement value within its track
+    times_idx = pair_index - start_idx[track_idx]
+    # Keep values from the track start to the last valid value, within the track stats times
+    keep = (times_idx >= 0) & (times_idx < ntimes) & (pair_index <= end_idx[track_idx])
+    track_idx = track_idx[keep]
+    times_idx = times_idx[keep]
+
+    tracks_movement_mag[track_idx, times_idx] = movement_mag[keep]
+    tracks_movement_speed[track_idx, times_idx] = movement_speed[keep]
+    tracks_movement_dir[track_idx, times_idx] = movement_dir[keep]
+    tracks_movement_x[track_idx, times_idx] = movement_x[keep]
+    tracks_movement_y[track_idx, times_idx] = movement_y[keep]
 
     # Define new variables dictionary
     var_dict = {
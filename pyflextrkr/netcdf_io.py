@@ -2,6 +2,7 @@ import time
 import numpy as np
 import xarray as xr
 from netCDF4 import stringtochar
+from pyflextrkr.trackstats_func import add_feature_stats
 
 # ----------------------------------------------------------------------------------
 def write_cloudid_tb(
@@ -185,6 +186,10 @@ def write_cloudid_tb(
         ds_out["cloudnumber_orig"].attrs["units"] = "unitless"
         ds_out["cloudnumber_orig"].attrs["_FillValue"] = 0
 
+    # Add feature statistics for trackstats
+    if config.get("feature_stats_at_id", True):
+        ds_out = add_feature_stats(ds_out, config)
+
     # Set encoding/compression for all variables
     comp = dict(zlib=True)
     encoding = {var: comp for var in ds_out.data_vars}
@@ -364,6 +369,10 @@ def write_radar_cellid(
         ds_out['core_steiner_orig'].attrs['long_name'] = 'Steiner convective core before core area filter'
         ds_out['core_steiner_orig'].attrs['unit'] = 'unitless'
 
+    # Add feature statistics for trackstats
+    if config.get("feature_stats_at_id", True):
+        ds_out = add_feature_stats(ds_out, config)
+
     # Set encoding/compression for all variables
     comp = dict(zlib=True)
     encoding = {var: comp for var in ds_out.data_vars}
@@ -298,55 +298,46 @@ def get_melting_height(height_asl, temperature_c, ntimes, nx, ny, nz):
 
     Returns:
         melting_height: np.array
-            Melting-level height.
+            Melting-level height (float32).
     """
     logger = logging.getLogger(__name__)
 
-    # Multiply temperatures between adjacent vertical levels
-    temperature_c_adjacent = np.zeros((ntimes - 1, nz - 1, ny, nx), dtype=float)
-    temperature_c_adjacent[:, :, :, :] = temperature_c[:, 0:nz - 1, :, :] * temperature_c[:, 1:nz, :, :]
-    # Get temperature and height for adjacent levels
-    temperature_c_low = np.full((ntimes - 1, nz - 1, ny, nx), np.nan, dtype=float)
-    temperature_c_up = np.full((ntimes - 1, nz - 1, ny, nx), np.nan, dtype=float)
-    height_asl_low = np.full((ntimes - 1, nz - 1, ny, nx), np.nan, dtype=float)
-    height_asl_up = np.full((ntimes - 1, nz - 1, ny, nx), np.nan, dtype=float)
-    # Locate points where temperature changes to negative
+    # Find the highest level where temperature crosses 0 between adjacent levels,
+    # i.e., the product of temperatures between adjacent levels <= 0
     # Adjacent layers where temperature are both positive or negative are excluded
-    loc = np.where(temperature_c_adjacent <= 0.)
-    # Save temperature and height above/below these locations
-    temperature_c_low[loc] = (temperature_c[:, 0:nz - 1, :, :])[loc]
-    temperature_c_up[loc] = (temperature_c[:, 1:nz, :, :])[loc]
-    height_asl_low[loc] = (height_asl[:, 0:nz - 1, :, :])[loc]
-    height_asl_up[loc] = (height_asl[:, 1:nz, :, :])[loc]
-    # del loc
-    # del temperature_c, height_asl
-    melting_height = np.full((ntimes - 1, ny, nx), np.nan, dtype=float)
-
-    # Loop over each vertical level
+    # Loop over levels keeping only 2D arrays, the last (highest) crossing is kept
+    kmelt = np.full((ntimes - 1, ny, nx), -1, dtype=np.int32)
     for zz in range(0, nz - 1):
-        if (np.any(~np.isnan(temperature_c_low[:, zz, :, :]))):
-            # Get the height and temperature at this vertical level
-            height_asl_up_tmp = height_asl_up[:, zz, :, :]
-            height_asl_low_tmp = height_asl_low[:, zz, :, :]
-            temperature_c_up_tmp = temperature_c_up[:, zz, :, :]
-            temperature_c_low_tmp = temperature_c_low[:, zz, :, :]
-            # Calculate the difference between levels (up - low)
-            tmph = height_asl_up_tmp - height_asl_low_tmp
-            tmpc = temperature_c_up_tmp - temperature_c_low_tmp
-            # Location where dT = 0
-            locconstant = np.where((~np.isnan(tmpc)) & (tmpc == 0.))
-            # Location where dT != 0
-            locvalid = np.where((~np.isnan(tmpc)) & (tmpc != 0.))
-            if (len(locconstant[0]) > 0):
-                # Use the height level above
-                melting_height[locconstant] = height_asl_up_tmp[locconstant]
-            if (len(locvalid[0]) > 0):
-                # Interpolate height using dT/dz
-                melting_height[locvalid] = height_asl_low_tmp[locvalid] + tmph[locvalid] / tmpc[locvalid] * (
-                            0. - temperature_c_low_tmp[locvalid])
-            del tmph, tmpc, locconstant, locvalid, height_asl_up_tmp, height_asl_low_tmp, \
-                temperature_c_up_tmp, temperature_c_low_tmp
-    del temperature_c_adjacent, height_asl_low, height_asl_up, temperature_c_low, temperature_c_up
+        temperature_c_low = temperature_c[:, zz, :, :]
+        temperature_c_up = temperature_c[:, zz + 1, :, :]
+        crossing = ((temperature_c_low <= 0.) & (temperature_c_up >= 0.)) | \
+                   ((temperature_c_low >= 0.) & (temperature_c_up <= 0.))
+        kmelt[crossing] = zz
+    valid = kmelt >= 0
+
+    # Get temperature and height at the levels below/above the crossing
+    kidx = np.where(valid, kmelt, 0)[:, None, :, :]
+    temperature_c_low = np.take_along_axis(temperature_c, kidx, axis=1)[:, 0, :, :].astype(np.float64)
+    temperature_c_up = np.take_along_axis(temperature_c, kidx + 1, axis=1)[:, 0, :, :].astype(np.float64)
+    height_asl_low = np.take_along_axis(height_asl, kidx, axis=1)[:, 0, :, :].astype(np.float64)
+    height_asl_up = np.take_along_axis(height_asl, kidx + 1, axis=1)[:, 0, :, :].astype(np.float64)
+    del kidx
+
+    # Calculate the difference between levels (up - low)
+    tmph = height_asl_up - height_asl_low
+    tmpc = temperature_c_up - temperature_c_low
+    melting_height = np.full((ntimes - 1, ny, nx), np.nan, dtype=np.float32)
+    # Location where dT = 0
+    locconstant = valid & (tmpc == 0.)
+    # Location where dT != 0
+    locvalid = valid & (tmpc != 0.)
+    # Use the height level above
+    melting_height[locconstant] = height_asl_up[locconstant]
+    # Interpolate height using dT/dz
+    melting_height[locvalid] = height_asl_low[locvalid] + tmph[locvalid] / tmpc[locvalid] * (
+                0. - temperature_c_low[locvalid])
+    del tmph, tmpc, locconstant, locvalid, height_asl_up, height_asl_low, \
+        temperature_c_up, temperature_c_low
 
     #filter out those melting level too high and unrealistic, just in case melting level is in the stratosphere
     #melting_height[np.where((~np.isnan(melting_height)) & (melting_height > 12.))]=np.nan
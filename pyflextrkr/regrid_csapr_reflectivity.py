@@ -86,25 +86,7 @@ def convolve_reflectivity(in_reflectivity, kernel):
         out_reflectivity: np.array
             Output reflectivity array.
     """
-    # Convert reflectivity to linear unit
-    linrefl = 10. ** (in_reflectivity / 10.)
-    # Make an array for counting number of grids for convolution
-    mask_goodvalues = (~np.isnan(in_reflectivity)).astype(float)
-
-    # Apply convolution filter
-    bkg_linrefl = ndimage.convolve(linrefl, kernel, mode='constant', cval=0.0)
-    numPixs = ndimage.convolve(mask_goodvalues, kernel, mode='constant', cval=0.0)
-    # Mask missing data area
-    bkg_linrefl[mask_goodvalues==0] = 0
-    numPixs[mask_goodvalues==0] = 0
-
-    # Calculate average linear reflectivity and convert to log values
-    out_reflectivity = np.full(in_reflectivity.shape, np.NaN, dtype=np.float32)
-    out_reflectivity[numPixs>0] = 10.0 * np.log10(bkg_linrefl[numPixs>0] / numPixs[numPixs>0])
-
-    # Remove pixels with 0 number of pixels
-    out_reflectivity[mask_goodvalues==0] = np.NaN
-    
+    out_reflectivity = convolve_vars([in_reflectivity], kernel, [True])[0]
     return out_reflectivity
 
 def convolve_var(in_var, kernel):
@@ -121,24 +103,190 @@ def convolve_var(in_var, kernel):
         out_var: np.array
             Output variable array.
     """
-    # Make an array for counting number of grids for convolution
-    mask_goodvalues = (~np.isnan(in_var)).astype(float)
+    out_var = convolve_vars([in_var], kernel, [False])[0]
+    return out_var
+
+def convolve_vars(in_vars, kernel, is_reflectivity, subsample=None):
+    """
+    Apply convolution to several variables of the same shape within a moving kernel,
+    summing all variables and their good value counts in one pass.
+    Reflectivity is averaged in linear unit.
+
+    Args:
+        in_vars: list
+            List of input variable arrays, can be either 2D or 3D.
+        kernel: np.array
+            Kernel for weights.
+        is_reflectivity: list
+            List of flags, True if the variable is reflectivity [dBZ].
+        subsample: tuple, optional
+            Tuple of slices for each dimension, only return these grid points (default None: all).
+
+    Returns:
+        out_vars: list
+            List of output variable arrays.
+    """
+    nvars = len(in_vars)
+    if subsample is None:
+        subsample = (slice(None),) * in_vars[0].ndim
+    # Stack the values and good value masks of all variables
+    values = np.empty((2 * nvars,) + in_vars[0].shape, dtype=np.float64)
+    for ivar in range(nvars):
+        if is_reflectivity[ivar]:
+            # Convert reflectivity to linear unit
+            values[ivar] = 10. ** (in_vars[ivar] / 10.)
+        else:
+            values[ivar] = in_vars[ivar]
+        # Make an array for counting number of grids for convolution
+        values[nvars + ivar] = ~np.isnan(in_vars[ivar])
 
     # Apply convolution filter
-    bkg_var = ndimage.convolve(in_var, kernel, mode='constant', cval=0.0)
-    numPixs = ndimage.convolve(mask_goodvalues, kernel, mode='constant', cval=0.0)
-    # Mask missing data area
-    bkg_var[mask_goodvalues==0] = 0
-    numPixs[mask_goodvalues==0] = 0
+    sums = window_sum(values, kernel[None, ...], subsample=(slice(None),) + tuple(subsample))
+
+    out_vars = []
+    for ivar in range(nvars):
+        bkg_var = sums[ivar]
+        numPixs = sums[nvars + ivar]
+        mask_goodvalues = values[nvars + ivar][subsample]
+        # Mask missing data area
+        bkg_var[mask_goodvalues==0] = 0
+        numPixs[mask_goodvalues==0] = 0
+
+        # Calculate average value, convert reflectivity to log values
+        out_var = np.full(mask_goodvalues.shape, np.NaN, dtype=np.float32)
+        if is_reflectivity[ivar]:
+            out_var[numPixs>0] = 10.0 * np.log10(bkg_var[numPixs>0] / numPixs[numPixs>0])
+        else:
+            out_var[numPixs>0] = bkg_var[numPixs>0] / numPixs[numPixs>0]
 
-    # Calculate average linear reflectivity and convert to log values
-    out_var = np.full(in_var.shape, np.NaN, dtype=np.float32)
-    out_var[numPixs>0] = bkg_var[numPixs>0] / numPixs[numPixs>0]
+        # Remove pixels with 0 number of pixels
+        out_var[mask_goodvalues==0] = np.NaN
+        out_vars.append(out_var)
 
-    # Remove pixels with 0 number of pixels
-    out_var[mask_goodvalues==0] = np.NaN
+    return out_vars
 
-    return out_var
+def window_sum(data, kernel, subsample=None):
+    """
+    Sum data within a moving kernel, same as ndimage.convolve(data, kernel, mode='constant', cval=0.0).
+    Box kernels (equal non-zero weights on a rectangular block) are summed along each axis separately,
+    and only at the subsampled grid points.
+
+    Args:
+        data: np.array
+            Input data array.
+        kernel: np.array
+            Kernel for weights, same number of dimensions as data.
+        subsample: tuple, optional
+            Tuple of slices for each dimension, only return these grid points (default None: all).
+
+    Returns:
+        out: np.array
+            Sum within the kernel at each (subsampled) grid point.
+    """
+    if subsample is None:
+        subsample = (slice(None),) * data.ndim
+    box = get_box_window(kernel)
+    # Direct convolution is faster for small windows at all grid points
+    full_output = all(islice.indices(n) == (0, n, 1) for islice, n in zip(subsample, data.shape))
+    if (box is None) or (full_output and max(hi - lo + 1 for lo, hi in box[1]) <= max_shift_window):
+        return ndimage.convolve(data, kernel, mode='constant', cval=0.0)[tuple(subsample)]
+    weight, offsets = box
+    out = data.astype(np.float64, copy=False)
+    for axis, (lo, hi) in enumerate(offsets):
+        out = box_sum_1d(out, axis, lo, hi, subsample[axis])
+    if out is data:
+        out = out.copy()
+    if weight != 1:
+        out *= weight
+    return out
+
+def get_box_window(kernel):
+    """
+    Check if a kernel is a box, and get the window offsets of the box along each axis.
+
+    Args:
+        kernel: np.array
+            Kernel for weights.
+
+    Returns:
+        box: tuple or None
+            (weight, offsets), where offsets is a list of (lo, hi) such that the window of
+            output point i covers input points i+lo to i+hi along each axis (following
+            ndimage.convolve). None if the kernel is not a box.
+    """
+    nonzero = kernel != 0
+    if not np.any(nonzero):
+        return None
+    weights = kernel[nonzero]
+    if not np.all(weights == weights[0]):
+        return None
+    indices = np.nonzero(nonzero)
+    nbox = np.prod([idx.max() - idx.min() + 1 for idx in indices])
+    if np.count_nonzero(nonzero) != nbox:
+        return None
+    # Convolve an impulse to get the window offsets following ndimage.convolve conventions
+    impulse = np.zeros([2 * n + 1 for n in kernel.shape])
+    center = tuple(kernel.shape)
+    impulse[center] = 1
+    response = ndimage.convolve(impulse, nonzero.astype(float), mode='constant', cval=0.0)
+    # The window of output point p covers the impulse at center: center = p + offset
+    offsets = [(int(c - idx.max()), int(c - idx.min())) for c, idx in zip(center, np.nonzero(response))]
+    return weights[0], offsets
+
+def box_sum_1d(data, axis, lo, hi, out_slice=slice(None)):
+    """
+    Sum data within a window along one axis, with zeros outside the domain.
+
+    Args:
+        data: np.array
+            Input data array.
+        axis: int
+            Axis to sum along.
+        lo: int
+            Window start offset.
+        hi: int
+            Window end offset.
+        out_slice: slice, optional
+            Output grid points along the axis (default all).
+
+    Returns:
+        out: np.array
+            Sum of data[i+lo] to data[i+hi] along the axis, at the output grid points i.
+    """
+    n = data.shape[axis]
+    start, stop, step = out_slice.indices(n)
+    nout = len(range(start, stop, step))
+    if (lo == 0) and (hi == 0):
+        return data[(slice(None),) * axis + (out_slice,)]
+    values = np.moveaxis(data, axis, -1)
+    if (hi - lo + 1) <= max_shift_window:
+        # Add shifted arrays for small windows
+        out = np.zeros(values.shape[:-1] + (nout,), dtype=values.dtype)
+        for shift in range(lo, hi + 1):
+            # Output points j with 0 <= start + step * j + shift < n
+            j0 = max(0, -((start + shift) // step))
+            j1 = min(nout, (n - 1 - start - shift) // step + 1)
+            if j1 > j0:
+                i0 = start + shift + step * j0
+                out[..., j0:j1] += values[..., i0:i0 + step * (j1 - j0):step]
+    else:
+        # Summed-area (cumulative sum) differences for large windows,
+        # missing values are counted separately so they only affect windows that contain them
+        isnan = np.isnan(values)
+        cumsum = np.zeros(values.shape[:-1] + (n + 1,), dtype=values.dtype)
+        np.cumsum(np.where(isnan, 0, values), axis=-1, out=cumsum[..., 1:])
+        idx = np.arange(start, stop, step)
+        idx_hi = np.clip(idx + hi + 1, 0, n)
+        idx_lo = np.clip(idx + lo, 0, n)
+        out = cumsum[..., idx_hi] - cumsum[..., idx_lo]
+        if np.any(isnan):
+            nancount = np.zeros(values.shape[:-1] + (n + 1,), dtype=np.int64)
+            np.cumsum(isnan, axis=-1, out=nancount[..., 1:])
+            out[(nancount[..., idx_hi] - nancount[..., idx_lo]) > 0] = np.nan
+    return np.moveaxis(out, -1, axis)
+
+# Largest window size summed by adding shifted arrays, larger windows use cumulative sums
+max_shift_window = 8
 
 
 def regrid_file(in_filename, in_basename, out_dir, out_basename, config):
@@ -194,14 +342,12 @@ def regrid_file(in_filename, in_basename, out_dir, out_basename, config):
 
     # Make a 3D kernel
     kernel3d = kernel[None,:,:]
-    # Call convlution function
-    REFL_conv = convolve_reflectivity(REFL.data, kernel3d)
-    ncp_conv = convolve_var(ncp.data, kernel3d)
+    # Call convlution function, only at the subsampled grid points (every X grid points)
+    subsample = (slice(None), slice(start_idx, None, ratio), slice(start_idx, None, ratio))
+    REFL_reg, ncp_reg = convolve_vars([REFL.data, ncp.data], kernel3d, [True, False], subsample=subsample)
     # REFL_MAX_conv = convolve_reflectivity(REFL_MAX.data, kernel)
 
     # Subsample every X grid points
-    REFL_reg = REFL_conv[:,start_idx::ratio,start_idx::ratio]
-    ncp_reg = ncp_conv[:,start_idx::ratio,start_idx::ratio]
     # REFL_MAX_reg = REFL_MAX_conv[start_idx::ratio,start_idx::ratio]
     longitude_reg = longitude.data[:,start_idx::ratio,start_idx::ratio]
     latitude_reg = latitude.data[:,start_idx::ratio,start_idx::ratio]
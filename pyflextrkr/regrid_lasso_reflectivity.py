@@ -4,11 +4,11 @@ import sys
 import time
 import logging
 import numpy as np
-from scipy import ndimage
 import xarray as xr
 import pandas as pd
 import dask
 from dask.distributed import wait
+from pyflextrkr.regrid_csapr_reflectivity import convolve_vars
 
 def regrid_lasso_reflectivity(config):
     """
@@ -85,25 +85,7 @@ def convolve_reflectivity(in_reflectivity, kernel):
         out_reflectivity: np.array
             Output reflectivity array.
     """
-    # Convert reflectivity to linear unit
-    linrefl = 10. ** (in_reflectivity / 10.)
-    # Make an array for counting number of grids for convolution
-    mask_goodvalues = (~np.isnan(in_reflectivity)).astype(float)
-
-    # Apply convolution filter
-    bkg_linrefl = ndimage.convolve(linrefl, kernel, mode='constant', cval=0.0)
-    numPixs = ndimage.convolve(mask_goodvalues, kernel, mode='constant', cval=0.0)
-    # Mask missing data area
-    bkg_linrefl[mask_goodvalues==0] = 0
-    numPixs[mask_goodvalues==0] = 0
-
-    # Calculate average linear reflectivity and convert to log values
-    out_reflectivity = np.full(in_reflectivity.shape, np.NaN, dtype=np.float32)
-    out_reflectivity[numPixs>0] = 10.0 * np.log10(bkg_linrefl[numPixs>0] / numPixs[numPixs>0])
-
-    # Remove pixels with 0 number of pixels
-    out_reflectivity[mask_goodvalues==0] = np.NaN
-    
+    out_reflectivity, = convolve_vars([in_reflectivity], kernel, [True])
     return out_reflectivity
 
 
@@ -141,13 +123,15 @@ def regrid_file(in_filename, in_basename, out_dir, out_basename):
 
     # Make a 3D kernel
     kernel3d = kernel[None,:,:]
-    # Call convlution function
-    REFL_10CM_conv = convolve_reflectivity(REFL_10CM.data, kernel3d)
-    REFL_10CM_MAX_conv = convolve_reflectivity(REFL_10CM_MAX.data, kernel)
+    # Call convlution function, only at the subsampled grid points (every X grid points)
+    # Column max reflectivity is appended as an extra level to average all levels in one pass
+    subsample = (slice(None), slice(start_idx, None, ratio), slice(start_idx, None, ratio))
+    REFL_10CM_all = np.concatenate([REFL_10CM.data, REFL_10CM_MAX.data[None,:,:]], axis=0)
+    REFL_10CM_all_reg, = convolve_vars([REFL_10CM_all], kernel3d, [True], subsample=subsample)
+    REFL_10CM_reg = REFL_10CM_all_reg[:-1,:,:]
+    REFL_10CM_MAX_reg = REFL_10CM_all_reg[-1,:,:]
 
     # Subsample every X grid points
-    REFL_10CM_reg = REFL_10CM_conv[:,start_idx::ratio,start_idx::ratio]
-    REFL_10CM_MAX_reg = REFL_10CM_MAX_conv[start_idx::ratio,start_idx::ratio]
     XLONG_reg = XLONG.data[start_idx::ratio,start_idx::ratio]
     XLAT_reg = XLAT.data[start_idx::ratio,start_idx::ratio]
 
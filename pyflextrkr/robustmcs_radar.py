@@ -6,7 +6,9 @@ import time
 import warnings
 import logging
 import pandas as pd
+from pyflextrkr.ft_profiling import profile_step
 
+@profile_step
 def define_robust_mcs_radar(config):
     """
     Identify robust MCS based on radar statistics.
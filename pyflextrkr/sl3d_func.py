@@ -2,6 +2,7 @@ import numpy as np
 import math
 from scipy import ndimage
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from pyflextrkr.echotop_func import echotop_height
 
 def run_sl3d(ds, config):
@@ -223,6 +224,8 @@ def gridrad_sl3d(data, config, **kwargs):
     updraft_ReflGradiant_MaxHeight = config.get('updraft_ReflGradiant_MaxHeight', 7.0)
     # Composite reflectivity threshold [dBZ] to be updraft
     updraft_CompRefl_Thresh = config.get('updraft_CompRefl_Thresh', 40.0)
+    # Number of threads to compute peakedness median filter (None: number of available cores)
+    median_nthreads = config.get('sl3d_median_nthreads', 1)
 
     # Extract dimension sizes for ease
     nx = data['x']['n']
@@ -338,19 +341,8 @@ def gridrad_sl3d(data, config, **kwargs):
         # Get column-maximum reflectivity for above melting level altitudes
         dbz_aml = np.nanmax(tmp * (zzz > (zml + 1.0)), axis=0)
 
-    # Create array to compute peakedness in lowest 9 km altitude layer
-    peak = np.full((k9km+1,ny,nx), np.NaN, dtype=data['Z_H']['values'].dtype)
-
-    # Loop over the lowest 9 km levels
-    for k in range(0, k9km+1):
-        tmp = data['Z_H']['values'][k,:,:]
-
-        # According to this thread: 
-        # https://forum.image.sc/t/skimage-filters-median-using-mask-for-floating-point-image-with-nans/57289
-        # scipy.ndimage.median_filter v1.7 (same as skimage.filters.median v0.17) above ignores NaN
-        # But it produces incorrect values at the edge of the domain
-        # These values will be removed at the end of the code
-        peak[k,:,:] = tmp - ndimage.median_filter(tmp, size=nsearch)
+    # Compute peakedness in lowest 9 km altitude layer
+    peak = calc_peakedness(data['Z_H']['values'][0:k9km+1,:,:], nsearch, nthreads=median_nthreads)
 
     # Compute peakedness threshold for reflectivity value
     tmp = 10.0 - ((data['Z_H']['values'][0:k9km+1,:,:])**2) / 337.5
@@ -454,3 +446,42 @@ def gridrad_sl3d(data, config, **kwargs):
     sl3dclass[:, -ngrids:] = 0
 
     return sl3dclass
+
+
+def calc_peakedness(refl, nsearch, nthreads=1):
+    """
+    Calculate reflectivity peakedness (reflectivity minus its horizontal median) on each level.
+
+    Args:
+        refl: np.array
+            Reflectivity array [z, y, x].
+        nsearch: int
+            Number of grid points of the horizontal median filter box.
+        nthreads: int, default=1
+            Number of threads to filter the levels (median_filter releases the GIL).
+            Capped by the number of levels. When files are processed in parallel,
+            each worker uses this many threads.
+
+    Returns:
+        peak: np.array
+            Peakedness array [z, y, x].
+    """
+    # According to this thread:
+    # https://forum.image.sc/t/skimage-filters-median-using-mask-for-floating-point-image-with-nans/57289
+    # scipy.ndimage.median_filter v1.7 (same as skimage.filters.median v0.17) above ignores NaN
+    # But it produces incorrect values at the edge of the domain
+    # These values will be removed at the end of gridrad_sl3d
+    nlevels = refl.shape[0]
+    nthreads = max(min(nthreads, nlevels), 1)
+
+    peak = np.full(refl.shape, np.NaN, dtype=refl.dtype)
+    def filter_level(k):
+        peak[k,:,:] = refl[k,:,:] - ndimage.median_filter(refl[k,:,:], size=nsearch)
+    if nthreads == 1:
+        for k in range(0, nlevels):
+            filter_level(k)
+    else:
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            list(executor.map(filter_level, range(0, nlevels)))
+    return peak
+
@@ -1,5 +1,8 @@
+import functools
 import numpy as np
 from scipy import ndimage, signal
+from scipy import fft as sp_fft
+from pyflextrkr.ft_tiling import label_tiled
 
 def background_intensity(refl, mask_goodvalues, dx, dy, bkg_rad, convolve_method):
     """
@@ -14,7 +17,9 @@ def background_intensity(refl, mask_goodvalues, dx, dy, bkg_rad, convolve_method
     bkg_rad: float
         Background radius value to calculate reflectivity intensity (meters)
     convolve_method: string, optional
-        Choose which convolution method to use in Scipy: 'ndimage' (default), or 'signal'
+        Choose which convolution method to use: 'ndimage', 'signal' (Scipy),
+        'rowsum' (disk sums from running sums along each row), 'fft' (Fourier transform of the disk kernel
+        is cached and reused for frames of the same shape), or 'auto' (chooses by kernel size)
 
     Returns
     ----------
@@ -35,6 +40,10 @@ def background_intensity(refl, mask_goodvalues, dx, dy, bkg_rad, convolve_method
     # mask[bkg_rad_x,bkg_rad_y]=1
     # mask = ndimage.binary_dilation(mask,iterations=bkg_rad_x)
 
+    # Choose convolution method by kernel size
+    if convolve_method == 'auto':
+        convolve_method = 'rowsum' if mask.shape[0] <= auto_rowsum_max_kernel_rows else 'fft'
+
     # Convert to linear unit
     linrefl = np.zeros(refl.shape)
     linrefl[mask_goodvalues==1] = 10. ** (refl[mask_goodvalues==1] / 10.)
@@ -48,6 +57,14 @@ def background_intensity(refl, mask_goodvalues, dx, dy, bkg_rad, convolve_method
         # it automatically chooses direct or Fourier method based on an estimate of which is faster (default)
         bkg_linrefl = signal.convolve(linrefl, mask, mode='same', method='auto')
         numPixs = signal.convolve(mask_goodvalues, mask, mode='same', method='auto')
+    if convolve_method == 'rowsum':
+        # Sum of each row of the disk from running sums along rows
+        bkg_linrefl = disk_sum_rowruns(linrefl, mask)
+        numPixs = disk_sum_rowruns(mask_goodvalues, mask)
+    if convolve_method == 'fft':
+        # Use the cached Fourier transform of the disk kernel
+        bkg_linrefl = disk_sum_fft(linrefl, mask)
+        numPixs = disk_sum_fft(mask_goodvalues, mask)
     # Mask bad values
     bkg_linrefl[mask_goodvalues==0] = 0
     numPixs[mask_goodvalues==0] = 0
@@ -62,6 +79,94 @@ def background_intensity(refl, mask_goodvalues, dx, dy, bkg_rad, convolve_method
     return refl_bkg
 
 
+# Largest number of kernel rows that uses row sums when convolve_method='auto', FFT is faster for larger kernels
+auto_rowsum_max_kernel_rows = 17
+
+def disk_sum_rowruns(field, mask):
+    """
+    Sum a 2D field within a kernel that is one contiguous run on each row (e.g., a disk),
+    with zeros outside the domain. Same as ndimage.convolve(field, mask, mode='constant', cval=0)
+    for a symmetric kernel, at a cost proportional to the number of kernel rows instead of kernel points.
+
+    Args:
+        field: np.ndarray
+            2D array to sum.
+        mask: np.ndarray(bool)
+            Kernel with odd dimensions, the True values on each row must be contiguous.
+
+    Returns:
+        out: np.ndarray
+            Kernel sum at each grid point, integer if field is integer.
+    """
+    ny, nx = field.shape
+    ky, kx = mask.shape
+    ry, rx = ky // 2, kx // 2
+    dtype = np.int64 if np.issubdtype(field.dtype, np.integer) else np.float64
+    # Running sums along rows of the zero-padded field, with a leading column of 0
+    padded = np.zeros((ny + 2 * ry, nx + 2 * rx + 1), dtype=dtype)
+    padded[ry:ry + ny, rx + 1:rx + 1 + nx] = field
+    runsum = np.cumsum(padded, axis=1, out=padded)
+    out = np.zeros((ny, nx), dtype=dtype)
+    for iy in range(ky):
+        ix = np.nonzero(mask[iy, :])[0]
+        if len(ix) == 0:
+            continue
+        # Row sum from column ix[0] to ix[-1] of the kernel
+        rows = runsum[iy:iy + ny, :]
+        out += rows[:, ix[-1] + 1:ix[-1] + 1 + nx]
+        out -= rows[:, ix[0]:ix[0] + nx]
+    return out
+
+def disk_sum_fft(field, mask):
+    """
+    Sum a 2D field within a kernel using FFT, with zeros outside the domain.
+    The Fourier transform of the kernel is cached for fields of the same shape.
+
+    Args:
+        field: np.ndarray
+            2D array to sum.
+        mask: np.ndarray(bool)
+            Kernel with odd dimensions.
+
+    Returns:
+        out: np.ndarray
+            Kernel sum at each grid point, integer if field is integer.
+    """
+    ny, nx = field.shape
+    ky, kx = mask.shape
+    fft_shape = (sp_fft.next_fast_len(ny + ky - 1, real=True), sp_fft.next_fast_len(nx + kx - 1, real=True))
+    kernel_fft = get_kernel_fft(mask.tobytes(), mask.shape, fft_shape)
+    conv = sp_fft.irfft2(sp_fft.rfft2(field, s=fft_shape) * kernel_fft, s=fft_shape)
+    out = conv[ky // 2:ky // 2 + ny, kx // 2:kx // 2 + nx]
+    if np.issubdtype(field.dtype, np.integer):
+        out = np.rint(out).astype(np.int64)
+    else:
+        out = np.array(out)
+    return out
+
+@functools.lru_cache(maxsize=8)
+def get_kernel_fft(mask_bytes, mask_shape, fft_shape):
+    """
+    Get the Fourier transform of a kernel, cached by kernel and FFT shape.
+
+    Args:
+        mask_bytes: bytes
+            Kernel values (bool) as bytes.
+        mask_shape: tuple
+            Kernel shape.
+        fft_shape: tuple
+            FFT shape.
+
+    Returns:
+        kernel_fft: np.ndarray(complex)
+            Fourier transform of the kernel.
+    """
+    mask = np.frombuffer(mask_bytes, dtype=bool).reshape(mask_shape)
+    kernel_fft = sp_fft.rfft2(mask.astype(np.float64), s=fft_shape)
+    kernel_fft.setflags(write=False)
+    return kernel_fft
+
+
 def peakedness(refl_bkg, mask_goodvalues, minZdiff, absConvThres):
     """
     Given a background reflectivity value, we determine what the necessary
@@ -289,7 +394,7 @@ def mod_dilate_conv_rad(
     return sclass_new, score_dilate
 
 
-def label_cells(convmask, min_cellpix):
+def label_cells(convmask, min_cellpix, tile_size=None, tile_nthreads=1):
     """
     Labels convective cells, and returns sorted cell number arrays by size.
     ----------
@@ -297,6 +402,10 @@ def label_cells(convmask, min_cellpix):
         Binary convective mask array.
     min_cellpix: float
         Minimum number of pixel to count as a cell.
+    tile_size: int or list, optional
+        Tile size [ny, nx] to label cells tile by tile (default None)
+    tile_nthreads: int, optional
+        Number of threads to label the tiles (default 1)
 
     Returns
     ----------
@@ -307,10 +416,10 @@ def label_cells(convmask, min_cellpix):
     """
 
     # Create output arrays
-    sortedlabelcell_number2d = np.zeros(convmask.shape, dtype=int)
+    sortedlabelcell_number2d = np.zeros(convmask.shape, dtype=np.int32)
 
     # Label convective cells
-    labelcell_number2d, nlabelcells = ndimage.label(convmask)
+    labelcell_number2d, nlabelcells = label_tiled(convmask, tile_size=tile_size, nthreads=tile_nthreads)
 
     # Check if there is any cells identified
     if (nlabelcells > 0):
@@ -367,7 +476,7 @@ def label_cells(convmask, min_cellpix):
     return sortedlabelcell_number2d, sortedcell_npix
 
 
-def expand_conv_core(score, radii_expand, dx, dy, min_corenpix=1):
+def expand_conv_core(score, radii_expand, dx, dy, min_corenpix=1, tile_size=None, tile_nthreads=1):
     """
     Expand convective cores outward to a set of specified radii sequentially.
     
@@ -379,6 +488,10 @@ def expand_conv_core(score, radii_expand, dx, dy, min_corenpix=1):
         Radii values to expand
     min_corenpix: int, optional
         Minimum number of pixels to label a core (default 1)
+    tile_size: int or list, optional
+        Tile size [ny, nx] to label cores tile by tile (default None)
+    tile_nthreads: int, optional
+        Number of threads to label the tiles (default 1)
 
     Returns:
     ===========
@@ -389,7 +502,7 @@ def expand_conv_core(score, radii_expand, dx, dy, min_corenpix=1):
     """
 
     # Sort and renumber the cores by size
-    score_sorted, sortedcell_npix = label_cells(score, min_corenpix)
+    score_sorted, sortedcell_npix = label_cells(score, min_corenpix, tile_size=tile_size, tile_nthreads=tile_nthreads)
     ncores = len(sortedcell_npix)
 
     # Initialize expanded core array
@@ -405,7 +518,7 @@ def expand_conv_core(score, radii_expand, dx, dy, min_corenpix=1):
             for ic in range(1, ncores+1):
 
                 # Create a binary mask for the current cell
-                coremap = np.zeros(score_sorted.shape, dtype=int)
+                coremap = np.zeros(score_sorted.shape, dtype=np.int8)
                 coremap[score_sorted == ic] = 1
 
                 # Make a mask for dilatable region (this gets updated every iteration)
@@ -465,7 +578,7 @@ def expand_conv_core_nosort(score, radii_expand, dx, dy, min_corenpix=1):
             for ic in corenumber_unique:
 
                 # Create a binary mask for the current cell
-                coremap = np.zeros(score_sorted.shape, dtype=int)
+                coremap = np.zeros(score_sorted.shape, dtype=np.int8)
                 coremap[score_sorted == ic] = 1
 
                 # Make a mask for dilatable region (this gets updated every iteration)
@@ -537,7 +650,8 @@ def steiner_classification(
     weakEchoThres: float
         Reflectivity threshold to define weak echo (Ze < weakEchoThres is weak echo)
     convolve_method: string, optional
-        Choose which convolution method to use in Scipy: 'ndimage' (default), or 'signal'
+        Choose which convolution method to use: 'ndimage' (default), 'signal', 'rowsum', 'fft', or 'auto'
+        (see background_intensity)
 
     Returns:
     ========
@@ -547,8 +661,8 @@ def steiner_classification(
         Convetive Core, same size as refl. 
     """
 
-    score = np.zeros(refl.shape, dtype=int)
-    sclass = np.zeros(refl.shape, dtype=int) 
+    score = np.zeros(refl.shape, dtype=np.int16)
+    sclass = np.zeros(refl.shape, dtype=np.int16) 
     
     mask_goodvalues = np.ones(refl.shape, dtype=int)
     mask_goodvalues[np.isnan(refl)] = 0
@@ -598,6 +712,8 @@ def mod_steiner_classification(
         remove_smallcores=True,
         return_diag=False,
         convolve_method='ndimage',
+        tile_size=None,
+        tile_nthreads=1,
 ):
     """
     Modified Steiner et al. (1995) algorithm for echo classification using the reflectivity field
@@ -639,7 +755,12 @@ def mod_steiner_classification(
     return_diag: bool, optional
         A flag to return more fields for diagnostic purpose (default False)
     convolve_method: string, optional
-        Choose which convolution method to use in Scipy: 'ndimage' (default), or 'signal'
+        Choose which convolution method to use: 'ndimage' (default), 'signal', 'rowsum', 'fft', or 'auto'
+        (see background_intensity)
+    tile_size: int or list, optional
+        Tile size [ny, nx] to label cores tile by tile (default None)
+    tile_nthreads: int, optional
+        Number of threads to label the tiles (default 1)
 
     Returns:
     ===========
@@ -656,8 +777,8 @@ def mod_steiner_classification(
     # If refl below truncZconvThres, use peakedness criteria
     peak = peakedness(refl_bkg, mask_goodvalues, minZdiff, absConvThres)
 
-    score = np.zeros(refl.shape, dtype=int)
-    sclass = np.zeros(refl.shape, dtype=int)
+    score = np.zeros(refl.shape, dtype=np.int16)
+    sclass = np.zeros(refl.shape, dtype=np.int16)
 
     # Default is stratiform
     sclass[mask_goodvalues==1] = types_steiner['STRATIFORM']
@@ -687,7 +808,7 @@ def mod_steiner_classification(
 
         # Remove small cores
         # Label connected core pixels as regions
-        tmpregions, num_regions = ndimage.label(score_keep)
+        tmpregions, num_regions = label_tiled(score_keep, tile_size=tile_size, nthreads=tile_nthreads)
         for rr in range(1, num_regions+1):
             rid = np.where(tmpregions == rr)
             if (len(rid[0]) < min_corenpix):
@@ -0,0 +1,489 @@
+import os
+import sys
+import time
+import logging
+import numpy as np
+import xarray as xr
+from netCDF4 import Dataset
+from scipy import ndimage
+from pyflextrkr.ft_utilities import subset_files_timerange
+from pyflextrkr.idfeature_driver import get_idfeature_function
+from pyflextrkr.idfeature_tracksingle_driver import get_cloudid_basetime
+from pyflextrkr.tracksingle_drift import trackclouds
+from pyflextrkr.gettracks import link_pair_tracks, write_tracking_state, load_tracking_state
+from pyflextrkr.mapfeature_func import map_feature
+
+# Explanation of the link status in the streaming pixel-level files
+stream_status_explanation = (
+    "Link status from the previous file (gettracks): "
+    + "1: Simple track continuation;  "
+    + "3: This is the bigger cloud from a split;  "
+    + "31: This is the smaller cloud from a split;  "
+    + "0: Track starts or no link to the previous file"
+)
+
+def streaming_driver(config):
+    """
+    Track features in near-real-time as new input files arrive in clouddata_path.
+
+    The input directory is checked every config["stream_poll_interval"] seconds.
+    Each new file is processed in time order: features are identified (idfeature),
+    linked to the previous file (trackclouds), and track numbers are advanced from the
+    track state kept in memory (link_pair_tracks). A pixel-level track number file
+    (map_feature) and a rolling track statistics file are written for every file.
+    The track state is saved after every file, so that streaming can be resumed.
+
+    The driver stops when a file at or after enddate has been processed, or when
+    no new file arrives for config["stream_max_idle"] seconds (if provided).
+
+    Args:
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        None.
+    """
+    logger = logging.getLogger(__name__)
+    logger.info('Streaming feature tracking')
+
+    clouddata_path = config["clouddata_path"]
+    databasename = config["databasename"]
+    start_basetime = config["start_basetime"]
+    end_basetime = config["end_basetime"]
+    time_format = config["time_format"]
+    poll_interval = config.get("stream_poll_interval", 10)
+    max_idle = config.get("stream_max_idle", None)
+    # Minimum age [second] of a file before it is processed, to skip files that are being written
+    min_file_age = config.get("stream_min_file_age", 5)
+
+    tracker = StreamingTracker(config)
+
+    idle_time = 0.
+    while True:
+        # Find new input files
+        rawdatafiles, files_basetime = subset_files_timerange(
+            clouddata_path,
+            databasename,
+            start_basetime,
+            end_basetime,
+            time_format=time_format,
+        )[0:2]
+        now = time.time()
+        nnew = 0
+        for rawdatafile, file_basetime in zip(rawdatafiles, files_basetime):
+            if (tracker.last_input_basetime is not None) and (file_basetime <= tracker.last_input_basetime):
+                continue
+            if (now - os.path.getmtime(rawdatafile)) < min_file_age:
+                # Process this file and later files at the next check
+                break
+            t0 = time.perf_counter()
+            tracker.add_file(rawdatafile, file_basetime)
+            logger.info(f"Processed {os.path.basename(rawdatafile)} in {time.perf_counter() - t0:.1f}s")
+            nnew += 1
+
+        # Stop if the end of the period is reached
+        if (tracker.last_input_basetime is not None) and (tracker.last_input_basetime >= end_basetime):
+            logger.info('Reached enddate')
+            break
+        if nnew > 0:
+            idle_time = 0.
+        elif (max_idle is not None) and (idle_time >= max_idle):
+            logger.info(f'No new file in {idle_time:.0f}s, stop streaming')
+            break
+        time.sleep(poll_interval)
+        idle_time += poll_interval
+
+    logger.info('Done with streaming feature tracking')
+    return
+
+
+class StreamingTracker:
+    """
+    Track state of the most recent file, advanced one file at a time.
+    """
+
+    def __init__(self, config):
+        """
+        Initialize the tracker, resuming from a saved track state if one exists.
+
+        Args:
+            config: dictionary
+                Dictionary containing config parameters.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config
+        self.id_feature = get_idfeature_function(config["feature_type"])
+        self.maxnclouds = config["maxnclouds"]
+        self.fillval = config["fillval"]
+        self.timegap = config["timegap"]
+        self.featuresize_varname = config.get("featuresize_varname", "npix_feature")
+        self.feature_varname = config.get("feature_varname", "feature_number")
+        self.pixel_area = config["pixel_radius"] ** 2
+        # Rolling window [hour] of track statistics
+        self.rolling_window = config.get("stream_rolling_window", 24) * 3600.
+        stats_outpath = config["stats_outpath"]
+        self.state_file = f"{stats_outpath}{config['tracking_state_filebase']}stream.nc"
+        self.rolling_stats_file = f"{stats_outpath}{config['trackstats_filebase']}stream.nc"
+        self.pixeltracking_outpath = config["pixeltracking_outpath"]
+        self.pixeltracking_filebase = config["pixeltracking_filebase"]
+        os.makedirs(self.pixeltracking_outpath, exist_ok=True)
+
+        # Track state of the most recent file
+        self.itrack = 1
+        self.last_input_basetime = None
+        self.cloudid_file = None
+        self.basetime = None
+        self.npix = None
+        self.tracknumber = None
+        self.trackreset = None
+        self.tracksplitnumber = None
+        self.newtrackstatus = None
+        # Rolling statistics of each track
+        self.tracks = {}
+
+        if os.path.isfile(self.state_file):
+            state = load_tracking_state(self.state_file, self.maxnclouds)
+            self.cloudid_file = f"{config['tracking_outpath']}{state['cloudid_file']}"
+            self.basetime = state["basetime"]
+            self.last_input_basetime = state["basetime"]
+            self.npix = self.read_npix(self.cloudid_file)
+            self.tracknumber = state["track_numbers"]
+            self.trackreset = state["track_reset"]
+            self.tracksplitnumber = state["track_splitnumbers"]
+            self.newtrackstatus = state["newtrack_status"]
+            self.itrack = state["next_tracknumber"]
+            if os.path.isfile(self.rolling_stats_file):
+                self.read_rolling_stats()
+            self.logger.info(f"Resuming from track state: {self.state_file}")
+
+    def add_file(self, rawdatafile, file_basetime):
+        """
+        Identify features in a new input file and advance the tracks.
+
+        Args:
+            rawdatafile: string
+                Input data file name.
+            file_basetime: int
+                Input data file base time.
+
+        Returns:
+            tracksmap_outfile: string
+                Pixel-level track number file name, None if no features are identified.
+        """
+        self.last_input_basetime = file_basetime
+        config = self.config
+        fillval = self.fillval
+
+        # Identify features
+        cloudid_file = self.id_feature(rawdatafile, config)
+        if cloudid_file is None:
+            return None
+        basetime = get_cloudid_basetime(cloudid_file, config["cloudid_filebase"])
+        npix = self.read_npix(cloudid_file)
+        nclouds = len(npix)
+        if (nclouds + 1) > self.maxnclouds:
+            self.logger.critical(f"Error: Number of clouds in file exceed allowed maximum number of clouds")
+            self.logger.critical(f"nclouds: {nclouds}, nmaxclouds: {self.maxnclouds}")
+            self.logger.critical("Increase maxnclouds in the config file.")
+            sys.exit("Code exits in streaming_driver.py")
+
+        # Track arrays of the new file
+        tracknumber = np.full(self.maxnclouds, fillval, dtype=np.int32)
+        trackreset = np.full(self.maxnclouds, fillval, dtype=np.int16)
+        tracksplitnumber = np.full(self.maxnclouds, fillval, dtype=np.int32)
+        newtrackstatus = np.full(self.maxnclouds, np.nan, dtype=np.float32)
+        # Track arrays of the previous file that are completed by linking to the new file
+        referencetrackstatus = np.full(self.maxnclouds, np.nan, dtype=np.float32)
+        trackmergenumber = np.full(self.maxnclouds, fillval, dtype=np.int32)
+
+        # Link to the previous file if within the time gap
+        track_file = None
+        if self.cloudid_file is not None:
+            hour_diff = (basetime - self.basetime) / 3600.
+            if 0 < hour_diff < self.timegap:
+                track_file = trackclouds((self.cloudid_file, cloudid_file), (self.basetime, basetime), config)
+                if not os.path.isfile(track_file):
+                    track_file = None
+
+        if track_file is not None:
+            singletracking_data = Dataset(track_file, "r")
+            nclouds_reference = int(np.nanmax(singletracking_data["nclouds_ref"][:]) + 1)
+            nclouds_new = int(np.nanmax(singletracking_data["nclouds_new"][:]) + 1)
+            refcloud_forward_index = singletracking_data["refcloud_forward_index"][:].astype(int)
+            newcloud_backward_index = singletracking_data["newcloud_backward_index"][:].astype(int)
+            singletracking_data.close()
+            self.itrack = link_pair_tracks(
+                refcloud_forward_index,
+                newcloud_backward_index,
+                self.npix,
+                npix,
+                nclouds_reference,
+                nclouds_new,
+                self.tracknumber,
+                tracknumber,
+                referencetrackstatus,
+                newtrackstatus,
+                trackmergenumber,
+                tracksplitnumber,
+                trackreset,
+                self.itrack,
+            )
+            # Track status of the previous file is now complete
+            prev_status = np.nansum(np.stack([referencetrackstatus, self.newtrackstatus]), axis=0)
+            self.update_previous(prev_status, trackmergenumber)
+        else:
+            # Start new tracks for all features (first file or after a data gap)
+            if self.cloudid_file is not None:
+                self.logger.info(f"Time gap to the previous file exceeds timegap, starting new tracks")
+                self.update_previous(np.nansum(np.stack([self.newtrackstatus]), axis=0), trackmergenumber)
+            # Single track files count one more cloud than nfeatures, use the same number here
+            # so that track numbers are consistent with gettracks
+            tracknumber[0:nclouds + 1] = np.arange(self.itrack, self.itrack + nclouds + 1)
+            self.itrack = self.itrack + nclouds + 1
+            trackreset[:] = 1
+
+        # Keep the state of the new file
+        self.cloudid_file = cloudid_file
+        self.basetime = basetime
+        self.npix = npix
+        self.tracknumber = tracknumber
+        self.trackreset = trackreset
+        self.tracksplitnumber = tracksplitnumber
+        self.newtrackstatus = newtrackstatus
+        write_tracking_state(
+            self.state_file,
+            tracknumber,
+            trackreset,
+            tracksplitnumber,
+            newtrackstatus,
+            self.itrack,
+            np.datetime64(int(basetime), "s"),
+            os.path.basename(cloudid_file),
+            config,
+        )
+
+        # Map track numbers to pixels and update rolling statistics
+        tracksmap_outfile = self.map_tracks(nclouds)
+        self.update_rolling_stats(nclouds)
+        self.write_rolling_stats()
+        return tracksmap_outfile
+
+    def read_npix(self, cloudid_file):
+        """
+        Read the number of pixels of each feature in a cloudid file.
+
+        Args:
+            cloudid_file: string
+                Cloudid file name.
+
+        Returns:
+            npix: np.array
+                Number of pixels of each feature.
+        """
+        cloudid_data = Dataset(cloudid_file, "r")
+        npix = cloudid_data[self.featuresize_varname][:]
+        cloudid_data.close()
+        return npix
+
+    def map_tracks(self, nclouds):
+        """
+        Write the pixel-level track number file of the most recent file.
+
+        The track status is from linking to the previous file only.
+
+        Args:
+            nclouds: int
+                Number of features in the most recent file.
+
+        Returns:
+            tracksmap_outfile: string
+                Pixel-level track number file name.
+        """
+        fillval = self.fillval
+        cloudidx = np.where(self.tracknumber[0:nclouds] > 0)[0]
+        file_trackindex = self.tracknumber[cloudidx] - 1
+        file_cloudnumber = cloudidx + 1
+        file_trackstatus = np.nan_to_num(self.newtrackstatus[cloudidx], nan=0).astype(np.int32)
+        file_splittracknumber = self.tracksplitnumber[cloudidx]
+        # Merges are only known after linking to the next file
+        file_mergetracknumber = np.full(len(cloudidx), fillval, dtype=np.int32)
+        file_mergecloudnumber = np.full((len(cloudidx), 1), fillval, dtype=np.int32)
+        file_splitcloudnumber = np.full((len(cloudidx), 1), fillval, dtype=np.int32)
+        tracksmap_outfile = map_feature(
+            self.cloudid_file,
+            self.basetime,
+            file_trackindex,
+            file_cloudnumber,
+            file_trackstatus,
+            file_mergetracknumber,
+            file_splittracknumber,
+            file_mergecloudnumber,
+            file_splitcloudnumber,
+            stream_status_explanation,
+            self.config,
+            self.pixeltracking_outpath,
+            self.pixeltracking_filebase,
+        )
+        return tracksmap_outfile
+
+    def update_previous(self, prev_status, trackmergenumber):
+        """
+        Update the rolling statistics with the completed track status of the previous file.
+
+        Args:
+            prev_status: np.array
+                Track status of each feature in the previous file.
+            trackmergenumber: np.array
+                Track number that each feature in the previous file merges into.
+
+        Returns:
+            None.
+        """
+        cloudidx = np.where(self.tracknumber > 0)[0]
+        for icloud in cloudidx:
+            itrack = int(self.tracknumber[icloud])
+            if itrack not in self.tracks:
+                continue
+            self.tracks[itrack]["track_status"] = int(prev_status[icloud])
+            if trackmergenumber[icloud] > 0:
+                self.tracks[itrack]["end_merge_tracknumber"] = int(trackmergenumber[icloud])
+
+    def update_rolling_stats(self, nclouds):
+        """
+        Add the features in the most recent file to the rolling statistics of each track,
+        and drop tracks that ended before the rolling window.
+
+        Args:
+            nclouds: int
+                Number of features in the most recent file.
+
+        Returns:
+            None.
+        """
+        fillval = self.fillval
+        ds = xr.open_dataset(self.cloudid_file, mask_and_scale=False, decode_times=False)
+        feature_number = ds[self.feature_varname].data.squeeze()
+        lat = ds["latitude"].data.squeeze()
+        lon = ds["longitude"].data.squeeze()
+        ds.close()
+        if lat.ndim == 1:
+            lon, lat = np.meshgrid(lon, lat)
+        index = np.arange(1, nclouds + 1)
+        meanlat = ndimage.mean(lat, labels=feature_number, index=index) if nclouds > 0 else []
+        meanlon = ndimage.mean(lon, labels=feature_number, index=index) if nclouds > 0 else []
+
+        for icloud in range(0, nclouds):
+            itrack = int(self.tracknumber[icloud])
+            if itrack <= 0:
+                continue
+            area = float(self.npix[icloud]) * self.pixel_area
+            if itrack not in self.tracks:
+                self.tracks[itrack] = {
+                    "start_basetime": self.basetime,
+                    "duration": 0,
+                    "max_area": area,
+                    "start_split_tracknumber": int(self.tracksplitnumber[icloud]),
+                    "end_merge_tracknumber": fillval,
+                    "track_status": fillval,
+                }
+            track = self.tracks[itrack]
+            track["end_basetime"] = self.basetime
+            track["duration"] += 1
+            track["cloudnumber"] = icloud + 1
+            track["area"] = area
+            track["max_area"] = max(track["max_area"], area)
+            track["meanlat"] = float(meanlat[icloud])
+            track["meanlon"] = float(meanlon[icloud])
+
+        # Drop tracks that ended before the rolling window
+        for itrack in list(self.tracks.keys()):
+            if self.tracks[itrack]["end_basetime"] < (self.basetime - self.rolling_window):
+                del self.tracks[itrack]
+
+    def read_rolling_stats(self):
+        """
+        Read the rolling statistics of tracks from netCDF file, to resume streaming.
+
+        Returns:
+            None.
+        """
+        ds = xr.open_dataset(self.rolling_stats_file, mask_and_scale=False, decode_times=False)
+        varnames = {
+            "start_basetime": "start_basetime",
+            "end_basetime": "end_basetime",
+            "duration": "track_duration",
+            "cloudnumber": "cloudnumber",
+            "area": "area",
+            "max_area": "max_area",
+            "meanlat": "meanlat",
+            "meanlon": "meanlon",
+            "track_status": "track_status",
+            "start_split_tracknumber": "start_split_tracknumber",
+            "end_merge_tracknumber": "end_merge_tracknumber",
+        }
+        values = {key: ds[varname].values.tolist() for key, varname in varnames.items()}
+        for ii, itrack in enumerate(ds["tracknumber"].values.tolist()):
+            self.tracks[itrack] = {key: values[key][ii] for key in varnames}
+        ds.close()
+        return
+
+    def write_rolling_stats(self):
+        """
+        Write the rolling statistics of tracks within the rolling window to netCDF file.
+
+        Returns:
+            None.
+        """
+        fillval = self.fillval
+        tracknumbers = np.array(sorted(self.tracks.keys()), dtype=np.int32)
+        ntracks = len(tracknumbers)
+
+        def get_values(key, dtype):
+            return np.array([self.tracks[itrack][key] for itrack in tracknumbers], dtype=dtype)
+
+        # Tracks with a feature in the most recent file
+        active = get_values("end_basetime", np.int64) == self.basetime if ntracks > 0 else np.zeros(0, dtype=bool)
+        varlist = {
+            "tracknumber": (["tracks"], tracknumbers, {"long_name": "Track number"}),
+            "start_basetime": (["tracks"], get_values("start_basetime", np.int64),
+                               {"long_name": "Start time of the track", "units": "seconds since 1970-01-01"}),
+            "end_basetime": (["tracks"], get_values("end_basetime", np.int64),
+                             {"long_name": "Latest time of the track", "units": "seconds since 1970-01-01"}),
+            "track_duration": (["tracks"], get_values("duration", np.int32),
+                               {"long_name": "Number of files in the track so far", "units": "unitless"}),
+            "active": (["tracks"], active.astype(np.int8),
+                       {"long_name": "Track has a feature in the most recent file", "units": "unitless"}),
+            "cloudnumber": (["tracks"], get_values("cloudnumber", np.int32),
+                            {"long_name": "Feature number in the latest file of the track", "units": "unitless"}),
+            "area": (["tracks"], get_values("area", np.float32),
+                     {"long_name": "Area of the feature in the latest file of the track", "units": "km^2"}),
+            "max_area": (["tracks"], get_values("max_area", np.float32),
+                         {"long_name": "Maximum area of the track so far", "units": "km^2"}),
+            "meanlat": (["tracks"], get_values("meanlat", np.float32),
+                        {"long_name": "Mean latitude of the feature in the latest file of the track",
+                         "units": "degrees_north"}),
+            "meanlon": (["tracks"], get_values("meanlon", np.float32),
+                        {"long_name": "Mean longitude of the feature in the latest file of the track",
+                         "units": "degrees_east"}),
+            "track_status": (["tracks"], get_values("track_status", np.int32),
+                             {"long_name": "Link status of the track in its latest completed file",
+                              "units": "unitless", "_FillValue": fillval}),
+            "start_split_tracknumber": (["tracks"], get_values("start_split_tracknumber", np.int32),
+                                        {"long_name": "Track number that this track splits from",
+                                         "units": "unitless", "_FillValue": fillval}),
+            "end_merge_tracknumber": (["tracks"], get_values("end_merge_tracknumber", np.int32),
+                                      {"long_name": "Track number that this track merges into",
+                                       "units": "unitless", "_FillValue": fillval}),
+        }
+        gattrlist = {
+            "Title": "Rolling statistics of tracks in near-real-time tracking",
+            "Created_on": time.ctime(time.time()),
+            "latest_basetime": int(self.basetime),
+            "rolling_window_hour": self.rolling_window / 3600.,
+        }
+        dsout = xr.Dataset(varlist, coords={"tracks": (["tracks"], np.arange(0, ntracks))}, attrs=gattrlist)
+        # Write to a temporary file and rename, so readers never see a partial file
+        tmp_file = f"{self.rolling_stats_file}.tmp"
+        dsout.to_netcdf(path=tmp_file, mode="w", format="NETCDF4")
+        os.replace(tmp_file, self.rolling_stats_file)
+        return
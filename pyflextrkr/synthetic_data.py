@@ -0,0 +1,473 @@
+"""
+Generate synthetic input data for testing and benchmarking the tracking workflow.
+
+Features are idealized blobs that are born, move, grow, decay, merge and split.
+Three input data formats are supported (feature_type in the config file):
+    - 'tb_pf': 2D brightness temperature + precipitation (read by idclouds_tbpf)
+    - 'radar_cells': 3D gridded radar reflectivity in PyART format (read by idcells_reflectivity)
+    - 'generic': 2D generic field (read by idfeature_generic)
+
+Usage:
+    python synthetic_data.py -t tb_pf -o /path/to/input/ --ny 200 --nx 300 --ntimes 24
+"""
+import os
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+# Default parameters for each data type, sizes are in number of grid points
+synthetic_defaults = {
+    "tb_pf": {
+        "ny": 200,
+        "nx": 300,
+        "dx": 10000.,  # [m]
+        "time_resolution": 60,  # [minute]
+        "radius_range": [12, 30],
+        "lifetime_range": [4, 24],
+        "speed_range": [0.5, 3.0],
+        "databasename": "synthetic_tbpf_",
+    },
+    "radar_cells": {
+        "ny": 200,
+        "nx": 200,
+        "nz": 24,
+        "dx": 500.,  # [m]
+        "dz": 500.,  # [m]
+        "time_resolution": 5,  # [minute]
+        "radius_range": [5, 12],
+        "lifetime_range": [4, 18],
+        "speed_range": [0.5, 2.0],
+        "databasename": "synthetic_radar_",
+    },
+    "generic": {
+        "ny": 120,
+        "nx": 240,
+        "dx": 1.,  # [degree]
+        "time_resolution": 1440,  # [minute]
+        "radius_range": [8, 16],
+        "lifetime_range": [4, 16],
+        "speed_range": [0.3, 1.5],
+        "databasename": "synthetic_generic_",
+    },
+}
+
+def make_synthetic_tracks(
+        ntimes,
+        ny,
+        nx,
+        density=1.0,
+        radius_range=(10, 20),
+        lifetime_range=(4, 12),
+        speed_range=(0.5, 2.0),
+        merge_fraction=0.2,
+        split_fraction=0.2,
+        seed=0,
+):
+    """
+    Make synthetic feature tracks that move, merge and split.
+
+    Each track has a position and a peak radius at each of its times. A merging track
+    starts away from its parent track, converges onto it and ends when the centers meet.
+    A splitting track starts at the center of its parent track and moves away.
+
+    Args:
+        ntimes: int
+            Number of times (frames).
+        ny: int
+            Number of grid points in y.
+        nx: int
+            Number of grid points in x.
+        density: float, default=1.0
+            Number of parent tracks per 100 x 100 grid points per 10 frames.
+        radius_range: tuple, default=(10, 20)
+            Min/max feature radius [grid points].
+        lifetime_range: tuple, default=(4, 12)
+            Min/max parent track lifetime [frames].
+        speed_range: tuple, default=(0.5, 2.0)
+            Min/max feature speed [grid points per frame].
+        merge_fraction: float, default=0.2
+            Fraction of parent tracks that have a merging track.
+        split_fraction: float, default=0.2
+            Fraction of parent tracks that have a splitting track.
+        seed: int, default=0
+            Random number generator seed.
+
+    Returns:
+        tracks: list
+            List of dictionaries, each containing the track start/end time index ('t0', 't1'),
+            center position ('y', 'x') and radius ('radius') at each time,
+            and peak amplitude ('amplitude') of a track.
+    """
+    rng = np.random.default_rng(seed)
+    ntracks = max(int(round(density * (ny * nx / 1e4) * (ntimes / 10.))), 1)
+
+    tracks = []
+    for itrack in range(0, ntracks):
+        lifetime = int(rng.integers(lifetime_range[0], lifetime_range[1] + 1))
+        # Allow tracks to start before and continue after the period
+        t0 = int(rng.integers(-lifetime // 2, ntimes))
+        t1 = t0 + lifetime - 1
+        times = np.arange(t0, t1 + 1)
+        speed = rng.uniform(speed_range[0], speed_range[1])
+        direction = rng.uniform(0, 2 * np.pi)
+        y0 = rng.uniform(0, ny)
+        x0 = rng.uniform(0, nx)
+        y = y0 + speed * np.sin(direction) * (times - t0)
+        x = x0 + speed * np.cos(direction) * (times - t0)
+        # Grow and decay over the lifetime
+        peak_radius = rng.uniform(radius_range[0], radius_range[1])
+        age = (times - t0 + 0.5) / lifetime
+        radius = peak_radius * (0.5 + 0.5 * np.sin(np.pi * age))
+        amplitude = rng.uniform(0.8, 1.0)
+        tracks.append({"t0": t0, "t1": t1, "y": y, "x": x, "radius": radius, "amplitude": amplitude})
+
+        if lifetime < 4:
+            continue
+        # Merging track: converges onto the parent before the parent ends
+        if rng.uniform() < merge_fraction:
+            tm = int(rng.integers(t0 + 2, t1))
+            nlife = int(rng.integers(3, lifetime_range[1] + 1))
+            tm0 = tm - nlife + 1
+            mtimes = np.arange(tm0, tm + 1)
+            offset = 2.5 * peak_radius
+            angle = rng.uniform(0, 2 * np.pi)
+            # Parent position, extrapolated before the parent starts
+            py = y0 + speed * np.sin(direction) * (mtimes - t0)
+            px = x0 + speed * np.cos(direction) * (mtimes - t0)
+            weight = (tm - mtimes) / max(tm - tm0, 1)
+            mradius = 0.7 * peak_radius * np.ones(len(mtimes))
+            tracks.append({
+                "t0": tm0, "t1": tm,
+                "y": py + offset * np.sin(angle) * weight,
+                "x": px + offset * np.cos(angle) * weight,
+                "radius": mradius, "amplitude": amplitude,
+            })
+        # Splitting track: moves away from the parent after it splits
+        if rng.uniform() < split_fraction:
+            ts = int(rng.integers(t0 + 1, t1))
+            nlife = int(rng.integers(3, lifetime_range[1] + 1))
+            stimes = np.arange(ts, ts + nlife)
+            sspeed = rng.uniform(speed_range[0], speed_range[1]) + 0.5 * peak_radius / nlife
+            angle = rng.uniform(0, 2 * np.pi)
+            py = y0 + speed * np.sin(direction) * (stimes - t0)
+            px = x0 + speed * np.cos(direction) * (stimes - t0)
+            sage = (stimes - ts + 0.5) / nlife
+            sradius = 0.7 * peak_radius * (0.6 + 0.4 * np.sin(np.pi * sage))
+            tracks.append({
+                "t0": ts, "t1": ts + nlife - 1,
+                "y": py + sspeed * np.sin(angle) * (stimes - ts),
+                "x": px + sspeed * np.cos(angle) * (stimes - ts),
+                "radius": sradius, "amplitude": amplitude,
+            })
+    return tracks
+
+def get_feature_intensity(tracks, itime, ny, nx):
+    """
+    Get normalized feature intensity on the grid at a time.
+
+    The intensity of each feature is a Gaussian with its radius as the e-folding distance.
+    Overlapping features take the maximum intensity.
+
+    Args:
+        tracks: list
+            List of track dictionaries from make_synthetic_tracks.
+        itime: int
+            Time index.
+        ny: int
+            Number of grid points in y.
+        nx: int
+            Number of grid points in x.
+
+    Returns:
+        intensity: np.ndarray(float32)
+            Feature intensity [0-1], dimensions: [ny, nx].
+    """
+    intensity = np.zeros((ny, nx), dtype=np.float32)
+    for track in tracks:
+        if (itime < track["t0"]) or (itime > track["t1"]):
+            continue
+        ii = itime - track["t0"]
+        yc, xc, radius = track["y"][ii], track["x"][ii], track["radius"][ii]
+        # Only compute within 3 radii of the center
+        ymin, ymax = max(int(yc - 3 * radius), 0), min(int(yc + 3 * radius) + 1, ny)
+        xmin, xmax = max(int(xc - 3 * radius), 0), min(int(xc + 3 * radius) + 1, nx)
+        if (ymin >= ymax) or (xmin >= xmax):
+            continue
+        yy = np.arange(ymin, ymax, dtype=np.float32)[:, None] - yc
+        xx = np.arange(xmin, xmax, dtype=np.float32)[None, :] - xc
+        blob = track["amplitude"] * np.exp(-(yy ** 2 + xx ** 2) / radius ** 2)
+        intensity[ymin:ymax, xmin:xmax] = np.maximum(intensity[ymin:ymax, xmin:xmax], blob)
+    return intensity
+
+def write_tbpf_file(filename, intensity, file_time, lat, lon, rng):
+    """
+    Write a synthetic Tb + precipitation file.
+
+    Args:
+        filename: string
+            Output file name.
+        intensity: np.ndarray
+            Feature intensity [0-1], dimensions: [ny, nx].
+        file_time: Pandas Timestamp
+            Time of the data.
+        lat: np.ndarray
+            Latitude, dimensions: [ny, nx].
+        lon: np.ndarray
+            Longitude, dimensions: [ny, nx].
+        rng: np.random.Generator
+            Random number generator for the noise.
+
+    Returns:
+        None.
+    """
+    tb = 290. - 100. * intensity + rng.normal(0, 1, intensity.shape)
+    pcp = 40. * intensity ** 4
+    dims = ["time", "yc", "xc"]
+    ds = xr.Dataset(
+        {
+            "Tb": (dims, tb[None, :, :].astype(np.float32), {"long_name": "Brightness temperature", "units": "K"}),
+            "PR": (dims, pcp[None, :, :].astype(np.float32), {"long_name": "Precipitation rate", "units": "mm/hr"}),
+        },
+        coords={
+            "time": (["time"], [file_time]),
+            "lat": (["yc", "xc"], lat, {"long_name": "Latitude", "units": "degrees_north"}),
+            "lon": (["yc", "xc"], lon, {"long_name": "Longitude", "units": "degrees_east"}),
+        },
+        attrs={"title": "Synthetic Tb + precipitation data"},
+    )
+    ds.to_netcdf(filename)
+
+def write_radar_file(filename, intensity, file_time, x, y, z, lat, lon, radar_lat, radar_lon):
+    """
+    Write a synthetic 3D radar reflectivity file in PyART grid format.
+
+    Args:
+        filename: string
+            Output file name.
+        intensity: np.ndarray
+            Feature intensity [0-1], dimensions: [ny, nx].
+        file_time: Pandas Timestamp
+            Time of the data.
+        x: np.ndarray
+            X distance from the radar [m], dimensions: [nx].
+        y: np.ndarray
+            Y distance from the radar [m], dimensions: [ny].
+        z: np.ndarray
+            Height above radar [m], dimensions: [nz].
+        lat: np.ndarray
+            Latitude, dimensions: [ny, nx].
+        lon: np.ndarray
+            Longitude, dimensions: [ny, nx].
+        radar_lat: float
+            Radar latitude.
+        radar_lon: float
+            Radar longitude.
+
+    Returns:
+        None.
+    """
+    nz = len(z)
+    # Reflectivity decreases with height up to the echo-top height
+    dbz_sfc = 10. + 50. * intensity
+    echotop = 2000. + 10000. * intensity
+    zfrac = z[:, None, None] / echotop[None, :, :]
+    dbz3d = dbz_sfc[None, :, :] * (1. - zfrac ** 2)
+    dbz3d[(zfrac > 1) | (dbz3d < 5.) | (intensity[None, :, :] < 0.05)] = np.nan
+    dims3d = ["time", "z", "y", "x"]
+    ds = xr.Dataset(
+        {
+            "reflectivity": (dims3d, dbz3d[None, :, :, :].astype(np.float32), {"long_name": "Reflectivity", "units": "dBZ"}),
+            "point_latitude": (["z", "y", "x"], np.broadcast_to(lat, (nz,) + lat.shape).astype(np.float32)),
+            "point_longitude": (["z", "y", "x"], np.broadcast_to(lon, (nz,) + lon.shape).astype(np.float32)),
+            "origin_latitude": radar_lat,
+            "origin_longitude": radar_lon,
+            "alt": 0.,
+        },
+        coords={
+            "time": (["time"], [file_time]),
+            "z": (["z"], z.astype(np.float32), {"long_name": "Height above radar", "units": "m"}),
+            "y": (["y"], y.astype(np.float32), {"long_name": "Y distance from radar", "units": "m"}),
+            "x": (["x"], x.astype(np.float32), {"long_name": "X distance from radar", "units": "m"}),
+        },
+        attrs={"title": "Synthetic radar reflectivity data"},
+    )
+    ds.to_netcdf(filename)
+
+def write_generic_file(filename, intensity, file_time, lat, lon, field_varname):
+    """
+    Write a synthetic generic field file.
+
+    Args:
+        filename: string
+            Output file name.
+        intensity: np.ndarray
+            Feature intensity [0-1], dimensions: [ny, nx].
+        file_time: Pandas Timestamp
+            Time of the data.
+        lat: np.ndarray
+            Latitude, dimensions: [ny].
+        lon: np.ndarray
+            Longitude, dimensions: [nx].
+        field_varname: string
+            Field variable name.
+
+    Returns:
+        None.
+    """
+    field = 3. * intensity
+    ds = xr.Dataset(
+        {field_varname: (["time", "lat", "lon"], field[None, :, :].astype(np.float32))},
+        coords={
+            "time": (["time"], [file_time]),
+            "lat": (["lat"], lat, {"long_name": "Latitude", "units": "degrees_north"}),
+            "lon": (["lon"], lon, {"long_name": "Longitude", "units": "degrees_east"}),
+        },
+        attrs={"title": "Synthetic generic field data"},
+    )
+    ds.to_netcdf(filename)
+
+def generate_synthetic_data(
+        output_path,
+        data_type,
+        ntimes=24,
+        ny=None,
+        nx=None,
+        nz=None,
+        density=1.0,
+        merge_fraction=0.2,
+        split_fraction=0.2,
+        start_time="2020-01-01T00:00:00",
+        field_varname="z500_anom_sm",
+        seed=0,
+):
+    """
+    Generate synthetic input data files.
+
+    Args:
+        output_path: string
+            Output directory.
+        data_type: string
+            Data type: 'tb_pf', 'radar_cells', 'generic'.
+        ntimes: int, default=24
+            Number of times (files).
+        ny: int, default=None
+            Number of grid points in y, default from synthetic_defaults.
+        nx: int, default=None
+            Number of grid points in x, default from synthetic_defaults.
+        nz: int, default=None
+            Number of vertical levels ('radar_cells' only), default from synthetic_defaults.
+        density: float, default=1.0
+            Number of parent tracks per 100 x 100 grid points per 10 frames.
+        merge_fraction: float, default=0.2
+            Fraction of parent tracks that have a merging track.
+        split_fraction: float, default=0.2
+            Fraction of parent tracks that have a splitting track.
+        start_time: string, default="2020-01-01T00:00:00"
+            Time of the first file.
+        field_varname: string, default="z500_anom_sm"
+            Field variable name ('generic' only).
+        seed: int, default=0
+            Random number generator seed.
+
+    Returns:
+        out_files: list
+            List of output file names.
+    """
+    logger = logging.getLogger(__name__)
+    if data_type not in synthetic_defaults:
+        logger.critical(f"Unknown synthetic data type: {data_type}")
+        raise ValueError(f"data_type must be one of {list(synthetic_defaults.keys())}")
+
+    params = synthetic_defaults[data_type]
+    ny = params["ny"] if ny is None else ny
+    nx = params["nx"] if nx is None else nx
+    dx = params["dx"]
+    databasename = params["databasename"]
+    os.makedirs(output_path, exist_ok=True)
+
+    tracks = make_synthetic_tracks(
+        ntimes, ny, nx,
+        density=density,
+        radius_range=params["radius_range"],
+        lifetime_range=params["lifetime_range"],
+        speed_range=params["speed_range"],
+        merge_fraction=merge_fraction,
+        split_fraction=split_fraction,
+        seed=seed,
+    )
+    logger.info(f"Number of synthetic tracks: {len(tracks)}, grid size: {ny} x {nx}, times: {ntimes}")
+    # Separate random number generator for the noise
+    rng = np.random.default_rng(seed + 1)
+    times = pd.date_range(start_time, periods=ntimes, freq=f"{params['time_resolution']}min")
+
+    # Make the grid
+    if data_type == "tb_pf":
+        # Keep latitude within +/-50 degrees for large grids
+        dlat = min(dx / 111200., 100. / ny)
+        lat1d = (np.arange(ny) - ny / 2) * dlat
+        lon1d = np.arange(nx) * dlat
+        lon, lat = np.meshgrid(lon1d.astype(np.float32), lat1d.astype(np.float32))
+    elif data_type == "radar_cells":
+        nz = params["nz"] if nz is None else nz
+        radar_lat, radar_lon = 29.4719, -95.0787
+        x = (np.arange(nx) - nx // 2) * dx
+        y = (np.arange(ny) - ny // 2) * dx
+        z = np.arange(nz) * params["dz"]
+        lat = radar_lat + y[:, None] / 111200. + np.zeros((1, nx))
+        lon = radar_lon + x[None, :] / (111200. * np.cos(np.deg2rad(radar_lat))) + np.zeros((ny, 1))
+    elif data_type == "generic":
+        dlat = min(dx, 120. / ny)
+        lat = (-60. + np.arange(ny) * dlat).astype(np.float32)
+        lon = (np.arange(nx) * min(dx, 360. / nx)).astype(np.float32)
+
+    out_files = []
+    for itime, file_time in enumerate(times):
+        intensity = get_feature_intensity(tracks, itime, ny, nx)
+        filename = f"{output_path}/{databasename}{file_time.strftime('%Y%m%d.%H%M%S')}.nc"
+        if data_type == "tb_pf":
+            write_tbpf_file(filename, intensity, file_time, lat, lon, rng)
+        elif data_type == "radar_cells":
+            write_radar_file(filename, intensity, file_time, x, y, z, lat, lon, radar_lat, radar_lon)
+        elif data_type == "generic":
+            write_generic_file(filename, intensity, file_time, lat, lon, field_varname)
+        out_files.append(filename)
+    logger.info(f"Synthetic data written to: {output_path}")
+    return out_files
+
+def mainfunc():
+
+    parser = argparse.ArgumentParser(description="Generate synthetic input data for PyFLEXTRKR.")
+    parser.add_argument("-t", "--data_type", required=True, choices=list(synthetic_defaults.keys()),
+                        help="Synthetic data type")
+    parser.add_argument("-o", "--output_path", required=True, help="Output directory")
+    parser.add_argument("--ntimes", type=int, default=24, help="Number of times (files)")
+    parser.add_argument("--ny", type=int, default=None, help="Number of grid points in y")
+    parser.add_argument("--nx", type=int, default=None, help="Number of grid points in x")
+    parser.add_argument("--nz", type=int, default=None, help="Number of vertical levels (radar_cells)")
+    parser.add_argument("--density", type=float, default=1.0,
+                        help="Number of tracks per 100 x 100 grid points per 10 frames")
+    parser.add_argument("--merge_fraction", type=float, default=0.2, help="Fraction of tracks with a merger")
+    parser.add_argument("--split_fraction", type=float, default=0.2, help="Fraction of tracks with a split")
+    parser.add_argument("--start_time", default="2020-01-01T00:00:00", help="Time of the first file")
+    parser.add_argument("--seed", type=int, default=0, help="Random number generator seed")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    generate_synthetic_data(
+        args.output_path,
+        args.data_type,
+        ntimes=args.ntimes,
+        ny=args.ny,
+        nx=args.nx,
+        nz=args.nz,
+        density=args.density,
+        merge_fraction=args.merge_fraction,
+        split_fraction=args.split_fraction,
+        start_time=args.start_time,
+        seed=args.seed,
+    )
+
+if __name__ == '__main__':
+    mainfunc()
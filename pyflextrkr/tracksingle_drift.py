@@ -6,6 +6,7 @@ import pandas as pd
 import time
 import scipy.ndimage as ndi
 import logging
+from pyflextrkr.ft_tiling import count_overlaps_tiled
 
 def trackclouds(
     cloudid_filepairs,
@@ -47,6 +48,7 @@ def trackclouds(
     nmaxlinks = config["nmaxlinks"]
     othresh = config["othresh"]
     fillval = config["fillval"]
+    tile_size = config.get("tile_size", None)
     if drift_data is not None:
         datetime_drift, xdrift, ydrift = drift_data[0], drift_data[1], drift_data[2]
 
@@ -87,11 +89,16 @@ def trackclouds(
         # Load cloudid file from before, called reference file
         logger.debug(reference_filedatetime)
 
+        # Overlaps are counted tile by tile without loading the full arrays
+        # if tile_size is set (not available with drift)
+        use_tiles = (tile_size is not None) and (drift_data is None)
+
         # Open file
         reference_data = xr.open_dataset(
-            reference_file, mask_and_scale=False, decode_times=False, chunks=-1,
+            reference_file, mask_and_scale=False, decode_times=False,
         )
-        reference_convcold_cloudnumber = reference_data[feature_varname].load().data
+        if not use_tiles:
+            reference_convcold_cloudnumber = reference_data[feature_varname].load().data
         nreference = reference_data[nfeature_varname].load().data
         reference_data.close()
 
@@ -101,18 +108,20 @@ def trackclouds(
 
         # Open file
         new_data = xr.open_dataset(
-            new_file, mask_and_scale=False, decode_times=False, chunks=-1,
+            new_file, mask_and_scale=False, decode_times=False,
         )
-        new_convcold_cloudnumber = new_data[feature_varname].load().data
+        if not use_tiles:
+            new_convcold_cloudnumber = new_data[feature_varname].load().data
         nnew = new_data[nfeature_varname].load().data
         new_data.close()
 
-        # Convert float type to int, missing value to 0
-        # This should not be needed when setting mask_and_scale=False
-        reference_convcold_cloudnumber[np.isnan(reference_convcold_cloudnumber)] = 0
-        reference_convcold_cloudnumber = reference_convcold_cloudnumber.astype("int")
-        new_convcold_cloudnumber[np.isnan(new_convcold_cloudnumber)] = 0
-        new_convcold_cloudnumber = new_convcold_cloudnumber.astype("int")
+        if not use_tiles:
+            # Convert float type to int, missing value to 0
+            # This should not be needed when setting mask_and_scale=False
+            reference_convcold_cloudnumber[np.isnan(reference_convcold_cloudnumber)] = 0
+            reference_convcold_cloudnumber = reference_convcold_cloudnumber.astype(np.int32)
+            new_convcold_cloudnumber[np.isnan(new_convcold_cloudnumber)] = 0
+            new_convcold_cloudnumber = new_convcold_cloudnumber.astype(np.int32)
 
         if drift_data is not None:
             # Compare drift datetime with reference datetime
@@ -130,131 +139,147 @@ def trackclouds(
                 logger.info("datetime_drift: " + datetime_drift)
 
 
-        ############################################################
-        # Get size of data
-        times, ny, nx = np.shape(new_convcold_cloudnumber)
-
         # Add 1 to nclouds for both reference and new cloudid files to account for files that have 0 clouds
         nreference = nreference + 1
         nnew = nnew + 1
 
         #######################################################
         # Initialize matrices
-        reference_forward_index = (
-            np.ones((1, int(nreference), int(nmaxlinks)), dtype=int) * fillval
+        reference_forward_index = np.full(
+            (1, int(nreference), int(nmaxlinks)), fillval, dtype=np.int32
         )
-        reference_forward_size = (
-            np.ones((1, int(nreference), int(nmaxlinks)), dtype=int) * fillval
+        reference_forward_size = np.full(
+            (1, int(nreference), int(nmaxlinks)), fillval, dtype=np.int32
         )
-        new_backward_index = (
-            np.ones((1, int(nnew), int(nmaxlinks)), dtype=int) * fillval
+        new_backward_index = np.full(
+            (1, int(nnew), int(nmaxlinks)), fillval, dtype=np.int32
+        )
+        new_backward_size = np.full(
+            (1, int(nnew), int(nmaxlinks)), fillval, dtype=np.int32
         )
-        new_backward_size = np.ones((1, int(nnew), int(nmaxlinks)), dtype=int) * fillval
-
-        ######################################################
-        # Loop through each cloud / feature in reference time and look for overlaping clouds / features in the new file
-        for refindex in np.arange(1, nreference + 1):
-            # Locate where the cloud in the reference file overlaps with any cloud in the new file
-            forward_matchindices = np.where(
-                (reference_convcold_cloudnumber == refindex)
-                & (new_convcold_cloudnumber != 0)
-            )
-
-            # Get the convcold_cloudnumber of the clouds in the new file that overlap the cloud in the reference file
-            forward_newindex = new_convcold_cloudnumber[forward_matchindices]
-            unique_forwardnewindex = np.unique(forward_newindex)
 
-            # Calculate size of reference cloud in terms of number of pixels
-            sizeref = len(
-                np.extract(
-                    reference_convcold_cloudnumber == refindex,
-                    reference_convcold_cloudnumber,
-                )
+        if use_tiles:
+            pair_ref, pair_new, pair_npix, reference_npix, new_npix = count_overlaps_tiled(
+                reference_file, new_file, feature_varname, tile_size,
             )
-
-            # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
-            forward_nmatch = 0  # Initialize overlap counter
-            for matchindex in unique_forwardnewindex:
-                sizematch = len(
-                    np.extract(forward_newindex == matchindex, forward_newindex)
+            # Forward links: overlaps sorted by (reference, new)
+            link_overlap_pairs(
+                pair_ref, pair_new, pair_npix, reference_npix, new_npix, nreference,
+                reference_forward_index, reference_forward_size, othresh, nmaxlinks,
+                "More than " + str(int(nmaxlinks)) + " clouds in new file match with reference cloud?!",
+            )
+            # Backward links: overlaps sorted by (new, reference)
+            order = np.lexsort((pair_ref, pair_new))
+            link_overlap_pairs(
+                pair_new[order], pair_ref[order], pair_npix[order], new_npix, reference_npix, nnew,
+                new_backward_index, new_backward_size, othresh, nmaxlinks,
+                "More than " + str(int(nmaxlinks)) + " clouds in reference file match with new cloud?!",
+            )
+        else:
+            ######################################################
+            # Loop through each cloud / feature in reference time and look for overlaping clouds / features in the new file
+            for refindex in np.arange(1, nreference + 1):
+                # Locate where the cloud in the reference file overlaps with any cloud in the new file
+                forward_matchindices = np.where(
+                    (reference_convcold_cloudnumber == refindex)
+                    & (new_convcold_cloudnumber != 0)
                 )
 
-                if sizematch / float(sizeref) > othresh:
-                    if forward_nmatch > nmaxlinks:
-                        logger.debug(
-                            ("reference: " + reference_file)
-                        )
-                        logger.debug(("new: " + new_file))
-                        sys.exit(
-                            "More than "
-                            + str(int(nmaxlinks))
-                            + " clouds in new file match with reference cloud?!"
-                        )
-                    else:
-                        reference_forward_index[
-                            0, int(refindex) - 1, forward_nmatch
-                        ] = matchindex
-                        reference_forward_size[
-                            0, int(refindex) - 1, forward_nmatch
-                        ] = len(
-                            np.extract(
-                                new_convcold_cloudnumber == matchindex,
-                                new_convcold_cloudnumber,
-                            )
-                        )
+                # Get the convcold_cloudnumber of the clouds in the new file that overlap the cloud in the reference file
+                forward_newindex = new_convcold_cloudnumber[forward_matchindices]
+                unique_forwardnewindex = np.unique(forward_newindex)
 
-                        forward_nmatch = forward_nmatch + 1
+                # Calculate size of reference cloud in terms of number of pixels
+                sizeref = len(
+                    np.extract(
+                        reference_convcold_cloudnumber == refindex,
+                        reference_convcold_cloudnumber,
+                    )
+                )
 
-        ######################################################
-        # Loop through each cloud / feature at new time and look for overlaping clouds / features in the reference file
-        for newindex in np.arange(1, nnew + 1):
-            # Locate where the cloud in the new file overlaps with any cloud in the reference file
-            backward_matchindices = np.where(
-                (new_convcold_cloudnumber == newindex)
-                & (reference_convcold_cloudnumber != 0)
-            )
+                # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
+                forward_nmatch = 0  # Initialize overlap counter
+                for matchindex in unique_forwardnewindex:
+                    sizematch = len(
+                        np.extract(forward_newindex == matchindex, forward_newindex)
+                    )
+
+                    if sizematch / float(sizeref) > othresh:
+                        if forward_nmatch > nmaxlinks:
+                            logger.debug(
+                                ("reference: " + reference_file)
+                            )
+                            logger.debug(("new: " + new_file))
+                            sys.exit(
+                                "More than "
+                                + str(int(nmaxlinks))
+                                + " clouds in new file match with reference cloud?!"
+                            )
+                        else:
+                            reference_forward_index[
+                                0, int(refindex) - 1, forward_nmatch
+                            ] = matchindex
+                            reference_forward_size[
+                                0, int(refindex) - 1, forward_nmatch
+                            ] = len(
+                                np.extract(
+                                    new_convcold_cloudnumber == matchindex,
+                                    new_convcold_cloudnumber,
+                                )
+                            )
 
-            # Get the convcold_cloudnumber of the clouds in the reference file that overlap the cloud in the new file
-            backward_refindex = reference_convcold_cloudnumber[backward_matchindices]
-            unique_backwardrefindex = np.unique(backward_refindex)
+                            forward_nmatch = forward_nmatch + 1
 
-            # Calculate size of reference cloud in terms of number of pixels
-            sizenew = len(
-                np.extract(
-                    new_convcold_cloudnumber == newindex, new_convcold_cloudnumber
+            ######################################################
+            # Loop through each cloud / feature at new time and look for overlaping clouds / features in the reference file
+            for newindex in np.arange(1, nnew + 1):
+                # Locate where the cloud in the new file overlaps with any cloud in the reference file
+                backward_matchindices = np.where(
+                    (new_convcold_cloudnumber == newindex)
+                    & (reference_convcold_cloudnumber != 0)
                 )
-            )
 
-            # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
-            backward_nmatch = 0  # Initialize overlap counter
-            for matchindex in unique_backwardrefindex:
-                sizematch = len(
-                    np.extract(backward_refindex == matchindex, backward_refindex)
+                # Get the convcold_cloudnumber of the clouds in the reference file that overlap the cloud in the new file
+                backward_refindex = reference_convcold_cloudnumber[backward_matchindices]
+                unique_backwardrefindex = np.unique(backward_refindex)
+
+                # Calculate size of reference cloud in terms of number of pixels
+                sizenew = len(
+                    np.extract(
+                        new_convcold_cloudnumber == newindex, new_convcold_cloudnumber
+                    )
                 )
 
-                if sizematch / float(sizenew) > othresh:
-                    if backward_nmatch > nmaxlinks:
-                        logger.debug(
-                            ("reference: " + reference_file)
-                        )
-                        logger.debug(("new: " + new_file))
-                        sys.exit(
-                            "More than "
-                            + str(int(nmaxlinks))
-                            + " clouds in reference file match with new cloud?!"
-                        )
-                    else:
-                        new_backward_index[
-                            0, int(newindex) - 1, backward_nmatch
-                        ] = matchindex
-                        new_backward_size[0, int(newindex) - 1, backward_nmatch] = len(
-                            np.extract(
-                                reference_convcold_cloudnumber == matchindex,
-                                reference_convcold_cloudnumber,
+                # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
+                backward_nmatch = 0  # Initialize overlap counter
+                for matchindex in unique_backwardrefindex:
+                    sizematch = len(
+                        np.extract(backward_refindex == matchindex, backward_refindex)
+                    )
+
+                    if sizematch / float(sizenew) > othresh:
+                        if backward_nmatch > nmaxlinks:
+                            logger.debug(
+                                ("reference: " + reference_file)
+                            )
+                            logger.debug(("new: " + new_file))
+                            sys.exit(
+                                "More than "
+                                + str(int(nmaxlinks))
+                                + " clouds in reference file match with new cloud?!"
+                            )
+                        else:
+                            new_backward_index[
+                                0, int(newindex) - 1, backward_nmatch
+                            ] = matchindex
+                            new_backward_size[0, int(newindex) - 1, backward_nmatch] = len(
+                                np.extract(
+                                    reference_convcold_cloudnumber == matchindex,
+                                    reference_convcold_cloudnumber,
+                                )
                             )
-                        )
 
-                        backward_nmatch = backward_nmatch + 1
+                            backward_nmatch = backward_nmatch + 1
 
         #########################################################
         # Save forward and backward indices and linked sizes in netcdf file
@@ -382,26 +407,85 @@ def trackclouds(
                     "units": "seconds since 1970-01-01",
                 },
                 "newcloud_backward_index": {
-                    "dtype": "int",
+                    "dtype": "int32",
                     "zlib": zlib,
                     "_FillValue": fillval,
                 },
                 "newcloud_backward_size": {
-                    "dtype": "int",
+                    "dtype": "int32",
                     "zlib": zlib,
                     "_FillValue": fillval,
                 },
                 "refcloud_forward_index": {
-                    "dtype": "int",
+                    "dtype": "int32",
                     "zlib": zlib,
                     "_FillValue": fillval,
                 },
                 "refcloud_forward_size": {
-                    "dtype": "int",
+                    "dtype": "int32",
                     "zlib": zlib,
                     "_FillValue": fillval,
                 },
             },
         )
         logger.info(track_outfile)
-    return track_outfile
\ No newline at end of file
+    return track_outfile
+
+
+def link_overlap_pairs(
+    pair_a,
+    pair_b,
+    pair_npix,
+    a_npix,
+    b_npix,
+    na,
+    link_index,
+    link_size,
+    othresh,
+    nmaxlinks,
+    exit_message,
+):
+    """
+    Fill link arrays from overlapping feature pairs, same as the per-feature overlap loops in trackclouds.
+
+    Args:
+        pair_a: np.array
+            Feature number in file a of each overlapping pair, sorted by (pair_a, pair_b).
+        pair_b: np.array
+            Feature number in file b of each overlapping pair.
+        pair_npix: np.array
+            Number of overlapping pixels of each pair.
+        a_npix: np.array
+            Number of pixels of each feature in file a (index is the feature number).
+        b_npix: np.array
+            Number of pixels of each feature in file b (index is the feature number).
+        na: int
+            Number of features in file a to link.
+        link_index: np.array
+            Linked feature numbers in file b, dimensions: [1, na, nmaxlinks], updated in place.
+        link_size: np.array
+            Linked feature sizes in file b, dimensions: [1, na, nmaxlinks], updated in place.
+        othresh: float
+            Overlap fraction threshold.
+        nmaxlinks: int
+            Maximum number of links for a feature.
+        exit_message: string
+            Message if a feature has more than nmaxlinks links.
+
+    Returns:
+        None.
+    """
+    # Keep pairs where the overlap fraction of feature a exceeds the threshold
+    keep = (pair_a <= na) & (pair_npix / a_npix[pair_a].astype(float) > othresh)
+    pair_a = pair_a[keep]
+    pair_b = pair_b[keep]
+    if len(pair_a) == 0:
+        return
+    # Link number of each pair among the links of feature a
+    group_start = np.r_[0, np.nonzero(np.diff(pair_a))[0] + 1]
+    group_size = np.diff(np.r_[group_start, len(pair_a)])
+    link_number = np.arange(len(pair_a)) - np.repeat(group_start, group_size)
+    if np.max(link_number) >= nmaxlinks:
+        sys.exit(exit_message)
+    link_index[0, pair_a - 1, link_number] = pair_b
+    link_size[0, pair_a - 1, link_number] = b_npix[pair_b]
@@ -1,10 +1,11 @@
-import sys
+import numpy as np
 import logging
-import dask
-from dask.distributed import wait
 from pyflextrkr.ft_utilities import subset_files_timerange, match_drift_times
+from pyflextrkr.ft_parallel import run_tasks
 from pyflextrkr.tracksingle_drift import trackclouds
+from pyflextrkr.ft_profiling import profile_step
 
+@profile_step
 def tracksingle_driver(config):
     """
     Driver for tracking sequential pairs of idfeature files.
@@ -24,8 +25,8 @@ def tracksingle_driver(config):
     cloudid_filebase = config["cloudid_filebase"]
     start_basetime = config["start_basetime"]
     end_basetime = config["end_basetime"]
-    run_parallel = config["run_parallel"]
     driftfile = config.get("driftfile", None)
+    append_basetime = config.get("append_basetime", None)
 
     # Identify files to process
     cloudidfiles, \
@@ -35,6 +36,14 @@ def tracksingle_driver(config):
                                                      cloudid_filebase,
                                                      start_basetime,
                                                      end_basetime)
+    # In append mode, start from the last file of the previous run,
+    # so that it is linked to the first new file
+    if append_basetime is not None:
+        istart = max(np.searchsorted(cloudidfiles_basetime, append_basetime, side="right") - 1, 0)
+        cloudidfiles = cloudidfiles[istart:]
+        cloudidfiles_basetime = cloudidfiles_basetime[istart:]
+        cloudidfiles_datestring = cloudidfiles_datestring[istart:]
+        cloudidfiles_timestring = cloudidfiles_timestring[istart:]
     cloudidfilestep = len(cloudidfiles)
     logger.info(f"Total number of files to process: {cloudidfilestep}")
 
@@ -55,45 +64,17 @@ def tracksingle_driver(config):
     cloudid_filepairs = list(zip(cloudidfiles[0:-1], cloudidfiles[1::]))
     cloudid_basetimepairs = list(zip(cloudidfiles_basetime[0:-1], cloudidfiles_basetime[1::]))
 
-    # Serial version
-    if run_parallel == 0:
-        for ifile in range(0, cloudidfilestep - 1):
-            if driftfile is not None:
-                trackclouds(
-                    cloudid_filepairs[ifile],
-                    cloudid_basetimepairs[ifile],
-                    config,
-                    drift_data=drift_data[ifile]
-                )
-            else:
-                trackclouds(
-                    cloudid_filepairs[ifile],
-                    cloudid_basetimepairs[ifile],
-                    config
-                )
-
-    # Parallel version
-    elif run_parallel >= 1:
-        results = []
-        for ifile in range(0, cloudidfilestep - 1):
-            if driftfile is not None:
-                result = dask.delayed(trackclouds)(
-                    cloudid_filepairs[ifile],
-                    cloudid_basetimepairs[ifile],
-                    config,
-                    drift_data=drift_data[ifile],
-                )
-            else:
-                result = dask.delayed(trackclouds)(
-                    cloudid_filepairs[ifile],
-                    cloudid_basetimepairs[ifile],
-                    config,
-                )
-            results.append(result)
-        final_result = dask.compute(*results)
-        wait(final_result)
+    # Make task arguments for each pair
+    args_list = [
+        (cloudid_filepairs[ifile], cloudid_basetimepairs[ifile]) for ifile in range(0, cloudidfilestep - 1)
+    ]
+    if driftfile is not None:
+        kwargs_list = [{"drift_data": drift_data[ifile]} for ifile in range(0, cloudidfilestep - 1)]
     else:
-        sys.exit('Valid parallelization flag not provided.')
+        kwargs_list = None
+
+    # Track each pair of files
+    run_tasks(trackclouds, args_list, config, kwargs_list=kwargs_list, task_name="tracksingle")
 
     logger.info('Done with tracking sequential pairs of idfeature files')
     return
\ No newline at end of file
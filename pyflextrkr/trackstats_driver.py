@@ -4,13 +4,14 @@ from scipy.sparse import csr_matrix
 import os
 import sys
 import time
-import copy
 import gc
 import logging
-import dask
-from dask.distributed import wait
+from pyflextrkr.ft_parallel import iter_tasks
 from pyflextrkr.trackstats_func import calc_stats_singlefile, adjust_mergesplit_numbers, get_track_startend_status
+from pyflextrkr.ft_profiling import profile_step
+from pyflextrkr.ft_utilities import fill_missing_dense, write_trackstats_dense_netcdf
 
+@profile_step
 def trackstats_driver(config):
     """
     Calculate statistics of track features.
@@ -37,17 +38,19 @@ def trackstats_driver(config):
     enddate = config["enddate"]
     stats_path = config["stats_outpath"]
     duration_range = config["duration_range"]
-    run_parallel = config["run_parallel"]
     fillval = config["fillval"]
     tracks_dimname = config["tracks_dimname"]
     times_dimname = config["times_dimname"]
     remove_shorttracks = config["remove_shorttracks"]
     trackstats_dense_netcdf = config["trackstats_dense_netcdf"]
+    append_basetime = config.get("append_basetime", None)
+    save_tracking_state = config.get("save_tracking_state", False) or (append_basetime is not None)
     fillval_f = np.nan
 
     # Set output filename
     trackstats_outfile = f"{stats_path}{trackstats_filebase}{startdate}_{enddate}.nc"
     trackstats_sparse_outfile = f"{stats_path}{trackstats_sparse_filebase}{startdate}_{enddate}.nc"
+    trackstats_cache_outfile = f"{stats_path}{config['trackstats_cache_filebase']}{startdate}_{enddate}.nc"
 
     # Load track data
     logger.debug("Loading tracknumbers data")
@@ -66,73 +69,44 @@ def trackstats_driver(config):
     trackstatus = ds["track_status"].squeeze()
     ds.close()
 
+    # In append mode, reuse the statistics of the previous run,
+    # the last file of the previous run is recalculated because its track status is now complete
+    if append_basetime is not None:
+        trackstats_cache_file = f"{stats_path}{config['trackstats_cache_filebase']}" + \
+                                f"{startdate}_{config['append_from_enddate']}.nc"
+        cache = load_trackstats_cache(trackstats_cache_file)
+        ifile_start = cache["nfiles"] - 1
+        logger.info(f"Appending to track statistics from: {trackstats_cache_file}")
+    else:
+        cache = None
+        ifile_start = 0
+
     #########################################################################################
     # loop over files. Calculate statistics and organize matrices by tracknumber and cloud
-    logger.info(f"Total number of files to process: {nfiles}")
+    logger.info(f"Total number of files to process: {nfiles - ifile_start}")
     logger.debug("Looping over pixel files and calculating feature statistics")
     t0_files = time.time()
 
-    results = []
-
-    # Serial
-    if run_parallel == 0:
-        for nf in range(0, nfiles):
-            result = calc_stats_singlefile(
-                tracknumbers[nf, :],
-                cloudidfiles[nf],
-                trackstatus[nf, :],
-                trackmerge[nf, :],
-                tracksplit[nf, :],
-                trackreset[nf, :],
-                config,
-            )
-            results.append(result)
-
-        # Serial
-        final_result = results
-
-    # Parallel
-    elif run_parallel >= 1:
-        for nf in range(0, nfiles):
-            result = dask.delayed(calc_stats_singlefile)(
-                tracknumbers[nf, :],
-                cloudidfiles[nf],
-                trackstatus[nf, :],
-                trackmerge[nf, :],
-                tracksplit[nf, :],
-                trackreset[nf, :],
-                config,
-            )
-            results.append(result)
-
-        # Trigger dask computation
-        final_result = dask.compute(*results)
-        wait(final_result)
-
-    else:
-        sys.exit('Valid parallelization flag not provided.')
-
+    # Make task arguments for each file
+    args_list = [
+        (
+            tracknumbers[nf, :],
+            cloudidfiles[nf],
+            trackstatus[nf, :],
+            trackmerge[nf, :],
+            tracksplit[nf, :],
+            trackreset[nf, :],
+        ) for nf in range(ifile_start, nfiles)
+    ]
 
     #########################################################################################
     # Create arrays to store output
-    logger.debug("Collecting track statistics")
-
     max_trackduration = int(max(duration_range))
     numtracks = int(numtracks)
 
-    # Make a variable list and get attributes from one of the returned dictionaries
-    # Loop over each return results till one that is not None
-    counter = 0
-    while counter < nfiles:
-        if final_result[counter] is not None:
-            var_names = list(final_result[counter][0].keys())
-            # Get variable attributes
-            var_attrs = final_result[counter][1]
-            break
-        counter += 1
-    # Drop variables from the list
-    var_names.remove("uniquetracknumbers")
-    var_names.remove("numtracks")
+    # Get the time index of each track in each file from the track numbers,
+    # so that the results from each file can be collected in any order
+    file_tracknumbers, file_timeindices = get_file_track_timeindices(tracknumbers.values, numtracks)
 
     # Sparse array indices
     tracks_idx_varname = f"{tracks_dimname}_indices"
@@ -155,47 +129,80 @@ def trackstats_driver(config):
                      "track_interruptions",
                      "merge_tracknumbers",
                      "split_tracknumbers"]
-    # Loop over variable list to create the dictionary entry
-    for ivar in var_names:
-        out_dict[ivar] = np.array([])
-        out_dict_attrs[ivar] = var_attrs[ivar]
-
-    # Initialize row/col indices arrays
-    row_idx = np.array([])
-    col_idx = np.array([])
-
-    # Collect results
-    for nf in range(0, nfiles):
+    var_names = None
+    # Lists to collect values and row/col indices from each file
+    out_list = {}
+    row_list = []
+    col_list = []
+    file_list = []
+    last_tracks = np.zeros(0, dtype=np.int32)
+    if cache is not None:
+        var_names = cache["var_names"]
+        for ivar in var_names:
+            out_list[ivar] = [cache[ivar]]
+            out_dict_attrs[ivar] = cache["attrs"][ivar]
+        row_list.append(cache["row"])
+        col_list.append(cache["col"])
+        file_list.append(cache["file"])
+        out_dict["track_duration"][:len(cache["track_duration"])] = cache["track_duration"]
+
+    # Calculate statistics for each file, collect the results as they complete
+    for itask, result in iter_tasks(calc_stats_singlefile, args_list, config, task_name="trackstats"):
+        nf = ifile_start + itask
         # Get the return results for this pixel file
         # The result is a tuple: (out_dict, out_dict_attrs)
         # The first entry is the dictionary containing the variables
-        iResult = final_result[nf][0]
+        iResult = result[0]
         if iResult is not None:
+            # Make a variable list and get attributes from the first returned dictionary
+            if var_names is None:
+                var_names = list(iResult.keys())
+                # Drop variables from the list
+                var_names.remove("uniquetracknumbers")
+                var_names.remove("numtracks")
+                # Get variable attributes
+                for ivar in var_names:
+                    out_list[ivar] = []
+                    out_dict_attrs[ivar] = result[1][ivar]
+
             # unique tracknumbers in the current file
             tracknumbertmp = iResult["uniquetracknumbers"] - 1
-            # number of tracks in the current file
-            numtrackstmp = iResult["numtracks"]
 
             # Record the current length of the track by adding 1
             out_dict["track_duration"][tracknumbertmp] = (
                     out_dict["track_duration"][tracknumbertmp] + 1
             )
 
+            # Get the time index of the tracks in the current file
+            itimeidx = file_timeindices[nf][np.searchsorted(file_tracknumbers[nf], tracknumbertmp)]
             # Find track lengths that are within max_trackduration
             # Only record these to avoid array index out of bounds
-            # itracklength = out_tracklength[tracknumbertmp]
-            itracklength = out_dict["track_duration"][tracknumbertmp]
-            ridx = itracklength <= max_trackduration
-            # Loop over each variable and assign values to output dictionary
+            ridx = itimeidx < max_trackduration
+            # Loop over each variable and save values to the list
             for ivar in var_names:
-                # Concatenate arrays for 2D variables
-                out_dict[ivar] = np.concatenate(
-                    (out_dict[ivar], iResult[ivar])
-                )
+                out_list[ivar].append(iResult[ivar][ridx])
             # row, column indices for sparse matrix
             # row:tracks, col:times
-            row_idx = np.concatenate((row_idx, tracknumbertmp[ridx])).astype(int)
-            col_idx = np.concatenate((col_idx, itracklength[ridx] - 1)).astype(int)
+            row_list.append(tracknumbertmp[ridx])
+            col_list.append(itimeidx[ridx])
+            file_list.append(np.full(np.count_nonzero(ridx), nf, dtype=np.int32))
+            if nf == nfiles - 1:
+                last_tracks = tracknumbertmp
+
+    logger.debug("Collecting track statistics")
+    # Concatenate values and row/col indices from all files
+    for ivar in var_names:
+        out_dict[ivar] = np.concatenate(out_list[ivar])
+    del out_list
+    row_idx = np.concatenate(row_list).astype(int)
+    col_idx = np.concatenate(col_list).astype(int)
+    file_idx = np.concatenate(file_list)
+    del row_list, col_list, file_list
+
+    # Save the statistics of each cloud for appending later
+    if save_tracking_state:
+        write_trackstats_cache(trackstats_cache_outfile, out_dict, out_dict_attrs, var_names,
+                               row_idx, col_idx, file_idx, last_tracks, nfiles)
 
     #########################################################################################
     # Check data max duration against config set up
@@ -463,32 +470,19 @@ def write_trackstats_dense(config, fillval, fillval_f,
     if os.path.isfile(trackstats_outfile):
         os.remove(trackstats_outfile)
 
-    # Create a deep copy of the sparse matrix dictionary
-    out_dict_dense = copy.deepcopy(out_dict)
-
-    # Convert the sparse arrays to dense arrays
-    for ivar in out_dict_dense.keys():
-        if out_dict_dense[ivar].ndim == 2:
-            out_dict_dense[ivar] = out_dict_dense[ivar].toarray()
-    # Remove the tracks/times indices variables
-    out_dict_dense.pop(tracks_idx_varname, None)
-    out_dict_dense.pop(times_idx_varname, None)
-
     # Create a dense mask for no feature
-    mask = out_dict_dense['base_time'] == 0
+    mask = out_dict['base_time'].toarray() == 0
 
-    varlist = {}
-    # Define output variable dictionary
-    for key, value in out_dict_dense.items():
+    def get_variable(key):
+        value = out_dict[key]
         if value.ndim == 1:
-            varlist[key] = ([tracks_dimname], value, out_dict_attrs[key])
-        if value.ndim == 2:
-            # Replace missing values based on variable type
-            if isinstance(value[0, 0], np.floating):
-                value[mask] = fillval_f
-            else:
-                value[mask] = fillval
-            varlist[key] = ([tracks_dimname, times_dimname], value, out_dict_attrs[key])
+            return ([tracks_dimname], value, out_dict_attrs[key])
+        # Convert the sparse array to dense array, replace missing values based on variable type
+        value = fill_missing_dense(value.toarray(), mask, fillval, fillval_f)
+        return ([tracks_dimname, times_dimname], value, out_dict_attrs[key])
+
+    # Remove the tracks/times indices variables
+    varnames = [key for key in out_dict.keys() if key not in (tracks_idx_varname, times_idx_varname)]
     # Define coordinate list
     coordlist = {
         tracks_dimname: ([tracks_dimname], np.arange(0, numtracks)),
@@ -508,16 +502,133 @@ def write_trackstats_dense(config, fillval, fillval_f,
         "time_resolution_hour": config["datatimeresolution"],
         "pixel_radius_km": config["pixel_radius"],
     }
-    # Define output Xarray dataset
-    dsout = xr.Dataset(varlist, coords=coordlist, attrs=gattrlist)
-    # Set encoding/compression for all variables
-    comp = dict(zlib=True)
-    encoding = {var: comp for var in dsout.data_vars}
-    # Write to netcdf file
-    dsout.to_netcdf(path=trackstats_outfile,
-                    mode='w',
-                    format='NETCDF4',
-                    unlimited_dims=tracks_dimname,
-                    encoding=encoding)
+    # Write to netcdf file one variable at a time
+    write_trackstats_dense_netcdf(
+        trackstats_outfile, varnames, get_variable, coordlist, gattrlist, tracks_dimname,
+    )
     logger.info(trackstats_outfile)
     return
+
+
+def get_file_track_timeindices(tracknumbers, numtracks):
+    """
+    Get the track numbers in each file and their time index within each track.
+
+    Args:
+        tracknumbers: np.array
+            Track number of each cloud, dimensions: [nfiles, nclouds].
+        numtracks: int
+            Total number of tracks.
+
+    Returns:
+        file_tracknumbers: list
+            Sorted track indices (track number - 1) in each file.
+        file_timeindices: list
+            Time index of each track in file_tracknumbers, counted from the track start.
+    """
+    nfiles = tracknumbers.shape[0]
+    track_count = np.zeros(numtracks, dtype=np.int32)
+    file_tracknumbers = []
+    file_timeindices = []
+    for nf in range(0, nfiles):
+        itracknumbers = tracknumbers[nf, :]
+        itracknumbers = itracknumbers[np.isfinite(itracknumbers)]
+        itrackidx = np.unique(itracknumbers[itracknumbers > 0]).astype(np.int32) - 1
+        file_tracknumbers.append(itrackidx)
+        file_timeindices.append(track_count[itrackidx].copy())
+        track_count[itrackidx] += 1
+    return file_tracknumbers, file_timeindices
+
+
+def write_trackstats_cache(trackstats_cache_outfile, out_dict, out_dict_attrs, var_names,
+                           row_idx, col_idx, file_idx, last_tracks, nfiles):
+    """
+    Write the statistics of each cloud before track selection, used to append new periods later.
+
+    Args:
+        trackstats_cache_outfile: string
+            Output cache netCDF filename.
+        out_dict: dictionary
+            Output variables dictionary, with the values of each cloud.
+        out_dict_attrs: dictionary
+            Output variable attributes dictionary.
+        var_names: list
+            Names of the variables of each cloud.
+        row_idx: np.array
+            Track index of each cloud.
+        col_idx: np.array
+            Time index of each cloud within its track.
+        file_idx: np.array
+            File index of each cloud.
+        last_tracks: np.array
+            Track indices in the last file.
+        nfiles: int
+            Number of files.
+
+    Returns:
+        None.
+    """
+    logger = logging.getLogger(__name__)
+    # Track duration without the last file, which is recalculated when appending
+    track_duration = np.copy(out_dict["track_duration"])
+    track_duration[last_tracks] -= 1
+    # Sort clouds by file and track, results from parallel tasks are collected in any order
+    order = np.lexsort((row_idx, file_idx))
+    varlist = {
+        "track_duration": (["tracks"], track_duration, out_dict_attrs["track_duration"]),
+        "tracks_indices": (["clouds"], row_idx[order].astype(np.int32)),
+        "times_indices": (["clouds"], col_idx[order].astype(np.int32)),
+        "files_indices": (["clouds"], file_idx[order].astype(np.int32)),
+    }
+    for ivar in var_names:
+        varlist[ivar] = (["clouds"], out_dict[ivar][order], out_dict_attrs[ivar])
+    gattrlist = {
+        "Title": 'Statistics of each cloud in tracks, before track selection',
+        "Created_on": time.ctime(time.time()),
+        "nfiles": nfiles,
+    }
+    dsout = xr.Dataset(varlist, attrs=gattrlist)
+    comp = dict(zlib=True, _FillValue=None)
+    encoding = {var: comp for var in dsout.data_vars}
+    dsout.to_netcdf(path=trackstats_cache_outfile, mode='w', format='NETCDF4', encoding=encoding)
+    logger.info(trackstats_cache_outfile)
+    return
+
+
+def load_trackstats_cache(trackstats_cache_file):
+    """
+    Load the statistics of each cloud from a previous run, without the last file of the previous run.
+
+    Args:
+        trackstats_cache_file: string
+            Cache netCDF filename written by write_trackstats_cache.
+
+    Returns:
+        cache: dictionary
+            Dictionary containing the values of each cloud ("row", "col", "file" and each variable),
+            "var_names", "attrs", "track_duration" and "nfiles".
+    """
+    logger = logging.getLogger(__name__)
+    if not os.path.isfile(trackstats_cache_file):
+        logger.critical(f"Track statistics cache file not found: {trackstats_cache_file}")
+        logger.critical("Set save_tracking_state: True in the config file of the previous run.")
+        sys.exit("Code exits in trackstats_driver.py")
+    ds = xr.open_dataset(trackstats_cache_file, mask_and_scale=False, decode_times=False)
+    nfiles = int(ds.attrs["nfiles"])
+    # Drop the last file of the previous run
+    keep = ds["files_indices"].values < (nfiles - 1)
+    index_names = ["track_duration", "tracks_indices", "times_indices", "files_indices"]
+    var_names = [ivar for ivar in ds.data_vars if ivar not in index_names]
+    cache = {
+        "var_names": var_names,
+        "attrs": {ivar: dict(ds[ivar].attrs) for ivar in var_names},
+        "track_duration": ds["track_duration"].values,
+        "row": ds["tracks_indices"].values[keep],
+        "col": ds["times_indices"].values[keep],
+        "file": ds["files_indices"].values[keep],
+        "nfiles": nfiles,
+    }
+    for ivar in var_names:
+        cache[ivar] = ds[ivar].values[keep]
+    ds.close()
+    return cache
@@ -42,9 +42,7 @@ def calc_stats_singlefile(
     logger = logging.getLogger(__name__)
 
     tracking_outpath = config["tracking_outpath"]
-    pixel_radius = config["pixel_radius"]
     feature_type = config.get("feature_type", None)
-    terrain_file = config.get("terrain_file", None)
     rangemask_varname = config.get("rangemask_varname", 'None')
     feature_varname = config.get("feature_varname", "feature_number")
 
@@ -59,45 +57,15 @@ def calc_stats_singlefile(
         ds = xr.open_dataset(cloudid_file,
                              mask_and_scale=False,
                              decode_times=False)
-        latitude = ds["latitude"].values
-        longitude = ds["longitude"].values
-        nx = ds.sizes["lon"]
-        ny = ds.sizes["lat"]
-        # file_cloudnumber = ds["cloudnumber"].squeeze().values
-        file_corecold_cloudnumber = ds[feature_varname].squeeze().values
-        file_basetime = ds["base_time"].squeeze()
-
-        # Read feature specific variables
-        if feature_type == "radar_cells":
-            ref_varname = config["ref_varname"]
-            # Convert x,y units to [km]
-            x_coords = ds["x"] / 1000.
-            y_coords = ds["y"] / 1000.
-            file_dbz = ds[ref_varname].squeeze().values
-            file_conv_core = ds["conv_core"].squeeze().values
-            file_conv_mask = ds["conv_mask"].squeeze().values
-            # Replace default cloudnumber with convective mask
-            # Cell tracking uses expanded cloud area for tracking purpose only,
-            # but the true cell mask is conv_mask
-            file_corecold_cloudnumber = file_conv_mask
-            # Convert echo-top height units to [km]
-            file_echotop10 = ds["echotop10"].squeeze().values / 1000.
-            file_echotop20 = ds["echotop20"].squeeze().values / 1000.
-            file_echotop30 = ds["echotop30"].squeeze().values / 1000.
-            file_echotop40 = ds["echotop40"].squeeze().values / 1000.
-            file_echotop50 = ds["echotop50"].squeeze().values / 1000.
-
-            # Range mask file
-            if terrain_file is not None:
-                dster = xr.open_dataset(terrain_file, decode_cf=False, mask_and_scale=False)
-                rangemask = dster[rangemask_varname].values.astype('int8')
-                dster.close()
+        file_basetime = ds["base_time"].squeeze().load()
 
-        if "tb" in feature_type:
-            file_tb = ds["tb"].squeeze().values
-            file_cloudtype = ds["cloudtype"].squeeze().values
-
-        # ds.close()
+        # Use the feature statistics saved by feature identification if available,
+        # otherwise calculate them from the pixel data
+        feature_stats = read_feature_stats(ds, config)
+        if feature_stats is None:
+            feature_stats = calc_feature_stats(ds, config)
+        ds.close()
+        nfeatures = len(feature_stats["area"])
 
         # Find unique track numbers
         uniquetracknumbers = np.unique(tracknumbers)
@@ -109,81 +77,15 @@ def calc_stats_singlefile(
         fillval_f = np.nan
         numtracks = len(uniquetracknumbers)
         out_basetime = np.full(numtracks, fillval, dtype=np.float64)
-        out_meanlat = np.full(numtracks, fillval_f, dtype=np.float32)
-        out_meanlon = np.full(numtracks, fillval_f, dtype=np.float32)
-        out_area = np.full(numtracks, fillval_f, dtype=np.float32)
         out_cloudnumber = np.full(numtracks, fillval, dtype=np.int32)
         out_status = np.full(numtracks, fillval, dtype=np.int32)
         out_trackinterruptions = np.full(numtracks, fillval, dtype=np.int32)
         out_mergenumber = np.full(numtracks, fillval, dtype=np.int32)
         out_splitnumber = np.full(numtracks, fillval, dtype=np.int32)
-
-        # Create feature specific variables
-        # Radar cells
-        if feature_type == "radar_cells":
-            out_core_meanlat = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_meanlon = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_mean_x = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_mean_y = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_meanlat = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_meanlon = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_mean_x = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_mean_y = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_max_dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_maxETH10dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_maxETH20dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_maxETH30dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_maxETH40dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_maxETH50dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_area = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_area = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_rangeflag = np.full(numtracks, fillval, dtype=np.short)
-
-        # Satellite Tb
-        if "tb" in feature_type:
-            out_corecold_mintb = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_corecold_meantb = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_meantb = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_mintb_lon = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_mintb_lat = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_area = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cold_area = np.full(numtracks, fillval_f, dtype=np.float32)
-
-
-        # Pre-sort cloudnumber to get location indices
-        fcn_gt_0 = file_corecold_cloudnumber > 0
-        corecold_cloudnumber_mask = file_corecold_cloudnumber * fcn_gt_0
-        cloudnumber1d_uniq, cloudnumber1d_counts, \
-        ast_corecoldarea, cumcounts_corecoldarea = pre_sort_cloudnumber(corecold_cloudnumber_mask)
-
-        if feature_type == "radar_cells":
-            # Pre-sort core number to get location indices
-            core_cloudnumber_mask = file_corecold_cloudnumber * file_conv_core
-            corenumber1d_uniq, corenumber1d_counts, \
-            ast_corearea, cumcounts_corearea = pre_sort_cloudnumber(core_cloudnumber_mask)
-
-            # Pre-sort dilated cell number to get location indices
-            dilated_cloudnumber_mask = ds[feature_varname].squeeze().values
-            dilatednumber1d_uniq, dilatednumber1d_counts, \
-            ast_dilatedcellarea, cumcounts_dilatedcellarea = pre_sort_cloudnumber(dilated_cloudnumber_mask)
-
-        if "tb" in feature_type:
-            # Pre-sort core number to get location indices
-            core_cloudnumber_mask = file_corecold_cloudnumber * (file_cloudtype == 1)
-            corenumber1d_uniq, corenumber1d_counts, \
-            ast_corearea, cumcounts_corearea = pre_sort_cloudnumber(core_cloudnumber_mask)
-
-            # Pre-sort cold anvil number to get location indices
-            cold_cloudnumber_mask = file_corecold_cloudnumber * (file_cloudtype == 2)
-            coldnumber1d_uniq, coldnumber1d_counts, \
-            ast_coldarea, cumcounts_coldarea = pre_sort_cloudnumber(cold_cloudnumber_mask)
-
-            # import matplotlib.pyplot as plt
-            # Zm = np.ma.masked_where(cold_cloudnumber_mask == 0, cold_cloudnumber_mask)
-            # import pdb;
-            # pdb.set_trace()
-            # plt.pcolormesh(Zm)
-
+        # Feature statistics variables
+        out_stats = {}
+        for key, dtype in get_feature_stats_names(feature_type):
+            out_stats[key] = np.full(numtracks, fillval if dtype == np.short else fillval_f, dtype=dtype)
 
         # Loop over unique tracknumbers
         for itrack in range(numtracks):
@@ -198,145 +100,19 @@ def calc_stats_singlefile(
                 cloudnumber_map = cloudnumber_map[0]
             cloudindex = cloudnumber_map - 1
 
-            # # Get the cloudmask for the current track (this is the slow method!)
-            # mask_corecold = file_corecold_cloudnumber == cloudnumber_map
-            # mask_cloud = file_cloudnumber == cloudnumber_map
-
-            # Get corecold cloud pixel location indices
-            corecold_npix, corecold_indices = get_loc_indices(
-                cloudnumber1d_uniq, cloudnumber1d_counts,
-                ast_corecoldarea, cumcounts_corecoldarea,
-                cloudnumber_map, nx, ny,
-            )
-
-            if corecold_npix > 0:
-                out_area[itrack] = corecold_npix * pixel_radius ** 2
-                corecold_lat = latitude[corecold_indices[0], corecold_indices[1]]
-                corecold_lon = longitude[corecold_indices[0], corecold_indices[1]]
-                out_meanlon[itrack] = np.nanmean(corecold_lon)
-                out_meanlat[itrack] = np.nanmean(corecold_lat)
-
-                # Calculate feature specific statistics
-                # Satellite Tb
-                if "tb" in feature_type:
-                    # Get cold core pixel location indices
-                    core_npix, core_indices = get_loc_indices(
-                        corenumber1d_uniq, corenumber1d_counts,
-                        ast_corearea, cumcounts_corearea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    # Get cold anvil pixel location indices
-                    cold_npix, cold_indices = get_loc_indices(
-                        coldnumber1d_uniq, coldnumber1d_counts,
-                        ast_coldarea, cumcounts_coldarea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    out_core_area[itrack] = core_npix * pixel_radius ** 2
-                    out_cold_area[itrack] = cold_npix * pixel_radius ** 2
-                    out_corecold_mintb[itrack] = np.nanmin(file_tb[corecold_indices[0], corecold_indices[1]])
-                    out_corecold_meantb[itrack] = np.nanmean(file_tb[corecold_indices[0], corecold_indices[1]])
-                    # Get min Tb location
-                    mintb_index = np.argmin(file_tb[corecold_indices[0], corecold_indices[1]])
-                    out_mintb_lat[itrack] = latitude[corecold_indices[0], corecold_indices[1]][mintb_index]
-                    out_mintb_lon[itrack] = longitude[corecold_indices[0], corecold_indices[1]][mintb_index]
-                    if core_npix > 0:
-                        out_core_meantb[itrack] = np.nanmean(file_tb[core_indices[0], core_indices[1]])
-
-                    # iy_min, iy_max = np.min(corecold_indices[0]), np.max(corecold_indices[0])
-                    # ix_min, ix_max = np.min(corecold_indices[1]), np.max(corecold_indices[1])
-                    # import pdb; pdb.set_trace()
-
-                # Calculate feature specific statistics
-                # Radar cells
-                if feature_type == "radar_cells":
-                    # Get core pixel location indices
-                    core_npix, core_indices = get_loc_indices(
-                        corenumber1d_uniq, corenumber1d_counts,
-                        ast_corearea, cumcounts_corearea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    # Get dilated cell pixel location indices
-                    dilatedcell_npix, dilatedcell_indices = get_loc_indices(
-                        dilatednumber1d_uniq, dilatednumber1d_counts,
-                        ast_dilatedcellarea, cumcounts_dilatedcellarea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    # Location of core
-                    core_lat = latitude[core_indices[0], core_indices[1]]
-                    core_lon = longitude[core_indices[0], core_indices[1]]
-                    core_y = y_coords[core_indices[0]]
-                    core_x = x_coords[core_indices[1]]
-
-                    # Location of cell (same as corecold location)
-                    cell_lat = corecold_lat
-                    cell_lon = corecold_lon
-                    cell_y = y_coords[corecold_indices[0]]
-                    cell_x = x_coords[corecold_indices[1]]
-
-                    # Core center location
-                    out_core_meanlat[itrack] = np.nanmean(core_lat)
-                    out_core_meanlon[itrack] = np.nanmean(core_lon)
-                    out_core_mean_y[itrack] = np.nanmean(core_y)
-                    out_core_mean_x[itrack] = np.nanmean(core_x)
-
-                    # Cell center location
-                    out_cell_meanlat[itrack] = np.nanmean(cell_lat)
-                    out_cell_meanlon[itrack] = np.nanmean(cell_lon)
-                    out_cell_mean_y[itrack] = np.nanmean(cell_y)
-                    out_cell_mean_x[itrack] = np.nanmean(cell_x)
-
-                    out_core_area[itrack] = core_npix * pixel_radius ** 2
-                    out_cell_area[itrack] = corecold_npix * pixel_radius ** 2
-
-                    out_cell_max_dbz[itrack] = np.nanmax(
-                        file_dbz[corecold_indices[0], corecold_indices[1]]
-                    )
-
-                    # Ignore "All-NaN slice encountered" error in ETH variables
-                    with warnings.catch_warnings():
-                        warnings.simplefilter("ignore", category=RuntimeWarning)
-
-                        out_cell_maxETH10dbz[itrack] = np.nanmax(
-                            file_echotop10[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH20dbz[itrack] = np.nanmax(
-                            file_echotop20[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH30dbz[itrack] = np.nanmax(
-                            file_echotop30[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH40dbz[itrack] = np.nanmax(
-                            file_echotop40[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH50dbz[itrack] = np.nanmax(
-                            file_echotop50[corecold_indices[0], corecold_indices[1]]
-                        )
-
-                    if terrain_file is not None:
-                        # The min range mask value within the dilated cell area
-                        # 1: cell completely within range mask
-                        # 0: some portion of the cell outside range mask
-                        out_cell_rangeflag[itrack] = np.min(
-                            rangemask[dilatedcell_indices[0], dilatedcell_indices[1]])
+            # Get the statistics of the feature
+            if int(cloudindex) < nfeatures:
+                for key in out_stats.keys():
+                    out_stats[key][itrack] = feature_stats[key][int(cloudindex)]
 
             out_basetime[itrack] = file_basetime
             out_cloudnumber[itrack] = cloudnumber_map
-            # out_cloudidfile[itrack][:] = fname
-            # out_area[itrack] = np.count_nonzero(mask_corecold) * pixel_radius ** 2
-            # out_meanlat[itrack] = np.nanmean(latitude[mask_corecold])
-            # out_meanlon[itrack] = np.nanmean(longitude[mask_corecold])
-            # out_cell_max_dbz[itrack] = np.nanmax(file_dbz[mask_corecold])
 
             # Save track status, merge/split information
             out_status[itrack] = trackstatus[cloudindex]
             out_mergenumber[itrack] = trackmerge[cloudindex]
             out_splitnumber[itrack] = tracksplit[cloudindex]
             out_trackinterruptions[itrack] = trackreset[cloudindex]
-
         # Track status explanation
         track_status_explanation = (
             "0: Track stops;  "
@@ -364,9 +140,9 @@ def calc_stats_singlefile(
 
         # Define baseline output variables and attributes dictionary
         out_dict, \
-        out_dict_attrs = define_base_vars_dict(file_basetime, fillval, fillval_f, numtracks, out_area,
-                                               out_basetime, out_cloudnumber, out_meanlat, out_meanlon,
-                                               out_mergenumber, out_splitnumber, out_status,
+        out_dict_attrs = define_base_vars_dict(file_basetime, fillval, fillval_f, numtracks, out_stats["area"],
+                                               out_basetime, out_cloudnumber, out_stats["meanlat"],
+                                               out_stats["meanlon"], out_mergenumber, out_splitnumber, out_status,
                                                out_trackinterruptions, track_status_explanation,
                                                uniquetracknumbers)
 
@@ -375,9 +151,9 @@ def calc_stats_singlefile(
         if "tb" in feature_type:
             out_dict_attrs_extra, \
             out_dict_extra = define_extra_tb(
-                fillval_f, out_cold_area, out_core_area,
-                out_core_meantb, out_corecold_meantb,
-                out_corecold_mintb, out_mintb_lat, out_mintb_lon,
+                fillval_f, out_stats["cold_area"], out_stats["core_area"],
+                out_stats["core_meantb"], out_stats["corecold_meantb"],
+                out_stats["corecold_mintb"], out_stats["mintb_lat"], out_stats["mintb_lon"],
             )
             # Merge with the baseline dictionaries
             out_dict.update(out_dict_extra)
@@ -385,15 +161,15 @@ def calc_stats_singlefile(
 
         if feature_type == "radar_cells":
             out_dict_attrs_extra, \
-            out_dict_extra = define_extra_radar_cells(fillval, fillval_f, out_cell_area,
-                                                      out_cell_maxETH10dbz, out_cell_maxETH20dbz,
-                                                      out_cell_maxETH30dbz, out_cell_maxETH40dbz,
-                                                      out_cell_maxETH50dbz, out_cell_max_dbz,
-                                                      out_cell_mean_x, out_cell_mean_y,
-                                                      out_cell_meanlat, out_cell_meanlon,
-                                                      out_cell_rangeflag, out_core_area,
-                                                      out_core_mean_x, out_core_mean_y,
-                                                      out_core_meanlat, out_core_meanlon,
+            out_dict_extra = define_extra_radar_cells(fillval, fillval_f, out_stats["cell_area"],
+                                                      out_stats["cell_maxETH10dbz"], out_stats["cell_maxETH20dbz"],
+                                                      out_stats["cell_maxETH30dbz"], out_stats["cell_maxETH40dbz"],
+                                                      out_stats["cell_maxETH50dbz"], out_stats["cell_max_dbz"],
+                                                      out_stats["cell_mean_x"], out_stats["cell_mean_y"],
+                                                      out_stats["cell_meanlat"], out_stats["cell_meanlon"],
+                                                      out_stats["cell_rangeflag"], out_stats["core_area"],
+                                                      out_stats["core_mean_x"], out_stats["core_mean_y"],
+                                                      out_stats["core_meanlat"], out_stats["core_meanlon"],
                                                       rangemask_varname)
             # Merge with the baseline dictionaries
             out_dict.update(out_dict_extra)
@@ -409,6 +185,314 @@ def calc_stats_singlefile(
 
 
 
+def get_feature_stats_names(feature_type):
+    """
+    Get the names and data types of the statistics of each feature.
+
+    Args:
+        feature_type: string
+            Feature type from the config file.
+
+    Returns:
+        stats_names: list
+            List of (name, dtype) tuples.
+    """
+    stats_names = [
+        ("area", np.float32),
+        ("meanlat", np.float32),
+        ("meanlon", np.float32),
+    ]
+    if "tb" in feature_type:
+        stats_names += [
+            ("core_area", np.float32),
+            ("cold_area", np.float32),
+            ("corecold_mintb", np.float32),
+            ("corecold_meantb", np.float32),
+            ("core_meantb", np.float32),
+            ("mintb_lat", np.float32),
+            ("mintb_lon", np.float32),
+        ]
+    if feature_type == "radar_cells":
+        stats_names += [
+            ("core_meanlat", np.float32),
+            ("core_meanlon", np.float32),
+            ("core_mean_x", np.float32),
+            ("core_mean_y", np.float32),
+            ("cell_meanlat", np.float32),
+            ("cell_meanlon", np.float32),
+            ("cell_mean_x", np.float32),
+            ("cell_mean_y", np.float32),
+            ("cell_max_dbz", np.float32),
+            ("cell_maxETH10dbz", np.float32),
+            ("cell_maxETH20dbz", np.float32),
+            ("cell_maxETH30dbz", np.float32),
+            ("cell_maxETH40dbz", np.float32),
+            ("cell_maxETH50dbz", np.float32),
+            ("core_area", np.float32),
+            ("cell_area", np.float32),
+            ("cell_rangeflag", np.short),
+        ]
+    return stats_names
+
+
+def calc_feature_stats(ds, config):
+    """
+    Calculate statistics of each feature from the pixel data of a cloudid file.
+
+    Args:
+        ds: xarray.Dataset
+            Cloudid dataset, either read from file or before it is written.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        feature_stats: dictionary
+            Dictionary containing the statistics of each feature,
+            array index is feature number - 1.
+    """
+    pixel_radius = config["pixel_radius"]
+    feature_type = config.get("feature_type", None)
+    terrain_file = config.get("terrain_file", None)
+    rangemask_varname = config.get("rangemask_varname", 'None')
+    feature_varname = config.get("feature_varname", "feature_number")
+    featuresize_varname = config.get("featuresize_varname", "npix_feature")
+
+    latitude = ds["latitude"].values
+    longitude = ds["longitude"].values
+    nx = ds.sizes["lon"]
+    ny = ds.sizes["lat"]
+    nfeatures = ds[featuresize_varname].size
+    file_corecold_cloudnumber = ds[feature_varname].squeeze().values
+
+    # Read feature specific variables
+    if feature_type == "radar_cells":
+        ref_varname = config["ref_varname"]
+        # Convert x,y units to [km]
+        x_coords = ds["x"] / 1000.
+        y_coords = ds["y"] / 1000.
+        file_dbz = ds[ref_varname].squeeze().values
+        file_conv_core = ds["conv_core"].squeeze().values
+        file_conv_mask = ds["conv_mask"].squeeze().values
+        # Replace default cloudnumber with convective mask
+        # Cell tracking uses expanded cloud area for tracking purpose only,
+        # but the true cell mask is conv_mask
+        file_corecold_cloudnumber = file_conv_mask
+        # Convert echo-top height units to [km]
+        file_echotop10 = ds["echotop10"].squeeze().values / 1000.
+        file_echotop20 = ds["echotop20"].squeeze().values / 1000.
+        file_echotop30 = ds["echotop30"].squeeze().values / 1000.
+        file_echotop40 = ds["echotop40"].squeeze().values / 1000.
+        file_echotop50 = ds["echotop50"].squeeze().values / 1000.
+
+        # Range mask file
+        if terrain_file is not None:
+            dster = xr.open_dataset(terrain_file, decode_cf=False, mask_and_scale=False)
+            rangemask = dster[rangemask_varname].values.astype('int8')
+            dster.close()
+
+    if "tb" in feature_type:
+        file_tb = ds["tb"].squeeze().values
+        file_cloudtype = ds["cloudtype"].squeeze().values
+
+    # Create output variables
+    fillval = -9999
+    fillval_f = np.nan
+    feature_stats = {}
+    for key, dtype in get_feature_stats_names(feature_type):
+        feature_stats[key] = np.full(nfeatures, fillval if dtype == np.short else fillval_f, dtype=dtype)
+
+    # Pre-sort cloudnumber to get location indices
+    fcn_gt_0 = file_corecold_cloudnumber > 0
+    corecold_cloudnumber_mask = file_corecold_cloudnumber * fcn_gt_0
+    cloudnumber1d_uniq, cloudnumber1d_counts, \
+    ast_corecoldarea, cumcounts_corecoldarea = pre_sort_cloudnumber(corecold_cloudnumber_mask)
+
+    if feature_type == "radar_cells":
+        # Pre-sort core number to get location indices
+        core_cloudnumber_mask = file_corecold_cloudnumber * file_conv_core
+        corenumber1d_uniq, corenumber1d_counts, \
+        ast_corearea, cumcounts_corearea = pre_sort_cloudnumber(core_cloudnumber_mask)
+
+        # Pre-sort dilated cell number to get location indices
+        dilated_cloudnumber_mask = ds[feature_varname].squeeze().values
+        dilatednumber1d_uniq, dilatednumber1d_counts, \
+        ast_dilatedcellarea, cumcounts_dilatedcellarea = pre_sort_cloudnumber(dilated_cloudnumber_mask)
+
+    if "tb" in feature_type:
+        # Pre-sort core number to get location indices
+        core_cloudnumber_mask = file_corecold_cloudnumber * (file_cloudtype == 1)
+        corenumber1d_uniq, corenumber1d_counts, \
+        ast_corearea, cumcounts_corearea = pre_sort_cloudnumber(core_cloudnumber_mask)
+
+        # Pre-sort cold anvil number to get location indices
+        cold_cloudnumber_mask = file_corecold_cloudnumber * (file_cloudtype == 2)
+        coldnumber1d_uniq, coldnumber1d_counts, \
+        ast_coldarea, cumcounts_coldarea = pre_sort_cloudnumber(cold_cloudnumber_mask)
+
+    # Loop over features
+    for ifeature in range(nfeatures):
+        cloudnumber_map = ifeature + 1
+
+        # Get corecold cloud pixel location indices
+        corecold_npix, corecold_indices = get_loc_indices(
+            cloudnumber1d_uniq, cloudnumber1d_counts,
+            ast_corecoldarea, cumcounts_corecoldarea,
+            cloudnumber_map, nx, ny,
+        )
+
+        if corecold_npix > 0:
+            feature_stats["area"][ifeature] = corecold_npix * pixel_radius ** 2
+            corecold_lat = latitude[corecold_indices[0], corecold_indices[1]]
+            corecold_lon = longitude[corecold_indices[0], corecold_indices[1]]
+            feature_stats["meanlon"][ifeature] = np.nanmean(corecold_lon)
+            feature_stats["meanlat"][ifeature] = np.nanmean(corecold_lat)
+
+            # Calculate feature specific statistics
+            # Satellite Tb
+            if "tb" in feature_type:
+                # Get cold core pixel location indices
+                core_npix, core_indices = get_loc_indices(
+                    corenumber1d_uniq, corenumber1d_counts,
+                    ast_corearea, cumcounts_corearea,
+                    cloudnumber_map, nx, ny,
+                )
+
+                # Get cold anvil pixel location indices
+                cold_npix, cold_indices = get_loc_indices(
+                    coldnumber1d_uniq, coldnumber1d_counts,
+                    ast_coldarea, cumcounts_coldarea,
+                    cloudnumber_map, nx, ny,
+                )
+
+                feature_stats["core_area"][ifeature] = core_npix * pixel_radius ** 2
+                feature_stats["cold_area"][ifeature] = cold_npix * pixel_radius ** 2
+                corecold_tb = file_tb[corecold_indices[0], corecold_indices[1]]
+                feature_stats["corecold_mintb"][ifeature] = np.nanmin(corecold_tb)
+                feature_stats["corecold_meantb"][ifeature] = np.nanmean(corecold_tb)
+                # Get min Tb location
+                mintb_index = np.argmin(corecold_tb)
+                feature_stats["mintb_lat"][ifeature] = corecold_lat[mintb_index]
+                feature_stats["mintb_lon"][ifeature] = corecold_lon[mintb_index]
+                if core_npix > 0:
+                    feature_stats["core_meantb"][ifeature] = np.nanmean(file_tb[core_indices[0], core_indices[1]])
+
+            # Calculate feature specific statistics
+            # Radar cells
+            if feature_type == "radar_cells":
+                # Get core pixel location indices
+                core_npix, core_indices = get_loc_indices(
+                    corenumber1d_uniq, corenumber1d_counts,
+                    ast_corearea, cumcounts_corearea,
+                    cloudnumber_map, nx, ny,
+                )
+
+                # Get dilated cell pixel location indices
+                dilatedcell_npix, dilatedcell_indices = get_loc_indices(
+                    dilatednumber1d_uniq, dilatednumber1d_counts,
+                    ast_dilatedcellarea, cumcounts_dilatedcellarea,
+                    cloudnumber_map, nx, ny,
+                )
+
+                # Location of core
+                core_lat = latitude[core_indices[0], core_indices[1]]
+                core_lon = longitude[core_indices[0], core_indices[1]]
+                core_y = y_coords[core_indices[0]]
+                core_x = x_coords[core_indices[1]]
+
+                # Location of cell (same as corecold location)
+                cell_y = y_coords[corecold_indices[0]]
+                cell_x = x_coords[corecold_indices[1]]
+
+                # Core center location
+                feature_stats["core_meanlat"][ifeature] = np.nanmean(core_lat)
+                feature_stats["core_meanlon"][ifeature] = np.nanmean(core_lon)
+                feature_stats["core_mean_y"][ifeature] = np.nanmean(core_y)
+                feature_stats["core_mean_x"][ifeature] = np.nanmean(core_x)
+
+                # Cell center location
+                feature_stats["cell_meanlat"][ifeature] = np.nanmean(corecold_lat)
+                feature_stats["cell_meanlon"][ifeature] = np.nanmean(corecold_lon)
+                feature_stats["cell_mean_y"][ifeature] = np.nanmean(cell_y)
+                feature_stats["cell_mean_x"][ifeature] = np.nanmean(cell_x)
+
+                feature_stats["core_area"][ifeature] = core_npix * pixel_radius ** 2
+                feature_stats["cell_area"][ifeature] = corecold_npix * pixel_radius ** 2
+
+                feature_stats["cell_max_dbz"][ifeature] = np.nanmax(
+                    file_dbz[corecold_indices[0], corecold_indices[1]]
+                )
+
+                # Ignore "All-NaN slice encountered" error in ETH variables
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", category=RuntimeWarning)
+                    for eth_thresh, file_echotop in zip(
+                        [10, 20, 30, 40, 50],
+                        [file_echotop10, file_echotop20, file_echotop30, file_echotop40, file_echotop50],
+                    ):
+                        feature_stats[f"cell_maxETH{eth_thresh}dbz"][ifeature] = np.nanmax(
+                            file_echotop[corecold_indices[0], corecold_indices[1]]
+                        )
+
+                if terrain_file is not None:
+                    # The min range mask value within the dilated cell area
+                    # 1: cell completely within range mask
+                    # 0: some portion of the cell outside range mask
+                    feature_stats["cell_rangeflag"][ifeature] = np.min(
+                        rangemask[dilatedcell_indices[0], dilatedcell_indices[1]])
+
+    return feature_stats
+
+
+def add_feature_stats(ds_out, config):
+    """
+    Add the statistics of each feature to a cloudid dataset before it is written,
+    so that trackstats does not need to read the pixel data again.
+
+    Args:
+        ds_out: xarray.Dataset
+            Cloudid dataset with a "features" dimension.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        ds_out: xarray.Dataset
+            Cloudid dataset with the feature statistics variables added.
+    """
+    if config.get("feature_type", None) is None:
+        return ds_out
+    feature_stats = calc_feature_stats(ds_out, config)
+    for key, values in feature_stats.items():
+        ds_out[f"feature_stats_{key}"] = (["features"], values)
+        ds_out[f"feature_stats_{key}"].attrs["long_name"] = f"Feature {key} for track statistics"
+    return ds_out
+
+
+def read_feature_stats(ds, config):
+    """
+    Read the statistics of each feature from a cloudid dataset.
+
+    Args:
+        ds: xarray.Dataset
+            Cloudid dataset.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        feature_stats: dictionary
+            Dictionary containing the statistics of each feature,
+            None if the cloudid file does not have all the statistics variables.
+    """
+    feature_type = config.get("feature_type", None)
+    stats_names = get_feature_stats_names(feature_type)
+    if not all(f"feature_stats_{key}" in ds for key, dtype in stats_names):
+        return None
+    feature_stats = {}
+    for key, dtype in stats_names:
+        feature_stats[key] = ds[f"feature_stats_{key}"].values.astype(dtype, copy=False)
+    return feature_stats
+
+
+
 
 
 def define_base_vars_dict(file_basetime, fillval, fillval_f, numtracks, out_area, out_basetime, out_cloudnumber,
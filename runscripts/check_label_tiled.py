@@ -0,0 +1,81 @@
+"""
+Check that ft_tiling.label_tiled gives labels identical to scipy.ndimage.label.
+
+Random masks with a fixed seed are labeled with 4- and 8-connectivity, with tile sizes that
+do and do not divide the domain (including 1-pixel tiles and tiles larger than the domain),
+and with one and several threads. Masks include sparse and dense random pixels, smoothed blobs
+crossing many tile seams, a checkerboard (only diagonal connections) and an empty mask.
+The labels and the number of labels must match exactly. The wall time of both is printed.
+
+Usage:
+    python check_label_tiled.py
+    python check_label_tiled.py --ny 2000 --nx 3000 --tiles 500 1000 --nthreads 1 4
+
+Returns exit code 1 if any case differs from ndimage.label.
+"""
+import sys
+import time
+import argparse
+import numpy as np
+from scipy import ndimage
+from pyflextrkr.ft_tiling import label_tiled
+
+
+def make_masks(ny, nx, seed):
+    """
+    Make test masks with different patterns.
+
+    Args:
+        ny: int
+            Number of rows.
+        nx: int
+            Number of columns.
+        seed: int
+            Random seed.
+
+    Returns:
+        masks: dictionary
+            Name and 2D boolean array for each case.
+    """
+    rng = np.random.default_rng(seed)
+    masks = {
+        "sparse": rng.random((ny, nx)) < 0.2,
+        "dense": rng.random((ny, nx)) < 0.6,
+        "blobs": ndimage.uniform_filter(rng.random((ny, nx)), size=9) > 0.52,
+        "checkerboard": (np.add.outer(np.arange(ny), np.arange(nx)) % 2) == 0,
+        "empty": np.zeros((ny, nx), dtype=bool),
+    }
+    return masks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check label_tiled against ndimage.label.")
+    parser.add_argument("--ny", type=int, default=301, help="Number of rows")
+    parser.add_argument("--nx", type=int, default=457, help="Number of columns")
+    parser.add_argument("--tiles", type=int, nargs="+", default=[1, 7, 64, 100, 1000],
+                        help="Tile sizes (same in y and x)")
+    parser.add_argument("--nthreads", type=int, nargs="+", default=[1, 3], help="Number of threads")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    structures = {
+        "4-conn": ndimage.generate_binary_structure(2, 1),
+        "8-conn": ndimage.generate_binary_structure(2, 2),
+    }
+    failed = False
+    for name, mask in make_masks(args.ny, args.nx, args.seed).items():
+        for sname, structure in structures.items():
+            t0 = time.perf_counter()
+            ref, nref = ndimage.label(mask, structure=structure)
+            tref = time.perf_counter() - t0
+            for tile_size in args.tiles + [[args.ny // 3 + 1, args.nx // 4 + 1]]:
+                for nthreads in args.nthreads:
+                    t0 = time.perf_counter()
+                    out, nout = label_tiled(mask, tile_size=tile_size, structure=structure, nthreads=nthreads)
+                    tout = time.perf_counter() - t0
+                    ok = (nout == nref) & np.array_equal(out, ref)
+                    failed |= not ok
+                    print(f"{name:12s} {sname} tile={str(tile_size):12s} nthreads={nthreads:d}  "
+                          f"nlabels={nout:7d} (ndimage {nref:7d})  time={tout:.3f}s (ndimage {tref:.3f}s)  "
+                          f"{'OK' if ok else 'FAIL'}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,112 @@
+"""
+Check that ftfunctions.smooth_box_nan matches the astropy box convolution it replaced.
+
+The reference is astropy.convolution.convolve with a Box2DKernel, boundary="extend",
+nan_treatment="interpolate" and preserve_nan=True. Fields with a fixed random seed are
+smoothed with odd and even widths, with scattered NaNs, NaN blocks on the edges and corners,
+and a NaN block larger than the window (so some windows have no valid pixels).
+
+Usage:
+    python check_smooth_box_nan.py
+    python check_smooth_box_nan.py --widths 3 4 5 10 --ny 120 --nx 150 --tol 1e-5
+
+Returns exit code 1 if any case differs from astropy by more than the tolerance.
+"""
+import sys
+import argparse
+import numpy as np
+from astropy.convolution import convolve, Box2DKernel
+from pyflextrkr.ftfunctions import smooth_box_nan
+
+
+def make_cases(ny, nx, seed):
+    """
+    Make test fields with different NaN patterns.
+
+    Args:
+        ny: int
+            Number of rows.
+        nx: int
+            Number of columns.
+        seed: int
+            Random seed.
+
+    Returns:
+        cases: dictionary
+            Name and 2D float32 array for each case.
+    """
+    rng = np.random.default_rng(seed)
+    base = (rng.random((ny, nx)) * 100 + 180).astype(np.float32)
+    cases = {"no_nan": base.copy()}
+
+    # Scattered NaNs
+    data = base.copy()
+    data[rng.random((ny, nx)) < 0.1] = np.nan
+    cases["scattered_nan"] = data
+
+    # NaN blocks along the edges and in the corners
+    data = base.copy()
+    data[:5, :] = np.nan
+    data[:, -3:] = np.nan
+    data[-8:, :8] = np.nan
+    data[ny // 2:ny // 2 + 4, :2] = np.nan
+    cases["edge_nan"] = data
+
+    # NaN block much larger than the window, so interior windows have no valid pixel
+    data = base.copy()
+    data[ny // 4:ny // 4 + 30, nx // 4:nx // 4 + 30] = np.nan
+    data[-20:, -20:] = np.nan
+    cases["allnan_window"] = data
+    return cases
+
+
+def compare(data, width):
+    """
+    Smooth a field with smooth_box_nan and astropy and return the differences.
+
+    Args:
+        data: np.array
+            2D field.
+        width: int
+            Box width.
+
+    Returns:
+        maxdiff: float
+            Max absolute difference over pixels valid in both.
+        maxulp: float
+            maxdiff in units of float32 spacing at the data magnitude.
+        nan_mismatch: int
+            Number of pixels that are NaN in one result and not the other.
+    """
+    ref = convolve(data, Box2DKernel(width), boundary="extend",
+                   nan_treatment="interpolate", preserve_nan=True)
+    out = smooth_box_nan(data, width)
+    nan_mismatch = int(np.count_nonzero(np.isnan(ref) != np.isnan(out)))
+    valid = np.isfinite(ref) & np.isfinite(out)
+    if np.any(valid):
+        diff = np.abs(out[valid].astype(np.float64) - ref[valid].astype(np.float64))
+        maxdiff = float(diff.max())
+        maxulp = maxdiff / float(np.spacing(np.float32(np.nanmax(np.abs(ref[valid])))))
+    else:
+        maxdiff, maxulp = 0.0, 0.0
+    return maxdiff, maxulp, nan_mismatch
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check smooth_box_nan against astropy convolve.")
+    parser.add_argument("--widths", type=int, nargs="+", default=[3, 4, 5, 10], help="Box widths")
+    parser.add_argument("--ny", type=int, default=120, help="Number of rows")
+    parser.add_argument("--nx", type=int, default=150, help="Number of columns")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--tol", type=float, default=1e-4, help="Max absolute difference allowed")
+    args = parser.parse_args()
+
+    failed = False
+    for name, data in make_cases(args.ny, args.nx, args.seed).items():
+        for width in args.widths:
+            maxdiff, maxulp, nan_mismatch = compare(data, width)
+            ok = (maxdiff <= args.tol) & (nan_mismatch == 0)
+            failed |= not ok
+            print(f"{name:15s} width={width:3d}  max abs diff={maxdiff:.3e} ({maxulp:.2f} ulp)  "
+                  f"NaN mismatch={nan_mismatch:d}  {'OK' if ok else 'FAIL'}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,339 @@
+"""
+Benchmark the tracking workflow steps on synthetic data at several scales.
+
+For each scale, synthetic input data is generated (or reused), a config file is made from
+the example config for the data type, and the tracking run script is run in a separate
+process with profile_timeline turned on. The step timings (wall time, CPU time, peak memory)
+are appended to a benchmark history file and compared with a baseline to find regressions.
+
+Usage:
+    python run_benchmark.py -t tb_pf -w /path/to/benchmark/ --scales 1 2 4 --ntimes 24
+    python run_benchmark.py -t radar_cells -w /path/to/benchmark/ --nprocesses 4 --baseline history.json
+
+Returns exit code 1 if any step is slower (or uses more memory) than the baseline
+by more than the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import yaml
+import shutil
+import socket
+import argparse
+import logging
+import subprocess
+import pandas as pd
+from pyflextrkr.ft_utilities import setup_logging
+from pyflextrkr.synthetic_data import generate_synthetic_data, synthetic_defaults
+
+# Example config file and run script for each synthetic data type (relative to the repository root)
+benchmark_cases = {
+    "tb_pf": {
+        "config": "config/config_mcs_idealized.yml",
+        "runscript": "runscripts/run_mcs_tbpf.py",
+        "overrides": {},
+    },
+    "radar_cells": {
+        "config": "config/config_nexrad500m_example.yml",
+        "runscript": "runscripts/run_celltracking.py",
+        "overrides": {"terrain_file": None},
+    },
+    "generic": {
+        "config": "config/config_era5_z500_example.yml",
+        "runscript": "runscripts/run_generic_tracking.py",
+        "overrides": {},
+    },
+}
+
+# Fields identifying a benchmark case
+case_keys = ["data_type", "ny", "nx", "ntimes", "density", "nprocesses", "step"]
+
+def make_benchmark_config(data_type, input_path, root_path, start_time, end_time, nprocesses, maxnclouds, repo_path):
+    """
+    Make a config dictionary for a benchmark case from the example config file.
+
+    Args:
+        data_type: string
+            Synthetic data type.
+        input_path: string
+            Synthetic input data directory.
+        root_path: string
+            Tracking output directory.
+        start_time: Pandas Timestamp
+            Time of the first input file.
+        end_time: Pandas Timestamp
+            Time of the last input file.
+        nprocesses: int
+            Number of processes, 0 to run in serial.
+        maxnclouds: int
+            Minimum value for the maximum number of features in one snapshot.
+        repo_path: string
+            Repository root directory.
+
+    Returns:
+        config: dictionary
+            Dictionary containing config parameters.
+    """
+    case = benchmark_cases[data_type]
+    with open(f"{repo_path}/{case['config']}", "r") as stream:
+        config = yaml.full_load(stream)
+    config.update(case["overrides"])
+    config.update({
+        "clouddata_path": f"{input_path}/",
+        "root_path": f"{root_path}/",
+        "databasename": synthetic_defaults[data_type]["databasename"],
+        "time_format": "yyyymodd.hhmmss",
+        "startdate": start_time.strftime("%Y%m%d.%H%M"),
+        "enddate": end_time.strftime("%Y%m%d.%H%M"),
+        "run_parallel": 1 if (nprocesses > 0) else 0,
+        "nprocesses": max(nprocesses, 1),
+        "maxnclouds": max(config["maxnclouds"], maxnclouds),
+        "profile_timeline": True,
+    })
+    return config
+
+def run_benchmark_case(data_type, scale, ntimes, density, nprocesses, work_path, repo_path):
+    """
+    Run the tracking workflow for one benchmark case and collect the step timings.
+
+    Args:
+        data_type: string
+            Synthetic data type.
+        scale: int
+            Grid size multiplier in x and y relative to the default grid size.
+        ntimes: int
+            Number of times (files).
+        density: float
+            Number of tracks per 100 x 100 grid points per 10 frames.
+        nprocesses: int
+            Number of processes, 0 to run in serial.
+        work_path: string
+            Benchmark working directory.
+        repo_path: string
+            Repository root directory.
+
+    Returns:
+        results: list
+            List of dictionaries with timings of each step, None if the run failed.
+    """
+    logger = logging.getLogger(__name__)
+    params = synthetic_defaults[data_type]
+    ny = params["ny"] * scale
+    nx = params["nx"] * scale
+    case_name = f"{data_type}_{ny}x{nx}x{ntimes}_d{density}"
+    input_path = f"{work_path}/{case_name}/input"
+    root_path = f"{work_path}/{case_name}/run_np{nprocesses}"
+    start_time = pd.Timestamp("2020-01-01T00:00:00")
+    end_time = start_time + pd.Timedelta(minutes=params["time_resolution"] * (ntimes - 1))
+
+    # Generate synthetic data if not already available
+    nfiles = len([ifile for ifile in os.listdir(input_path) if ifile.endswith(".nc")]) \
+        if os.path.isdir(input_path) else 0
+    if nfiles != ntimes:
+        logger.info(f"Generating synthetic data: {case_name}")
+        generate_synthetic_data(input_path, data_type, ntimes=ntimes, ny=ny, nx=nx, density=density,
+                                start_time=str(start_time))
+
+    # Remove output from previous runs of this case
+    if os.path.isdir(root_path):
+        shutil.rmtree(root_path)
+    os.makedirs(root_path)
+    # Allow for many more features than the synthetic tracks in one snapshot
+    maxnclouds = int(density * ny * nx / 1e3)
+    config = make_benchmark_config(
+        data_type, input_path, root_path, start_time, end_time, nprocesses, maxnclouds, repo_path,
+    )
+    config_file = f"{root_path}/config_benchmark.yml"
+    with open(config_file, "w") as stream:
+        yaml.dump(config, stream)
+
+    # Run the tracking workflow
+    logger.info(f"Running benchmark: {case_name}, nprocesses: {nprocesses}")
+    log_file = f"{root_path}/benchmark.log"
+    t0 = time.perf_counter()
+    with open(log_file, "w") as flog:
+        status = subprocess.run(
+            [sys.executable, f"{repo_path}/{benchmark_cases[data_type]['runscript']}", config_file],
+            stdout=flog, stderr=subprocess.STDOUT,
+        )
+    total_time = time.perf_counter() - t0
+    if status.returncode != 0:
+        logger.error(f"Benchmark run failed: {case_name}, see log: {log_file}")
+        return None
+
+    # Read step timings from the timeline file
+    timeline_file = f"{root_path}/{config['stats_path_name']}/timeline_{config['startdate']}_{config['enddate']}.json"
+    with open(timeline_file, "r") as ftimeline:
+        records = json.load(ftimeline)
+    case_info = {
+        "data_type": data_type,
+        "ny": ny,
+        "nx": nx,
+        "ntimes": ntimes,
+        "density": density,
+        "nprocesses": nprocesses,
+    }
+    results = []
+    for record in records:
+        if record["record_type"] != "step":
+            continue
+        results.append({
+            **case_info,
+            "step": record["step"],
+            "wall_time": record["wall_time"],
+            "cpu_time": record["cpu_time"],
+            "peak_rss_mb": record["peak_rss_mb"],
+        })
+    results.append({**case_info, "step": "total", "wall_time": total_time, "cpu_time": None, "peak_rss_mb": None})
+    return results
+
+def compare_results(results, baseline_results, tolerance, min_time, min_memory):
+    """
+    Compare benchmark results with baseline results.
+
+    If a case appears more than once in the baseline results, the last one is used.
+
+    Args:
+        results: list
+            List of dictionaries with timings of each step.
+        baseline_results: list
+            List of dictionaries with baseline timings of each step.
+        tolerance: float
+            Allowed fractional increase from the baseline.
+        min_time: float
+            Wall time increases smaller than this [second] are not regressions.
+        min_memory: float
+            Peak memory increases smaller than this [MB] are not regressions.
+
+    Returns:
+        regressions: list
+            List of strings describing each regression.
+    """
+    logger = logging.getLogger(__name__)
+    baseline = {tuple(ires[key] for key in case_keys): ires for ires in baseline_results}
+    regressions = []
+    logger.info(f"{'step':<32} {'grid':>12} {'base[s]':>9} {'new[s]':>9} {'ratio':>6} {'base[MB]':>9} {'new[MB]':>9}")
+    for ires in results:
+        key = tuple(ires[key] for key in case_keys)
+        if key not in baseline:
+            continue
+        bres = baseline[key]
+        ratio = ires["wall_time"] / max(bres["wall_time"], 1e-6)
+        grid = f"{ires['ny']}x{ires['nx']}x{ires['ntimes']}"
+        base_mem = bres["peak_rss_mb"] if bres["peak_rss_mb"] is not None else float("nan")
+        new_mem = ires["peak_rss_mb"] if ires["peak_rss_mb"] is not None else float("nan")
+        logger.info(
+            f"{ires['step']:<32} {grid:>12} {bres['wall_time']:9.2f} {ires['wall_time']:9.2f} "
+            f"{ratio:6.2f} {base_mem:9.1f} {new_mem:9.1f}"
+        )
+        if (ires["wall_time"] > bres["wall_time"] * (1 + tolerance)) and \
+                (ires["wall_time"] - bres["wall_time"] > min_time):
+            regressions.append(f"{ires['data_type']} {grid} {ires['step']}: wall time "
+                               f"{bres['wall_time']:.2f}s -> {ires['wall_time']:.2f}s")
+        if (ires["peak_rss_mb"] is not None) and (bres["peak_rss_mb"] is not None) and \
+                (ires["peak_rss_mb"] > bres["peak_rss_mb"] * (1 + tolerance)) and \
+                (ires["peak_rss_mb"] - bres["peak_rss_mb"] > min_memory):
+            regressions.append(f"{ires['data_type']} {grid} {ires['step']}: peak RSS "
+                               f"{bres['peak_rss_mb']:.1f}MB -> {ires['peak_rss_mb']:.1f}MB")
+    return regressions
+
+def get_git_commit(repo_path):
+    """
+    Get the current git commit of the repository.
+
+    Args:
+        repo_path: string
+            Repository root directory.
+
+    Returns:
+        commit: string
+            Commit hash, empty if not available.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "-C", repo_path, "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ""
+    return commit
+
+if __name__ == '__main__':
+
+    # Set the logging message level
+    setup_logging()
+    logger = logging.getLogger(__name__)
+
+    parser = argparse.ArgumentParser(description="Benchmark the tracking workflow on synthetic data.")
+    parser.add_argument("-t", "--data_type", nargs="+", default=["tb_pf"], choices=list(benchmark_cases.keys()),
+                        help="Synthetic data types to benchmark")
+    parser.add_argument("-w", "--work_path", required=True, help="Benchmark working directory")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 2],
+                        help="Grid size multipliers in x and y relative to the default grid size")
+    parser.add_argument("--ntimes", type=int, default=24, help="Number of times (files)")
+    parser.add_argument("--density", type=float, default=1.0,
+                        help="Number of tracks per 100 x 100 grid points per 10 frames")
+    parser.add_argument("--nprocesses", type=int, default=0, help="Number of processes, 0 to run in serial")
+    parser.add_argument("--history", default=None,
+                        help="Benchmark history file, default: work_path/benchmark_history.json")
+    parser.add_argument("--baseline", default=None,
+                        help="Baseline history file (latest run of each case is used), default: the history file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed fractional increase from the baseline")
+    parser.add_argument("--min_time", type=float, default=1.0,
+                        help="Wall time increases smaller than this [second] are not regressions")
+    parser.add_argument("--min_memory", type=float, default=50.,
+                        help="Peak memory increases smaller than this [MB] are not regressions")
+    args = parser.parse_args()
+
+    repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    work_path = os.path.abspath(args.work_path)
+    os.makedirs(work_path, exist_ok=True)
+    history_file = args.history if args.history is not None else f"{work_path}/benchmark_history.json"
+
+    # Run all benchmark cases
+    results = []
+    nfailed = 0
+    for data_type in args.data_type:
+        for scale in args.scales:
+            case_results = run_benchmark_case(
+                data_type, scale, args.ntimes, args.density, args.nprocesses, work_path, repo_path,
+            )
+            if case_results is None:
+                nfailed += 1
+            else:
+                results.extend(case_results)
+
+    # Read the history and the baseline
+    history = []
+    if os.path.isfile(history_file):
+        with open(history_file, "r") as fhist:
+            history = json.load(fhist)
+    baseline_history = history
+    if args.baseline is not None:
+        with open(args.baseline, "r") as fbase:
+            baseline_history = json.load(fbase)
+    # Results of the same case in later runs replace earlier ones
+    baseline_results = [ires for irun in baseline_history for ires in irun["results"]]
+
+    # Append this run to the history
+    history.append({
+        "run_time": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "git_commit": get_git_commit(repo_path),
+        "host": socket.gethostname(),
+        "results": results,
+    })
+    with open(history_file, "w") as fhist:
+        json.dump(history, fhist, indent=1)
+    logger.info(f"Benchmark history: {history_file}")
+
+    # Compare with the baseline
+    regressions = []
+    if len(baseline_results) > 0:
+        regressions = compare_results(results, baseline_results, args.tolerance, args.min_time, args.min_memory)
+    else:
+        logger.info("No baseline to compare with.")
+    for iregression in regressions:
+        logger.warning(f"Regression: {iregression}")
+    if (len(regressions) > 0) or (nfailed > 0):
+        sys.exit(1)
@@ -6,6 +6,7 @@ from dask.distributed import Client, LocalCluster
 from pyflextrkr.ft_utilities import load_config, setup_logging
 from pyflextrkr.idfeature_driver import idfeature_driver
 from pyflextrkr.tracksingle_driver import tracksingle_driver
+from pyflextrkr.idfeature_tracksingle_driver import idfeature_tracksingle_driver
 from pyflextrkr.gettracks import gettracknumbers
 from pyflextrkr.trackstats_driver import trackstats_driver
 from pyflextrkr.identifymcs import identifymcs_tb
@@ -46,13 +47,17 @@ if __name__ == '__main__':
     else:
         logger.info(f"Running in serial.")
 
-    # Step 1 - Identify features
-    if config['run_idfeature']:
-        idfeature_driver(config)
+    # Step 1 & 2 - Pipelined feature identification and linking of time adjacent files
+    if config['run_idfeature'] and config['run_tracksingle'] and config.get('pipeline_idfeature_tracksingle', False):
+        idfeature_tracksingle_driver(config)
+    else:
+        # Step 1 - Identify features
+        if config['run_idfeature']:
+            idfeature_driver(config)
 
-    # Step 2 - Link features in time adjacent files
-    if config['run_tracksingle']:
-        tracksingle_driver(config)
+        # Step 2 - Link features in time adjacent files
+        if config['run_tracksingle']:
+            tracksingle_driver(config)
 
     # Step 3 - Track features through the entire dataset
     if config['run_gettracks']:
@@ -0,0 +1,21 @@
+import sys
+import logging
+from pyflextrkr.ft_utilities import load_config, setup_logging
+from pyflextrkr.streaming_driver import streaming_driver
+
+# Purpose: Near-real-time tracking of features as new input files arrive
+# Usage: python run_streaming.py config.yml
+
+if __name__ == '__main__':
+
+    # Set the logging message level
+    setup_logging()
+    logger = logging.getLogger(__name__)
+
+    # Load configuration file
+    config_file = sys.argv[1]
+    config = load_config(config_file)
+
+    # Identify features, track and map track numbers to pixel files as new files arrive
+    # Runs in serial: each file depends on the track state of the previous file
+    streaming_driver(config)